@@ -1,75 +1,80 @@
 
 
+import sys
+
 import pandas as pd
 
-# Load the Excel file
-file_path = "AI in Renal Care_13_05_2025_Anzed.xlsx"  # Replace with your actual file path
-xls = pd.ExcelFile(file_path)
-df = xls.parse('HD sessions 2024')  # Adjust if the sheet name is different
-
-
-records = []
-current_session = None
-
-# Iterate through rows
-for _, row in df.iterrows():
-    session_marker = row[0]
-    param_name = row[1]
-
-    # If this row starts a new session
-    if isinstance(session_marker, str) and session_marker.strip().lower().startswith("session"):
-        current_session = session_marker  # Set session number
-        # still process this row (do NOT continue)
-    
-    # Skip if no parameter name
-    if pd.isna(param_name):
-        continue
-
-    # Record values for all subjects
-    for col_idx in range(2, len(row)):
-        subject_id = df.columns[col_idx]
-        value = row[col_idx]
-
-        if pd.notna(value):
-            records.append({
-                "Subject_ID": subject_id,
-                "Session_No": current_session,
-                "Parameter": param_name,
-                "Value": value
-            })
-
-# Convert to DataFrame
-long_df = pd.DataFrame(records)
-
-# Pivot into wide format
-wide_df = long_df.pivot_table(
-    index=["Subject_ID", "Session_No"],
-    columns="Parameter",
-    values="Value",
-    aggfunc="first"
-).reset_index()
-
-# Move 'Date' if present
-if "Date" in wide_df.columns:
-    wide_df["Date"] = pd.to_datetime(wide_df["Date"], dayfirst=True, errors='coerce')
-
-    cols = list(wide_df.columns)
-    cols.insert(2, cols.pop(cols.index("Date")))
-    wide_df = wide_df[cols]
-
-# Ensure 'BP (mmHg)' exists
-if "BP (mmHg)" in wide_df.columns:
-    # Fix: Use proper named groups
-    bp_split = wide_df["BP (mmHg)"].astype(str).str.extract(r'(?P<SYS>[0-9]+)\/(?P<DIA>[0-9]+)')
-
-    # Convert to numeric (optional but recommended)
-    wide_df["SYS (mmHg)"] = pd.to_numeric(bp_split["SYS"], errors="coerce")
-    wide_df["DIA (mmHg)"] = pd.to_numeric(bp_split["DIA"], errors="coerce")
-
-    # Optional: Drop the original BP column
-    # wide_df.drop(columns=["BP (mmHg)"], inplace=True)
-
-# Save result
-output_path = "restructured_dialysis_sessions_with_date.xlsx"
-wide_df.to_excel(output_path, index=False)
-print(f"✅ Saved: {output_path}")
+SESSION_SHEET = 'HD sessions 2024'
+
+
+def restructure_sessions(df):
+    """
+    Turn the 'HD sessions 2024' sheet into one row per subject and session
+
+    The sheet has the session marker ("Session 1", ...) in its first column, the
+    parameter name in its second and one column per subject. A marker applies
+    to its own row and the rows below it, until the next marker; rows without
+    a parameter name and empty cells are skipped, and when a subject has the
+    same parameter twice in a session the first value wins. 'Date' is parsed
+    (day first) and moved after Session_No, and 'BP (mmHg)' is split into
+    'SYS (mmHg)' and 'DIA (mmHg)'.
+    """
+    markers = df.iloc[:, 0]
+    params = df.iloc[:, 1]
+
+    # Forward-fill the session markers down to the rows of their session
+    is_marker = markers.map(lambda value: isinstance(value, str) and value.strip().lower().startswith("session"))
+    sessions = markers.where(is_marker).ffill()
+
+    # One (subject, session, parameter, value) row per non-empty cell
+    subjects = df.iloc[:, 2:]
+    keep = params.notna().to_numpy()
+    labelled = subjects[keep].assign(_Session_No=sessions[keep], _Parameter=params[keep])
+    long_df = labelled.melt(
+        id_vars=["_Session_No", "_Parameter"],
+        value_vars=list(subjects.columns),
+        var_name="Subject_ID",
+        value_name="Value"
+    ).rename(columns={"_Session_No": "Session_No", "_Parameter": "Parameter"})
+    long_df = long_df[long_df["Value"].notna()]
+
+    # Pivot into wide format
+    wide_df = long_df.pivot_table(
+        index=["Subject_ID", "Session_No"],
+        columns="Parameter",
+        values="Value",
+        aggfunc="first"
+    ).reset_index()
+
+    # Move 'Date' if present
+    if "Date" in wide_df.columns:
+        wide_df["Date"] = pd.to_datetime(wide_df["Date"], dayfirst=True, errors='coerce')
+
+        cols = list(wide_df.columns)
+        cols.insert(2, cols.pop(cols.index("Date")))
+        wide_df = wide_df[cols]
+
+    # Split 'BP (mmHg)' into systolic and diastolic pressure
+    if "BP (mmHg)" in wide_df.columns:
+        bp_split = wide_df["BP (mmHg)"].astype(str).str.extract(r'(?P<SYS>[0-9]+)\/(?P<DIA>[0-9]+)')
+
+        wide_df["SYS (mmHg)"] = pd.to_numeric(bp_split["SYS"], errors="coerce")
+        wide_df["DIA (mmHg)"] = pd.to_numeric(bp_split["DIA"], errors="coerce")
+
+        # Optional: Drop the original BP column
+        # wide_df.drop(columns=["BP (mmHg)"], inplace=True)
+
+    return wide_df
+
+
+if __name__ == "__main__":
+    # Load the Excel file
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "AI in Renal Care_13_05_2025_Anzed.xlsx"
+    df = pd.read_excel(file_path, sheet_name=SESSION_SHEET)  # Adjust if the sheet name is different
+
+    wide_df = restructure_sessions(df)
+
+    # Save result
+    output_path = "restructured_dialysis_sessions_with_date.xlsx"
+    wide_df.to_excel(output_path, index=False)
+    print(f"✅ Saved: {output_path}")
@@ -0,0 +1,148 @@
+"""
+Timing comparison of the session reshape in SessionPreProc.py
+
+Builds a synthetic 'HD sessions 2024' sheet (session markers in the first
+column, parameter names in the second, one column per subject), runs the
+former row-by-row reshape and restructure_sessions on it, checks that both
+give the same table and prints their run times and peak memory.
+
+    python sessionPreProcBenchmark.py --subjects 300 --sessions 150
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from SessionPreProc import restructure_sessions
+
+PARAMETERS = [
+    "Date", "BP (mmHg)", "AP (mmHg)", "VP (mmHg)", "TMP (mmHg)", "BFR (ml/min)", "AUF (ml)", "PUF (ml)",
+    "Pre HD weight (kg)", "Post HD weight (kg)", "Dry weight (kg)", "Weight gain (kg)", "HD duration (h)",
+]
+
+
+def restructure_sessions_iterrows(df):
+    """The former reshape of SessionPreProc.py: a dict per non-empty cell, then pivot_table"""
+    records = []
+    current_session = None
+
+    for _, row in df.iterrows():
+        session_marker = row.iloc[0]
+        param_name = row.iloc[1]
+
+        if isinstance(session_marker, str) and session_marker.strip().lower().startswith("session"):
+            current_session = session_marker
+
+        if pd.isna(param_name):
+            continue
+
+        for col_idx in range(2, len(row)):
+            subject_id = df.columns[col_idx]
+            value = row.iloc[col_idx]
+
+            if pd.notna(value):
+                records.append({
+                    "Subject_ID": subject_id,
+                    "Session_No": current_session,
+                    "Parameter": param_name,
+                    "Value": value
+                })
+
+    long_df = pd.DataFrame(records)
+
+    wide_df = long_df.pivot_table(
+        index=["Subject_ID", "Session_No"],
+        columns="Parameter",
+        values="Value",
+        aggfunc="first"
+    ).reset_index()
+
+    if "Date" in wide_df.columns:
+        wide_df["Date"] = pd.to_datetime(wide_df["Date"], dayfirst=True, errors='coerce')
+
+        cols = list(wide_df.columns)
+        cols.insert(2, cols.pop(cols.index("Date")))
+        wide_df = wide_df[cols]
+
+    if "BP (mmHg)" in wide_df.columns:
+        bp_split = wide_df["BP (mmHg)"].astype(str).str.extract(r'(?P<SYS>[0-9]+)\/(?P<DIA>[0-9]+)')
+        wide_df["SYS (mmHg)"] = pd.to_numeric(bp_split["SYS"], errors="coerce")
+        wide_df["DIA (mmHg)"] = pd.to_numeric(bp_split["DIA"], errors="coerce")
+
+    return wide_df
+
+
+def synthetic_sheet(subjects, sessions, seed=0):
+    """
+    A sessions sheet like the hospital workbook, with its irregularities:
+    missing cells, text in numeric rows, a note before the first session,
+    blank separator rows, a repeated parameter and a subject column of
+    numbers only
+    """
+    rng = np.random.default_rng(seed)
+    columns = ["Session", "Parameter"] + [f"RHD_THP_{index:03d}" for index in range(1, subjects + 1)]
+    rows = [["Notes", "Date"] + ["01/01/2024"] * subjects]
+
+    for session in range(1, sessions + 1):
+        day = pd.Timestamp(2024, 1, 1) + pd.Timedelta(days=2 * session)
+        for position, parameter in enumerate(PARAMETERS + ["AP (mmHg)"] if session % 7 == 0 else PARAMETERS):
+            marker = f"Session {session}" if position == 0 else None
+            if parameter == "Date":
+                values = [day.strftime("%d/%m/%Y") if rng.random() < 0.5 else day.to_pydatetime()
+                          for _ in range(subjects)]
+            elif parameter == "BP (mmHg)":
+                values = [f"{rng.integers(90, 180)}/{rng.integers(50, 110)}" for _ in range(subjects)]
+            elif parameter == "HD duration (h)":
+                values = [["4h", "3h 30min", 4.0, 3.5][rng.integers(4)] for _ in range(subjects)]
+            elif parameter == "AUF (ml)":
+                values = [["-", "NR"][rng.integers(2)] if rng.random() < 0.05 else int(rng.integers(1000, 4000))
+                          for _ in range(subjects)]
+            else:
+                values = list(np.round(rng.normal(100, 30, subjects), 1))
+            values = [None if rng.random() < 0.08 else value for value in values]
+            rows.append([marker, parameter] + values)
+        if session % 10 == 0:
+            rows.append([None, None] + [None] * subjects)
+
+    df = pd.DataFrame(rows, columns=columns, dtype=object)
+    df[columns[-1]] = pd.to_numeric(df[columns[-1]], errors="coerce")
+    return df
+
+
+def timed(function, df, repeat):
+    """Result, best run time in seconds and peak traced memory in MiB (from one extra run) of function(df)"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(df)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    function(df)
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, best, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=300)
+    parser.add_argument("--sessions", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_sheet(args.subjects, args.sessions)
+    print(f"Synthetic sheet: {df.shape[0]} rows x {df.shape[1]} columns")
+
+    expected, before, before_peak = timed(restructure_sessions_iterrows, df, args.repeat)
+    wide_df, after, after_peak = timed(restructure_sessions, df, args.repeat)
+
+    pd.testing.assert_frame_equal(wide_df, expected, check_exact=True)
+    for column in wide_df.columns:
+        assert list(map(type, wide_df[column])) == list(map(type, expected[column])), column
+    print(f"✅ Identical output: {wide_df.shape[0]} rows x {wide_df.shape[1]} columns")
+    print(f"iterrows + dicts: {before:.2f} s, peak {before_peak:.0f} MiB")
+    print(f"melt + pivot:     {after:.2f} s, peak {after_peak:.0f} MiB ({before / after:.0f}x faster)")
@@ -0,0 +1,44 @@
+"""
+Gunicorn configuration for the ML server
+
+Usage:
+    gunicorn ml_server.wsgi -c gunicorn.conf.py
+
+With preload_app the Django application (and therefore every ML model, see
+MlModelsConfig.ready) is loaded once in the master process before the workers
+are forked, so the model objects are shared copy-on-write between workers.
+"""
+import gc
+import glob
+import multiprocessing
+import os
+import tempfile
+
+# LightGBM/XGBoost use OpenMP. The GNU OpenMP runtime is not fork-safe once its
+# thread pool has been started, so keep prediction single-threaded (small
+# per-request matrices do not benefit from more threads anyway). This must be
+# set before the application, and with it the model libraries, is imported.
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+
+# Load and warm up the models when the application is loaded (in the master with
+# preload_app); other entry points such as manage.py leave this off
+os.environ.setdefault('ML_PRELOAD_MODELS', 'True')
+
+# Every worker writes its metrics snapshot here and /api/ml/metrics/ merges them.
+# Snapshots of a previous run are removed (this file is read before the app is loaded).
+metrics_dir = os.environ.setdefault('ML_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'ml_server_metrics'))
+for stale_snapshot in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+    os.remove(stale_snapshot)
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8001')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+
+def when_ready(server):
+    # Move everything allocated while preloading into the permanent generation
+    # so the garbage collector in the workers does not touch (and copy) those pages
+    gc.freeze()
+    server.log.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
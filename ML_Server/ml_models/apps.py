@@ -1,7 +1,76 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class MlModelsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ml_models'
     verbose_name = 'ML Models'
+    
+    def ready(self):
+        """
+        Load and warm up all models at startup instead of on the first request.
+        When gunicorn runs with preload_app this happens once in the master
+        process and the loaded models are shared copy-on-write with the workers.
+        Optionally start watching the model files for hot reloads.
+        """
+        from .history import patient_history
+        from .metrics import metrics
+        from .services import configure_micro_batching, explanation_cache, model_manager, prediction_cache, preload_models
+        from .shadow import shadow_evaluator
+        from .tiers import latency_tiers
+        from .validation import input_validation
+        
+        metrics.configure(
+            getattr(settings, 'ML_METRICS_DIR', ''),
+            flush_interval=getattr(settings, 'ML_METRICS_FLUSH_INTERVAL', 5.0)
+        )
+        
+        input_validation.configure(compiled=getattr(settings, 'ML_COMPILED_VALIDATION', True))
+        latency_tiers.configure(
+            getattr(settings, 'ML_LATENCY_TIERS', {'fast': 0.5, 'fastest': 0.2}),
+            report_path=getattr(settings, 'ML_LATENCY_TIER_REPORT', None)
+        )
+        model_manager.prefer_native = getattr(settings, 'ML_NATIVE_ARTIFACTS', True)
+        model_manager.configure_backends(getattr(settings, 'ML_INFERENCE_BACKENDS', {}))
+        prediction_cache.configure(
+            max_entries=getattr(settings, 'ML_PREDICTION_CACHE_SIZE', 1024),
+            ttl=getattr(settings, 'ML_PREDICTION_CACHE_TTL', 300)
+        )
+        explanation_cache.configure(max_entries=getattr(settings, 'ML_EXPLANATION_CACHE_SIZE', 4096), ttl=0)
+        patient_history.configure(
+            getattr(settings, 'ML_HISTORY_DB', settings.BASE_DIR / 'ml_history.sqlite3'),
+            enabled=getattr(settings, 'ML_HISTORY_STORE', True)
+        )
+        configure_micro_batching(
+            getattr(settings, 'ML_MICRO_BATCH_MODELS', []),
+            window_ms=getattr(settings, 'ML_MICRO_BATCH_WINDOW_MS', 2.0),
+            max_rows=getattr(settings, 'ML_MICRO_BATCH_MAX_ROWS', 64)
+        )
+        
+        if getattr(settings, 'ML_PRELOAD_MODELS', False):
+            status = preload_models(warm_up=getattr(settings, 'ML_WARMUP_MODELS', True))
+            loaded = [name for name, model_status in status.items() if model_status['loaded']]
+            logger.info(f"Preloaded ML models: {', '.join(loaded) if loaded else 'none'}")
+            # Publish the load timings now; with preload_app this process never serves requests
+            metrics.flush()
+        
+        # Shadow models never serve requests, so one that fails to load is only reported
+        shadow_evaluator.configure(
+            max_queued_rows=getattr(settings, 'ML_SHADOW_QUEUE_ROWS', 4096),
+            batch_rows=getattr(settings, 'ML_SHADOW_BATCH_ROWS', 512)
+        )
+        for model_name, path in getattr(settings, 'ML_SHADOW_MODELS', {}).items():
+            try:
+                model_manager.register_shadow(model_name, path)
+            except Exception as e:
+                logger.error(f"Failed to register shadow model {path} for {model_name}: {str(e)}")
+        
+        # Hot-reload models whose files change on disk (restarted in forked workers)
+        watch_interval = getattr(settings, 'ML_MODEL_WATCH_INTERVAL', 0)
+        if watch_interval:
+            model_manager.start_watcher(watch_interval)
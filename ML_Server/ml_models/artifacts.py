@@ -0,0 +1,273 @@
+"""
+Native model artifacts: booster files, memory-mapped arrays and a JSON manifest
+
+A pickled estimator is rebuilt object by object into the private heap of every
+process that loads it. The native artifact of a model is a directory
+(models/<name>/) holding each booster in its library's own format (LightGBM
+text model, XGBoost UBJSON), the compiled forests as .npy arrays and a
+manifest.json with the feature order, ensemble weights, threshold and
+version. Loading parses the boosters directly and memory-maps the arrays
+read-only, so all workers on a host share one page-cache copy of them, also
+when a worker hot-reloads a model after the fork.
+
+export_native_artifact() writes the artifact of a loaded pickle (see the
+export_native_models management command). MLModelManager prefers the artifact
+when its manifest exists and falls back to the pickle otherwise.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .tree_engine import CompiledForest, FusedEnsemble, compile_model
+
+MANIFEST_NAME = 'manifest.json'
+ARTIFACT_FORMAT = 'ml-server-native'
+ARTIFACT_FORMAT_VERSION = 1
+
+# Member name of a model that is a single estimator rather than an ensemble bundle
+SINGLE_MEMBER = 'model'
+
+# Maximum probability deviation accepted between the pickled estimator and its exported booster
+EXPORT_TOLERANCE = 1e-9
+
+_BOOSTER_SUFFIXES = {'lightgbm': 'txt', 'xgboost': 'ubj'}
+
+
+class NativeClassifier:
+    """
+    Binary classifier around a bare LightGBM or XGBoost booster
+    
+    Provides the part of the sklearn classifier interface the predictors use
+    (predict_proba, predict, classes_), and booster_ / get_booster() for the
+    compiled backend.
+    """
+    
+    def __init__(self, library: str, booster: Any, classes: List[Any]):
+        if library not in _BOOSTER_SUFFIXES:
+            raise ValueError(f"Unsupported booster library: {library}")
+        self.library = library
+        self.booster = booster
+        self.classes_ = np.asarray(classes)
+        self.n_classes_ = len(self.classes_)
+        if self.n_classes_ != 2:
+            raise ValueError(f"Only binary classifiers are supported (got {self.n_classes_} classes)")
+        self._iteration_range = (0, 0)
+        if library == 'lightgbm':
+            # Lets _predict_proba call the booster directly, as it does for a fitted LGBMClassifier
+            self.booster_ = booster
+        else:
+            best_iteration = booster.attr('best_iteration')
+            if best_iteration is not None:
+                # XGBClassifier predicts with the trees up to the best iteration only
+                self._iteration_range = (0, int(best_iteration) + 1)
+    
+    def get_booster(self):
+        return self.booster
+    
+    def predict_proba(self, X: np.ndarray, iteration_range: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        # iteration_range limits the boosting rounds, as in XGBClassifier.predict_proba
+        if self.library == 'lightgbm':
+            positive = self.booster.predict(X, num_iteration=iteration_range[1] if iteration_range else None)
+        else:
+            positive = self.booster.inplace_predict(X, iteration_range=iteration_range or self._iteration_range)
+        return np.column_stack((1.0 - positive, positive))
+    
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class NativeArtifact:
+    """
+    A native artifact loaded from its manifest
+    
+    `model` has the shape of the unpickled object (a classifier, or the
+    ensemble bundle dict), `forests` holds the memory-mapped compiled forest of
+    every member and `fused` the merged forest of an ensemble.
+    """
+    
+    __slots__ = ('path', 'manifest', 'content_hash', 'model', 'forests', 'fused')
+    
+    def __init__(self, path: str, manifest: Dict[str, Any], content_hash: str, model: Any,
+                 forests: Dict[str, CompiledForest], fused: Optional[CompiledForest]):
+        self.path = path
+        self.manifest = manifest
+        self.content_hash = content_hash
+        self.model = model
+        self.forests = forests
+        self.fused = fused
+    
+    @property
+    def version(self) -> str:
+        return self.manifest['version']
+    
+    def forest(self, member: Optional[str]) -> Optional[CompiledForest]:
+        """Compiled forest of an ensemble member (None for a single estimator), if exported"""
+        return self.forests.get(member or SINGLE_MEMBER)
+
+
+def _members(loaded_object: Any) -> Dict[str, Any]:
+    if isinstance(loaded_object, dict):
+        return {key: loaded_object[key] for key in ('xgb', 'lgbm')}
+    return {SINGLE_MEMBER: loaded_object}
+
+
+def _library(estimator: Any) -> str:
+    if hasattr(estimator, 'booster_'):
+        return 'lightgbm'
+    if hasattr(estimator, 'get_booster'):
+        return 'xgboost'
+    raise ValueError(f"Cannot export model of type {type(estimator).__name__}: not a LightGBM or XGBoost classifier")
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def export_native_artifact(model_name: str, loaded_object: Any, directory: str, version: str,
+                           features: Optional[List[str]] = None, source_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Write the native artifact of an unpickled model (classifier or Hb ensemble bundle) to `directory`
+    
+    Files are named after a hash of the exported content and the manifest is
+    replaced last, so a server watching the directory only ever sees a
+    complete artifact; exporting the same model again gives the same manifest
+    (and model version). The exported boosters must reproduce the pickled
+    estimators' probabilities before the manifest is written. Returns the
+    manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    source = None
+    if source_path is not None:
+        with open(source_path, 'rb') as f:
+            source = {'file': os.path.basename(source_path), 'sha256': _sha256(f.read())}
+    
+    members = _members(loaded_object)
+    libraries = {key: _library(estimator) for key, estimator in members.items()}
+    booster_bytes = {}
+    for key, estimator in members.items():
+        if libraries[key] == 'lightgbm':
+            booster_bytes[key] = estimator.booster_.model_to_string().encode('utf-8')
+        else:
+            booster_bytes[key] = bytes(estimator.get_booster().save_raw('ubj'))
+    tag = _sha256(b''.join(booster_bytes[key] for key in sorted(booster_bytes)))[:12]
+    
+    manifest_members = {}
+    forests = {}
+    for key, estimator in members.items():
+        booster_file = f"{key}.{tag}.{_BOOSTER_SUFFIXES[libraries[key]]}"
+        _write_file(os.path.join(directory, booster_file), booster_bytes[key])
+        forests[key] = compile_model(estimator)
+        manifest_members[key] = {
+            'library': libraries[key],
+            'booster': booster_file,
+            'sha256': _sha256(booster_bytes[key]),
+            'classes': [value.item() if hasattr(value, 'item') else value for value in estimator.classes_],
+            'compiled': forests[key].save_arrays(directory, f"{key}.{tag}"),
+        }
+    
+    is_ensemble = isinstance(loaded_object, dict)
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'model': model_name,
+        'version': version,
+        'features': list(features) if features is not None else None,
+        'members': manifest_members,
+        'weights': [float(weight) for weight in loaded_object['weights']] if is_ensemble else None,
+        'threshold': float(loaded_object['threshold']) if is_ensemble else None,
+        'fused': None,
+        'source': source,
+    }
+    if is_ensemble:
+        fused = FusedEnsemble([forests['xgb'], forests['lgbm']], manifest['weights'])
+        manifest['fused'] = fused.merged.save_arrays(directory, f"fused.{tag}")
+    
+    # The exported boosters must score exactly like the pickled estimators
+    exported = _load_members(directory, manifest)
+    for key, estimator in members.items():
+        probe = forests[key].probe_matrix()
+        deviation = float(np.abs(exported[key].predict_proba(probe)[:, 1] - estimator.predict_proba(probe)[:, 1]).max())
+        if deviation > EXPORT_TOLERANCE:
+            raise ValueError(f"Exported booster {model_name}/{key} deviates from the pickled model by {deviation:.2e}")
+    
+    _write_file(os.path.join(directory, MANIFEST_NAME), json.dumps(manifest, indent=2).encode('utf-8'))
+    
+    # Files of earlier exports; processes that still map them keep their pages until they reload
+    referenced = _referenced_files(manifest)
+    for name in os.listdir(directory):
+        if name not in referenced and name.endswith(('.txt', '.ubj', '.npy')):
+            os.remove(os.path.join(directory, name))
+    return manifest
+
+
+def _write_file(path: str, data: bytes):
+    # Replace rather than overwrite: other processes may be reading (or mapping) the previous file
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as f:
+        f.write(data)
+    os.replace(temporary_path, path)
+
+
+def _referenced_files(manifest: Dict[str, Any]) -> set:
+    files = set()
+    for member in manifest['members'].values():
+        files.add(member['booster'])
+        if member.get('compiled'):
+            files.update(member['compiled']['arrays'].values())
+    if manifest.get('fused'):
+        files.update(manifest['fused']['arrays'].values())
+    return files
+
+
+def _load_members(directory: str, manifest: Dict[str, Any]) -> Dict[str, NativeClassifier]:
+    members = {}
+    for key, member in manifest['members'].items():
+        with open(os.path.join(directory, member['booster']), 'rb') as f:
+            data = f.read()
+        if _sha256(data) != member['sha256']:
+            raise ValueError(f"Booster file {member['booster']} does not match its manifest checksum")
+        if member['library'] == 'lightgbm':
+            import lightgbm
+            booster = lightgbm.Booster(model_str=data.decode('utf-8'))
+        elif member['library'] == 'xgboost':
+            import xgboost
+            booster = xgboost.Booster()
+            booster.load_model(bytearray(data))
+        else:
+            raise ValueError(f"Unsupported booster library: {member['library']}")
+        members[key] = NativeClassifier(member['library'], booster, member['classes'])
+    return members
+
+
+def load_native_artifact(manifest_path: str, mmap_mode: Optional[str] = 'r') -> NativeArtifact:
+    """Load the artifact described by manifest_path, memory-mapping the compiled arrays"""
+    with open(manifest_path, 'rb') as f:
+        manifest_bytes = f.read()
+    manifest = json.loads(manifest_bytes)
+    if manifest.get('format') != ARTIFACT_FORMAT or manifest.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format: {manifest.get('format')} v{manifest.get('format_version')}")
+    
+    directory = os.path.dirname(manifest_path)
+    members = _load_members(directory, manifest)
+    forests = {
+        key: CompiledForest.load_arrays(directory, member['compiled'], mmap_mode=mmap_mode)
+        for key, member in manifest['members'].items()
+        if member.get('compiled')
+    }
+    fused = CompiledForest.load_arrays(directory, manifest['fused'], mmap_mode=mmap_mode) if manifest.get('fused') else None
+    
+    if SINGLE_MEMBER in members:
+        model = members[SINGLE_MEMBER]
+    else:
+        # Same shape as the pickled ensemble bundle
+        model = {
+            **members,
+            'weights': tuple(manifest['weights']),
+            'threshold': manifest['threshold'],
+            'features': manifest['features'],
+            'version': manifest['version'],
+        }
+    return NativeArtifact(manifest_path, manifest, _sha256(manifest_bytes), model, forests, fused)
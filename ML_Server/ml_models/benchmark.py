@@ -0,0 +1,423 @@
+"""
+Load benchmark of the prediction endpoints
+
+Payloads are generated from the input serializers: every numeric field gets a
+value drawn uniformly from its min_value/max_value range, so every request
+passes validation and reaches the model. Requests are signed with a freshly
+minted JWT and sent either through the Django test client (in-process, no
+network or server process involved) or over HTTP to a gunicorn server, from a
+pool of client threads. Each run records throughput, latency percentiles and
+the resident memory of the serving processes, and is saved as JSON so that two
+runs (before/after a change) can be compared with compare_results().
+
+The batch endpoints send --batch-size records per request. Every endpoint is
+run in each of the requested encodings (JSON, MessagePack and, for batches,
+Arrow IPC; see ml_models/formats.py), used for the request body and asked for
+with Accept, and the runs record the mean request and response sizes.
+
+Used by the benchmark_api management command.
+"""
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import jwt
+import numpy as np
+from rest_framework import serializers
+
+from .formats import ARROW_FORMAT, JSON_FORMAT, MEDIA_TYPES, MSGPACK_FORMAT, encode_arrow_records, format_available
+from .history import HISTORY_INPUTS
+from .serializers import DryWeightPredictionSerializer, HbPredictionSerializer, URRPredictionSerializer
+
+# Benchmarked endpoints: name -> (path, input serializer). The -explain variants measure
+# the cost of explanations against plain prediction; -batch endpoints get batches of records
+ENDPOINTS = {
+    'hb': ('/api/ml/predict/hb/', HbPredictionSerializer),
+    'urr': ('/api/ml/predict/urr/', URRPredictionSerializer),
+    'dry-weight': ('/api/ml/predict/dry-weight/', DryWeightPredictionSerializer),
+    'hb-explain': ('/api/ml/predict/hb/?explain=true', HbPredictionSerializer),
+    'urr-explain': ('/api/ml/predict/urr/?explain=true', URRPredictionSerializer),
+    'dry-weight-explain': ('/api/ml/predict/dry-weight/?explain=true', DryWeightPredictionSerializer),
+    'hb-batch': ('/api/ml/predict/hb/batch/', HbPredictionSerializer),
+    'urr-batch': ('/api/ml/predict/urr/batch/', URRPredictionSerializer),
+    'dry-weight-batch': ('/api/ml/predict/dry-weight/batch/', DryWeightPredictionSerializer),
+}
+
+# Request and response encodings; Arrow is only served by the batch endpoints
+ENCODINGS = (JSON_FORMAT, MSGPACK_FORMAT, ARROW_FORMAT)
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def synthetic_payloads(serializer_class, count: int, seed: int = 0, optional_rate: float = 0.5) -> List[dict]:
+    """
+    count valid request bodies for serializer_class
+    
+    Numeric fields are drawn uniformly from [min_value, max_value] (rounded
+    like clinical values), character fields get a benchmark patient id.
+    Optional fields are included with probability optional_rate, except the
+    history inputs a prediction needs (the benchmark pushes no history to fill
+    them in). Dates are left out.
+    """
+    rng = random.Random(seed)
+    fields = serializer_class().fields
+    history_inputs = {
+        history_input.name for inputs in HISTORY_INPUTS.values() for history_input in inputs if history_input.required
+    }
+    payloads = []
+    for index in range(count):
+        payload = {}
+        for name, field in fields.items():
+            if field.read_only or isinstance(field, serializers.DateField):
+                continue
+            if not field.required and name not in history_inputs and rng.random() >= optional_rate:
+                continue
+            payload[name] = _synthetic_value(field, index, rng)
+        # Every payload is validated once here, so a serializer change cannot silently turn the benchmark into a 400 benchmark
+        checked = serializer_class(data=payload)
+        if not checked.is_valid():
+            raise ValueError(f"Generated an invalid {serializer_class.__name__} payload: {checked.errors}")
+        payloads.append(payload)
+    return payloads
+
+
+def _synthetic_value(field, index: int, rng: random.Random):
+    if isinstance(field, (serializers.FloatField, serializers.DecimalField)):
+        low = field.min_value if field.min_value is not None else 0.0
+        high = field.max_value if field.max_value is not None else low + 100.0
+        return round(rng.uniform(float(low), float(high)), 2)
+    if isinstance(field, serializers.IntegerField):
+        low = field.min_value if field.min_value is not None else 0
+        high = field.max_value if field.max_value is not None else low + 100
+        return rng.randint(low, high)
+    if isinstance(field, serializers.BooleanField):
+        return rng.random() < 0.5
+    if isinstance(field, serializers.CharField):
+        value = f"BENCH-{index:06d}"
+        return value[:field.max_length] if field.max_length else value
+    raise TypeError(f"No synthetic value for {type(field).__name__} field '{field.field_name}'")
+
+
+def mint_token(secret: str, role: str = 'doctor', user_id: str = 'benchmark', ttl: int = 3600) -> str:
+    """HS256 token in the shape issued by the Express backend"""
+    return jwt.encode({'id': user_id, 'role': role, 'exp': int(time.time()) + ttl}, secret, algorithm='HS256')
+
+
+class InProcessTransport:
+    """
+    Sends requests through the Django test client (full middleware stack, no network)
+    """
+    
+    mode = 'inprocess'
+    
+    def __init__(self, token: str):
+        self.token = token
+        self._local = threading.local()
+    
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            from django.test import Client
+            client = self._local.client = Client(HTTP_AUTHORIZATION=f'Bearer {self.token}', HTTP_HOST='localhost')
+        return client
+    
+    def post(self, path: str, body: bytes, content_type: str = 'application/json',
+             accept: str = 'application/json') -> Tuple[int, int]:
+        """Status and body size of the response (as sent, so compressed when the server gzips it)"""
+        response = self._client().post(path, body, content_type=content_type, HTTP_ACCEPT=accept,
+                                       HTTP_ACCEPT_ENCODING='gzip, deflate')
+        size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming else len(response.content)
+        return response.status_code, size
+    
+    def server_pids(self) -> List[int]:
+        return [os.getpid()]
+
+
+class HTTPTransport:
+    """
+    Sends requests over HTTP with one keep-alive session per client thread
+    """
+    
+    mode = 'http'
+    
+    def __init__(self, base_url: str, token: str, server_pid: Optional[int] = None, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.server_pid = server_pid
+        self.timeout = timeout
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        self._local = threading.local()
+    
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+            session.headers.update(self.headers)
+        return session
+    
+    def post(self, path: str, body: bytes, content_type: str = 'application/json',
+             accept: str = 'application/json') -> Tuple[int, int]:
+        """Status and body size of the response (bytes read from the connection, so compressed when gzipped)"""
+        response = self._session().post(self.base_url + path, data=body, timeout=self.timeout,
+                                        headers={'Content-Type': content_type, 'Accept': accept})
+        return response.status_code, response.raw.tell() or len(response.content)
+    
+    def server_pids(self) -> List[int]:
+        """The gunicorn workers (children of the master), or nothing when the server pid is unknown"""
+        if self.server_pid is None:
+            return []
+        return _child_pids(self.server_pid) or [self.server_pid]
+
+
+def _child_pids(parent_pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; the parent pid is the second field after it
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def process_memory(pid: int) -> Optional[Dict[str, float]]:
+    """RSS and PSS (proportional share of copy-on-write pages) in MiB, None where /proc is unavailable"""
+    memory = {}
+    for path, key, name in ((f'/proc/{pid}/status', 'VmRSS', 'rss_mb'), (f'/proc/{pid}/smaps_rollup', 'Pss', 'pss_mb')):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key + ':'):
+                        memory[name] = round(int(line.split()[1]) / 1024, 1)
+                        break
+        except OSError:
+            continue
+    return memory or None
+
+
+def encoding_supported(endpoint: str, encoding: str) -> bool:
+    """Whether an endpoint is benchmarked in an encoding (Arrow: batches only; the format's package installed)"""
+    return (encoding != ARROW_FORMAT or endpoint.endswith('-batch')) and format_available(encoding)
+
+
+def request_bodies(endpoint: str, payloads: Sequence[dict], encoding: str = JSON_FORMAT,
+                   batch_size: int = 100) -> List[bytes]:
+    """Request bodies of an endpoint in an encoding: one per payload, or batches of batch_size payloads"""
+    if endpoint.endswith('-batch'):
+        documents = [payloads[start:start + batch_size] for start in range(0, len(payloads), batch_size)]
+    else:
+        documents = list(payloads)
+    if encoding == ARROW_FORMAT:
+        return [encode_arrow_records(records) for records in documents]
+    if endpoint.endswith('-batch'):
+        documents = [{'records': records} for records in documents]
+    if encoding == MSGPACK_FORMAT:
+        import msgpack
+        return [msgpack.packb(document) for document in documents]
+    return [json.dumps(document).encode() for document in documents]
+
+
+def run_level(transport, endpoint: str, payloads: Sequence[dict], concurrency: int, requests_count: int,
+              warmup: int = 0, encoding: str = JSON_FORMAT, batch_size: int = 100) -> dict:
+    """
+    Send requests_count requests from `concurrency` threads as fast as the server answers
+    
+    Payloads are used round-robin (in batches of batch_size for the batch
+    endpoints), encoded and asked for in `encoding`. The first `warmup`
+    requests are sent before timing starts and are not counted.
+    """
+    path = ENDPOINTS[endpoint][0]
+    bodies = request_bodies(endpoint, payloads, encoding, batch_size)
+    media_type = MEDIA_TYPES[encoding][0]
+    
+    for index in range(warmup):
+        transport.post(path, bodies[index % len(bodies)], media_type, media_type)
+    
+    # next() on a shared itertools.count is atomic under the GIL
+    ticket = itertools.count()
+    latencies = np.zeros(requests_count)
+    sizes = np.zeros(requests_count)
+    statuses: Dict[int, int] = {}
+    status_lock = threading.Lock()
+    
+    def client_loop():
+        local_statuses: Dict[int, int] = {}
+        while True:
+            index = next(ticket)
+            if index >= requests_count:
+                break
+            body = bodies[(warmup + index) % len(bodies)]
+            started = time.perf_counter()
+            try:
+                status, sizes[index] = transport.post(path, body, media_type, media_type)
+            except Exception:
+                status = 0
+            latencies[index] = time.perf_counter() - started
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with status_lock:
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench-client') as executor:
+        for future in [executor.submit(client_loop) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    
+    latencies_ms = latencies * 1000
+    succeeded = sum(count for status, count in statuses.items() if 200 <= status < 300)
+    return {
+        'mode': transport.mode,
+        'endpoint': endpoint,
+        'encoding': encoding,
+        'concurrency': concurrency,
+        'requests': requests_count,
+        'request_bytes': round(float(np.mean([len(body) for body in bodies])), 1),
+        'response_bytes': round(float(sizes.mean()), 1),
+        'errors': requests_count - succeeded,
+        'status_counts': {str(status): count for status, count in sorted(statuses.items())},
+        'duration_s': round(elapsed, 4),
+        'throughput_rps': round(requests_count / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(float(latencies_ms.mean()), 3),
+            'p50': round(float(np.percentile(latencies_ms, 50)), 3),
+            'p95': round(float(np.percentile(latencies_ms, 95)), 3),
+            'p99': round(float(np.percentile(latencies_ms, 99)), 3),
+            'max': round(float(latencies_ms.max()), 3),
+        },
+        'workers': {str(pid): process_memory(pid) for pid in transport.server_pids()},
+    }
+
+
+def run_benchmark(transport, endpoints: Iterable[str], concurrency_levels: Iterable[int], requests_count: int,
+                  payload_count: int = 1000, warmup: int = 20, seed: int = 0,
+                  progress: Optional[Callable[[dict], None]] = None, encodings: Iterable[str] = (JSON_FORMAT,),
+                  batch_size: int = 100) -> List[dict]:
+    """
+    Run every endpoint in every encoding it supports at every concurrency
+    level; progress(result) is called after each run
+    """
+    runs = []
+    for endpoint in endpoints:
+        # Explain variants get other records than the plain endpoints, so their predictions are not cached yet
+        payload_seed = seed + 1 if endpoint.endswith('-explain') else seed
+        payloads = synthetic_payloads(ENDPOINTS[endpoint][1], payload_count, seed=payload_seed)
+        for encoding in encodings:
+            if not encoding_supported(endpoint, encoding):
+                continue
+            for concurrency in concurrency_levels:
+                result = run_level(transport, endpoint, payloads, concurrency, requests_count, warmup=warmup,
+                                   encoding=encoding, batch_size=batch_size)
+                runs.append(result)
+                if progress is not None:
+                    progress(result)
+    return runs
+
+
+def start_gunicorn(bind: str, workers: int, env: Dict[str, str], cwd: str, ready_timeout: float = 120.0) -> subprocess.Popen:
+    """Start `gunicorn ml_server.wsgi -c gunicorn.conf.py` and wait until the health endpoint answers"""
+    import requests
+    
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'ml_server.wsgi', '-c', 'gunicorn.conf.py'],
+        cwd=cwd,
+        env={**os.environ, **env, 'GUNICORN_BIND': bind, 'GUNICORN_WORKERS': str(workers)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    health_url = f"http://{bind}/api/ml/health/"
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode} before it was ready")
+        try:
+            if requests.get(health_url, timeout=1).status_code == 200 and len(_child_pids(process.pid)) >= workers:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    stop_gunicorn(process)
+    raise RuntimeError(f"gunicorn did not answer on {health_url} within {ready_timeout:.0f}s")
+
+
+def stop_gunicorn(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def environment_info() -> dict:
+    """Where and on what a run was made, saved with the results"""
+    from django.conf import settings
+    
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {
+            name: getattr(settings, name, None)
+            for name in ('ML_INFERENCE_BACKENDS', 'ML_PREDICTION_CACHE_SIZE', 'ML_PREDICTION_CACHE_TTL',
+                         'ML_MICRO_BATCH_MODELS', 'ML_MICRO_BATCH_WINDOW_MS', 'ML_REQUEST_LOGGING',
+                         'ML_COMPRESS_MIN_BYTES')
+        },
+    }
+
+
+def build_results(runs: List[dict], parameters: dict) -> dict:
+    return {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'parameters': parameters,
+        'runs': runs,
+    }
+
+
+def compare_results(baseline: dict, candidate: dict) -> List[dict]:
+    """
+    Side-by-side rows for the runs present in both results (matched on mode, endpoint, encoding and concurrency)
+    
+    Changes are relative to the baseline in percent; for throughput higher is
+    better, for latencies and response sizes lower is better. Runs saved
+    before encodings were benchmarked count as JSON.
+    """
+    def key(run) -> Tuple[str, str, str, int]:
+        return run['mode'], run['endpoint'], run.get('encoding', JSON_FORMAT), run['concurrency']
+    
+    baseline_runs = {key(run): run for run in baseline['runs']}
+    rows = []
+    for run in candidate['runs']:
+        before = baseline_runs.get(key(run))
+        if before is None:
+            continue
+        row = {'mode': run['mode'], 'endpoint': run['endpoint'], 'encoding': key(run)[2], 'concurrency': run['concurrency']}
+        for metric, old, new in [('throughput_rps', before['throughput_rps'], run['throughput_rps'])] + [
+            (f'{percentile}_ms', before['latency_ms'][percentile], run['latency_ms'][percentile])
+            for percentile in ('p50', 'p95', 'p99')
+        ] + [('response_bytes', before.get('response_bytes'), run.get('response_bytes'))]:
+            row[metric] = (old, new, round((new - old) / old * 100, 1) if old and new is not None else None)
+        rows.append(row)
+    return rows
@@ -0,0 +1,202 @@
+"""
+Cold-start profile of a serving worker
+
+A fresh interpreter (`python -m ml_models.boot`) imports the WSGI application
+the way gunicorn does, which sets Django up and, with ML_PRELOAD_MODELS, loads
+and warms up the models, then sends one prediction request through the WSGI
+callable. It reports when the interpreter started, when the application was
+ready and when the first response was complete, its resident memory after boot
+and after the first response, and which of the heavy optional modules it
+imported. One more boot under `-X importtime` gives the import time per
+top-level package.
+
+Profiles are saved as JSON, and check_regressions() compares one with a
+baseline profile. Used by the profile_boot management command.
+
+This module only imports the standard library, so the child process measures
+the application and not its own imports.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+PROFILE_FORMAT_VERSION = 1
+
+# Printed in front of the child's result line (the application may log to stdout)
+RESULT_MARKER = 'BOOT_PROFILE '
+
+# Modules a serving worker should not import: the admin app (with its sessions) and schema
+# generation are only loaded when enabled (ML_ENABLE_ADMIN, ML_OPENAPI_SCHEMA). The
+# django.contrib.admin package itself is always imported, by DRF's schema module
+AVOIDED_MODULES = ('drf_spectacular', 'django.contrib.auth.admin', 'django.contrib.sessions.middleware')
+
+# Reported as loaded or not after the first response. The ML libraries import pandas,
+# scipy and scikit-learn themselves when the models are unpickled
+WATCHED_MODULES = AVOIDED_MODULES + ('joblib', 'pandas', 'scipy', 'sklearn', 'lightgbm', 'xgboost')
+
+# Compared by check_regressions(): timings in seconds, memory in MiB (higher is worse)
+REGRESSION_METRICS = ('interpreter_s', 'django_ready_s', 'first_response_s', 'cold_start_s', 'rss_booted_mb', 'rss_served_mb')
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _boot_child():
+    """Child side: boot the application, serve the request read from stdin, print the measurements"""
+    started_at = time.time()
+    request = json.loads(sys.stdin.read())
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+    
+    from ml_server.wsgi import application
+    ready_at = time.time()
+    rss_booted = _rss_mb()
+    
+    from io import BytesIO
+    body = json.dumps(request['body']).encode()
+    path, _, query = request['path'].partition('?')
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'HTTP_AUTHORIZATION': f"Bearer {request['token']}",
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    responded_at = time.time()
+    
+    print(RESULT_MARKER + json.dumps({
+        'started_at': started_at,
+        'ready_at': ready_at,
+        'responded_at': responded_at,
+        'status': statuses[0] if statuses else None,
+        'rss_booted_mb': rss_booted,
+        'rss_served_mb': _rss_mb(),
+        'modules': {name: name in sys.modules for name in WATCHED_MODULES},
+    }), flush=True)
+
+
+def boot_once(request: dict, cwd: str, env: Dict[str, str], importtime: bool = False, timeout: float = 300.0):
+    """One cold start in a new interpreter: (measurements, -X importtime lines or None)"""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-m', 'ml_models.boot']
+    spawned_at = time.time()
+    completed = subprocess.run(command, input=json.dumps(request), cwd=cwd, env=env, capture_output=True,
+                               text=True, timeout=timeout)
+    result = None
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            result = json.loads(line[len(RESULT_MARKER):])
+    if completed.returncode != 0 or result is None:
+        tail = '\n'.join(completed.stderr.strip().splitlines()[-10:])
+        raise RuntimeError(f"Boot profile process exited with status {completed.returncode}:\n{tail}")
+    
+    measurement = {
+        'status': result['status'],
+        'interpreter_s': round(result['started_at'] - spawned_at, 4),
+        'django_ready_s': round(result['ready_at'] - result['started_at'], 4),
+        'first_response_s': round(result['responded_at'] - result['ready_at'], 4),
+        'cold_start_s': round(result['responded_at'] - spawned_at, 4),
+        'rss_booted_mb': result['rss_booted_mb'],
+        'rss_served_mb': result['rss_served_mb'],
+        'modules': result['modules'],
+    }
+    lines = [line for line in completed.stderr.splitlines() if line.startswith('import time:')] if importtime else None
+    return measurement, lines
+
+
+def summarize_importtime(lines: List[str], top: int = 15) -> dict:
+    """Total import time and the top-level packages that took longest (self times added up), in ms"""
+    packages = defaultdict(float)
+    modules = 0
+    for line in lines:
+        try:
+            self_us, _, name = (part.strip() for part in line[len('import time:'):].split('|'))
+            self_us = int(self_us)
+        except ValueError:
+            # The header line ("self [us] | cumulative | imported package")
+            continue
+        packages[name.split('.')[0]] += self_us / 1000
+        modules += 1
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return {
+        'modules': modules,
+        'total_ms': round(sum(packages.values()), 1),
+        'packages_ms': {name: round(elapsed, 1) for name, elapsed in ranked[:top]},
+    }
+
+
+def profile_boot(request: dict, cwd: str, env: Dict[str, str], runs: int = 3, top: int = 15,
+                 progress=None) -> dict:
+    """Median of `runs` cold starts, plus the import time summary of one more boot under -X importtime"""
+    measurements = []
+    for _ in range(runs):
+        measurement, _ = boot_once(request, cwd, env)
+        measurements.append(measurement)
+        if progress is not None:
+            progress(measurement)
+    _, lines = boot_once(request, cwd, env, importtime=True)
+    
+    summary = {}
+    for metric in REGRESSION_METRICS:
+        values = [measurement[metric] for measurement in measurements if measurement[metric] is not None]
+        summary[metric] = round(statistics.median(values), 4) if values else None
+    return {
+        'format_version': PROFILE_FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'request_path': request['path'],
+        'runs': measurements,
+        'summary': summary,
+        'modules': measurements[-1]['modules'],
+        'imports': summarize_importtime(lines, top),
+    }
+
+
+def check_regressions(baseline: dict, profile: dict, threshold_percent: float) -> List[str]:
+    """
+    Metrics of profile more than threshold_percent above the baseline, and
+    avoided modules the profile imports that the baseline did not
+    """
+    regressions = []
+    for metric in REGRESSION_METRICS:
+        old, new = baseline['summary'].get(metric), profile['summary'].get(metric)
+        if old and new is not None and new > old * (1 + threshold_percent / 100):
+            regressions.append(f"{metric} {old} -> {new} ({(new - old) / old * 100:+.1f}%, threshold {threshold_percent:g}%)")
+    for name in AVOIDED_MODULES:
+        if profile['modules'].get(name) and not baseline['modules'].get(name):
+            regressions.append(f"{name} is now imported by the serving path")
+    return regressions
+
+
+if __name__ == '__main__':
+    _boot_child()
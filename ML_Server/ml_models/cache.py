@@ -0,0 +1,182 @@
+"""
+In-process cache of prediction payloads
+
+The Express backend asks for the same patient's predictions every time a
+clinician opens the patient page, and the inputs only change when new labs
+arrive. Payloads are cached per (model, model version, canonical input record)
+with LRU eviction and a TTL, and identical requests that arrive while the
+first one is still being scored wait for its result instead of running the
+model again (single-flight).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Sequence
+
+
+class _Flight:
+    """
+    A computation in progress that other callers can wait for
+    """
+    
+    __slots__ = ('done', 'value', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+    
+    def wait(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with TTL, hit/miss counters and single-flight de-duplication
+    
+    A max_entries of 0 disables caching (every call computes), a ttl of 0 keeps
+    entries until they are evicted. Cached values are shared between callers
+    and must not be mutated.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._init_state()
+        
+        # A lock held by another thread at fork time would stay locked in the child
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._init_state)
+    
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._in_flight: Dict[Hashable, _Flight] = {}
+        self._reset_counters()
+    
+    def _reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    def configure(self, max_entries: int, ttl: float):
+        """Resize the cache and change the TTL; existing entries are dropped"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._entries.clear()
+    
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._reset_counters()
+    
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Cached value for key, computing it (once across concurrent callers) on a miss"""
+        return self.get_many([key], lambda indexes: [compute()])[0]
+    
+    def get_many(self, keys: Sequence[Hashable], compute_many: Callable[[List[int]], List[Any]]) -> List[Any]:
+        """
+        Cached values for several keys
+        
+        compute_many receives the positions (in keys) of the entries this call
+        has to compute, one position per distinct missing key, and returns
+        their values in the same order, so all misses of a batch are computed
+        together. Keys already being computed by another caller are waited for.
+        """
+        if not self.enabled:
+            return compute_many(list(range(len(keys))))
+        
+        results: List[Any] = [None] * len(keys)
+        owned: Dict[Hashable, List[int]] = {}
+        waiting = []
+        with self._lock:
+            now = self._clock()
+            for index, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at is None or expires_at > now:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        results[index] = value
+                        continue
+                    del self._entries[key]
+                    self.expirations += 1
+                
+                if key in owned:
+                    # Same record twice in one batch: compute it once
+                    owned[key].append(index)
+                    self.coalesced += 1
+                    continue
+                flight = self._in_flight.get(key)
+                if flight is not None:
+                    waiting.append((index, flight))
+                    self.coalesced += 1
+                    continue
+                self._in_flight[key] = _Flight()
+                owned[key] = [index]
+                self.misses += 1
+        
+        if owned:
+            owned_keys = list(owned)
+            try:
+                values = compute_many([owned[key][0] for key in owned_keys])
+            except BaseException as e:
+                with self._lock:
+                    flights = [self._in_flight.pop(key) for key in owned_keys]
+                for flight in flights:
+                    flight.error = e
+                    flight.done.set()
+                raise
+            
+            with self._lock:
+                expires_at = self._clock() + self.ttl if self.ttl > 0 else None
+                flights = []
+                for key, value in zip(owned_keys, values):
+                    self._entries[key] = (expires_at, value)
+                    self._entries.move_to_end(key)
+                    flights.append(self._in_flight.pop(key))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            for flight, value in zip(flights, values):
+                flight.value = value
+                flight.done.set()
+            for key, value in zip(owned_keys, values):
+                for index in owned[key]:
+                    results[index] = value
+        
+        # Wait only after publishing our own results, so two overlapping batches cannot wait on each other
+        for index, flight in waiting:
+            results[index] = flight.wait()
+        return results
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters reported by the health endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 3) if lookups else None,
+            }
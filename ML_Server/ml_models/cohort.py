@@ -0,0 +1,595 @@
+"""
+Offline cohort scoring
+
+Applies the risk models to every row of a dataset file (CSV, XLSX or
+Parquet) without going through the HTTP API. The file is read in chunks;
+each chunk is validated with the prediction serializers and scored by the
+predictors' own feature and recommendation logic in a pool of worker
+processes, each of which loads the models once. Results are written in
+input order as soon as a chunk is done, so memory stays bounded by
+(workers x chunk size) rows whatever the size of the file.
+
+Columns are matched to the prediction inputs by input name or by the
+labels of the cleaned datasets the models were trained on ('Hb (g/dL)',
+'BU - pre HD', 'Subject_ID', ...). Inputs the cleaned datasets do not
+contain are computed the way the training notebooks did: URR from the
+urea values, and Hb_diff, URR_diff and the 3-session rolling averages from
+the patient's previous rows. The latter need the rows of each patient in
+chronological order (as in the cleaned files); the last rows of every
+patient are carried from one chunk to the next.
+
+Used by the score_cohort management command.
+"""
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .features import FEATURE_SCHEMAS
+
+# Rows per chunk read, validated and scored at once
+DEFAULT_CHUNK_SIZE = 10000
+
+# Separator of the recommendations of a row in the output
+RECOMMENDATION_SEPARATOR = ' | '
+
+# Dataset labels of the inputs that are not model feature columns (the feature
+# columns are matched by their name, which is the dataset label)
+DATASET_LABELS = {
+    'patient_id': ['Subject_ID'],
+    'bu_pre_hd': ['BU - pre HD'],
+    'bu_post_hd': ['BU - post HD'],
+    'scr_pre_hd': ['SCR- pre HD (µmol/L)'],
+    'scr_post_hd': ['SCR- post HD (µmol/L)'],
+    'serum_k_pre_hd': ['Serum K Pre-HD (mmol/L)'],
+    'serum_k_post_hd': ['Serum K Post-HD (mmol/L)'],
+}
+
+# Per model: serializer path and the result attributes written as
+# <model>_predicted, <model>_status and <model>_probability
+MODEL_OUTPUTS = {
+    'dry_weight': ('ml_models.serializers.DryWeightPredictionSerializer',
+                   'dry_weight_change_predicted', 'prediction_status', 'change_probability'),
+    'urr': ('ml_models.serializers.URRPredictionSerializer', 'urr_risk_predicted', 'risk_status', 'risk_probability'),
+    'hb': ('ml_models.serializers.HbPredictionSerializer', 'hb_risk_predicted', 'risk_status', 'risk_probability'),
+}
+
+
+class DerivedInput:
+    """
+    An input computed from other columns when the file does not have it
+    
+    `lags` is the number of earlier rows of the same patient the value
+    depends on (0 for a value computed from the row alone).
+    """
+    
+    __slots__ = ('name', 'sources', 'lags', 'compute', 'description')
+    
+    def __init__(self, name: str, sources: Sequence[str], lags: int,
+                 compute: Callable[[Dict[str, np.ndarray], List[Dict[str, np.ndarray]]], np.ndarray],
+                 description: str):
+        self.name = name
+        self.sources = list(sources)
+        self.lags = lags
+        self.compute = compute
+        self.description = description
+
+
+def _urr(columns, lagged):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.round((columns['bu_pre_hd'] - columns['bu_post_hd']) / columns['bu_pre_hd'] * 100, 3)
+
+
+def _difference(source: str):
+    def compute(columns, lagged):
+        return columns[source] - lagged[0][source]
+    return compute
+
+
+def _rolling_mean(source: str):
+    # pandas rolling(3, min_periods=1).mean(): mean of the non-missing values of the window
+    def compute(columns, lagged):
+        window = np.stack([columns[source]] + [values[source] for values in lagged])
+        present = ~np.isnan(window)
+        count = present.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(count > 0, np.where(present, window, 0.0).sum(axis=0) / count, np.nan)
+    return compute
+
+
+# In dependency order (urr_diff needs urr)
+DERIVED_INPUTS = [
+    DerivedInput('urr', ['bu_pre_hd', 'bu_post_hd'], 0, _urr, '(BU pre HD - BU post HD) / BU pre HD × 100'),
+    DerivedInput('urr_diff', ['urr'], 1, _difference('urr'), 'URR - URR of the previous row of the patient'),
+    DerivedInput('hb_diff', ['hb'], 1, _difference('hb'), 'Hb - Hb of the previous row of the patient'),
+    DerivedInput('sys_avg_3', ['sys'], 2, _rolling_mean('sys'), 'mean SYS of the last 3 rows of the patient'),
+    DerivedInput('weight_gain_avg_3', ['weight_gain'], 2, _rolling_mean('weight_gain'),
+                 'mean weight gain of the last 3 rows of the patient'),
+]
+
+
+def _normalize(label: Any) -> str:
+    return ' '.join(str(label).split()).lower()
+
+
+class CohortPlan:
+    """
+    How the columns of a file map to the inputs of the models to score
+    
+    `columns` maps input names to file column labels, `derived` lists the
+    inputs computed by the scorer, in order.
+    """
+    
+    def __init__(self, model_names: List[str], columns: Dict[str, str], derived: List[DerivedInput]):
+        self.model_names = model_names
+        self.columns = columns
+        self.derived = derived
+    
+    @property
+    def history_size(self) -> int:
+        """Earlier rows of a patient the derived inputs need"""
+        return max([derived.lags for derived in self.derived], default=0)
+    
+    def describe(self) -> List[str]:
+        lines = [f"{name} <- '{label}'" for name, label in self.columns.items()]
+        lines.extend(f"{derived.name} = {derived.description}" for derived in self.derived)
+        return lines
+
+
+def _label_candidates(name: str) -> List[str]:
+    candidates = [name] + DATASET_LABELS.get(name, [])
+    for schema in FEATURE_SCHEMAS.values():
+        candidates.extend(feature.name for feature in schema.features if feature.source == name)
+    return candidates
+
+
+def plan_columns(labels: Sequence[Any], model_names: Optional[List[str]] = None,
+                 overrides: Optional[Dict[str, str]] = None) -> CohortPlan:
+    """
+    Match the column labels of a file to the inputs of the models
+    
+    Without `model_names`, every model whose inputs the file provides is
+    scored. Raises ValueError naming the missing columns of a requested
+    model, or if no model can be scored.
+    """
+    by_label = {}
+    for label in labels:
+        by_label.setdefault(_normalize(label), label)
+    overrides = overrides or {}
+    for name, label in overrides.items():
+        if _normalize(label) not in by_label:
+            raise ValueError(f"Column '{label}' given for {name} is not in the file")
+    
+    def find(name):
+        if name in overrides:
+            return by_label[_normalize(overrides[name])]
+        for candidate in _label_candidates(name):
+            label = by_label.get(_normalize(candidate))
+            if label is not None:
+                return label
+        return None
+    
+    columns = {}
+    derived = []
+    available = set()
+    
+    def resolve(name, patient_available):
+        # True if the input is in the file or can be derived from it
+        if name in available:
+            return True
+        label = find(name)
+        if label is not None:
+            columns[name] = label
+            available.add(name)
+            return True
+        for candidate in DERIVED_INPUTS:
+            if candidate.name == name and (candidate.lags == 0 or patient_available):
+                if all(resolve(source, patient_available) for source in candidate.sources):
+                    derived.append(candidate)
+                    available.add(name)
+                    return True
+        return False
+    
+    patient_available = resolve('patient_id', False)
+    schemas = FEATURE_SCHEMAS if model_names is None else {name: FEATURE_SCHEMAS[name] for name in model_names}
+    scored = []
+    for model_name, schema in schemas.items():
+        missing = [field.name for field in schema.inputs if field.required and not resolve(field.name, patient_available)]
+        # Optional inputs with a fallback are used when present or derivable
+        for field in schema.numeric_inputs:
+            if not field.required and field.fallback is not None:
+                resolve(field.name, patient_available)
+        if not missing:
+            scored.append(model_name)
+        elif model_names is not None:
+            labels_hint = ', '.join(f"{name} ('{_label_candidates(name)[-1]}')" for name in missing)
+            raise ValueError(f"Cannot score {model_name}: no column for {labels_hint}")
+    if not scored:
+        raise ValueError(f"The file has the inputs of none of the models ({', '.join(FEATURE_SCHEMAS)})")
+    
+    used = {name for name in columns if name == 'patient_id'}
+    needed = set()
+    for model_name in scored:
+        needed.update(field.name for field in FEATURE_SCHEMAS[model_name].inputs)
+    for candidate in reversed(derived):
+        if candidate.name in needed:
+            needed.update(candidate.sources)
+    used.update(name for name in columns if name in needed)
+    return CohortPlan(
+        scored,
+        {name: label for name, label in columns.items() if name in used},
+        [candidate for candidate in derived if candidate.name in needed],
+    )
+
+
+class PatientHistory:
+    """
+    Last rows of every patient, carried across chunks for the derived inputs
+    
+    Memory is bounded by (patients x history size) values.
+    """
+    
+    def __init__(self, plan: CohortPlan):
+        self.size = plan.history_size
+        self.sources = sorted({source for derived in plan.derived if derived.lags for source in derived.sources})
+        self._rows: Dict[Any, deque] = {}
+    
+    def lagged(self, patients: np.ndarray, columns: Dict[str, np.ndarray]) -> List[Dict[str, np.ndarray]]:
+        """
+        Values of the sources 1..size rows earlier for the same patient
+        (NaN where there is no such row), then remember the chunk's rows
+        """
+        count = len(patients)
+        missing = [np.nan] * len(self.sources)
+        earlier_rows = [[missing] * count for _ in range(self.size)]
+        values = np.column_stack([columns[source] for source in self.sources]).tolist() if count else []
+        rows = self._rows
+        for position, (patient, row) in enumerate(zip(patients.tolist(), values)):
+            # Rows without a patient have no history
+            if not isinstance(patient, str):
+                continue
+            history = rows.get(patient)
+            if history is None:
+                history = rows[patient] = deque(maxlen=self.size)
+            for lag, earlier in enumerate(reversed(history)):
+                earlier_rows[lag][position] = earlier
+            history.append(row)
+        
+        lagged = []
+        for lag_rows in earlier_rows:
+            matrix = np.array(lag_rows, dtype=np.float64).reshape(count, len(self.sources))
+            lagged.append({source: matrix[:, offset] for offset, source in enumerate(self.sources)})
+        return lagged
+
+
+def prepare_chunk(frame: pd.DataFrame, plan: CohortPlan, history: Optional[PatientHistory]) -> pd.DataFrame:
+    """Rename the file columns to input names and compute the derived inputs"""
+    frame = frame.rename(columns={label: name for name, label in plan.columns.items()})
+    if 'patient_id' in frame:
+        patients = frame['patient_id']
+        frame['patient_id'] = patients.where(patients.isna(), patients.astype(str))
+    if not plan.derived:
+        return frame
+    
+    derived_names = {derived.name for derived in plan.derived}
+    columns = {}
+    for derived in plan.derived:
+        for source in derived.sources:
+            if source not in columns and source not in derived_names:
+                columns[source] = pd.to_numeric(frame[source], errors='coerce').to_numpy(dtype=np.float64)
+    # Inputs derived from the row alone first: the history ones may read them
+    for derived in plan.derived:
+        if not derived.lags:
+            columns[derived.name] = derived.compute(columns, [])
+    if history is not None:
+        lagged = history.lagged(frame['patient_id'].to_numpy(dtype=object), columns)
+        for derived in plan.derived:
+            if derived.lags:
+                columns[derived.name] = derived.compute(columns, lagged)
+    for derived in plan.derived:
+        frame[derived.name] = columns[derived.name]
+    return frame
+
+
+def _open_xlsx(path: str, sheet: Optional[str]):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError('Reading XLSX files requires openpyxl (pip install openpyxl)')
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    return workbook, (workbook[sheet] if sheet else workbook.active)
+
+
+def _parquet_file(path: str):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError('Reading Parquet files requires pyarrow (pip install pyarrow)')
+    return pyarrow.parquet.ParquetFile(path)
+
+
+def file_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    formats = {'.csv': 'csv', '.xlsx': 'xlsx', '.xlsm': 'xlsx', '.parquet': 'parquet', '.pq': 'parquet'}
+    if extension not in formats:
+        raise ValueError(f"Unsupported file type '{extension}' (expected .csv, .xlsx or .parquet)")
+    return formats[extension]
+
+
+def read_header(path: str, sheet: Optional[str] = None) -> Tuple[List[Any], Optional[int]]:
+    """Column labels of a dataset file and its row count when known without reading it"""
+    kind = file_format(path)
+    if kind == 'csv':
+        return list(pd.read_csv(path, nrows=0).columns), None
+    if kind == 'parquet':
+        parquet = _parquet_file(path)
+        return list(parquet.schema_arrow.names), parquet.metadata.num_rows
+    workbook, worksheet = _open_xlsx(path, sheet)
+    try:
+        header = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        total = worksheet.max_row - 1 if worksheet.max_row else None
+        return [label for label in header if label is not None], total
+    finally:
+        workbook.close()
+
+
+def read_chunks(path: str, labels: List[str], chunk_size: int, sheet: Optional[str] = None,
+                text_labels: Sequence[str] = ()) -> Iterator[pd.DataFrame]:
+    """The given columns of a dataset file, `chunk_size` rows at a time (`text_labels` are read as strings in CSV)"""
+    kind = file_format(path)
+    if kind == 'csv':
+        yield from pd.read_csv(path, usecols=labels, chunksize=chunk_size, dtype={label: str for label in text_labels})
+    elif kind == 'parquet':
+        for batch in _parquet_file(path).iter_batches(batch_size=chunk_size, columns=labels):
+            yield batch.to_pandas()
+    else:
+        workbook, worksheet = _open_xlsx(path, sheet)
+        try:
+            rows = worksheet.iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            positions = [header.index(label) for label in labels]
+            chunk = []
+            for row in rows:
+                if not any(cell is not None for cell in row):
+                    continue
+                chunk.append([row[position] if position < len(row) else None for position in positions])
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame.from_records(chunk, columns=labels, coerce_float=True)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame.from_records(chunk, columns=labels, coerce_float=True)
+        finally:
+            workbook.close()
+
+
+def output_columns(model_names: List[str], recommendations: bool) -> Dict[str, str]:
+    """Output column names and their types (int, str, bool, float)"""
+    columns = {'row': 'int', 'patient_id': 'str'}
+    for model_name in model_names:
+        columns.update({
+            f'{model_name}_predicted': 'bool',
+            f'{model_name}_status': 'str',
+            f'{model_name}_probability': 'float',
+            f'{model_name}_confidence': 'float',
+        })
+        if recommendations:
+            columns[f'{model_name}_recommendations'] = 'str'
+        columns[f'{model_name}_error'] = 'str'
+    return columns
+
+
+class CsvResultWriter:
+    """
+    Appends result chunks to a CSV file
+    """
+    
+    def __init__(self, path: str, columns: Dict[str, str]):
+        self.path = path
+        self.columns = list(columns)
+        self._header = True
+    
+    def write(self, frame: pd.DataFrame):
+        frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False,
+                     columns=self.columns)
+        self._header = False
+    
+    def close(self):
+        if self._header:
+            pd.DataFrame(columns=self.columns).to_csv(self.path, index=False)
+
+
+class ParquetResultWriter:
+    """
+    Appends result chunks to a Parquet file, one row group per chunk
+    """
+    
+    def __init__(self, path: str, columns: Dict[str, str]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError('Writing Parquet files requires pyarrow (pip install pyarrow)')
+        types = {'int': pyarrow.int64(), 'str': pyarrow.string(), 'bool': pyarrow.bool_(), 'float': pyarrow.float64()}
+        self._pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns.items()])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+    
+    def write(self, frame: pd.DataFrame):
+        self._writer.write_table(self._pyarrow.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+    
+    def close(self):
+        self._writer.close()
+
+
+def result_writer(path: str, columns: Dict[str, str]):
+    kind = file_format(path)
+    if kind == 'xlsx':
+        raise ValueError('Results are written as .csv or .parquet')
+    return ParquetResultWriter(path, columns) if kind == 'parquet' else CsvResultWriter(path, columns)
+
+
+# State of a scoring process (the command's process with --workers 1, else every pool worker)
+_worker = {}
+
+
+def init_worker(model_names: List[str], recommendations: bool, latency_tier: Optional[str] = None):
+    """Load the models once per process (limited to the boosting rounds of a latency tier, if given)"""
+    # Forked workers inherit the configured Django; spawned ones set it up again
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+        django.setup()
+    from django.utils.module_loading import import_string
+    
+    from . import services
+    predictors = {
+        'dry_weight': services.dry_weight_predictor,
+        'urr': services.urr_predictor,
+        'hb': services.hb_predictor,
+    }
+    _worker.clear()
+    _worker['recommendations'] = recommendations
+    _worker['models'] = []
+    for model_name in model_names:
+        serializer_path, predicted, status, probability = MODEL_OUTPUTS[model_name]
+        loaded = services.model_manager.get_loaded(model_name)
+        if latency_tier is not None:
+            loaded = loaded.for_tier(latency_tier)
+        _worker['models'].append(
+            (model_name, predictors[model_name], loaded, import_string(serializer_path), predicted, status, probability)
+        )
+
+
+def score_chunk(start: int, frame: pd.DataFrame) -> pd.DataFrame:
+    """Validate and score one chunk with every model of the worker"""
+    from .validation import input_validation
+    
+    # Missing cells are missing values (NaN) in every file format, as in training
+    records = frame.replace({None: np.nan}).to_dict('records')
+    if 'patient_id' in frame:
+        for record in records:
+            if not isinstance(record['patient_id'], str):
+                del record['patient_id']
+    count = len(records)
+    output = {'row': np.arange(start, start + count, dtype=np.int64)}
+    output['patient_id'] = frame['patient_id'].to_numpy(dtype=object) if 'patient_id' in frame else [None] * count
+    
+    for model_name, predictor, loaded, serializer_class, predicted, status, probability in _worker['models']:
+        validated, errors = input_validation.validate_many(serializer_class, records)
+        valid = [index for index, data in enumerate(validated) if data is not None]
+        results = predictor._predict_loaded(loaded, [validated[index] for index in valid]) if valid else []
+        
+        predicted_column = [None] * count
+        status_column = [None] * count
+        probability_column = np.full(count, np.nan)
+        confidence_column = np.full(count, np.nan)
+        for index, result in zip(valid, results):
+            predicted_column[index] = getattr(result, predicted)
+            status_column[index] = getattr(result, status)
+            probability_column[index] = getattr(result, probability)
+            confidence_column[index] = result.confidence_score
+        output[f'{model_name}_predicted'] = pd.array(predicted_column, dtype='boolean')
+        output[f'{model_name}_status'] = status_column
+        output[f'{model_name}_probability'] = probability_column
+        output[f'{model_name}_confidence'] = confidence_column
+        if _worker['recommendations']:
+            recommendations_column = [None] * count
+            for index, result in zip(valid, results):
+                recommendations_column[index] = RECOMMENDATION_SEPARATOR.join(result.recommendations)
+            output[f'{model_name}_recommendations'] = recommendations_column
+        output[f'{model_name}_error'] = [
+            None if error is None else json.dumps(error, ensure_ascii=False) for error in errors
+        ]
+    return pd.DataFrame(output)
+
+
+def score_cohort(input_path: str, output_path: str, model_names: Optional[List[str]] = None,
+                 columns: Optional[Dict[str, str]] = None, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1,
+                 recommendations: bool = False, sheet: Optional[str] = None,
+                 plan_ready: Optional[Callable[[CohortPlan], None]] = None,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 progress_interval: float = 5.0, latency_tier: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Score every row of `input_path` and write the results to `output_path`,
+    with the full models or the boosting rounds of `latency_tier`
+    
+    With workers > 1, chunks are scored in a process pool with at most two
+    chunks per worker in flight. `progress` is called with the running
+    totals at most every `progress_interval` seconds. Returns the final
+    totals.
+    """
+    labels, total = read_header(input_path, sheet)
+    plan = plan_columns(labels, model_names, columns)
+    if plan_ready is not None:
+        plan_ready(plan)
+    history = PatientHistory(plan) if plan.history_size else None
+    writer = result_writer(output_path, output_columns(plan.model_names, recommendations))
+    
+    stats = {'rows': 0, 'total': total, 'chunks': 0, 'models': plan.model_names,
+             'failed': {model_name: 0 for model_name in plan.model_names}}
+    started = time.perf_counter()
+    last_report = [started]
+    
+    def collect(result: pd.DataFrame):
+        writer.write(result)
+        stats['rows'] += len(result)
+        stats['chunks'] += 1
+        for model_name in plan.model_names:
+            stats['failed'][model_name] += int(result[f'{model_name}_error'].notna().sum())
+        now = time.perf_counter()
+        if progress is not None and now - last_report[0] >= progress_interval:
+            last_report[0] = now
+            progress(_progress(stats, now - started))
+    
+    # Patient identifiers stay text; everything else is parsed as pandas would
+    text_labels = [plan.columns['patient_id']] if 'patient_id' in plan.columns else []
+    frames = read_chunks(input_path, list(plan.columns.values()), chunk_size, sheet, text_labels)
+    chunks = (prepare_chunk(frame, plan, history) for frame in frames)
+    try:
+        if workers <= 1:
+            init_worker(plan.model_names, recommendations, latency_tier)
+            start = 0
+            for frame in chunks:
+                collect(score_chunk(start, frame))
+                start += len(frame)
+        else:
+            with ProcessPoolExecutor(workers, initializer=init_worker,
+                                     initargs=(plan.model_names, recommendations, latency_tier)) as executor:
+                # Results are written in input order; the reader stays at most 2 chunks per worker ahead
+                pending = deque()
+                start = 0
+                for frame in chunks:
+                    pending.append(executor.submit(score_chunk, start, frame))
+                    start += len(frame)
+                    while len(pending) >= 2 * workers or (pending and pending[0].done()):
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+    finally:
+        writer.close()
+    
+    summary = _progress(stats, time.perf_counter() - started)
+    summary['models'] = plan.model_names
+    return summary
+
+
+def _progress(stats: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    rows_per_second = stats['rows'] / elapsed if elapsed > 0 else 0.0
+    remaining = None
+    if stats['total'] and rows_per_second:
+        remaining = max(stats['total'] - stats['rows'], 0) / rows_per_second
+    return {
+        'rows': stats['rows'],
+        'total': stats['total'],
+        'chunks': stats['chunks'],
+        'elapsed_s': round(elapsed, 2),
+        'rows_per_second': round(rows_per_second, 1),
+        'eta_s': None if remaining is None else round(remaining, 1),
+        'failed': dict(stats['failed']),
+    }
@@ -0,0 +1,107 @@
+"""
+Direct JSON encoding of prediction responses
+
+Rendering a prediction used to run the payload dict through its response
+serializer (which re-walks and re-converts every field) and then through
+DRF's JSONRenderer. ResultEncoder writes the typed results of
+ml_models.results straight to bytes with the C-accelerated json encoder and
+gives the exact output of that pipeline: keys in serializer order, compact
+separators, non-ASCII characters kept (UNICODE_JSON) except U+2028/U+2029,
+no NaN/Infinity (STRICT_JSON) and prediction dates as naive ISO 8601
+strings. NumPy scalars and arrays are written as the Python values they hold.
+
+Batch responses can be produced chunk by chunk (iter_batch_response), so a
+large batch is streamed instead of being rendered as one string.
+"""
+import json
+import math
+from datetime import date
+from operator import attrgetter
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from .results import PredictionResult
+
+# Results encoded per chunk of a streamed batch response
+BATCH_CHUNK_SIZE = 64
+
+
+class ResultEncoder(json.JSONEncoder):
+    """
+    JSON encoder of prediction results with the settings of DRF's JSONRenderer
+    """
+    
+    def __init__(self):
+        super().__init__(ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+        # Per result class: (field names, getter returning their values)
+        self._fields = {}
+    
+    def default(self, value: Any) -> Any:
+        if isinstance(value, PredictionResult):
+            fields = self._fields.get(type(value))
+            if fields is None:
+                fields = self._fields[type(value)] = (value.FIELDS, attrgetter(*value.FIELDS))
+            payload = dict(zip(fields[0], fields[1](value)))
+            if value.latency_tier is not None:
+                payload['latency_tier'] = value.latency_tier
+            if value.explanation is not None:
+                payload['explanation'] = value.explanation
+            if value.index is not None:
+                payload['index'] = value.index
+            return payload
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, (np.generic, np.ndarray)):
+            return value.tolist()
+        return super().default(value)
+    
+    def encode_bytes(self, value: Any) -> bytes:
+        """UTF-8 JSON of a value, with U+2028/U+2029 escaped like JSONRenderer does"""
+        return _escape_separators(self.encode(value)).encode('utf-8')
+
+
+def _escape_separators(text: str) -> str:
+    # Valid JSON but not valid JavaScript string content
+    if '\u2028' in text or '\u2029' in text:
+        text = text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+    return text
+
+
+def encode_result(result: PredictionResult) -> bytes:
+    """Response body of a single-record prediction"""
+    return result_encoder.encode_bytes(result)
+
+
+def check_results(results: Sequence[PredictionResult]):
+    """Raise ValueError if a result cannot be encoded, before any of a streamed response is sent"""
+    for result in results:
+        for name in result.FLOAT_FIELDS:
+            if not math.isfinite(getattr(result, name)):
+                raise ValueError(f"Out of range float value in '{name}' is not JSON compliant")
+
+
+def iter_batch_response(total: int, results: Sequence[PredictionResult], errors: List[Dict[str, Any]],
+                        chunk_size: int = BATCH_CHUNK_SIZE) -> Iterator[bytes]:
+    """Body of a batch prediction response, `chunk_size` results at a time"""
+    yield f'{{"total":{total},"succeeded":{len(results)},"failed":{len(errors)},"results":['.encode('utf-8')
+    for start in range(0, len(results), chunk_size):
+        # Encode the chunk as a list and drop its brackets
+        text = _escape_separators(result_encoder.encode(results[start:start + chunk_size])[1:-1])
+        yield (text if start == 0 else ',' + text).encode('utf-8')
+    yield b'],"errors":' + result_encoder.encode_bytes(errors) + b'}'
+
+
+def encode_batch_response(total: int, results: Sequence[PredictionResult], errors: List[Dict[str, Any]]) -> bytes:
+    """Body of a batch prediction response in one piece"""
+    return result_encoder.encode_bytes({
+        'total': total,
+        'succeeded': len(results),
+        'failed': len(errors),
+        'results': results,
+        'errors': errors
+    })
+
+
+# Global encoder instance (stateless apart from its per-class field cache)
+result_encoder = ResultEncoder()
@@ -0,0 +1,96 @@
+"""
+Per-feature explanations of predictions
+
+Contributions come from the models' own TreeSHAP output (LightGBM
+pred_contrib, XGBoost pred_contribs): for every row, a booster's log-odds is
+its bias plus one contribution per feature. Responses give them on the
+probability scale. The log-odds contributions of each booster are scaled so
+that they add up to its probability minus the probability of its bias. The
+members of the Hb ensemble are then combined with the bundle weights, like
+their probabilities. So base_probability plus the contributions of a
+prediction is its risk probability (up to rounding).
+
+Contributions depend only on the model snapshot and the feature row, so the
+predictors cache the explanation of every row they compute (see
+services._explain_cached).
+"""
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Decimals of the contributions, feature values and base probability in responses
+EXPLANATION_DECIMALS = 4
+
+
+def _margin_contributions(model, X: np.ndarray, iterations: Optional[int] = None) -> np.ndarray:
+    """Native log-odds contributions of a LightGBM/XGBoost classifier, bias last"""
+    booster = getattr(model, 'booster_', None)
+    if booster is not None:
+        return booster.predict(X, num_iteration=iterations, pred_contrib=True)
+    if not hasattr(model, 'get_booster'):
+        raise ValueError(f"Explanations need a LightGBM or XGBoost model (got {type(model).__name__})")
+    import xgboost
+    booster = model.get_booster()
+    if iterations is None:
+        # Up to the best iteration, as XGBClassifier.predict_proba (0: all rounds)
+        best_iteration = booster.attr('best_iteration')
+        iterations = int(best_iteration) + 1 if best_iteration is not None else 0
+    matrix = xgboost.DMatrix(X, feature_names=booster.feature_names)
+    return booster.predict(matrix, pred_contribs=True, iteration_range=(0, iterations))
+
+
+def _sigmoid(values: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-values))
+
+
+def probability_contributions(model, X: np.ndarray, iterations: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-feature contributions to the positive-class probability of every row
+    of X, and the probability of the model's bias (rows x features, rows)
+    """
+    raw = np.asarray(_margin_contributions(model, X, iterations), dtype=np.float64)
+    contributions, bias = raw[:, :-1], raw[:, -1]
+    margin = raw.sum(axis=1)
+    probability, base = _sigmoid(margin), _sigmoid(bias)
+    # Secant of the sigmoid between bias and margin (its slope where they meet)
+    delta = margin - bias
+    moved = np.abs(delta) > 1e-12
+    scale = np.where(moved, (probability - base) / np.where(moved, delta, 1.0), base * (1.0 - base))
+    return contributions * scale[:, None], base
+
+
+def ensemble_contributions(members: Sequence[Any], weights: Sequence[float], X: np.ndarray,
+                           iterations: Optional[List[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Contributions and base probability of a weighted soft-voting ensemble"""
+    iterations = iterations or [None] * len(members)
+    total, base = None, 0.0
+    for member, weight, count in zip(members, weights, iterations):
+        contributions, member_base = probability_contributions(member, X, count)
+        total = weight * contributions if total is None else total + weight * contributions
+        base = base + weight * member_base
+    return total, base
+
+
+def explanation_payloads(feature_names: Sequence[str], X: np.ndarray, contributions: np.ndarray,
+                         base: np.ndarray) -> List[Dict[str, Any]]:
+    """Explanation of every row, features ordered by the size of their contribution"""
+    order = np.argsort(-np.abs(contributions), axis=1, kind='stable')
+    contributions = np.round(contributions, EXPLANATION_DECIMALS).tolist()
+    values = np.round(X, EXPLANATION_DECIMALS).tolist()
+    base = np.round(base, EXPLANATION_DECIMALS).tolist()
+    payloads = []
+    for row, columns in enumerate(order.tolist()):
+        row_values, row_contributions = values[row], contributions[row]
+        payloads.append({
+            'base_probability': base[row],
+            'contributions': [
+                {
+                    'feature': feature_names[column],
+                    'value': None if math.isnan(row_values[column]) else row_values[column],
+                    'contribution': row_contributions[column],
+                }
+                for column in columns
+            ],
+        })
+    return payloads
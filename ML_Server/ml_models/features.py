@@ -0,0 +1,329 @@
+"""
+Declarative feature schemas for the ML models
+
+Each model's inputs, derived features and column order are described once
+here. The schema is compiled into a FeatureBuilder that turns validated
+records into a NumPy feature matrix (one row per record) with vectorized
+column operations, and the same schema drives the /api/ml/models/ description.
+"""
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class InputField:
+    """
+    A raw input parameter of a prediction request
+    Optional fields fall back to another (required) field when missing.
+    Non-numeric fields (identifiers) are documented but never enter the matrix.
+    """
+    
+    __slots__ = ('name', 'required', 'fallback', 'numeric')
+    
+    def __init__(self, name: str, required: bool = True, fallback: Optional[str] = None, numeric: bool = True):
+        self.name = name
+        self.required = required
+        self.fallback = fallback
+        self.numeric = numeric
+    
+    @property
+    def label(self) -> str:
+        return self.name if self.required else f"{self.name} (optional)"
+
+
+class Feature:
+    """
+    A model column, either copied from an input field or derived from several
+    input columns by a vectorized function
+    """
+    
+    __slots__ = ('name', 'source', 'compute', 'description')
+    
+    def __init__(self, name: str, source: Optional[str] = None,
+                 compute: Optional[Callable[[Dict[str, np.ndarray]], np.ndarray]] = None,
+                 description: Optional[str] = None):
+        if (source is None) == (compute is None):
+            raise ValueError(f"Feature {name} needs exactly one of source or compute")
+        self.name = name
+        self.source = source
+        self.compute = compute
+        self.description = description
+    
+    @property
+    def is_derived(self) -> bool:
+        return self.description is not None
+
+
+class FeatureSchema:
+    """
+    Inputs and ordered features of one model
+    """
+    
+    def __init__(self, model_name: str, inputs: Sequence[InputField], features: Sequence[Feature],
+                 feature_engineering: str, calculated_order: Optional[Sequence[str]] = None):
+        self.model_name = model_name
+        self.inputs = list(inputs)
+        self.features = list(features)
+        self.feature_engineering = feature_engineering
+        # Order in which derived features are documented (defaults to column order)
+        self.calculated_order = list(calculated_order) if calculated_order else None
+        self._key_fields = [(field.name, field.numeric) for field in self.inputs]
+    
+    @property
+    def feature_names(self) -> List[str]:
+        return [feature.name for feature in self.features]
+    
+    @property
+    def numeric_inputs(self) -> List[InputField]:
+        return [field for field in self.inputs if field.numeric]
+    
+    def record_key(self, record: Dict[str, Any]) -> Tuple:
+        """
+        Hashable canonical form of a validated record's inputs (numbers as floats,
+        missing optional inputs as None), used as the prediction cache key
+        """
+        return tuple(
+            None if record.get(name) is None else (float(record[name]) if numeric else record[name])
+            for name, numeric in self._key_fields
+        )
+    
+    def compile(self, dtype=np.float64) -> 'FeatureBuilder':
+        """Compile the schema into a builder producing `dtype` feature matrices"""
+        return FeatureBuilder(self, dtype)
+    
+    def describe(self) -> Dict[str, Any]:
+        """Feature description used by the models info endpoint"""
+        derived = {feature.name: feature for feature in self.features if feature.is_derived}
+        calculated_order = self.calculated_order or list(derived)
+        return {
+            'input_parameters': [field.label for field in self.inputs],
+            'feature_order': [f"{position}. {name}" for position, name in enumerate(self.feature_names, 1)],
+            'calculated_features': [f"{name} ({derived[name].description})" for name in calculated_order],
+            'total_features': len(self.features),
+            'feature_engineering': self.feature_engineering,
+        }
+
+
+class ColumnarRecords(list):
+    """
+    Validated records that also carry their numeric inputs as float64 columns
+    (NaN where a record has no value), e.g. from an Arrow batch
+    
+    FeatureBuilder reads the columns instead of the record dicts; a NaN cell
+    is looked up in its record, which may have been completed after
+    validation (patient history).
+    """
+    
+    def __init__(self, records: Sequence[Dict[str, Any]], columns: Dict[str, np.ndarray]):
+        super().__init__(records)
+        self.columns = columns
+    
+    def take(self, indexes: Sequence[int]) -> 'ColumnarRecords':
+        """The records at `indexes`, with their columns"""
+        return ColumnarRecords([self[index] for index in indexes],
+                               {name: column[indexes] for name, column in self.columns.items()})
+
+
+class FeatureBuilder:
+    """
+    Compiled form of a FeatureSchema
+    
+    Input values are gathered into one preallocated float64 matrix (a single
+    C-level itemgetter call per record), then every model column is written in
+    place into the output matrix with vectorized operations, so one record and
+    thousands of records go through exactly the same code path.
+    """
+    
+    def __init__(self, schema: FeatureSchema, dtype=np.float64):
+        self.schema = schema
+        self.dtype = np.dtype(dtype)
+        self.feature_names = schema.feature_names
+        self.n_features = len(self.feature_names)
+        
+        numeric_inputs = schema.numeric_inputs
+        self._required = [field.name for field in numeric_inputs if field.required]
+        self._optional = [field for field in numeric_inputs if not field.required]
+        self._column_index = {name: index for index, name in enumerate(self._required)}
+        for offset, field in enumerate(self._optional):
+            self._column_index[field.name] = len(self._required) + offset
+        self._n_inputs = len(self._column_index)
+        
+        getter = itemgetter(*self._required)
+        # itemgetter returns a bare value instead of a tuple for a single key
+        self._get_required = getter if len(self._required) > 1 else (lambda record: (getter(record),))
+    
+    def build(self, records: Sequence[Dict[str, Any]], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Build the (len(records), n_features) feature matrix"""
+        return self.build_with_inputs(records, out)[0]
+    
+    def build_with_inputs(self, records: Sequence[Dict[str, Any]],
+                          out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Build the feature matrix and return it with the float64 input columns (optional inputs filled in)"""
+        n_rows = len(records)
+        if out is None:
+            out = np.empty((n_rows, self.n_features), dtype=self.dtype)
+        
+        raw = np.empty((n_rows, self._n_inputs), dtype=np.float64)
+        columns = {name: raw[:, index] for name, index in self._column_index.items()}
+        if isinstance(records, ColumnarRecords):
+            self._fill_columns(records, columns)
+        else:
+            n_required = len(self._required)
+            raw[:, :n_required] = [self._get_required(record) for record in records]
+            for field in self._optional:
+                columns[field.name][:] = [record.get(field.name, np.nan) for record in records]
+        
+        for field in self._optional:
+            column = columns[field.name]
+            missing = np.isnan(column)
+            if missing.any():
+                column[missing] = columns[field.fallback][missing]
+        
+        for index, feature in enumerate(self.schema.features):
+            if feature.source is not None:
+                out[:, index] = columns[feature.source]
+            else:
+                out[:, index] = feature.compute(columns)
+        return out, columns
+    
+    @staticmethod
+    def _fill_columns(records: ColumnarRecords, columns: Dict[str, np.ndarray]):
+        """Copy the input columns of columnar records, taking their NaN cells from the record dicts"""
+        for name, column in columns.items():
+            source = records.columns.get(name)
+            if source is None:
+                column[:] = [record.get(name, np.nan) for record in records]
+                continue
+            column[:] = source
+            for position in np.flatnonzero(np.isnan(column)).tolist():
+                column[position] = records[position].get(name, np.nan)
+    
+    def build_one(self, record: Dict[str, Any]) -> np.ndarray:
+        """Build the feature vector of a single record"""
+        return self.build([record])[0]
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """numerator / denominator where valid, 0 elsewhere"""
+    result = np.zeros_like(numerator, dtype=np.float64)
+    np.divide(numerator, denominator, out=result, where=valid)
+    return result
+
+
+def _ufr(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    # UFR calculation: PUF (ml) / (HD duration (h) × Pre HD weight (kg))
+    denominator = columns['hd_duration'] * columns['pre_hd_weight']
+    return _safe_divide(columns['puf'], denominator, denominator > 0)
+
+
+def _weight_gain_pct(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    dry_weight = columns['dry_weight']
+    return _safe_divide(columns['weight_gain'], dry_weight, dry_weight > 0) * 100
+
+
+def _albumin_bu_ratio(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    bu_pre_hd = columns['bu_pre_hd']
+    return _safe_divide(columns['albumin'], bu_pre_hd + 1, bu_pre_hd != 0)
+
+
+def _k_diff(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    return columns['serum_k_pre_hd'] - columns['serum_k_post_hd']
+
+
+def _bu_diff(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    return columns['bu_pre_hd'] - columns['bu_post_hd']
+
+
+def _scr_diff(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    return columns['scr_pre_hd'] - columns['scr_post_hd']
+
+
+DRY_WEIGHT_SCHEMA = FeatureSchema(
+    'dry_weight',
+    inputs=[
+        InputField('patient_id', numeric=False),
+        InputField('ap'), InputField('auf'), InputField('bfr'), InputField('hd_duration'),
+        InputField('puf'), InputField('tmp'), InputField('vp'), InputField('weight_gain'),
+        InputField('sys'), InputField('dia'), InputField('pre_hd_weight'), InputField('post_hd_weight'),
+        InputField('dry_weight'),
+        # Rolling averages (use current session values if not provided)
+        InputField('weight_gain_avg_3', required=False, fallback='weight_gain'),
+        InputField('sys_avg_3', required=False, fallback='sys'),
+    ],
+    features=[
+        Feature('SYS_avg_3', source='sys_avg_3',
+                description='3-session rolling average of SYS, uses current if not provided'),
+        Feature('VP (mmHg)', source='vp'),
+        Feature('AP (mmHg)', source='ap'),
+        Feature('Pre HD weight (kg)', source='pre_hd_weight'),
+        Feature('Weight_gain_avg_3', source='weight_gain_avg_3',
+                description='3-session rolling average of Weight gain, uses current if not provided'),
+        Feature('SYS (mmHg)', source='sys'),
+        Feature('Post HD weight (kg)', source='post_hd_weight'),
+        Feature('Weight_gain_pct', compute=_weight_gain_pct, description='(Weight gain / Dry weight) × 100'),
+        Feature('UFR', compute=_ufr, description='PUF / (HD duration × Pre HD weight)'),
+        Feature('TMP (mmHg)', source='tmp'),
+        Feature('DIA (mmHg)', source='dia'),
+        Feature('Dry weight (kg)', source='dry_weight'),
+        Feature('Weight gain (kg)', source='weight_gain'),
+        Feature('AUF (ml)', source='auf'),
+        Feature('PUF (ml)', source='puf'),
+        Feature('BFR (ml/min)', source='bfr'),
+        Feature('High_SBP', compute=lambda columns: columns['sys'] > 140, description='1 if SYS > 140, else 0'),
+        Feature('HD duration (h)', source='hd_duration'),
+        Feature('UFR_below_15', compute=lambda columns: _ufr(columns) < 15, description='1 if UFR < 15, else 0'),
+    ],
+    feature_engineering='Server automatically calculates 6 derived features from 13 original dialysis parameters',
+    calculated_order=['High_SBP', 'UFR', 'UFR_below_15', 'Weight_gain_pct', 'SYS_avg_3', 'Weight_gain_avg_3']
+)
+
+URR_SCHEMA = FeatureSchema(
+    'urr',
+    inputs=[
+        InputField('patient_id', required=False, numeric=False),
+        InputField('albumin'), InputField('hb'), InputField('s_ca'), InputField('serum_na_pre_hd'),
+        InputField('urr'), InputField('urr_diff'), InputField('serum_k_pre_hd'), InputField('serum_k_post_hd'),
+        InputField('bu_pre_hd'), InputField('bu_post_hd'), InputField('scr_pre_hd'), InputField('scr_post_hd'),
+    ],
+    features=[
+        Feature('Albumin (g/L)', source='albumin'),
+        Feature('Hb (g/dL)', source='hb'),
+        Feature('S Ca (mmol/L)', source='s_ca'),
+        Feature('Serum Na Pre-HD (mmol/L)', source='serum_na_pre_hd'),
+        Feature('URR', source='urr'),
+        Feature('URR_diff', source='urr_diff'),
+        Feature('K_Diff', compute=_k_diff, description='serum_k_pre_hd - serum_k_post_hd'),
+        Feature('BU_Diff', compute=_bu_diff, description='bu_pre_hd - bu_post_hd'),
+        Feature('SCR_Diff', compute=_scr_diff, description='scr_pre_hd - scr_post_hd'),
+    ],
+    feature_engineering='Server automatically calculates URR and 3 difference features from laboratory parameters'
+)
+
+HB_SCHEMA = FeatureSchema(
+    'hb',
+    inputs=[
+        InputField('albumin'), InputField('bu_post_hd'), InputField('bu_pre_hd'), InputField('s_ca'),
+        InputField('scr_post_hd'), InputField('scr_pre_hd'), InputField('serum_k_post_hd'), InputField('serum_k_pre_hd'),
+        InputField('serum_na_pre_hd'), InputField('ua'), InputField('hb_diff'), InputField('hb'),
+    ],
+    features=[
+        Feature('Albumin (g/L)', source='albumin'),
+        Feature('S Ca (mmol/L)', source='s_ca'),
+        Feature('Serum Na Pre-HD (mmol/L)', source='serum_na_pre_hd'),
+        Feature('UA (mg/dL)', source='ua'),
+        Feature('Hb_diff', source='hb_diff'),
+        Feature('Hb (g/dL)', source='hb'),
+        Feature('Albumin_BU_Ratio', compute=_albumin_bu_ratio, description='albumin / (bu_pre_hd + 1)'),
+        Feature('K_Diff', compute=_k_diff, description='serum_k_pre_hd - serum_k_post_hd'),
+        Feature('BU_Diff', compute=_bu_diff, description='bu_pre_hd - bu_post_hd'),
+        Feature('SCR_Diff', compute=_scr_diff, description='scr_pre_hd - scr_post_hd'),
+    ],
+    feature_engineering='Server automatically calculates 4 derived features from 12 laboratory parameters'
+)
+
+FEATURE_SCHEMAS = {
+    'dry_weight': DRY_WEIGHT_SCHEMA,
+    'urr': URR_SCHEMA,
+    'hb': HB_SCHEMA,
+}
@@ -0,0 +1,288 @@
+"""
+Binary request and response formats of the prediction endpoints
+
+JSON stays the default. Clients of bulk predictions can instead send and
+receive:
+
+- MessagePack (application/msgpack): the same documents as the JSON API
+  (a record, or {"records": [...]} for a batch; the response payloads with
+  their keys), in a compact binary form that is faster to parse. Single and
+  batch endpoints.
+- Apache Arrow IPC streams (application/vnd.apache.arrow.stream): a batch
+  is one table with a row per record and a column per input field (validated
+  and turned into features column by column), and the
+  response is a table with a row per successful result. The batch totals
+  and the errors of invalid records are in the schema metadata ('total',
+  'succeeded', 'failed' and 'errors', the latter as JSON). Batch endpoints
+  only.
+
+The request format follows Content-Type (MessagePackParser and
+ArrowStreamParser), the response format follows Accept (response_format).
+Error responses are always JSON. msgpack and pyarrow are optional
+(requirements-optional.txt): a format whose package is not installed is not
+offered, and requests in it are rejected with 415.
+"""
+import importlib
+import importlib.util
+import io
+import json
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from rest_framework.exceptions import NotAcceptable, ParseError, UnsupportedMediaType
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+
+from .encoding import result_encoder
+from .results import PredictionResult
+from .validation import NumericColumn
+
+JSON_FORMAT = 'json'
+MSGPACK_FORMAT = 'msgpack'
+ARROW_FORMAT = 'arrow'
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+# Accepted media types of each format (the first one is used in responses)
+MEDIA_TYPES = {
+    JSON_FORMAT: (JSON_CONTENT_TYPE,),
+    MSGPACK_FORMAT: (MSGPACK_CONTENT_TYPE, 'application/x-msgpack'),
+    ARROW_FORMAT: (ARROW_CONTENT_TYPE,),
+}
+
+# Package each binary format needs
+FORMAT_PACKAGES = {MSGPACK_FORMAT: 'msgpack', ARROW_FORMAT: 'pyarrow'}
+
+_available = {}
+
+
+def format_available(name: str) -> bool:
+    """Whether the package of a format is installed (checked once, without importing it)"""
+    package = FORMAT_PACKAGES.get(name)
+    if package is None:
+        return True
+    if package not in _available:
+        _available[package] = importlib.util.find_spec(package) is not None
+    return _available[package]
+
+
+def _media_ranges(accept: str):
+    """(media type, quality, position) of every range of an Accept header"""
+    for position, item in enumerate(accept.split(',')):
+        media_type, *params = (part.strip() for part in item.split(';'))
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            yield media_type.lower(), quality, position
+
+
+def response_format(request, formats: Sequence[str] = (JSON_FORMAT, MSGPACK_FORMAT)) -> str:
+    """
+    Format of the response to a request, from its Accept header
+    
+    The acceptable format with the highest quality wins (the first listed on
+    a tie). Wildcards, a missing header and types none of `formats` serves
+    give JSON: the endpoints never answer 406.
+    """
+    accept = request.META.get('HTTP_ACCEPT', '')
+    best, best_key = JSON_FORMAT, None
+    for media_type, quality, position in _media_ranges(accept):
+        if quality <= 0:
+            continue
+        for name in formats:
+            if media_type in MEDIA_TYPES[name] and format_available(name):
+                key = (-quality, position)
+                if best_key is None or key < best_key:
+                    best, best_key = name, key
+    return best
+
+
+class LenientContentNegotiation(DefaultContentNegotiation):
+    """
+    DRF content negotiation that falls back to the first renderer (JSON)
+    
+    The prediction views encode MessagePack and Arrow responses themselves
+    (see response_format), so an Accept header without JSON must not make DRF
+    answer 406 before they run; error responses are JSON.
+    """
+    
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+def _require(name: str):
+    """Import the package of a format for a request in it, 415 if it is not installed"""
+    if not format_available(name):
+        raise UnsupportedMediaType(
+            MEDIA_TYPES[name][0], detail=f"{MEDIA_TYPES[name][0]} requests need the {FORMAT_PACKAGES[name]} package"
+        )
+    return importlib.import_module(FORMAT_PACKAGES[name])
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack request bodies into the documents of the JSON API
+    """
+    
+    media_type = MSGPACK_CONTENT_TYPE
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        msgpack = _require(MSGPACK_FORMAT)
+        try:
+            return msgpack.unpackb(stream.read() if stream is not None else b'', raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ParseError(f"MessagePack parse error - {e}")
+
+
+class MessagePackAliasParser(MessagePackParser):
+    """
+    MessagePackParser for the older application/x-msgpack media type
+    """
+    
+    media_type = 'application/x-msgpack'
+
+
+class ArrowBatch:
+    """
+    The table of an Arrow batch request, kept in columns
+    
+    Every row is a record; null cells count as missing keys of a JSON record,
+    so optional columns can be sparse. The prediction views validate and
+    score it column by column (see InputValidation.validate_columns) instead
+    of turning the rows into record dicts first.
+    """
+    
+    def __init__(self, table):
+        self.table = table
+    
+    def __len__(self) -> int:
+        return self.table.num_rows
+    
+    def columns(self) -> Dict[str, Any]:
+        """
+        {name: column}: integer and float columns as NumericColumns (float64
+        values and null mask, straight from column.to_numpy()), the others as
+        lists of Python values (None for null)
+        """
+        import pyarrow
+        columns = {}
+        for name, column in zip(self.table.column_names, self.table.columns):
+            if pyarrow.types.is_integer(column.type) or pyarrow.types.is_floating(column.type):
+                columns[name] = NumericColumn(
+                    column.cast(pyarrow.float64()).to_numpy(zero_copy_only=False),
+                    column.is_null().to_numpy(zero_copy_only=False),
+                )
+            else:
+                columns[name] = column.to_pylist()
+        return columns
+
+
+class ArrowStreamParser(BaseParser):
+    """
+    Parses an Arrow IPC stream into a batch request ({"records": ArrowBatch})
+    """
+    
+    media_type = ARROW_CONTENT_TYPE
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        _require(ARROW_FORMAT)
+        import pyarrow.ipc
+        try:
+            table = pyarrow.ipc.open_stream(stream.read() if stream is not None else b'').read_all()
+        except Exception as e:
+            raise ParseError(f"Arrow IPC parse error - {e}")
+        return {'records': ArrowBatch(table)}
+
+
+def arrow_records(table) -> List[Dict[str, Any]]:
+    """Rows of an Arrow table (e.g. a batch response) as dicts, without their null cells"""
+    names = table.column_names
+    columns = [column.to_pylist() for column in table.columns]
+    return [
+        {name: value for name, value in zip(names, row) if value is not None}
+        for row in zip(*columns)
+    ]
+
+
+def encode_arrow_records(records: Sequence[Dict[str, Any]]) -> bytes:
+    """Arrow IPC stream of request records (missing keys become nulls); the client side of ArrowStreamParser"""
+    import pyarrow
+    import pyarrow.ipc
+    names = list(dict.fromkeys(name for record in records for name in record))
+    table = pyarrow.table({name: [record.get(name) for record in records] for name in names})
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, PredictionResult):
+        # The payload dict of the JSON encoder (same keys, same order)
+        return result_encoder.default(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not MessagePack serializable")
+
+
+def encode_msgpack(value: Any) -> bytes:
+    """MessagePack of a result or response document, with the values the JSON encoding gives"""
+    import msgpack
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+
+def encode_msgpack_batch(total: int, results: Sequence[PredictionResult], errors: List[Dict[str, Any]]) -> bytes:
+    """MessagePack body of a batch prediction response"""
+    return encode_msgpack({
+        'total': total,
+        'succeeded': len(results),
+        'failed': len(errors),
+        'results': results,
+        'errors': errors
+    })
+
+
+def encode_arrow_batch(total: int, results: Sequence[PredictionResult], errors: List[Dict[str, Any]],
+                       result_class: Optional[type] = None) -> bytes:
+    """
+    Arrow IPC body of a batch prediction response: a row per result, the
+    totals and errors in the schema metadata
+    
+    The columns are the response fields (prediction_date as a timestamp),
+    then latency_tier and explanation when the request asked for them, then
+    index. With no results, result_class gives the column names.
+    """
+    import pyarrow
+    import pyarrow.ipc
+    result_class = type(results[0]) if results else result_class
+    fields = result_class.FIELDS if result_class is not None else ()
+    columns = {name: [getattr(result, name) for result in results] for name in fields}
+    for name in ('latency_tier', 'explanation'):
+        if any(getattr(result, name) is not None for result in results):
+            columns[name] = [getattr(result, name) for result in results]
+    columns['index'] = pyarrow.array([result.index for result in results], type=pyarrow.int64())
+    metadata = {
+        'total': str(total),
+        'succeeded': str(len(results)),
+        'failed': str(len(errors)),
+        'errors': json.dumps(errors, ensure_ascii=False, default=str),
+    }
+    table = pyarrow.table(columns, metadata=metadata)
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,348 @@
+"""
+Server-side patient history for the history-based prediction inputs
+
+Some model inputs depend on a patient's earlier records: Hb_diff and
+URR_diff (change since the previous monthly investigation) and the
+3-session rolling averages of SYS and weight gain. Instead of every client
+looking up the history and computing them, clients push session and
+monthly records to the store and predict with the patient_id and the new
+values only; missing history inputs are filled in from the store.
+
+Records are appended to a table of a SQLite file of their own
+(ml_history.sqlite3 unless ML_HISTORY_DB is set), not Django's db.sqlite3,
+whose schema belongs to the migrations. The file is in WAL mode, so the
+server processes write concurrently without blocking readers. Every process keeps, per patient and
+stream, a ring buffer of the last records with rolling sums over the
+window, updated in O(1) per record, and answers from memory. Processes pick
+up each other's records by reading the log past the last row they applied,
+one indexed query that normally returns nothing.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from rest_framework.exceptions import ErrorDetail
+
+TABLE = 'ml_patient_history'
+
+
+class HistoryStream:
+    """
+    A kind of pushed record: its tracked fields and how many earlier records the inputs read
+    """
+    
+    __slots__ = ('name', 'fields', 'window')
+    
+    def __init__(self, name: str, fields: Sequence[str], window: int):
+        self.name = name
+        self.fields = tuple(fields)
+        self.window = window
+
+
+SESSION_STREAM = HistoryStream('session', ('weight_gain', 'sys'), window=2)
+MONTHLY_STREAM = HistoryStream('monthly', ('hb', 'urr'), window=1)
+STREAMS = {stream.name: stream for stream in (SESSION_STREAM, MONTHLY_STREAM)}
+
+
+class HistoryInput:
+    """
+    A prediction input computed from the request's current value and the patient's earlier records
+    
+    'mean' is the mean of the current value and the source field of the
+    earlier records in the window (the rolling mean used in training), 'diff'
+    the current value minus the source field of the previous record. A
+    required input the request and the history both lack is a validation error.
+    """
+    
+    __slots__ = ('name', 'stream', 'source', 'kind', 'required')
+    
+    def __init__(self, name: str, stream: HistoryStream, source: str, kind: str, required: bool = True):
+        self.name = name
+        self.stream = stream
+        self.source = source
+        self.kind = kind
+        self.required = required
+
+
+HISTORY_INPUTS = {
+    'dry_weight': [
+        # Without history the feature builder falls back to the current session
+        HistoryInput('weight_gain_avg_3', SESSION_STREAM, 'weight_gain', 'mean', required=False),
+        HistoryInput('sys_avg_3', SESSION_STREAM, 'sys', 'mean', required=False),
+    ],
+    'urr': [HistoryInput('urr_diff', MONTHLY_STREAM, 'urr', 'diff')],
+    'hb': [HistoryInput('hb_diff', MONTHLY_STREAM, 'hb', 'diff')],
+}
+
+
+class PatientWindow:
+    """
+    Ring buffer of the last records of one patient and stream, with rolling sums
+    
+    Keeps window + 1 records so that the aggregates are still complete when
+    the newest record is the one being predicted. `sums` and `counts` cover the
+    newest `window` records per field (missing values are skipped).
+    """
+    
+    __slots__ = ('window', 'dates', 'rows', 'sums', 'counts')
+    
+    def __init__(self, window: int, n_fields: int):
+        self.window = window
+        self.dates = deque(maxlen=window + 1)
+        self.rows = deque(maxlen=window + 1)
+        self.sums = [0.0] * n_fields
+        self.counts = [0] * n_fields
+    
+    def add(self, recorded_at: str, row: Tuple[Optional[float], ...]):
+        """Add a record; one with the date of a kept record replaces it"""
+        dates = self.dates
+        if not dates or recorded_at > dates[-1]:
+            # The usual case: a new latest record pushes the oldest one out of the window
+            if len(dates) >= self.window:
+                self._account(self.rows[-self.window], -1)
+            dates.append(recorded_at)
+            self.rows.append(row)
+            self._account(row, 1)
+        elif recorded_at == dates[-1]:
+            self._account(self.rows[-1], -1)
+            self.rows[-1] = row
+            self._account(row, 1)
+        else:
+            # A late (back-filled or corrected) record: re-sort the few kept records
+            records = dict(zip(dates, self.rows))
+            if recorded_at not in records and len(dates) == dates.maxlen and recorded_at < dates[0]:
+                return
+            records[recorded_at] = row
+            kept = sorted(records.items())[-dates.maxlen:]
+            dates.clear()
+            self.rows.clear()
+            self.sums = [0.0] * len(self.sums)
+            self.counts = [0] * len(self.counts)
+            for date, kept_row in kept:
+                self.add(date, kept_row)
+    
+    def _account(self, row: Tuple[Optional[float], ...], sign: int):
+        for index, value in enumerate(row):
+            if value is not None:
+                self.sums[index] += sign * value
+                self.counts[index] += sign
+    
+    def _earlier_rows(self, before: str) -> List[Tuple[Optional[float], ...]]:
+        return [row for date, row in zip(self.dates, self.rows) if date < before][-self.window:]
+    
+    def previous(self, index: int, before: Optional[str] = None) -> Optional[float]:
+        """Field `index` of the latest record (dated before `before`)"""
+        if before is None or self.dates[-1] < before:
+            return self.rows[-1][index]
+        rows = self._earlier_rows(before)
+        return rows[-1][index] if rows else None
+    
+    def window_sum(self, index: int, before: Optional[str] = None) -> Tuple[float, int]:
+        """Sum and count of field `index` over the window (of records dated before `before`)"""
+        if before is None or self.dates[-1] < before:
+            return self.sums[index], self.counts[index]
+        values = [row[index] for row in self._earlier_rows(before) if row[index] is not None]
+        return sum(values), len(values)
+
+
+def _stored_value(value: Any) -> Optional[float]:
+    # Missing and NaN values are not part of the history
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+
+class PatientHistoryStore:
+    """
+    Patient records persisted in SQLite with per-patient ring buffers in memory
+    """
+    
+    def __init__(self):
+        self.path = None
+        self.enabled = False
+        self._init_state()
+        
+        # The SQLite connection must not be used across fork; the windows stay valid
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+    
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._connection = None
+        self._windows: Dict[Tuple[str, str], PatientWindow] = {}
+        self._last_id = 0
+        self._loaded = False
+    
+    def _after_fork_in_child(self):
+        self._lock = threading.Lock()
+        self._connection = None
+    
+    def configure(self, path: str, enabled: bool = True):
+        """Use the SQLite database at `path` (created on first use)"""
+        self.path = str(path)
+        self.enabled = enabled
+        self._init_state()
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id TEXT NOT NULL, stream TEXT NOT NULL, '
+                'recorded_at TEXT NOT NULL, record TEXT NOT NULL, created_at TEXT NOT NULL)'
+            )
+            connection.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_patient ON {TABLE} (patient_id, stream, recorded_at)')
+            self._connection = connection
+        if not self._loaded:
+            self._load()
+        return self._connection
+    
+    def _load(self):
+        # Only the last records of every patient are needed: the latest version of each
+        # (patient, stream, date), ranked by date
+        keep = max(stream.window for stream in STREAMS.values()) + 1
+        rows = self._connection.execute(
+            f'SELECT id, patient_id, stream, recorded_at, record FROM ('
+            f'  SELECT *, ROW_NUMBER() OVER (PARTITION BY patient_id, stream ORDER BY recorded_at DESC) AS position'
+            f'  FROM {TABLE} WHERE id IN (SELECT MAX(id) FROM {TABLE} GROUP BY patient_id, stream, recorded_at)'
+            f') WHERE position <= ? ORDER BY recorded_at', (keep,)
+        ).fetchall()
+        for row in rows:
+            self._apply(*row[1:])
+        self._last_id = self._connection.execute(f'SELECT COALESCE(MAX(id), 0) FROM {TABLE}').fetchone()[0]
+        self._loaded = True
+    
+    def _apply(self, patient_id: str, stream_name: str, recorded_at: str, record: str):
+        stream = STREAMS.get(stream_name)
+        if stream is None:
+            return
+        window = self._windows.get((patient_id, stream_name))
+        if window is None:
+            window = self._windows[(patient_id, stream_name)] = PatientWindow(stream.window, len(stream.fields))
+        window.add(recorded_at, tuple(json.loads(record)))
+    
+    def _sync(self):
+        """Apply the records other processes appended since the last sync"""
+        rows = self._connect().execute(
+            f'SELECT id, patient_id, stream, recorded_at, record FROM {TABLE} WHERE id > ? ORDER BY id', (self._last_id,)
+        ).fetchall()
+        for row in rows:
+            self._apply(*row[1:])
+        if rows:
+            self._last_id = rows[-1][0]
+    
+    def push(self, stream: HistoryStream, records: Sequence[Dict[str, Any]]) -> int:
+        """Store validated records (patient_id, recorded_at and the stream's fields)"""
+        created_at = datetime.now(timezone.utc).isoformat()
+        rows = [
+            (str(record['patient_id']), stream.name, record['recorded_at'].isoformat(),
+             json.dumps([_stored_value(record.get(field)) for field in stream.fields]), created_at)
+            for record in records
+        ]
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    f'INSERT INTO {TABLE} (patient_id, stream, recorded_at, record, created_at) VALUES (?, ?, ?, ?, ?)', rows
+                )
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            self._sync()
+        return len(rows)
+    
+    def _value(self, history_input: HistoryInput, patient_id: str, data: Dict[str, Any]) -> Optional[float]:
+        current = data.get(history_input.source)
+        window = self._windows.get((patient_id, history_input.stream.name))
+        if current is None or window is None:
+            return None
+        recorded_at = data.get('recorded_at')
+        before = recorded_at.isoformat() if recorded_at is not None else None
+        index = history_input.stream.fields.index(history_input.source)
+        if history_input.kind == 'diff':
+            previous = window.previous(index, before)
+            return None if previous is None else current - previous
+        total, count = window.window_sum(index, before)
+        return (total + current) / (count + 1)
+    
+    def complete_many(self, model_name: str, validated: List[Optional[Dict[str, Any]]],
+                      errors: List[Optional[Dict[str, Any]]]):
+        """
+        Fill the missing history inputs of validated records in place; records
+        still lacking a required one become invalid (validated None, errors set)
+        """
+        history_inputs = HISTORY_INPUTS.get(model_name, [])
+        pending = [
+            index for index, data in enumerate(validated)
+            if data is not None and any(data.get(history_input.name) is None for history_input in history_inputs)
+        ]
+        if not pending:
+            return
+        
+        if self.enabled:
+            with self._lock:
+                self._sync()
+                for index in pending:
+                    data = validated[index]
+                    patient_id = data.get('patient_id')
+                    if patient_id is None:
+                        continue
+                    for history_input in history_inputs:
+                        if data.get(history_input.name) is None:
+                            value = self._value(history_input, patient_id, data)
+                            if value is not None:
+                                data[history_input.name] = value
+        
+        for index in pending:
+            missing = {
+                history_input.name: [ErrorDetail(
+                    f"This field is required unless patient_id has an earlier {history_input.stream.name} "
+                    f"record in the history store.", code='required'
+                )]
+                for history_input in history_inputs
+                if history_input.required and validated[index].get(history_input.name) is None
+            }
+            if missing:
+                validated[index] = None
+                errors[index] = missing
+    
+    def complete(self, model_name: str, data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """complete_many() for one record: (data or None, errors)"""
+        validated, errors = [data], [None]
+        self.complete_many(model_name, validated, errors)
+        return validated[0], errors[0] or {}
+    
+    def patient(self, patient_id: str) -> Dict[str, Any]:
+        """The kept records of a patient, per stream"""
+        with self._lock:
+            self._sync()
+            streams = {}
+            for name, stream in STREAMS.items():
+                window = self._windows.get((patient_id, name))
+                streams[name] = [] if window is None else [
+                    {'recorded_at': date, **dict(zip(stream.fields, row))} for date, row in zip(window.dates, window.rows)
+                ]
+        return {'patient_id': patient_id, **streams}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Store status for the health endpoint"""
+        if not self.enabled:
+            return {'enabled': False}
+        return {
+            'enabled': True,
+            'patients': len({patient_id for patient_id, _ in self._windows}),
+            'last_record_id': self._last_id,
+        }
+
+
+# Global store instance (configured from settings in apps.ready())
+patient_history = PatientHistoryStore()
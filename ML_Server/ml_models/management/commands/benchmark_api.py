@@ -0,0 +1,157 @@
+import json
+import os
+import secrets
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.benchmark import (
+    ENCODINGS, ENDPOINTS, HTTPTransport, InProcessTransport, build_results, compare_results, mint_token, run_benchmark,
+    start_gunicorn, stop_gunicorn,
+)
+from ml_models.formats import format_available
+
+
+def _int_list(value):
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise CommandError(f"Expected a comma-separated list of integers, got '{value}'")
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the prediction endpoints in-process and/or over HTTP against gunicorn '
+        'and save throughput, latency percentiles and worker memory as JSON. '
+        'With --compare BASELINE CANDIDATE, print the difference between two saved runs.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', default='inprocess,http',
+                            help="Comma-separated transports: inprocess, http (default: both)")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"Comma-separated endpoints (default: {','.join(ENDPOINTS)})")
+        parser.add_argument('--encodings', default=','.join(ENCODINGS),
+                            help=f"Comma-separated request/response encodings: {', '.join(ENCODINGS)} "
+                                 f"(default: all; arrow only for the batch endpoints)")
+        parser.add_argument('--batch-size', type=int, default=100, help='Records per request of the batch endpoints (default: 100)')
+        parser.add_argument('--concurrency', type=_int_list, default=[1, 4, 16],
+                            help='Comma-separated client thread counts (default: 1,4,16)')
+        parser.add_argument('--requests', type=int, default=500, help='Timed requests per endpoint and concurrency level')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests before each level')
+        parser.add_argument('--payloads', type=int, default=1000,
+                            help='Distinct synthetic payloads per endpoint (used round-robin; fewer payloads mean more prediction cache hits)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the payload generator')
+        parser.add_argument('--url', help='Benchmark an already running server at this URL instead of starting gunicorn')
+        parser.add_argument('--server-pid', type=int, help='Gunicorn master pid of --url, to report its workers\' memory')
+        parser.add_argument('--bind', default='127.0.0.1:8099', help='Address for the gunicorn started by the benchmark')
+        parser.add_argument('--workers', type=int, default=2, help='Worker count for the gunicorn started by the benchmark')
+        parser.add_argument('--output', help='Results file (default: benchmark-<timestamp>.json)')
+        parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                            help='Compare two results files instead of running a benchmark')
+    
+    def handle(self, *args, **options):
+        if options['compare']:
+            self._compare(*options['compare'])
+            return
+        
+        modes = [mode.strip() for mode in options['mode'].split(',') if mode.strip()]
+        endpoints = [endpoint.strip() for endpoint in options['endpoints'].split(',') if endpoint.strip()]
+        for mode in modes:
+            if mode not in ('inprocess', 'http'):
+                raise CommandError(f"Unknown mode '{mode}' (expected inprocess or http)")
+        for endpoint in endpoints:
+            if endpoint not in ENDPOINTS:
+                raise CommandError(f"Unknown endpoint '{endpoint}' (expected one of {', '.join(ENDPOINTS)})")
+        encodings = [encoding.strip() for encoding in options['encodings'].split(',') if encoding.strip()]
+        for encoding in encodings:
+            if encoding not in ENCODINGS:
+                raise CommandError(f"Unknown encoding '{encoding}' (expected one of {', '.join(ENCODINGS)})")
+            if not format_available(encoding):
+                self.stderr.write(f"Skipping the {encoding} encoding: its package is not installed")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        
+        # The token must be signed with the secret the server verifies with; without one, use a throwaway secret
+        secret = os.getenv('JWT_SECRET')
+        if not secret:
+            if options['url']:
+                raise CommandError('JWT_SECRET must be set to the secret of the server given with --url')
+            secret = os.environ['JWT_SECRET'] = secrets.token_hex(32)
+        token = mint_token(secret)
+        
+        runs = []
+        benchmark_options = dict(
+            endpoints=endpoints,
+            concurrency_levels=options['concurrency'],
+            requests_count=options['requests'],
+            payload_count=options['payloads'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+            progress=self._report,
+            encodings=encodings,
+            batch_size=options['batch_size'],
+        )
+        
+        if 'inprocess' in modes:
+            runs.extend(run_benchmark(InProcessTransport(token), **benchmark_options))
+        
+        if 'http' in modes:
+            if options['url']:
+                transport = HTTPTransport(options['url'], token, server_pid=options['server_pid'])
+                runs.extend(run_benchmark(transport, **benchmark_options))
+            else:
+                self.stdout.write(f"Starting gunicorn on {options['bind']} with {options['workers']} workers...")
+                server = start_gunicorn(options['bind'], options['workers'], {'JWT_SECRET': secret}, cwd=str(settings.BASE_DIR))
+                try:
+                    transport = HTTPTransport(f"http://{options['bind']}", token, server_pid=server.pid)
+                    runs.extend(run_benchmark(transport, **benchmark_options))
+                finally:
+                    stop_gunicorn(server)
+        
+        parameters = {
+            key: options[key] for key in ('requests', 'warmup', 'payloads', 'seed', 'concurrency', 'workers', 'url', 'batch_size')
+        }
+        parameters.update(modes=modes, endpoints=endpoints, encodings=encodings)
+        results = build_results(runs, parameters)
+        
+        output = options['output'] or f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Saved {len(runs)} runs to {output}"))
+    
+    def _report(self, run):
+        latency = run['latency_ms']
+        memory = ', '.join(
+            f"{pid}: {usage['rss_mb']} MiB" for pid, usage in run['workers'].items() if usage and usage.get('rss_mb') is not None
+        )
+        self.stdout.write(
+            f"{run['mode']:<9} {run['endpoint']:<18} {run['encoding']:<7} c={run['concurrency']:<3} "
+            f"{run['throughput_rps']:>8.1f} req/s  p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  "
+            f"p99 {latency['p99']:.2f} ms  request {run['request_bytes']:.0f} B  response {run['response_bytes']:.0f} B  "
+            f"errors {run['errors']}  rss [{memory}]"
+        )
+    
+    def _compare(self, baseline_path, candidate_path):
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+            with open(candidate_path) as f:
+                candidate = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read results: {e}")
+        
+        rows = compare_results(baseline, candidate)
+        if not rows:
+            raise CommandError('The two results have no run (mode, endpoint, concurrency) in common')
+        
+        self.stdout.write(f"baseline  {baseline_path} ({baseline['environment'].get('git_commit')})")
+        self.stdout.write(f"candidate {candidate_path} ({candidate['environment'].get('git_commit')})")
+        for row in rows:
+            cells = []
+            for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'response_bytes'):
+                old, new, change = row[metric]
+                cells.append(f"{metric} {old} -> {new} ({'n/a' if change is None else f'{change:+.1f}%'})")
+            self.stdout.write(f"{row['mode']:<9} {row['endpoint']:<18} {row['encoding']:<7} c={row['concurrency']:<3} "
+                              + '  '.join(cells))
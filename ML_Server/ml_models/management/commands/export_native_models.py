@@ -0,0 +1,56 @@
+import os
+
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.artifacts import export_native_artifact
+from ml_models.features import DRY_WEIGHT_SCHEMA, HB_SCHEMA, URR_SCHEMA
+from ml_models.services import MLModelManager, model_manager
+
+SCHEMAS = {'dry_weight': DRY_WEIGHT_SCHEMA, 'urr': URR_SCHEMA, 'hb': HB_SCHEMA}
+
+
+class Command(BaseCommand):
+    help = (
+        'Export the pickled models as native artifacts (booster files, memory-mappable compiled '
+        'arrays and a JSON manifest) in ml_models/models/<name>/. The server loads these instead '
+        'of the pickles; running servers pick them up on reload or through the file watcher.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--models', default=','.join(SCHEMAS),
+                            help=f"Comma-separated models to export (default: {','.join(SCHEMAS)})")
+        parser.add_argument('--model-version',
+                            help='Version recorded in the manifest (default: the bundle version, or 1.0.0)')
+    
+    def handle(self, *args, **options):
+        model_names = [name.strip() for name in options['models'].split(',') if name.strip()]
+        for model_name in model_names:
+            if model_name not in SCHEMAS:
+                raise CommandError(f"Unknown model '{model_name}' (expected one of {', '.join(SCHEMAS)})")
+        
+        for model_name in model_names:
+            source_path = model_manager.get_model_path(model_name)
+            if not os.path.exists(source_path):
+                self.stderr.write(f"Skipping {model_name}: {source_path} not found")
+                continue
+            
+            loaded_object = joblib.load(source_path)
+            features = SCHEMAS[model_name].feature_names
+            if isinstance(loaded_object, dict):
+                bundle_features = loaded_object.get('features')
+                if bundle_features is not None and list(bundle_features) != features:
+                    raise CommandError(f"{model_name}: bundle features {list(bundle_features)} do not match schema {features}")
+            version = options['model_version'] or (
+                isinstance(loaded_object, dict) and loaded_object.get('version')
+            ) or MLModelManager.DEFAULT_VERSION
+            
+            directory = os.path.dirname(model_manager.get_native_manifest_path(model_name))
+            try:
+                manifest = export_native_artifact(model_name, loaded_object, directory, str(version),
+                                                  features=features, source_path=source_path)
+            except Exception as e:
+                raise CommandError(f"Failed to export {model_name}: {str(e)}")
+            
+            boosters = ', '.join(f"{key}: {member['library']}" for key, member in manifest['members'].items())
+            self.stdout.write(self.style.SUCCESS(f"Exported {model_name} {manifest['version']} ({boosters}) to {directory}"))
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from ml_models.benchmark import synthetic_payloads
+from ml_models.cohort import MODEL_OUTPUTS, PatientHistory, plan_columns, prepare_chunk, read_chunks, read_header
+from ml_models.features import FEATURE_SCHEMAS
+from ml_models.services import dry_weight_predictor, hb_predictor, model_manager, urr_predictor
+from ml_models.tiers import latency_tiers, measure_tiers, report_entry
+from ml_models.validation import input_validation
+
+PREDICTORS = {'dry_weight': dry_weight_predictor, 'urr': urr_predictor, 'hb': hb_predictor}
+
+
+def _dataset_records(path, model_name, count, sheet):
+    """Up to `count` records of a dataset file, with the inputs the cohort scorer derives"""
+    labels, _ = read_header(path, sheet)
+    plan = plan_columns(labels, [model_name])
+    history = PatientHistory(plan) if plan.history_size else None
+    text_labels = [plan.columns['patient_id']] if 'patient_id' in plan.columns else []
+    records = []
+    for frame in read_chunks(path, list(plan.columns.values()), min(count, 10000), sheet, text_labels):
+        frame = prepare_chunk(frame, plan, history)
+        records.extend(frame.replace({None: np.nan}).to_dict('records'))
+        if len(records) >= count:
+            break
+    return records[:count]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how far the predictions of every latency tier (the first boosting rounds of the models) '
+        'are from the full models, and how fast each tier (the full one included) is, on synthetic requests or the rows of a '
+        'dataset. The results are written to the tier report that models_info publishes.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--models', default=','.join(FEATURE_SCHEMAS),
+                            help=f"Comma-separated models to measure (default: {','.join(FEATURE_SCHEMAS)})")
+        parser.add_argument('--records', type=int, default=5000,
+                            help='Records scored per model (default: 5000)')
+        parser.add_argument('--input',
+                            help='Dataset (.csv, .xlsx or .parquet) to take the records from instead of synthetic requests')
+        parser.add_argument('--sheet', help='Worksheet of an XLSX input (default: the active one)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic requests (default: 0)')
+        parser.add_argument('--output',
+                            help=f"Report file (default: {latency_tiers.report_path or 'ML_LATENCY_TIER_REPORT'})")
+    
+    def handle(self, *args, **options):
+        model_names = [name.strip() for name in options['models'].split(',') if name.strip()]
+        for model_name in model_names:
+            if model_name not in FEATURE_SCHEMAS:
+                raise CommandError(f"Unknown model '{model_name}' (expected one of {', '.join(FEATURE_SCHEMAS)})")
+        if options['records'] < 1:
+            raise CommandError('--records must be at least 1')
+        if options['input'] and not os.path.exists(options['input']):
+            raise CommandError(f"{options['input']} not found")
+        if options['output']:
+            latency_tiers.report_path = options['output']
+        if not latency_tiers.report_path:
+            raise CommandError('No report file: pass --output or set ML_LATENCY_TIER_REPORT')
+        
+        report = latency_tiers.load_report()
+        for model_name in model_names:
+            predictor = PREDICTORS[model_name]
+            serializer_class = import_string(MODEL_OUTPUTS[model_name][0])
+            if options['input']:
+                try:
+                    records = _dataset_records(options['input'], model_name, options['records'], options['sheet'])
+                except ValueError as e:
+                    raise CommandError(str(e))
+                source = os.path.basename(options['input'])
+            else:
+                records = synthetic_payloads(serializer_class, options['records'], seed=options['seed'])
+                source = 'synthetic'
+            validated, _ = input_validation.validate_many(serializer_class, records)
+            validated = [data for data in validated if data is not None]
+            if not validated:
+                self.stderr.write(f"Skipping {model_name}: no valid records")
+                continue
+            
+            loaded = model_manager.get_loaded(model_name)
+            X = predictor.feature_builder.build(validated)
+            measurements = measure_tiers(predictor._score, loaded, X, latency_tiers.names())
+            report['models'][model_name] = report_entry(loaded.model_version, len(X), source, measurements)
+            for tier, measured in measurements.items():
+                rounds = ', '.join(f"{key} {count}" for key, count in measured['boosting_rounds'].items())
+                self.stdout.write(
+                    f"{model_name} {tier} ({rounds} rounds): max |delta| {measured['max_abs_probability_delta']:.4f}, "
+                    f"mean |delta| {measured['mean_abs_probability_delta']:.4f}, "
+                    f"agreement {measured['prediction_agreement']:.4f}, {measured['batch_row_us']} µs per row in a batch, "
+                    f"{measured['single_record_us']} µs per single record"
+                )
+        
+        latency_tiers.save_report(report)
+        self.stdout.write(self.style.SUCCESS(f"Latency tier report written to {latency_tiers.report_path}"))
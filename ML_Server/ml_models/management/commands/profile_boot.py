@@ -0,0 +1,94 @@
+import json
+import os
+import secrets
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.benchmark import ENDPOINTS, environment_info, mint_token, synthetic_payloads
+from ml_models.boot import REGRESSION_METRICS, check_regressions, profile_boot
+
+# Endpoints whose first request is timed (the plain prediction endpoints of the benchmark)
+BOOT_ENDPOINTS = [name for name in ENDPOINTS if not name.endswith('-explain')]
+
+
+class Command(BaseCommand):
+    help = (
+        'Profile the cold start of a serving worker: boot the WSGI application in fresh interpreters, '
+        'time it up to the first prediction response, record its resident memory and summarize '
+        '`python -X importtime` per package. With --baseline, fail when a metric regressed by more than --threshold.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', default='hb', choices=BOOT_ENDPOINTS,
+                            help='Endpoint of the first request (default: hb)')
+        parser.add_argument('--runs', type=int, default=3, help='Cold starts measured (default: 3, the median is reported)')
+        parser.add_argument('--top', type=int, default=15, help='Packages listed in the import time summary (default: 15)')
+        parser.add_argument('--output', help='Profile file (default: boot-profile-<timestamp>.json)')
+        parser.add_argument('--baseline', help='Profile to compare with; regressions above --threshold fail the command')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Allowed increase of a timing or memory metric over the baseline, in percent (default: 20)')
+    
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read the baseline: {e}")
+        
+        # The worker checks requests against JWT_SECRET; without one, sign with a throwaway secret
+        secret = os.getenv('JWT_SECRET') or secrets.token_hex(32)
+        path, serializer_class = ENDPOINTS[options['endpoint']]
+        request = {
+            'path': path,
+            'body': synthetic_payloads(serializer_class, 1)[0],
+            'token': mint_token(secret),
+        }
+        env = {**os.environ, 'JWT_SECRET': secret, 'DJANGO_SETTINGS_MODULE': 'ml_server.settings'}
+        
+        try:
+            profile = profile_boot(request, str(settings.BASE_DIR), env, runs=options['runs'], top=options['top'],
+                                   progress=self._report_run)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        profile['environment'] = environment_info()
+        
+        summary = profile['summary']
+        self.stdout.write(
+            f"median cold start {summary['cold_start_s']:.2f} s (interpreter {summary['interpreter_s']:.2f}, "
+            f"django + models {summary['django_ready_s']:.2f}, first response {summary['first_response_s']:.3f}), "
+            f"rss {summary['rss_booted_mb']} MiB booted, {summary['rss_served_mb']} MiB after the first response"
+        )
+        imports = profile['imports']
+        self.stdout.write(f"imports: {imports['modules']} modules in {imports['total_ms']:.0f} ms")
+        for package, elapsed in imports['packages_ms'].items():
+            self.stdout.write(f"  {package:<24} {elapsed:>8.1f} ms")
+        loaded = [name for name, imported in profile['modules'].items() if imported]
+        self.stdout.write(f"loaded: {', '.join(loaded) or 'none of the watched modules'}")
+        
+        output = options['output'] or f"boot-profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        with open(output, 'w') as f:
+            json.dump(profile, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Saved the boot profile to {output}"))
+        
+        if baseline is not None:
+            for metric in REGRESSION_METRICS:
+                old, new = baseline['summary'].get(metric), summary.get(metric)
+                change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else 'n/a'
+                self.stdout.write(f"{metric:<18} {old} -> {new} ({change})")
+            regressions = check_regressions(baseline, profile, options['threshold'])
+            if regressions:
+                raise CommandError('Boot regressed against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regression above {options['threshold']:g}% against {options['baseline']}"))
+    
+    def _report_run(self, run):
+        self.stdout.write(
+            f"cold start {run['cold_start_s']:.2f} s (interpreter {run['interpreter_s']:.2f}, "
+            f"django + models {run['django_ready_s']:.2f}, first response {run['first_response_s']:.3f})  "
+            f"rss {run['rss_booted_mb']} -> {run['rss_served_mb']} MiB  {run['status']}"
+        )
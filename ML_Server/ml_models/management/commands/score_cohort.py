@@ -0,0 +1,111 @@
+import os
+import resource
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.cohort import DEFAULT_CHUNK_SIZE, score_cohort
+from ml_models.features import FEATURE_SCHEMAS
+from ml_models.tiers import latency_tiers
+
+
+def _column_overrides(values):
+    overrides = {}
+    for value in values or []:
+        name, separator, label = value.partition('=')
+        if not separator or not name.strip() or not label.strip():
+            raise CommandError(f"Expected --column INPUT=COLUMN, got '{value}'")
+        overrides[name.strip()] = label.strip()
+    return overrides
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Command(BaseCommand):
+    help = (
+        'Score every row of a CSV, XLSX or Parquet dataset (e.g. cleaned_monthly_investigations.xlsx or the '
+        'cleaned HD session data) with the risk models and write one result row per input row to CSV or '
+        'Parquet. The file is read in chunks that are scored by a pool of worker processes, so memory stays '
+        'bounded for any number of rows.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Dataset to score (.csv, .xlsx or .parquet)')
+        parser.add_argument('output', help='Results file (.csv or .parquet)')
+        parser.add_argument('--models',
+                            help=f"Comma-separated models to apply (default: those of {', '.join(FEATURE_SCHEMAS)} "
+                                 f"whose inputs the file provides)")
+        parser.add_argument('--column', action='append', metavar='INPUT=COLUMN',
+                            help="File column of a prediction input, e.g. --column hb='Hb g/dL' (repeatable)")
+        parser.add_argument('--sheet', help='Worksheet of an XLSX file (default: the active one)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Rows read and scored at once (default: {DEFAULT_CHUNK_SIZE})')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Scoring processes; 1 scores in this process (default: CPU count)')
+        parser.add_argument('--recommendations', action='store_true',
+                            help='Add the clinical recommendations of every model to the output')
+        parser.add_argument('--latency-tier',
+                            help=f"Score with the boosting rounds of a latency tier only ({', '.join(latency_tiers.names())}; "
+                                 f"default: full)")
+        parser.add_argument('--progress-interval', type=float, default=5.0,
+                            help='Seconds between progress reports (default: 5)')
+    
+    def handle(self, *args, **options):
+        model_names = None
+        if options['models']:
+            model_names = [name.strip() for name in options['models'].split(',') if name.strip()]
+            for model_name in model_names:
+                if model_name not in FEATURE_SCHEMAS:
+                    raise CommandError(f"Unknown model '{model_name}' (expected one of {', '.join(FEATURE_SCHEMAS)})")
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be at least 1')
+        if not os.path.exists(options['input']):
+            raise CommandError(f"{options['input']} not found")
+        if options['latency_tier'] is not None and latency_tiers.validate(options['latency_tier']):
+            raise CommandError(latency_tiers.validate(options['latency_tier']))
+        
+        try:
+            summary = score_cohort(
+                options['input'], options['output'],
+                model_names=model_names,
+                columns=_column_overrides(options['column']),
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                recommendations=options['recommendations'],
+                sheet=options['sheet'],
+                plan_ready=self._report_plan,
+                progress=self._report,
+                progress_interval=options['progress_interval'],
+                latency_tier=options['latency_tier'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        # ru_maxrss is in KiB on Linux; children are the pool workers
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+        failed = ', '.join(f"{model_name} {count}" for model_name, count in summary['failed'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {summary['rows']} rows with {', '.join(summary['models'])} in {_duration(summary['elapsed_s'])} "
+            f"({summary['rows_per_second']:.0f} rows/s, peak RSS per process {peak_rss:.0f} MiB); "
+            f"invalid rows: {failed}. Results in {options['output']}"
+        ))
+    
+    def _report_plan(self, plan):
+        self.stdout.write(f"Scoring with {', '.join(plan.model_names)}:")
+        for line in plan.describe():
+            self.stdout.write(f"  {line}")
+    
+    def _report(self, progress):
+        if progress['total']:
+            done = f"{progress['rows']}/{progress['total']} rows ({100 * progress['rows'] / progress['total']:.1f}%)"
+        else:
+            done = f"{progress['rows']} rows"
+        eta = f", ETA {_duration(progress['eta_s'])}" if progress['eta_s'] else ''
+        self.stdout.write(
+            f"{done} in {progress['chunks']} chunks, {_duration(progress['elapsed_s'])} elapsed, "
+            f"{progress['rows_per_second']:.0f} rows/s{eta}"
+        )
@@ -0,0 +1,275 @@
+"""
+Lightweight metrics for the ML server, exposed in Prometheus text format
+
+Every process keeps its own counters, gauges and fixed-bucket histograms in
+memory; recording is a bisect plus a few additions under a short lock. With
+gunicorn several worker processes serve requests, so when ML_METRICS_DIR is
+set each process periodically writes a snapshot file there and the metrics
+endpoint merges all snapshots when scraped: counters and histograms are
+summed, gauges come from the most recent snapshot.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Histogram bucket upper bounds in seconds (+Inf is implicit)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type and help text of every metric the server records
+METRICS = {
+    'ml_stage_seconds': ('histogram', 'Time spent in each request stage (validation, features, predict, recommendations, serialization)'),
+    'ml_requests_total': ('counter', 'Prediction requests by model, endpoint and HTTP status'),
+    'ml_prediction_errors_total': ('counter', 'Predictions that raised an error'),
+    'ml_model_load_seconds': ('histogram', 'Time spent loading (and validating) model artifacts'),
+    'ml_model_last_load_seconds': ('gauge', 'Duration of the most recent load of each model'),
+    'ml_prediction_cache_events_total': ('counter', 'Prediction cache lookups by outcome (hit, miss, coalesced) and evictions/expirations'),
+    'ml_explanation_cache_events_total': ('counter', 'Explanation cache lookups by outcome (hit, miss, coalesced) and evictions'),
+    'ml_micro_batch_total': ('counter', 'Micro-batcher batches, requests and rows'),
+    'ml_shadow_rows_total': ('counter', 'Rows offered to shadow models by outcome (queued, dropped, scored, agreed, failed)'),
+    'ml_shadow_seconds': ('histogram', 'Time a shadow model took to score one batch of mirrored rows'),
+    'ml_shadow_probability_delta': ('histogram', 'Absolute difference between the shadow and primary risk probability per row'),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def labels(**values) -> Labels:
+    """Label set in the canonical (sorted) form used as a metric key"""
+    return tuple(sorted((key, str(value)) for key, value in values.items()))
+
+
+class MetricsRegistry:
+    """
+    Per-process metric storage with optional snapshot files for multi-process serving
+    """
+    
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._collectors: List[Callable[['MetricsRegistry'], None]] = []
+        self._init_state()
+        
+        # Children start empty: what the parent recorded is in the parent's own snapshot
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._init_state)
+    
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], list] = {}
+        self._flusher = None
+        self._snapshot_path = None
+    
+    def configure(self, directory: Optional[str], flush_interval: float = 5.0):
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+    
+    def register_collector(self, collector: Callable[['MetricsRegistry'], None]):
+        """Call collector(registry) before every snapshot, to copy in counters kept elsewhere"""
+        self._collectors.append(collector)
+    
+    def inc(self, name: str, label_set: Labels = (), value: float = 1):
+        key = (name, label_set)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._ensure_flusher()
+    
+    def set_counter(self, name: str, label_set: Labels, value: float):
+        """Set a counter maintained by another component (used by collectors)"""
+        with self._lock:
+            self._counters[(name, label_set)] = value
+    
+    def set_gauge(self, name: str, label_set: Labels, value: float):
+        with self._lock:
+            self._gauges[(name, label_set)] = value
+    
+    def observe(self, name: str, label_set: Labels, seconds: float):
+        index = bisect_left(self.buckets, seconds)
+        key = (name, label_set)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket (non-cumulative) counts, +Inf last, then the sum
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+        self._ensure_flusher()
+    
+    def observe_many(self, name: str, label_set: Labels, values: Iterable[float]):
+        """Record several observations under one lock"""
+        indexes = [(bisect_left(self.buckets, value), value) for value in values]
+        key = (name, label_set)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, value in indexes:
+                histogram[index] += 1
+                histogram[-1] += value
+        self._ensure_flusher()
+    
+    def snapshot(self) -> dict:
+        for collector in self._collectors:
+            collector(self)
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'written_at': time.time(),
+                'counters': [[name, list(map(list, label_set)), value] for (name, label_set), value in self._counters.items()],
+                'gauges': [[name, list(map(list, label_set)), value] for (name, label_set), value in self._gauges.items()],
+                'histograms': [[name, list(map(list, label_set)), list(values)] for (name, label_set), values in self._histograms.items()],
+            }
+    
+    def flush(self):
+        """Write this process's snapshot file (no-op without a metrics directory)"""
+        if not self.directory:
+            return
+        if self._snapshot_path is None:
+            self._snapshot_path = os.path.join(self.directory, f"metrics-{os.getpid()}-{time.time_ns()}.json")
+        # The flusher thread and a scrape may flush at the same time
+        temporary_path = f"{self._snapshot_path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary_path, self._snapshot_path)
+    
+    def _ensure_flusher(self):
+        if self._flusher is not None or not self.directory:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name='ml-metrics-flusher', daemon=True)
+        self._flusher.start()
+    
+    def _flush_periodically(self):
+        flusher = self._flusher
+        while flusher is self._flusher:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+    
+    def _collect_snapshots(self) -> List[dict]:
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Being replaced right now; the next scrape will pick it up
+                continue
+        return snapshots
+    
+    def render(self) -> str:
+        """All processes' metrics merged, in Prometheus text exposition format"""
+        counters: Dict[Tuple[str, Labels], float] = {}
+        gauges: Dict[Tuple[str, Labels], Tuple[float, float]] = {}
+        histograms: Dict[Tuple[str, Labels], list] = {}
+        for snapshot in self._collect_snapshots():
+            written_at = snapshot['written_at']
+            for name, label_list, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, label_list)))
+                counters[key] = counters.get(key, 0) + value
+            for name, label_list, value in snapshot['gauges']:
+                key = (name, tuple(map(tuple, label_list)))
+                if key not in gauges or gauges[key][0] < written_at:
+                    gauges[key] = (written_at, value)
+            for name, label_list, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, label_list)))
+                if key in histograms and len(histograms[key]) == len(values):
+                    histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+                else:
+                    histograms[key] = list(values)
+        
+        lines: List[str] = []
+        families = sorted({name for name, _ in counters} | {name for name, _ in gauges} | {name for name, _ in histograms})
+        for family in families:
+            kind, help_text = METRICS.get(family, ('untyped', family))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for (name, label_set), value in sorted(counters.items()):
+                if name == family:
+                    lines.append(f"{name}{_format_labels(label_set)} {_format_value(value)}")
+            for (name, label_set), (_, value) in sorted(gauges.items()):
+                if name == family:
+                    lines.append(f"{name}{_format_labels(label_set)} {_format_value(value)}")
+            for (name, label_set), values in sorted(histograms.items()):
+                if name == family:
+                    lines.extend(self._render_histogram(name, label_set, values))
+        return '\n'.join(lines) + '\n'
+    
+    def _render_histogram(self, name: str, label_set: Labels, values: list) -> Iterable[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield f"{name}_bucket{_format_labels(label_set + (('le', le),))} {cumulative}"
+        yield f"{name}_sum{_format_labels(label_set)} {_format_value(values[-1])}"
+        yield f"{name}_count{_format_labels(label_set)} {cumulative}"
+
+
+def _format_labels(label_set: Labels) -> str:
+    if not label_set:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in label_set) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class StageClock:
+    """
+    Times consecutive stages of one request: each lap() records the time since
+    the previous lap (or since creation) under the given stage name
+    """
+    
+    __slots__ = ('model', 'registry', 'last')
+    
+    def __init__(self, model: str, registry: Optional[MetricsRegistry] = None):
+        self.model = model
+        self.registry = registry or metrics
+        self.last = time.perf_counter()
+    
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.registry.observe('ml_stage_seconds', (('model', self.model), ('stage', stage)), now - self.last)
+        self.last = now
+    
+    def skip(self):
+        """Restart the clock without recording (for a span timed elsewhere)"""
+        self.last = time.perf_counter()
+
+
+def track_requests(model: str, endpoint: str):
+    """View decorator counting responses by model, endpoint and status"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            metrics.inc('ml_requests_total', labels(model=model, endpoint=endpoint, status=response.status_code))
+            return response
+        
+        return wrapper
+    return decorator
+
+
+# Global registry (configured from settings in MlModelsConfig.ready)
+metrics = MetricsRegistry()
@@ -1,6 +1,12 @@
 import os
+import re
 import jwt
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
 from functools import wraps
@@ -9,26 +15,77 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified JWT payloads keyed by the token's SHA-256 digest
+    
+    An entry is only valid until the token's `exp` claim; tokens without `exp`
+    are not cached. The cached payload is shared between requests and must be
+    treated as read-only.
+    """
+    
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, key: bytes, now: float):
+        """(payload, role) of a verified token, None when unknown; raises ExpiredSignatureError once `exp` has passed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload, role = entry
+            if expires_at <= now:
+                # Same rule as jwt.decode without leeway
+                del self._entries[key]
+                raise jwt.ExpiredSignatureError('Signature has expired')
+            self._entries.move_to_end(key)
+            return payload, role
+    
+    def put(self, key: bytes, payload: dict, role: str):
+        expires_at = payload.get('exp')
+        if self.max_entries <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, payload, role)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
 class JWTAuthenticationMiddleware(MiddlewareMixin):
     """
     Middleware to authenticate JWT tokens from Express.js backend
+    
+    The secret and the public path policy are read once at startup. The backend
+    reuses the same token for many calls, so verified tokens are cached (see
+    VerifiedTokenCache) and a repeat call only costs a digest and a dict lookup.
     """
     
+    # Paths (prefixes) that skip authentication: health checks and public endpoints
+    public_paths = [
+        '/health/',
+        '/admin/',
+        '/api/ml/health/',
+        '/api/ml/models/',
+        '/api/ml/metrics/',
+    ]
+    
     def __init__(self, get_response):
         self.get_response = get_response
         super().__init__(get_response)
+        self.jwt_secret = os.getenv('JWT_SECRET')
+        self.public_path_pattern = re.compile('|'.join(re.escape(path) for path in self.public_paths))
+        self.token_cache = VerifiedTokenCache(getattr(settings, 'JWT_CACHE_SIZE', 1024))
     
     def process_request(self, request):
-        # Skip authentication for health checks and public endpoints
-        public_paths = [
-            '/health/',
-            '/admin/',
-            '/api/ml/health/',
-            '/api/ml/models/',
-        ]
-        
         # Check if the path is public
-        if any(request.path.startswith(path) for path in public_paths):
+        if self.public_path_pattern.match(request.path):
             return None
         
         # Extract JWT token from Authorization header
@@ -43,22 +100,27 @@ class JWTAuthenticationMiddleware(MiddlewareMixin):
         
         try:
             # Verify JWT token using the same secret as Express.js backend
-            jwt_secret = os.getenv('JWT_SECRET')
-            if not jwt_secret:
+            if not self.jwt_secret:
                 logger.error("JWT_SECRET not found in environment variables")
                 return JsonResponse({
                     'error': 'Server configuration error',
                     'message': 'JWT secret not configured'
                 }, status=500)
             
-            # Decode the token
-            decoded_token = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+            # Reuse an earlier verification of the same token, otherwise decode it
+            cache_key = self.token_cache.digest(token)
+            cached = self.token_cache.get(cache_key, time.time())
+            if cached is None:
+                decoded_token = jwt.decode(token, self.jwt_secret, algorithms=['HS256'])
+                user_role = str(decoded_token.get('role') or '').upper()
+                self.token_cache.put(cache_key, decoded_token, user_role)
+            else:
+                decoded_token, user_role = cached
             
             # Add user information to request
             request.user_id = decoded_token.get('id')
             request.jwt_payload = decoded_token
-            
-            logger.info(f"Authenticated user ID: {request.user_id}")
+            request.user_role = user_role
             
         except jwt.ExpiredSignatureError:
             return JsonResponse({
@@ -105,6 +167,8 @@ def require_role(allowed_roles):
     Decorator to require specific roles for views
     Note: This requires extending the JWT payload to include role information
     """
+    allowed_roles_upper = frozenset(role.upper() for role in allowed_roles)
+    
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
@@ -114,8 +178,10 @@ def require_role(allowed_roles):
                     'message': 'This endpoint requires authentication'
                 }, status=401)
             
-            user_role = request.jwt_payload.get('role', '').upper()
-            allowed_roles_upper = [role.upper() for role in allowed_roles]
+            # Resolved once per token by JWTAuthenticationMiddleware
+            user_role = getattr(request, 'user_role', None)
+            if user_role is None:
+                user_role = str(request.jwt_payload.get('role') or '').upper()
             
             if user_role not in allowed_roles_upper:
                 return JsonResponse({
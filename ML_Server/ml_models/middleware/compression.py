@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+
+class PredictionCompressionMiddleware(GZipMiddleware):
+    """
+    gzip compression of large prediction responses
+    
+    Only responses of the prediction endpoints of at least
+    ML_COMPRESS_MIN_BYTES bytes are compressed (0 disables it), when the client
+    sends Accept-Encoding: gzip; streamed batch responses always qualify. NDJSON
+    streams are left alone, since gzip would hold their lines back until it
+    has a block to emit.
+    """
+    
+    path_prefix = '/api/ml/predict/'
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_bytes = getattr(settings, 'ML_COMPRESS_MIN_BYTES', 0)
+    
+    def process_response(self, request, response):
+        if not self.min_bytes or not request.path.startswith(self.path_prefix):
+            return response
+        if response.get('Content-Type', '').startswith('application/x-ndjson'):
+            return response
+        if not response.streaming and len(response.content) < self.min_bytes:
+            return response
+        return super().process_response(request, response)
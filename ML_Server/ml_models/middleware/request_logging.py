@@ -1,64 +1,106 @@
+import io
 import logging
+import random
+import time
+
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+logger = logging.getLogger('ml_models.requests')
 
-logger = logging.getLogger(__name__)
+
+class BodyCapturingJSONParser(JSONParser):
+    """
+    JSONParser that remembers what it could not parse
+    
+    On a parse error the first ML_REQUEST_LOG_BODY_LIMIT bytes of the body and
+    the (equally capped) error are attached to the request for RequestLoggingMiddleware; the body
+    is never kept when parsing succeeds.
+    """
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        body = stream.read() if stream is not None else b''
+        try:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        except ParseError as e:
+            request = (parser_context or {}).get('request')
+            if request is not None:
+                limit = getattr(settings, 'ML_REQUEST_LOG_BODY_LIMIT', 2048)
+                request._request.ml_parse_failure = {
+                    'parse_error': str(e.detail)[:limit],
+                    'body_bytes': len(body),
+                    'body': body[:limit].decode('utf-8', errors='replace'),
+                    'body_truncated': len(body) > limit,
+                }
+            raise
 
 
 class RequestLoggingMiddleware(MiddlewareMixin):
     """
-    Middleware to log request details for debugging JSON parse errors
+    Sampled, structured logging of ML API requests
+    
+    One JSON line per logged request with method, path, status, duration,
+    sizes and user, written through the queue-based handler configured for the
+    'ml_models.requests' logger. Errors (status >= 400) are always logged,
+    other requests with probability ML_REQUEST_LOG_SAMPLE_RATE. The request
+    body is never read here; the capped body is only included when JSON
+    parsing failed (see BodyCapturingJSONParser). The path is capped to the
+    same ML_REQUEST_LOG_BODY_LIMIT, so no field of a line can grow unbounded.
+    Streamed responses are logged when their last chunk has been sent, with
+    the bytes sent and the full duration, and are never buffered.
     """
     
+    path_prefix = '/api/ml/'
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'ML_REQUEST_LOGGING', False)
+        self.sample_rate = getattr(settings, 'ML_REQUEST_LOG_SAMPLE_RATE', 1.0)
+        self.field_limit = getattr(settings, 'ML_REQUEST_LOG_BODY_LIMIT', 2048)
+    
     def process_request(self, request):
-        # Only log for ML prediction endpoints
-        if '/api/ml/predict/' in request.path:
-            logger.info(f"Request to {request.path}")
-            logger.info(f"Method: {request.method}")
-            logger.info(f"Content-Type: {request.content_type}")
-            logger.info(f"Content-Length: {request.META.get('CONTENT_LENGTH', 'unknown')}")
-            
-            # Log raw body for debugging
-            try:
-                if hasattr(request, 'body'):
-                    raw_body = request.body.decode('utf-8')
-                    logger.info(f"Raw body length: {len(raw_body)}")
-                    logger.info(f"Raw body: {raw_body}")
-                    
-                    # Show raw bytes around position 298 (where the error occurs)
-                    if len(raw_body) > 290:
-                        start_pos = max(0, 290)
-                        end_pos = min(len(raw_body), 310)
-                        context = raw_body[start_pos:end_pos]
-                        logger.info(f"Bytes around position 298: {context!r}")
-                        logger.info(f"Raw bytes: {raw_body[start_pos:end_pos].encode('utf-8')}")
-                    
-                    # Check for invisible characters and whitespace
-                    if raw_body:
-                        if not raw_body.strip():
-                            logger.warning("Body is only whitespace")
-                        elif raw_body != raw_body.strip():
-                            logger.warning(f"Body has leading/trailing whitespace")
-                            logger.info(f"Leading chars: {raw_body[:10]!r}")
-                            logger.info(f"Trailing chars: {raw_body[-10:]!r}")
-                        
-                        # Check each line for issues
-                        lines = raw_body.split('\n')
-                        for i, line in enumerate(lines, 1):
-                            if line != line.strip():
-                                logger.info(f"Line {i} has extra whitespace: {line!r}")
-                        
-                        if not raw_body.strip().startswith('{'):
-                            logger.warning("Body doesn't start with '{'")
-                        if not raw_body.strip().endswith('}'):
-                            logger.warning("Body doesn't end with '}'")
-                        
-                        # Check for unquoted property names
-                        import re
-                        unquoted_props = re.findall(r'\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*:', raw_body)
-                        if unquoted_props:
-                            logger.warning(f"Possible unquoted property names: {unquoted_props}")
-                            
-            except Exception as e:
-                logger.error(f"Error reading request body: {e}")
-        
+        if self.enabled and request.path.startswith(self.path_prefix):
+            request.ml_log_started = time.perf_counter()
         return None
+    
+    def process_response(self, request, response):
+        started = getattr(request, 'ml_log_started', None)
+        if started is None:
+            return response
+        
+        parse_failure = getattr(request, 'ml_parse_failure', None)
+        if parse_failure is None and response.status_code < 400 and random.random() >= self.sample_rate:
+            return response
+        
+        fields = {
+            'method': request.method,
+            'path': request.path[:self.field_limit],
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            'request_bytes': int(request.META.get('CONTENT_LENGTH') or 0),
+            'response_bytes': 0 if response.streaming else len(response.content),
+            'user_id': getattr(request, 'user_id', None),
+            'sample_rate': self.sample_rate,
+        }
+        if parse_failure is not None:
+            fields.update(parse_failure)
+        
+        level = logging.ERROR if response.status_code >= 500 else logging.WARNING if response.status_code >= 400 else logging.INFO
+        if response.streaming:
+            response.streaming_content = self._logged_stream(response.streaming_content, level, fields, started)
+        else:
+            logger.log(level, 'request', extra={'fields': fields})
+        return response
+    
+    @staticmethod
+    def _logged_stream(chunks, level, fields, started):
+        # Also logs streams the client stopped reading (the generator is closed)
+        try:
+            for chunk in chunks:
+                fields['response_bytes'] += len(chunk)
+                yield chunk
+        finally:
+            fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            logger.log(level, 'request', extra={'fields': fields})
@@ -0,0 +1,323 @@
+"""
+Declarative clinical recommendation rules
+
+Each model's recommendations are a table of rules: a condition on the
+prediction, the request inputs, the model features (UFR, BU_Diff, ...) or
+values derived from them, and the messages it adds, in output order. A table
+is compiled against the model's FeatureSchema and evaluated for a whole
+batch at once: every condition becomes one boolean mask over the feature
+matrix the predictor has already built, and records with the same
+combination of matching rules share one message list.
+
+Conditions are written with col() and PREDICTED:
+
+    Rule(PREDICTED & (col('urr') < 65), "...")
+    Rule(col('s_ca') < 2.1, "...")
+
+Comparisons follow Python's semantics for NaN (every comparison is False), so
+`~(col('hb') < 10)` and `col('hb') >= 10` differ for a NaN input; the tables
+negate conditions the way the original if/elif/else chains did.
+"""
+import operator
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .features import FeatureSchema
+
+# Distinct rule combinations whose message lists are kept per engine
+MAX_CACHED_PATTERNS = 4096
+
+
+class Condition:
+    """
+    A vectorized condition over the values of a batch
+    """
+    
+    __slots__ = ()
+    
+    def evaluate(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+    
+    def names(self) -> List[str]:
+        """Values the condition reads"""
+        raise NotImplementedError
+    
+    def __and__(self, other: 'Condition') -> 'Condition':
+        return _All(self, other)
+    
+    def __invert__(self) -> 'Condition':
+        return _Not(self)
+
+
+class _Compare(Condition):
+    __slots__ = ('name', 'symbol', 'compare', 'threshold')
+    
+    def __init__(self, name: str, symbol: str, compare: Callable, threshold: float):
+        self.name = name
+        self.symbol = symbol
+        self.compare = compare
+        self.threshold = threshold
+    
+    def evaluate(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        return self.compare(values[self.name], self.threshold)
+    
+    def names(self) -> List[str]:
+        return [self.name]
+    
+    def __str__(self) -> str:
+        return f"{self.name} {self.symbol} {self.threshold}"
+
+
+class _Predicted(Condition):
+    __slots__ = ()
+    
+    def evaluate(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        return values[PREDICTED_NAME]
+    
+    def names(self) -> List[str]:
+        return [PREDICTED_NAME]
+    
+    def __str__(self) -> str:
+        return PREDICTED_NAME
+
+
+class _Not(Condition):
+    __slots__ = ('condition',)
+    
+    def __init__(self, condition: Condition):
+        self.condition = condition
+    
+    def evaluate(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        return ~self.condition.evaluate(values)
+    
+    def names(self) -> List[str]:
+        return self.condition.names()
+    
+    def __str__(self) -> str:
+        return f"not ({self.condition})"
+
+
+class _All(Condition):
+    __slots__ = ('conditions',)
+    
+    def __init__(self, *conditions: Condition):
+        self.conditions = conditions
+    
+    def evaluate(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        mask = self.conditions[0].evaluate(values)
+        for condition in self.conditions[1:]:
+            mask = mask & condition.evaluate(values)
+        return mask
+    
+    def names(self) -> List[str]:
+        return [name for condition in self.conditions for name in condition.names()]
+    
+    def __str__(self) -> str:
+        return ' and '.join(str(condition) for condition in self.conditions)
+
+
+class Column:
+    """
+    Reference to an input, model feature or derived value in a rule condition
+    """
+    
+    __slots__ = ('name',)
+    
+    def __init__(self, name: str):
+        self.name = name
+    
+    def __gt__(self, threshold: float) -> Condition:
+        return _Compare(self.name, '>', operator.gt, threshold)
+    
+    def __lt__(self, threshold: float) -> Condition:
+        return _Compare(self.name, '<', operator.lt, threshold)
+    
+    def __ge__(self, threshold: float) -> Condition:
+        return _Compare(self.name, '>=', operator.ge, threshold)
+    
+    def __le__(self, threshold: float) -> Condition:
+        return _Compare(self.name, '<=', operator.le, threshold)
+
+
+def col(name: str) -> Column:
+    """Value `name` of the records: an input field, a model feature or a derived value of the table"""
+    return Column(name)
+
+
+# The model's positive class prediction for the record
+PREDICTED_NAME = 'predicted'
+PREDICTED = _Predicted()
+
+
+class Rule:
+    """
+    Messages added to the recommendations of every record matching a condition
+    """
+    
+    __slots__ = ('condition', 'messages')
+    
+    def __init__(self, condition: Condition, *messages: str):
+        if not messages:
+            raise ValueError(f"Rule '{condition}' has no messages")
+        self.condition = condition
+        self.messages = messages
+
+
+class RuleTable:
+    """
+    Ordered recommendation rules of one model
+    
+    `derived` holds values computed from the inputs and features for the
+    rules only (name -> vectorized function of the batch values).
+    """
+    
+    def __init__(self, model_name: str, rules: Sequence[Rule],
+                 derived: Optional[Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]]] = None):
+        self.model_name = model_name
+        self.rules = list(rules)
+        self.derived = dict(derived or {})
+    
+    def compile(self, schema: FeatureSchema) -> 'RecommendationEngine':
+        """Compile the table against the schema whose feature matrix it is evaluated on"""
+        return RecommendationEngine(self, schema)
+
+
+class RecommendationEngine:
+    """
+    Compiled form of a RuleTable
+    
+    evaluate() takes the feature matrix and input columns of a batch (see
+    FeatureBuilder.build_with_inputs) and the model's predictions, and
+    returns the recommendation list of every record.
+    """
+    
+    def __init__(self, table: RuleTable, schema: FeatureSchema):
+        self.table = table
+        if len(table.rules) > 62:
+            raise ValueError(f"Too many rules in the {table.model_name} table ({len(table.rules)} > 62)")
+        
+        inputs = {field.name for field in schema.numeric_inputs}
+        self._feature_columns = {name: index for index, name in enumerate(schema.feature_names)}
+        known = inputs | set(self._feature_columns) | set(table.derived) | {PREDICTED_NAME}
+        for rule in table.rules:
+            for name in rule.condition.names():
+                if name not in known:
+                    raise ValueError(f"Rule '{rule.condition}' of {table.model_name} reads unknown value '{name}'")
+        
+        self._conditions = [rule.condition for rule in table.rules]
+        self._messages = [rule.messages for rule in table.rules]
+        self._bits = np.left_shift(np.int64(1), np.arange(len(table.rules), dtype=np.int64))
+        # Message lists by bit pattern of matching rules
+        self._lists: Dict[int, Tuple[str, ...]] = {}
+    
+    def _values(self, inputs: Dict[str, np.ndarray], X: np.ndarray, predicted: np.ndarray) -> Dict[str, np.ndarray]:
+        values = dict(inputs)
+        for name, index in self._feature_columns.items():
+            values.setdefault(name, X[:, index])
+        values[PREDICTED_NAME] = predicted
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name, compute in self.table.derived.items():
+                values[name] = compute(values)
+        return values
+    
+    def masks(self, inputs: Dict[str, np.ndarray], X: np.ndarray, predictions: Sequence[Any]) -> np.ndarray:
+        """(n_rules, n_records) boolean matrix of the matching rules"""
+        predicted = np.fromiter(map(bool, predictions), dtype=bool, count=len(predictions))
+        values = self._values(inputs, np.asarray(X, dtype=np.float64), predicted)
+        masks = np.empty((len(self._conditions), len(predicted)), dtype=bool)
+        for index, condition in enumerate(self._conditions):
+            masks[index] = condition.evaluate(values)
+        return masks
+    
+    def evaluate(self, inputs: Dict[str, np.ndarray], X: np.ndarray, predictions: Sequence[Any]) -> List[List[str]]:
+        """Recommendation list of every record"""
+        patterns = (self._bits @ self.masks(inputs, X, predictions)).tolist()
+        # Records matching the same rules get the same messages: each distinct list is built once
+        lists = self._lists
+        try:
+            return [list(lists[pattern]) for pattern in patterns]
+        except KeyError:
+            if len(lists) > MAX_CACHED_PATTERNS:
+                lists.clear()
+            for pattern in set(patterns).difference(lists):
+                lists[pattern] = self._messages_for(pattern)
+            return [list(lists[pattern]) for pattern in patterns]
+    
+    def _messages_for(self, pattern: int) -> Tuple[str, ...]:
+        return tuple(
+            message
+            for index, messages in enumerate(self._messages) if pattern >> index & 1
+            for message in messages
+        )
+
+
+def _bu_reduction(values: Dict[str, np.ndarray]) -> np.ndarray:
+    # Urea reduction (%) from the BU_Diff feature, 0 when there is no pre-HD urea
+    bu_pre_hd = values['bu_pre_hd']
+    result = np.zeros_like(bu_pre_hd)
+    np.divide(values['BU_Diff'], bu_pre_hd, out=result, where=bu_pre_hd > 0)
+    return result * 100
+
+
+DRY_WEIGHT_RULES = RuleTable('dry_weight', [
+    # Main prediction recommendation
+    Rule(PREDICTED, "⚠️ Dry weight adjustment predicted for next session",
+         "Monitor fluid status closely and reassess dry weight"),
+    Rule(~PREDICTED, "✅ Current dry weight appears stable", "Continue with current dry weight target"),
+    # Clinical parameter recommendations
+    Rule(col('sys') > 140, "High systolic BP detected - consider antihypertensive adjustment"),
+    Rule(col('weight_gain') > 3.0, "Excessive interdialytic weight gain - patient education needed"),
+    Rule(col('weight_gain') < 1.0, "Low weight gain - monitor for signs of volume depletion"),
+    # UFR recommendations (UFR is a model feature)
+    Rule(col('UFR') > 13, "High UFR detected - risk of hypotension and cramping"),
+    Rule(col('UFR') < 10, "Low UFR - consider longer treatment time if volume overloaded"),
+    # TMP and blood flow recommendations
+    Rule(col('tmp') > 200, "High transmembrane pressure - check for access issues"),
+    Rule(col('bfr') < 300, "Low blood flow rate - consider access evaluation"),
+])
+
+URR_RULES = RuleTable('urr', [
+    # URR-specific recommendations
+    Rule(PREDICTED, "⚠️ Patient predicted to have inadequate URR next month"),
+    Rule(PREDICTED & (col('urr') < 65), "Current URR below target - dialysis inadequacy detected",
+         "Consider increasing treatment time or frequency", "Evaluate vascular access function"),
+    Rule(PREDICTED & ~(col('urr') < 65), "Monitor closely - risk of URR decline detected",
+         "Review dialysis prescription parameters"),
+    Rule(~PREDICTED, "✅ URR levels predicted to remain adequate", "Continue current dialysis regimen"),
+    # Lab-based recommendations for URR optimization
+    Rule(col('albumin') < 35, "Low albumin may affect dialysis efficiency - nutritional support needed"),
+    Rule(col('hb') < 10, "Low hemoglobin - may impact dialysis tolerance and adequacy"),
+    # Access-related recommendations based on the BU_Diff feature
+    Rule(col('bu_reduction') < 65, "Inadequate urea reduction - check access flow and dialyzer function"),
+    # Electrolyte balance recommendations
+    Rule(col('serum_k_pre_hd') > 5.5, "High potassium - dietary counseling and dialysate adjustment needed"),
+    Rule(col('s_ca') < 2.1, "Low calcium - consider calcium supplementation"),
+    Rule(col('s_ca') > 2.6, "High calcium - review phosphate binders and vitamin D therapy"),
+], derived={'bu_reduction': _bu_reduction})
+
+HB_RULES = RuleTable('hb', [
+    # Risk-based recommendations
+    Rule(PREDICTED, "⚠️ Patient predicted to enter Hb risk zone next month"),
+    Rule(PREDICTED & (col('hb') < 10), "Current Hb below target - urgent intervention needed",
+         "Consider increasing EPO dose or iron supplementation"),
+    Rule(PREDICTED & ~(col('hb') < 10) & (col('hb') > 12),
+         "Current Hb above target - risk of cardiovascular complications",
+         "Consider reducing EPO dose and monitor closely"),
+    Rule(PREDICTED & ~(col('hb') < 10) & ~(col('hb') > 12), "Monitor closely and consider preventive measures"),
+    Rule(~PREDICTED, "✅ Hb levels predicted to remain stable", "Continue current treatment regimen"),
+    # Lab-based recommendations
+    Rule(col('albumin') < 35, "Low albumin - nutritional counseling recommended"),
+    Rule(col('s_ca') < 2.1, "Low calcium - consider calcium supplementation"),
+    Rule(col('s_ca') > 2.6, "High calcium - review phosphate binders"),
+    Rule(col('serum_k_pre_hd') > 5.5, "High potassium - dietary restriction advised"),
+    Rule(col('serum_k_pre_hd') < 3.5, "Low potassium - monitor for arrhythmias"),
+    # Dialysis adequacy (BU_Diff feature over pre-HD urea, as a percentage)
+    Rule(col('bu_reduction') < 65, "Inadequate dialysis - consider increasing treatment time/frequency"),
+], derived={'bu_reduction': lambda values: values['BU_Diff'] / values['bu_pre_hd'] * 100})
+
+RECOMMENDATION_RULES = {
+    'dry_weight': DRY_WEIGHT_RULES,
+    'urr': URR_RULES,
+    'hb': HB_RULES,
+}
@@ -0,0 +1,146 @@
+"""
+Typed prediction results
+
+The predictors return these slotted objects instead of payload dicts. FIELDS
+lists the response fields in the order of the matching response serializer
+(which still documents the schema), and ml_models.encoding writes a result
+straight to the JSON bytes that serializer and DRF's JSONRenderer produced.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class PredictionResult:
+    """
+    Base class of the prediction results
+    
+    `index` is the position of the record in a batch request, `latency_tier`
+    the tier of a request that asked for one and `explanation` the feature
+    contributions of a request that asked for them (ml_models.explanations);
+    they are only part of the payload when set.
+    """
+    
+    __slots__ = ('model_version', 'prediction_date', 'latency_tier', 'explanation', 'index')
+    
+    # Response fields in serializer order, and the ones holding floats
+    FIELDS: Tuple[str, ...] = ()
+    FLOAT_FIELDS: Tuple[str, ...] = ()
+    
+    def stamped(self, prediction_date: datetime) -> 'PredictionResult':
+        """Copy of the result with another prediction date (results in the prediction cache are shared)"""
+        result = object.__new__(type(self))
+        for name in self.FIELDS:
+            setattr(result, name, getattr(self, name))
+        result.prediction_date = prediction_date
+        result.latency_tier = self.latency_tier
+        result.explanation = self.explanation
+        result.index = self.index
+        return result
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """The result as the payload dict the predictors used to return"""
+        payload = {name: getattr(self, name) for name in self.FIELDS}
+        payload['prediction_date'] = self.prediction_date.isoformat()
+        if self.latency_tier is not None:
+            payload['latency_tier'] = self.latency_tier
+        if self.explanation is not None:
+            payload['explanation'] = self.explanation
+        if self.index is not None:
+            payload['index'] = self.index
+        return payload
+
+
+class DryWeightResult(PredictionResult):
+    """
+    Dry weight change prediction (DryWeightPredictionResponseSerializer)
+    """
+    
+    __slots__ = ('patient_id', 'dry_weight_change_predicted', 'prediction_status', 'change_probability',
+                 'confidence_score', 'current_dry_weight', 'current_weight_gain', 'recommendations')
+    
+    FIELDS = ('patient_id', 'dry_weight_change_predicted', 'prediction_status', 'change_probability',
+              'confidence_score', 'current_dry_weight', 'current_weight_gain', 'recommendations',
+              'model_version', 'prediction_date')
+    FLOAT_FIELDS = ('change_probability', 'confidence_score', 'current_dry_weight', 'current_weight_gain')
+    
+    def __init__(self, patient_id: str, dry_weight_change_predicted: bool, prediction_status: str,
+                 change_probability: float, confidence_score: float, current_dry_weight: float,
+                 current_weight_gain: float, recommendations: List[str], model_version: str,
+                 prediction_date: datetime, index: Optional[int] = None, latency_tier: Optional[str] = None):
+        self.patient_id = patient_id
+        self.dry_weight_change_predicted = dry_weight_change_predicted
+        self.prediction_status = prediction_status
+        self.change_probability = change_probability
+        self.confidence_score = confidence_score
+        self.current_dry_weight = current_dry_weight
+        self.current_weight_gain = current_weight_gain
+        self.recommendations = recommendations
+        self.model_version = model_version
+        self.prediction_date = prediction_date
+        self.latency_tier = latency_tier
+        self.explanation = None
+        self.index = index
+
+
+class URRResult(PredictionResult):
+    """
+    URR risk prediction (URRPredictionResponseSerializer)
+    """
+    
+    __slots__ = ('patient_id', 'urr_risk_predicted', 'risk_status', 'adequacy_status', 'current_urr',
+                 'target_urr_range', 'risk_probability', 'confidence_score', 'recommendations')
+    
+    FIELDS = ('patient_id', 'urr_risk_predicted', 'risk_status', 'adequacy_status', 'current_urr',
+              'target_urr_range', 'risk_probability', 'confidence_score', 'recommendations',
+              'model_version', 'prediction_date')
+    FLOAT_FIELDS = ('current_urr', 'risk_probability', 'confidence_score')
+    
+    def __init__(self, patient_id: Optional[str], urr_risk_predicted: bool, risk_status: str, adequacy_status: str,
+                 current_urr: float, target_urr_range: Dict[str, float], risk_probability: float,
+                 confidence_score: float, recommendations: List[str], model_version: str,
+                 prediction_date: datetime, index: Optional[int] = None, latency_tier: Optional[str] = None):
+        self.patient_id = patient_id
+        self.urr_risk_predicted = urr_risk_predicted
+        self.risk_status = risk_status
+        self.adequacy_status = adequacy_status
+        self.current_urr = current_urr
+        self.target_urr_range = target_urr_range
+        self.risk_probability = risk_probability
+        self.confidence_score = confidence_score
+        self.recommendations = recommendations
+        self.model_version = model_version
+        self.prediction_date = prediction_date
+        self.latency_tier = latency_tier
+        self.explanation = None
+        self.index = index
+
+
+class HbResult(PredictionResult):
+    """
+    Hb risk prediction (HbPredictionResponseSerializer)
+    """
+    
+    __slots__ = ('hb_risk_predicted', 'risk_status', 'hb_trend', 'current_hb', 'target_hb_range',
+                 'risk_probability', 'recommendations', 'confidence_score')
+    
+    FIELDS = ('hb_risk_predicted', 'risk_status', 'hb_trend', 'current_hb', 'target_hb_range',
+              'risk_probability', 'recommendations', 'confidence_score', 'model_version', 'prediction_date')
+    FLOAT_FIELDS = ('current_hb', 'risk_probability', 'confidence_score')
+    
+    def __init__(self, hb_risk_predicted: bool, risk_status: str, hb_trend: str, current_hb: float,
+                 target_hb_range: Dict[str, float], risk_probability: float, recommendations: List[str],
+                 confidence_score: float, model_version: str, prediction_date: datetime,
+                 index: Optional[int] = None, latency_tier: Optional[str] = None):
+        self.hb_risk_predicted = hb_risk_predicted
+        self.risk_status = risk_status
+        self.hb_trend = hb_trend
+        self.current_hb = current_hb
+        self.target_hb_range = target_hb_range
+        self.risk_probability = risk_probability
+        self.recommendations = recommendations
+        self.confidence_score = confidence_score
+        self.model_version = model_version
+        self.prediction_date = prediction_date
+        self.latency_tier = latency_tier
+        self.explanation = None
+        self.index = index
@@ -0,0 +1,36 @@
+"""
+OpenAPI annotations of the views
+
+drf-spectacular is only needed to generate the schema, which the serving
+workers never do, so it is imported only when schema generation is enabled
+(ML_OPENAPI_SCHEMA, which also serves the document at /api/schema/).
+Otherwise extend_schema leaves the views untouched and OpenApiParameter just
+keeps its arguments.
+"""
+from django.conf import settings
+
+if getattr(settings, 'ML_OPENAPI_SCHEMA', False):
+    from drf_spectacular.utils import OpenApiParameter, extend_schema
+else:
+    class OpenApiParameter:
+        """
+        Arguments of a drf-spectacular OpenApiParameter, kept for reading
+        """
+        
+        QUERY = 'query'
+        PATH = 'path'
+        HEADER = 'header'
+        COOKIE = 'cookie'
+        
+        def __init__(self, name, type=str, location=QUERY, required=False, description='', **kwargs):
+            self.name = name
+            self.type = type
+            self.location = location
+            self.required = required
+            self.description = description
+            self.kwargs = kwargs
+    
+    def extend_schema(*args, **kwargs):
+        def decorator(view):
+            return view
+        return decorator
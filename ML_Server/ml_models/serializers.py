@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 
@@ -24,11 +25,34 @@ class DryWeightPredictionSerializer(serializers.Serializer):
     post_hd_weight = serializers.FloatField(min_value=20, max_value=300, help_text="Post HD weight (kg)")
     dry_weight = serializers.FloatField(min_value=20, max_value=300, help_text="Dry weight (kg)")
     
-    # Optional rolling averages (will use current session values if not provided)
+    # Optional rolling averages (taken from the patient's history, else the current session values, if not provided)
     weight_gain_avg_3 = serializers.FloatField(required=False, min_value=0, max_value=10, 
                                                help_text="3-session rolling average of Weight gain (kg)")
     sys_avg_3 = serializers.FloatField(required=False, min_value=60, max_value=250, 
                                        help_text="3-session rolling average of SYS (mmHg)")
+    recorded_at = serializers.DateField(required=False,
+                                        help_text="Session date; history records on or after it are not used")
+
+
+class FeatureContributionSerializer(serializers.Serializer):
+    """
+    Serializer for the contribution of one model feature to a prediction
+    """
+    feature = serializers.CharField(help_text="Model feature")
+    value = serializers.FloatField(allow_null=True, help_text="Feature value the model was given (null if missing)")
+    contribution = serializers.FloatField(help_text="Change of the predicted probability due to this feature")
+
+
+class PredictionExplanationSerializer(serializers.Serializer):
+    """
+    Serializer for the explanation of a prediction
+    base_probability plus the contributions is the predicted probability
+    """
+    base_probability = serializers.FloatField(help_text="Probability predicted without any feature information")
+    contributions = FeatureContributionSerializer(
+        many=True,
+        help_text="TreeSHAP contributions of the model features, largest first"
+    )
 
 
 class DryWeightPredictionResponseSerializer(serializers.Serializer):
@@ -48,6 +72,14 @@ class DryWeightPredictionResponseSerializer(serializers.Serializer):
     )
     model_version = serializers.CharField()
     prediction_date = serializers.DateTimeField()
+    latency_tier = serializers.CharField(
+        required=False,
+        help_text="Latency tier the prediction was scored with (only when the request asked for one)"
+    )
+    explanation = PredictionExplanationSerializer(
+        required=False,
+        help_text="Feature contributions (only when the request asked for an explanation)"
+    )
 
 
 class URRPredictionSerializer(serializers.Serializer):
@@ -64,7 +96,9 @@ class URRPredictionSerializer(serializers.Serializer):
     
     # URR parameters
     urr = serializers.FloatField(min_value=30, max_value=95, help_text="Current URR (%)")
-    urr_diff = serializers.FloatField(min_value=-30, max_value=30, help_text="URR difference from previous session (%)")
+    urr_diff = serializers.FloatField(required=False, min_value=-30, max_value=30,
+                                      help_text="URR difference from previous session (%); "
+                                                "taken from the patient's history if not provided")
     
     # Dialysis efficiency parameters (for calculating differences)
     serum_k_pre_hd = serializers.FloatField(min_value=2.0, max_value=8.0, help_text="Serum K Pre-HD (mmol/L)")
@@ -74,8 +108,10 @@ class URRPredictionSerializer(serializers.Serializer):
     scr_pre_hd = serializers.FloatField(min_value=10, max_value=2000, help_text="SCR- pre HD (µmol/L)")
     scr_post_hd = serializers.FloatField(min_value=10, max_value=1500, help_text="SCR- post HD (µmol/L)")
     
-    # Optional patient ID
+    # Optional patient ID (needed for history-based inputs)
     patient_id = serializers.CharField(max_length=50, required=False, help_text="Patient identifier")
+    recorded_at = serializers.DateField(required=False,
+                                        help_text="Investigation date; history records on or after it are not used")
 
 
 class URRPredictionResponseSerializer(serializers.Serializer):
@@ -96,6 +132,14 @@ class URRPredictionResponseSerializer(serializers.Serializer):
     )
     model_version = serializers.CharField()
     prediction_date = serializers.DateTimeField()
+    latency_tier = serializers.CharField(
+        required=False,
+        help_text="Latency tier the prediction was scored with (only when the request asked for one)"
+    )
+    explanation = PredictionExplanationSerializer(
+        required=False,
+        help_text="Feature contributions (only when the request asked for an explanation)"
+    )
 
 
 class HbPredictionSerializer(serializers.Serializer):
@@ -114,8 +158,14 @@ class HbPredictionSerializer(serializers.Serializer):
     serum_k_pre_hd = serializers.FloatField(min_value=0, max_value=8.0, help_text="Serum K Pre-HD (mmol/L)")
     serum_na_pre_hd = serializers.FloatField(min_value=0, max_value=150, help_text="Serum Na Pre-HD (mmol/L)")
     ua = serializers.FloatField(min_value=0, max_value=1000, help_text="UA (micro mol/L)")#check units for UA
-    hb_diff = serializers.FloatField(min_value=-7.0, max_value=7.0, help_text="Hb_diff (g/dL)")
+    hb_diff = serializers.FloatField(required=False, min_value=-7.0, max_value=7.0,
+                                     help_text="Hb_diff (g/dL); taken from the patient's history if not provided")
     hb = serializers.FloatField(min_value=2, max_value=20, help_text="Current Hb (g/dL)")
+    
+    # Optional patient ID (needed for history-based inputs)
+    patient_id = serializers.CharField(max_length=50, required=False, help_text="Patient identifier")
+    recorded_at = serializers.DateField(required=False,
+                                        help_text="Investigation date; history records on or after it are not used")
 
 
 class HbPredictionResponseSerializer(serializers.Serializer):
@@ -135,6 +185,126 @@ class HbPredictionResponseSerializer(serializers.Serializer):
     confidence_score = serializers.FloatField()
     model_version = serializers.CharField()
     prediction_date = serializers.DateTimeField()
+    latency_tier = serializers.CharField(
+        required=False,
+        help_text="Latency tier the prediction was scored with (only when the request asked for one)"
+    )
+    explanation = PredictionExplanationSerializer(
+        required=False,
+        help_text="Feature contributions (only when the request asked for an explanation)"
+    )
+
+
+class BatchPredictionRequestSerializer(serializers.Serializer):
+    """
+    Serializer for batch prediction requests
+    Each record is validated individually with the matching single-record serializer
+    so that invalid rows can be reported by index without failing the whole batch;
+    the list items are therefore not checked here (a non-object item is one invalid row)
+    """
+    records = serializers.ListField(
+        min_length=1,
+        max_length=settings.ML_BATCH_MAX_RECORDS,
+        help_text="List of prediction input records (same fields as the single-record endpoint)"
+    )
+
+
+class BatchPredictionErrorSerializer(serializers.Serializer):
+    """
+    Serializer for a single rejected record in a batch prediction response
+    """
+    index = serializers.IntegerField(help_text="Position of the record in the request")
+    details = serializers.DictField(help_text="Field validation errors for the record")
+
+
+class BatchPredictionResponseSerializer(serializers.Serializer):
+    """
+    Base serializer for batch prediction responses
+    """
+    total = serializers.IntegerField()
+    succeeded = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    errors = BatchPredictionErrorSerializer(many=True)
+
+
+class DryWeightBatchResultSerializer(DryWeightPredictionResponseSerializer):
+    index = serializers.IntegerField(help_text="Position of the record in the request")
+
+
+class DryWeightBatchPredictionResponseSerializer(BatchPredictionResponseSerializer):
+    results = DryWeightBatchResultSerializer(many=True)
+
+
+class URRBatchResultSerializer(URRPredictionResponseSerializer):
+    index = serializers.IntegerField(help_text="Position of the record in the request")
+
+
+class URRBatchPredictionResponseSerializer(BatchPredictionResponseSerializer):
+    results = URRBatchResultSerializer(many=True)
+
+
+class HbBatchResultSerializer(HbPredictionResponseSerializer):
+    index = serializers.IntegerField(help_text="Position of the record in the request")
+
+
+class HbBatchPredictionResponseSerializer(BatchPredictionResponseSerializer):
+    results = HbBatchResultSerializer(many=True)
+
+
+class SessionHistoryRecordSerializer(serializers.Serializer):
+    """
+    Serializer for a dialysis session record pushed to the patient history store
+    """
+    patient_id = serializers.CharField(max_length=50, help_text="Patient identifier")
+    recorded_at = serializers.DateField(help_text="Session date")
+    weight_gain = serializers.FloatField(required=False, allow_null=True, min_value=0, max_value=10,
+                                         help_text="Weight gain (kg)")
+    sys = serializers.FloatField(required=False, allow_null=True, min_value=60, max_value=250, help_text="SYS (mmHg)")
+
+
+class MonthlyHistoryRecordSerializer(serializers.Serializer):
+    """
+    Serializer for a monthly investigation record pushed to the patient history store
+    URR is calculated from the BU values when not provided
+    """
+    patient_id = serializers.CharField(max_length=50, help_text="Patient identifier")
+    recorded_at = serializers.DateField(help_text="Investigation date")
+    hb = serializers.FloatField(required=False, allow_null=True, min_value=2, max_value=20, help_text="Hb (g/dL)")
+    urr = serializers.FloatField(required=False, allow_null=True, min_value=30, max_value=95, help_text="URR (%)")
+    bu_pre_hd = serializers.FloatField(required=False, min_value=10, max_value=100, help_text="BU - pre HD (mmol/L)")
+    bu_post_hd = serializers.FloatField(required=False, min_value=5, max_value=50, help_text="BU - post HD (mmol/L)")
+    
+    def validate(self, attrs):
+        if attrs.get('urr') is None and 'bu_pre_hd' in attrs and 'bu_post_hd' in attrs:
+            attrs['urr'] = round((attrs['bu_pre_hd'] - attrs['bu_post_hd']) / attrs['bu_pre_hd'] * 100, 3)
+        return attrs
+
+
+class SessionHistoryRequestSerializer(serializers.Serializer):
+    records = SessionHistoryRecordSerializer(many=True, allow_empty=False, max_length=settings.ML_BATCH_MAX_RECORDS)
+
+
+class MonthlyHistoryRequestSerializer(serializers.Serializer):
+    records = MonthlyHistoryRecordSerializer(many=True, allow_empty=False, max_length=settings.ML_BATCH_MAX_RECORDS)
+
+
+class HistoryPushResponseSerializer(serializers.Serializer):
+    """
+    Serializer for the history push response
+    """
+    stream = serializers.CharField()
+    stored = serializers.IntegerField(help_text="Number of records stored")
+
+
+class ModelReloadSerializer(serializers.Serializer):
+    """
+    Serializer for the admin model reload request
+    """
+    model = serializers.ChoiceField(
+        choices=['dry_weight', 'urr', 'hb'], required=False,
+        help_text="Model to reload (all loaded models if omitted)"
+    )
+    force = serializers.BooleanField(default=False, help_text="Swap the model in even if the file content is unchanged")
 
 
 class ErrorResponseSerializer(serializers.Serializer):
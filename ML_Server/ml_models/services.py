@@ -1,80 +1,863 @@
 import os
-import joblib
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 import logging
 
+from .artifacts import MANIFEST_NAME, NativeArtifact, load_native_artifact
+from .cache import PredictionCache
+from .explanations import ensemble_contributions, explanation_payloads, probability_contributions
+from .features import DRY_WEIGHT_SCHEMA, URR_SCHEMA, HB_SCHEMA, ColumnarRecords, FeatureSchema
+from .metrics import StageClock, labels, metrics
+from .recommendations import DRY_WEIGHT_RULES, HB_RULES, URR_RULES
+from .results import DryWeightResult, HbResult, PredictionResult, URRResult
+from .shadow import shadow_evaluator
+from .tiers import FULL_TIER, latency_tiers
+from .tree_engine import COMPILED_TOLERANCE, CompiledForest, FusedEnsemble, compile_model
+
 logger = logging.getLogger(__name__)
 
 
+class LoadedModel:
+    """
+    An immutable snapshot of a loaded model artifact. Predictors take one snapshot
+    per request, so a hot swap never mixes the model of one version with the
+    version string of another.
+    
+    for_tier() gives the same snapshot scored with the boosting rounds of a
+    latency tier only (see tiers.py); `tier` is None for the snapshot itself.
+    """
+    
+    __slots__ = ('name', 'model', 'compiled', 'ensemble', 'version', 'content_hash', 'path', 'file_signature',
+                 'loaded_at', 'load_time_ms', 'tier', 'iterations', '_tiers')
+    
+    def __init__(self, name: str, model: Any, version: str, content_hash: str, path: str,
+                 file_signature: Tuple[int, int], load_time_ms: float, compiled: Any = None,
+                 ensemble: Optional['WeightedEnsemble'] = None):
+        self.name = name
+        self.model = model
+        # CompiledForest (FusedEnsemble for the Hb bundle) when the compiled backend is active
+        self.compiled = compiled
+        # Evaluator of an ensemble bundle, resolved once at load time
+        self.ensemble = ensemble
+        self.version = version
+        self.content_hash = content_hash
+        self.path = path
+        self.file_signature = file_signature
+        self.loaded_at = datetime.now()
+        self.load_time_ms = load_time_ms
+        # Boosting rounds a tier variant scores (None: all), for ensembles set on the ensemble
+        self.tier = None
+        self.iterations = None
+        self._tiers = {}
+    
+    @property
+    def model_version(self) -> str:
+        """Version reported in prediction responses: '<version>+<content hash prefix>'"""
+        return f"{self.version}+{self.content_hash[:12]}"
+    
+    @property
+    def boosting_rounds(self) -> Dict[str, int]:
+        """Boosting rounds scored per ensemble member ('model' for a single estimator)"""
+        if self.ensemble is not None:
+            iterations = self.ensemble.iterations or [None] * len(self.ensemble.members)
+            return {key: count or _boosting_rounds(member)
+                    for key, member, count in zip(('xgb', 'lgbm'), self.ensemble.members, iterations)}
+        return {'model': self.iterations or _boosting_rounds(self.model)}
+    
+    def for_tier(self, tier: str) -> 'LoadedModel':
+        """This snapshot limited to the boosting rounds of a latency tier (built once per tier)"""
+        variant = self._tiers.get(tier)
+        if variant is None:
+            variant = self._tiers[tier] = _tier_variant(self, tier)
+        return variant
+
+
 class MLModelManager:
     """
     Manager class for loading and managing ML models
+    
+    Models are kept in a registry of LoadedModel snapshots. Loading is
+    single-flight (concurrent first requests unpickle a model only once) and a
+    model can be replaced at runtime with reload_model(), either by an admin call
+    or by the file watcher. The new artifact is loaded and validated off to the
+    side and swapped in atomically; requests already holding the old snapshot
+    finish on the old version.
+    
+    A model is loaded from its native artifact (models/<name>/manifest.json,
+    see artifacts.py) when one exists and from the pickle otherwise.
+    
+    Each model can also have a shadow: another artifact (usually a retrained
+    candidate) that is scored on copies of the served model's traffic off the
+    request path (see shadow.py) but never answers a request.
     """
     
+    DEFAULT_VERSION = "1.0.0"
+    
     def __init__(self):
-        self.models = {}
-        self.model_versions = {}
+        self.registry = {}
+        self.shadows = {}
+        self.load_times = {}
+        self.warmup_times = {}
+        self.validators = {}
+        self.backends = {}
+        self.prefer_native = True
         self.model_paths = {
             'dry_weight': 'models/dry_weight_model.pkl',
             'urr': 'models/urr_model.pkl',
             'hb': 'models/hb_model.pkl'
         }
+        self._init_locks()
+        self._watch_interval = 0
+        self._watcher = None
+        self._watcher_stop = threading.Event()
         
+        # Locks held by another thread at fork time would stay locked forever in
+        # the child, and the watcher thread does not survive the fork either
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+    
+    def _init_locks(self):
+        self._registry_lock = threading.Lock()
+        self._load_locks = {model_name: threading.Lock() for model_name in self.model_paths}
+    
+    def _after_fork_in_child(self):
+        self._init_locks()
+        self._watcher = None
+        self._watcher_stop = threading.Event()
+        if self._watch_interval:
+            self.start_watcher(self._watch_interval)
+    
+    def get_model_path(self, model_name: str) -> str:
+        """Get the absolute path of a model artifact"""
+        if model_name not in self.model_paths:
+            raise ValueError(f"Unknown model: {model_name}")
+        return os.path.join(os.path.dirname(__file__), self.model_paths[model_name])
+    
+    def get_native_manifest_path(self, model_name: str) -> str:
+        """Get the absolute path of a model's native artifact manifest (models/<name>/ next to the pickle)"""
+        return os.path.join(os.path.dirname(self.get_model_path(model_name)), model_name, MANIFEST_NAME)
+    
+    def get_artifact_path(self, model_name: str) -> str:
+        """Path of the artifact the next load will use: the native manifest if present, else the pickle"""
+        manifest_path = self.get_native_manifest_path(model_name)
+        if self.prefer_native and os.path.exists(manifest_path):
+            return manifest_path
+        return self.get_model_path(model_name)
+    
+    def configure_backends(self, backends: Dict[str, str]):
+        """Select the inference backend ('native' or 'compiled') per model; applies to future loads"""
+        for model_name, backend in backends.items():
+            if model_name not in self.model_paths:
+                raise ValueError(f"Unknown model: {model_name}")
+            if backend not in ('native', 'compiled'):
+                raise ValueError(f"Unknown inference backend for {model_name}: {backend}")
+        self.backends = dict(backends)
+    
+    def register_validator(self, model_name: str, validator: Callable[[Any], None]):
+        """Register a callable that must accept a candidate model before it is swapped in"""
+        self.validators[model_name] = validator
+    
+    def get_loaded(self, model_name: str) -> LoadedModel:
+        """Get the current snapshot of a model, loading it on first use"""
+        loaded = self.registry.get(model_name)
+        if loaded is not None:
+            return loaded
+        
+        # Single-flight: only one thread loads a given model, the others wait for it
+        with self._load_locks[model_name]:
+            loaded = self.registry.get(model_name)
+            if loaded is None:
+                loaded = self._load_artifact(model_name)
+                self._swap(loaded)
+                logger.info(f"Successfully loaded model: {model_name} ({loaded.model_version}) in {loaded.load_time_ms:.1f} ms")
+        return loaded
+    
     def load_model(self, model_name: str):
         """Load a specific ML model or ensemble bundle"""
-        if model_name not in self.models:
-            model_path = os.path.join(os.path.dirname(__file__), self.model_paths[model_name])
+        return self.get_loaded(model_name).model
+    
+    def reload_model(self, model_name: str, force: bool = False) -> Dict[str, Any]:
+        """
+        Load the model file again and atomically replace the served model if the
+        content changed. The old model keeps serving if the new one fails to load
+        or validate.
+        """
+        with self._load_locks[model_name]:
+            current = self.registry.get(model_name)
+            candidate = self._load_artifact(model_name)
+            if current is not None and candidate.content_hash == current.content_hash and not force:
+                return {'model': model_name, 'reloaded': False, 'model_version': current.model_version}
+            
+            validator = self.validators.get(model_name)
+            if validator is not None:
+                validator(candidate)
+            
+            self._swap(candidate)
+        
+        previous_version = current.model_version if current is not None else None
+        logger.info(f"Reloaded model: {model_name} ({previous_version} -> {candidate.model_version}) in {candidate.load_time_ms:.1f} ms")
+        return {
+            'model': model_name,
+            'reloaded': True,
+            'previous_version': previous_version,
+            'model_version': candidate.model_version
+        }
+    
+    def register_shadow(self, model_name: str, path: str) -> Dict[str, Any]:
+        """
+        Load another artifact of a model (a pickle, or a native artifact directory
+        or manifest; relative paths are resolved like model_paths) and mirror the
+        model's traffic to it. It must pass the model's validator, and replaces
+        the current shadow of the model.
+        """
+        if model_name not in self.model_paths:
+            raise ValueError(f"Unknown model: {model_name}")
+        path = os.path.join(os.path.dirname(__file__), path)
+        
+        with self._load_locks[model_name]:
+            candidate = self._load_artifact(model_name, path)
+            validator = self.validators.get(model_name)
+            if validator is not None:
+                validator(candidate)
+            with self._registry_lock:
+                self.shadows[model_name] = candidate
+        
+        logger.info(f"Registered shadow model for {model_name}: {candidate.model_version} from {candidate.path}")
+        return {'model': model_name, 'shadow_version': candidate.model_version, 'path': candidate.path}
+    
+    def remove_shadow(self, model_name: str) -> bool:
+        """Stop mirroring a model's traffic; returns whether it had a shadow"""
+        with self._registry_lock:
+            return self.shadows.pop(model_name, None) is not None
+    
+    def _swap(self, loaded: LoadedModel):
+        with self._registry_lock:
+            self.registry[loaded.name] = loaded
+            self.load_times[loaded.name] = loaded.load_time_ms
+        metrics.observe('ml_model_load_seconds', labels(model=loaded.name), loaded.load_time_ms / 1000)
+        metrics.set_gauge('ml_model_last_load_seconds', labels(model=loaded.name), loaded.load_time_ms / 1000)
+    
+    def _load_artifact(self, model_name: str, path: Optional[str] = None) -> LoadedModel:
+        """
+        Load and structurally validate a model artifact without publishing it:
+        the model's own artifact, or the one at `path` (for a shadow model)
+        """
+        start = time.perf_counter()
+        artifact = None
+        if path is None:
+            manifest_path = self.get_native_manifest_path(model_name)
+            use_native = self.prefer_native and os.path.exists(manifest_path)
+            pickle_path = self.get_model_path(model_name)
+        else:
+            manifest_path = os.path.join(path, MANIFEST_NAME) if os.path.isdir(path) else path
+            use_native = os.path.basename(manifest_path) == MANIFEST_NAME
+            pickle_path = None if use_native else path
+        if use_native:
+            try:
+                file_signature = _file_signature(manifest_path)
+                artifact = load_native_artifact(manifest_path)
+            except Exception as e:
+                if pickle_path is None or not os.path.exists(pickle_path):
+                    raise ValueError(f"Failed to load native model artifact from {manifest_path}: {str(e)}")
+                logger.warning(f"Failed to load native artifact of {model_name}, falling back to the pickle: {str(e)}")
+        
+        if artifact is not None:
+            model_path = artifact.path
+            content_hash = artifact.content_hash
+            loaded_object = artifact.model
+        else:
+            model_path = pickle_path
             if not os.path.exists(model_path):
                 raise FileNotFoundError(f"Model file not found: {model_path}")
             
+            file_signature = _file_signature(model_path)
+            content_hash = _file_sha256(model_path)
             try:
+                # joblib is only needed for the pickles (not the native artifacts), so it is imported here
+                import joblib
                 loaded_object = joblib.load(model_path)
             except Exception as e:
                 raise ValueError(f"Failed to load model from {model_path}: {str(e)}")
-            
-            # Handle different model formats
-            if hasattr(loaded_object, 'predict'):
-                # Single model object
-                self.models[model_name] = loaded_object
-            elif isinstance(loaded_object, dict):
-                # Ensemble model bundle (like your notebook approach)
-                if model_name == 'hb':
-                    # Strictly validate ensemble structure for Hb model
-                    required_keys = ['xgb', 'lgbm', 'weights', 'threshold']
-                    missing_keys = [key for key in required_keys if key not in loaded_object]
-                    if missing_keys:
-                        raise ValueError(f"Invalid ensemble model for {model_name}. Missing keys: {missing_keys}. Required: {required_keys}")
-                    
-                    # Validate models are proper ML models
-                    if not hasattr(loaded_object['xgb'], 'predict_proba'):
-                        raise ValueError(f"XGB model in ensemble does not have predict_proba method")
-                    if not hasattr(loaded_object['lgbm'], 'predict_proba'):
-                        raise ValueError(f"LGBM model in ensemble does not have predict_proba method")
-                    
-                    # Store the complete ensemble bundle
-                    self.models[model_name] = loaded_object
-                    logger.info(f"Loaded ensemble model for {model_name} with XGB + LGBM (weights: {loaded_object['weights']}, threshold: {loaded_object['threshold']})")
-                else:
-                    # For other models, allow dict but warn
-                    self.models[model_name] = loaded_object
-                    logger.warning(f"Loaded dict object for {model_name}: {list(loaded_object.keys())}")
+        
+        # Handle different model formats
+        if hasattr(loaded_object, 'predict'):
+            # Single model object
+            pass
+        elif isinstance(loaded_object, dict):
+            # Ensemble model bundle (like your notebook approach)
+            if model_name == 'hb':
+                # Strictly validate ensemble structure for Hb model
+                required_keys = ['xgb', 'lgbm', 'weights', 'threshold']
+                missing_keys = [key for key in required_keys if key not in loaded_object]
+                if missing_keys:
+                    raise ValueError(f"Invalid ensemble model for {model_name}. Missing keys: {missing_keys}. Required: {required_keys}")
+                
+                # Validate models are proper ML models
+                if not hasattr(loaded_object['xgb'], 'predict_proba'):
+                    raise ValueError(f"XGB model in ensemble does not have predict_proba method")
+                if not hasattr(loaded_object['lgbm'], 'predict_proba'):
+                    raise ValueError(f"LGBM model in ensemble does not have predict_proba method")
+                
+                logger.info(f"Loaded ensemble model for {model_name} with XGB + LGBM (weights: {loaded_object['weights']}, threshold: {loaded_object['threshold']})")
             else:
-                raise ValueError(f"Loaded object for {model_name} is not a valid ML model (type: {type(loaded_object)}). Expected an object with 'predict' method or ensemble dict.")
-            
-            self.model_versions[model_name] = "1.0.0"  # Default version
-            logger.info(f"Successfully loaded model: {model_name}")
+                # For other models, allow dict but warn
+                logger.warning(f"Loaded dict object for {model_name}: {list(loaded_object.keys())}")
+        else:
+            raise ValueError(f"Loaded object for {model_name} is not a valid ML model (type: {type(loaded_object)}). Expected an object with 'predict' method or ensemble dict.")
+        
+        # Bundles and native artifacts may carry their own version, plain estimators get the default
+        version = self.DEFAULT_VERSION
+        if artifact is not None and artifact.version:
+            version = str(artifact.version)
+        elif isinstance(loaded_object, dict) and loaded_object.get('version'):
+            version = str(loaded_object['version'])
+        
+        compiled = None
+        if self.backends.get(model_name) == 'compiled':
+            compiled = self._compile(model_name, loaded_object, model_path, content_hash, artifact)
+        
+        ensemble = None
+        if isinstance(loaded_object, dict) and model_name == 'hb':
+            ensemble = WeightedEnsemble(
+                members=[loaded_object['xgb'], loaded_object['lgbm']],
+                weights=loaded_object['weights'],
+                threshold=loaded_object['threshold'],
+                fused=compiled
+            )
         
-        return self.models[model_name]
+        return LoadedModel(
+            name=model_name,
+            model=loaded_object,
+            version=version,
+            content_hash=content_hash,
+            path=model_path,
+            file_signature=file_signature,
+            load_time_ms=(time.perf_counter() - start) * 1000,
+            compiled=compiled,
+            ensemble=ensemble
+        )
+    
+    def _compile(self, model_name: str, loaded_object: Any, model_path: str, content_hash: str,
+                 artifact: Optional[NativeArtifact] = None):
+        """
+        Compile the model's boosters into flat arrays, reusing the memory-mapped
+        forests of a native artifact or the compiled copy cached next to the
+        model file. Ensemble bundles are fused into a single forest. The
+        compiled forest must reproduce the native probabilities; if it cannot,
+        the model is served natively.
+        """
+        if isinstance(loaded_object, dict):
+            if not all(key in loaded_object for key in ('xgb', 'lgbm', 'weights')):
+                logger.warning(f"Compiled backend unavailable for {model_name}, using native inference: not an ensemble bundle")
+                return None
+            members = {key: loaded_object[key] for key in ('xgb', 'lgbm')}
+        else:
+            members = {None: loaded_object}
+        
+        compiled = {}
+        for key, estimator in members.items():
+            label = f"{model_name}/{key}" if key else model_name
+            cache_path = f"{os.path.splitext(model_path)[0]}.{content_hash[:12]}{'.' + key if key else ''}.compiled.npz"
+            try:
+                if artifact is not None and artifact.forest(key) is not None:
+                    forest = artifact.forest(key)
+                elif os.path.exists(cache_path):
+                    forest = CompiledForest.load(cache_path)
+                else:
+                    forest = compile_model(estimator)
+                    try:
+                        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+                        forest.save(temporary_path)
+                        os.replace(temporary_path, cache_path)
+                    except OSError as e:
+                        logger.warning(f"Could not cache compiled model {label} at {cache_path}: {str(e)}")
+                
+                probe = forest.probe_matrix()
+                deviation = float(np.abs(forest.predict_proba(probe)[:, 1] - _predict_proba(estimator, probe)[:, 1]).max())
+                if deviation > COMPILED_TOLERANCE:
+                    raise ValueError(f"compiled predictions deviate from native ones by {deviation:.2e}")
+            except Exception as e:
+                logger.warning(f"Compiled backend unavailable for {label}, using native inference: {str(e)}")
+                return None
+            compiled[key] = forest
+            logger.info(f"Compiled {label}: {forest.n_trees} trees, depth {forest.max_depth}, max deviation {deviation:.2e}")
+        
+        if not isinstance(loaded_object, dict):
+            return compiled[None]
+        
+        try:
+            fused = FusedEnsemble([compiled['xgb'], compiled['lgbm']], loaded_object['weights'],
+                                  merged=artifact.fused if artifact is not None else None)
+            probe = np.vstack([forest.probe_matrix() for forest in compiled.values()])
+            native = sum(weight * _predict_proba(members[key], probe)[:, 1]
+                         for key, weight in zip(('xgb', 'lgbm'), loaded_object['weights']))
+            deviation = float(np.abs(fused.predict_positive(probe) - native).max())
+            if deviation > COMPILED_TOLERANCE:
+                raise ValueError(f"fused predictions deviate from the native ensemble by {deviation:.2e}")
+        except Exception as e:
+            logger.warning(f"Compiled backend unavailable for {model_name} ensemble, using native inference: {str(e)}")
+            return None
+        logger.info(f"Fused {model_name} ensemble: {fused.merged.n_trees} trees, max deviation {deviation:.2e}")
+        return fused
     
     def get_model_version(self, model_name: str) -> str:
         """Get the version of a loaded model"""
-        return self.model_versions.get(model_name, "unknown")
+        loaded = self.registry.get(model_name)
+        return loaded.model_version if loaded is not None else "unknown"
+    
+    def start_watcher(self, interval: float):
+        """Poll the model files every `interval` seconds and hot-reload the ones that changed"""
+        self._watch_interval = interval
+        if not interval or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='ml-model-watcher', daemon=True)
+        self._watcher.start()
+        logger.info(f"Watching model files for changes every {interval}s")
+    
+    def stop_watcher(self):
+        """Stop the model file watcher"""
+        self._watch_interval = 0
+        self._watcher_stop.set()
+    
+    def _watch(self, interval: float):
+        # Signatures of files that already failed to load, so a broken artifact is reported once
+        rejected = {}
+        while not self._watcher_stop.wait(interval):
+            for model_name, loaded in list(self.registry.items()):
+                try:
+                    # A native artifact exported (or removed) since the last load also counts as a change
+                    path = self.get_artifact_path(model_name)
+                    signature = (path, _file_signature(path))
+                    if signature == (loaded.path, loaded.file_signature) or rejected.get(model_name) == signature:
+                        continue
+                    self.reload_model(model_name)
+                    if self.registry[model_name].path != path:
+                        # The native artifact failed to load and the pickle is still served
+                        rejected[model_name] = signature
+                except FileNotFoundError:
+                    # File is being replaced; keep serving the current model
+                    continue
+                except Exception as e:
+                    rejected[model_name] = signature
+                    logger.error(f"Failed to hot-reload model {model_name}, keeping {loaded.model_version}: {str(e)}")
+    
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """Get load state, version and load/warm-up timings for every configured model"""
+        status = {}
+        for model_name in self.model_paths:
+            loaded = self.registry.get(model_name)
+            load_time = self.load_times.get(model_name)
+            warmup_time = self.warmup_times.get(model_name)
+            status[model_name] = {
+                'loaded': loaded is not None,
+                'version': self.get_model_version(model_name),
+                'content_hash': loaded.content_hash if loaded is not None else None,
+                'format': ('native' if os.path.basename(loaded.path) == MANIFEST_NAME else 'pickle') if loaded is not None else None,
+                'backend': ('compiled' if loaded.compiled is not None else 'native') if loaded is not None else self.backends.get(model_name, 'native'),
+                'loaded_at': loaded.loaded_at.isoformat() if loaded is not None else None,
+                'load_time_ms': round(load_time, 2) if load_time is not None else None,
+                'warmup_time_ms': round(warmup_time, 2) if warmup_time is not None else None,
+                'shadow_version': self.shadows[model_name].model_version if model_name in self.shadows else None,
+            }
+        return status
+
 
+def _file_signature(path: str) -> Tuple[int, int]:
+    """Cheap change detection for the watcher: modification time and size"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
 
 
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _predict_proba(model, X: np.ndarray, compiled: Optional[CompiledForest] = None,
+                   iterations: Optional[int] = None) -> np.ndarray:
+    """
+    predict_proba on a NumPy feature matrix. A compiled forest is used when the
+    model has one and the input is small enough for it to be the faster path.
+    Binary LightGBM classifiers are otherwise evaluated through their booster
+    directly, which gives the same probabilities without the sklearn wrapper's
+    per-call input checks (and without its feature name warning for models
+    fitted on a DataFrame). `iterations` limits the boosting rounds scored
+    natively (the compiled forest of a tier variant is truncated already).
+    """
+    if compiled is not None and compiled.is_efficient_for(X.shape[0]):
+        return compiled.predict_proba(X)
+    booster = getattr(model, 'booster_', None)
+    if booster is not None and getattr(model, 'n_classes_', None) == 2 and not callable(getattr(model, '_objective', None)):
+        positive = booster.predict(X, num_iteration=iterations)
+        return np.column_stack((1.0 - positive, positive))
+    if iterations is None:
+        return model.predict_proba(X)
+    if booster is not None:
+        return model.predict_proba(X, num_iteration=iterations)
+    return model.predict_proba(X, iteration_range=(0, iterations))
+
+
+def _boosting_rounds(model) -> int:
+    """Boosting rounds a LightGBM/XGBoost model predicts with (up to its best iteration, like predict_proba)"""
+    booster = getattr(model, 'booster_', None)
+    if booster is not None:
+        return booster.best_iteration if booster.best_iteration > 0 else booster.current_iteration()
+    if not hasattr(model, 'get_booster'):
+        raise ValueError(f"Latency tiers need a LightGBM or XGBoost model (got {type(model).__name__})")
+    booster = model.get_booster()
+    best_iteration = booster.attr('best_iteration')
+    return int(best_iteration) + 1 if best_iteration is not None else booster.num_boosted_rounds()
+
+
+def _tier_variant(loaded: LoadedModel, tier: str) -> LoadedModel:
+    """Copy of a snapshot that scores only the boosting rounds of a latency tier"""
+    if tier not in latency_tiers.fractions:
+        raise ValueError(latency_tiers.validate(tier))
+    variant = object.__new__(LoadedModel)
+    for name in LoadedModel.__slots__:
+        setattr(variant, name, getattr(loaded, name))
+    variant.tier = tier
+    variant._tiers = {}
+    if tier == FULL_TIER:
+        return variant
+    
+    if loaded.ensemble is not None:
+        ensemble = loaded.ensemble
+        rounds = [_boosting_rounds(member) for member in ensemble.members]
+        iterations = [latency_tiers.rounds(tier, count) for count in rounds]
+        fused = None
+        if ensemble.fused is not None:
+            # One tree per boosting round for binary objectives (more with XGBoost's num_parallel_tree)
+            fused = ensemble.fused.truncated([
+                iteration * (forest.n_trees // count) for forest, count, iteration in zip(ensemble.fused.forests, rounds, iterations)
+            ])
+        variant.compiled = fused
+        variant.ensemble = WeightedEnsemble(ensemble.members, ensemble.weights, ensemble.threshold, fused=fused,
+                                            iterations=None if iterations == rounds else iterations)
+    else:
+        rounds = _boosting_rounds(loaded.model)
+        iterations = latency_tiers.rounds(tier, rounds)
+        if iterations < rounds:
+            variant.iterations = iterations
+            if loaded.compiled is not None:
+                variant.compiled = loaded.compiled.truncated(iterations * (loaded.compiled.n_trees // rounds))
+    return variant
+
+
+# Batches at least this large score the ensemble members concurrently on the native backend
+ENSEMBLE_PARALLEL_MIN_ROWS = 256
+
+_ensemble_executor = None
+_ensemble_executor_lock = threading.Lock()
+
+
+def _get_ensemble_executor() -> ThreadPoolExecutor:
+    """Thread pool for concurrent member evaluation, created lazily in each process"""
+    global _ensemble_executor
+    with _ensemble_executor_lock:
+        if _ensemble_executor is None:
+            _ensemble_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ml-ensemble')
+        return _ensemble_executor
+
+
+def _reset_ensemble_executor():
+    # Pool threads do not survive fork; children create their own pool
+    global _ensemble_executor, _ensemble_executor_lock
+    _ensemble_executor = None
+    _ensemble_executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_ensemble_executor)
+
+
+class WeightedEnsemble:
+    """
+    Weighted soft-voting ensemble (the Hb XGB + LGBM bundle), resolved once at load time
+    
+    With the compiled backend, inputs small enough for it are scored by the
+    fused forest in one pass over all members' trees. Otherwise the members are
+    scored natively, concurrently for large batches (both libraries release the
+    GIL while predicting), and blended with the bundle weights.
+    """
+    
+    __slots__ = ('members', 'weights', 'threshold', 'fused', 'iterations')
+    
+    def __init__(self, members: List[Any], weights, threshold: float, fused: Optional[FusedEnsemble] = None,
+                 iterations: Optional[List[int]] = None):
+        if len(members) != len(weights):
+            raise ValueError(f"Ensemble has {len(members)} members but {len(weights)} weights")
+        self.members = list(members)
+        self.weights = [float(weight) for weight in weights]
+        self.threshold = float(threshold)
+        self.fused = fused
+        # Boosting rounds scored per member (None: all, as trained)
+        self.iterations = iterations
+    
+    def predict_positive(self, X: np.ndarray) -> np.ndarray:
+        """Weighted positive-class probability for every row"""
+        if self.fused is not None and self.fused.is_efficient_for(X.shape[0]):
+            return self.fused.predict_positive(X)
+        
+        iterations = self.iterations or [None] * len(self.members)
+        if len(self.members) > 1 and X.shape[0] >= ENSEMBLE_PARALLEL_MIN_ROWS:
+            executor = _get_ensemble_executor()
+            futures = [executor.submit(_predict_proba, member, X, None, count)
+                       for member, count in zip(self.members[1:], iterations[1:])]
+            probabilities = [_predict_proba(self.members[0], X, None, iterations[0])] + [future.result() for future in futures]
+        else:
+            probabilities = [_predict_proba(member, X, None, count) for member, count in zip(self.members, iterations)]
+        
+        blended = self.weights[0] * probabilities[0][:, 1]
+        for weight, member_probabilities in zip(self.weights[1:], probabilities[1:]):
+            blended = blended + weight * member_probabilities[:, 1]
+        return blended
+    
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(predicted class, weighted positive-class probability) for every row"""
+        probabilities = self.predict_positive(X)
+        return (probabilities >= self.threshold).astype(int), probabilities
+
+
+class _BatchRequest:
+    """
+    Records of one caller waiting in a MicroBatcher queue
+    """
+    
+    __slots__ = ('loaded', 'records', 'enqueued_at', 'done', 'is_leader', 'finished', 'result', 'error')
+    
+    def __init__(self, loaded: LoadedModel, records: List[Dict[str, Any]]):
+        self.loaded = loaded
+        self.records = records
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.is_leader = False
+        self.finished = False
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Merges concurrent prediction requests for one model into a single model call
+    
+    There is no background thread: the first caller to find the batcher idle
+    becomes the leader and scores its records immediately, so a lone request on
+    an idle server pays no extra latency. Requests arriving while a batch is
+    being scored queue up; when the batch is done its results are handed back
+    and the oldest queued request becomes the next leader. A leader that finds
+    other requests already waiting gives stragglers up to `window_ms` to join,
+    and stops collecting once `max_rows` rows are queued. Requests are only
+    merged with others holding the same model snapshot.
+    """
+    
+    def __init__(self, model_name: str, predict_loaded: Callable, window_ms: float = 2.0, max_rows: int = 64):
+        self.model_name = model_name
+        self.predict_loaded = predict_loaded
+        self.window_ms = window_ms
+        self.max_rows = max_rows
+        self._init_state()
+        
+        # A lock held by another thread at fork time would stay locked in the child
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._init_state)
+    
+    def _init_state(self):
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queued_rows = 0
+        self._running = False
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.max_batch_size = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+    
+    def submit(self, loaded: LoadedModel, records: List[Dict[str, Any]]) -> List[PredictionResult]:
+        """Score records as part of the next batch; same contract as the predictor's _predict_loaded"""
+        request = _BatchRequest(loaded, records)
+        with self._cond:
+            self._queue.append(request)
+            self._queued_rows += len(records)
+            if not self._running:
+                self._running = True
+                request.is_leader = True
+            else:
+                self._cond.notify_all()
+        
+        while not request.finished:
+            if request.is_leader:
+                self._run_batch()
+            else:
+                # Woken up either with a result or promoted to leader
+                request.done.wait()
+                request.done.clear()
+        
+        if request.error is not None:
+            raise request.error
+        return request.result
+    
+    def _run_batch(self):
+        """Collect a batch from the head of the queue, score it and hand over leadership"""
+        with self._cond:
+            if self.window_ms > 0 and len(self._queue) > 1:
+                deadline = time.perf_counter() + self.window_ms / 1000
+                while self._queued_rows < self.max_rows:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            
+            loaded = self._queue[0].loaded
+            batch = [self._queue.popleft()]
+            rows = len(batch[0].records)
+            while self._queue and self._queue[0].loaded is loaded and rows + len(self._queue[0].records) <= self.max_rows:
+                batch.append(self._queue.popleft())
+                rows += len(batch[-1].records)
+            self._queued_rows -= rows
+            
+            started_at = time.perf_counter()
+            wait_ms = [(started_at - request.enqueued_at) * 1000 for request in batch]
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += rows
+            self.max_batch_size = max(self.max_batch_size, rows)
+            self.total_wait_ms += sum(wait_ms)
+            self.max_wait_ms = max(self.max_wait_ms, max(wait_ms))
+        
+        try:
+            records = [record for request in batch for record in request.records] if len(batch) > 1 else batch[0].records
+            results = self.predict_loaded(loaded, records)
+            offset = 0
+            for request in batch:
+                request.result = results[offset:offset + len(request.records)]
+                offset += len(request.records)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                # Do not fail every request of the batch because of one of them: score them separately
+                for request in batch:
+                    try:
+                        request.result = self.predict_loaded(loaded, request.records)
+                    except Exception as request_error:
+                        request.error = request_error
+        
+        with self._cond:
+            for request in batch:
+                request.finished = True
+                request.is_leader = False
+                request.done.set()
+            if self._queue:
+                successor = self._queue[0]
+                successor.is_leader = True
+                successor.done.set()
+            else:
+                self._running = False
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, batch size and wait time counters reported by the health endpoint"""
+        with self._cond:
+            return {
+                'window_ms': self.window_ms,
+                'max_rows': self.max_rows,
+                'queue_depth': len(self._queue),
+                'queued_rows': self._queued_rows,
+                'batches': self.batches,
+                'requests': self.requests,
+                'rows': self.rows,
+                'mean_batch_size': round(self.rows / self.batches, 2) if self.batches else None,
+                'max_batch_size': self.max_batch_size,
+                'mean_wait_ms': round(self.total_wait_ms / self.requests, 3) if self.requests else None,
+                'max_wait_ms': round(self.max_wait_ms, 3),
+            }
+
+
+def _take(records: List[Dict[str, Any]], indexes: List[int]) -> List[Dict[str, Any]]:
+    """The records at `indexes`, keeping the input columns of columnar records"""
+    if isinstance(records, ColumnarRecords):
+        return records.take(indexes)
+    return [records[index] for index in indexes]
+
+
+def _predict_cached(cache: Optional[PredictionCache], loaded: LoadedModel, schema: FeatureSchema,
+                    records: List[Dict[str, Any]], predict_loaded: Callable) -> List[PredictionResult]:
+    """
+    Score records through the prediction cache, keyed by model version and the
+    canonical input record. Only records missing from the cache are scored, in
+    one batch. Cached results are shared, so every caller gets its own copy
+    stamped with the current prediction_date.
+    """
+    if cache is None or not cache.enabled:
+        return predict_loaded(loaded, records)
+    
+    keys = [(loaded.name, loaded.model_version, loaded.tier, schema.record_key(record)) for record in records]
+    payloads = cache.get_many(keys, lambda indexes: predict_loaded(loaded, _take(records, indexes)))
+    prediction_date = datetime.now()
+    return [payload.stamped(prediction_date) for payload in payloads]
+
+
+def _explain(loaded: LoadedModel, schema: FeatureSchema, X: np.ndarray) -> List[Dict[str, Any]]:
+    """Explanations of the rows of a feature matrix from the native contributions of the snapshot's boosters"""
+    if loaded.ensemble is not None:
+        ensemble = loaded.ensemble
+        contributions, base = ensemble_contributions(ensemble.members, ensemble.weights, X, ensemble.iterations)
+    else:
+        contributions, base = probability_contributions(loaded.model, X, loaded.iterations)
+    return explanation_payloads(schema.feature_names, X, contributions, base)
+
+
+def _explain_cached(cache: Optional[PredictionCache], loaded: LoadedModel, schema: FeatureSchema,
+                    X: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Explanations of the rows of X through the explanation cache, keyed by model
+    version, latency tier and the feature row itself. The rows missing from
+    the cache are explained together, with one contribution call per booster.
+    """
+    if cache is None or not cache.enabled:
+        return _explain(loaded, schema, X)
+    keys = [(loaded.name, loaded.model_version, loaded.tier, row.tobytes()) for row in X]
+    return cache.get_many(keys, lambda indexes: _explain(loaded, schema, X[indexes]))
+
+
+def _attach_explanations(predictor, loaded: LoadedModel, records: List[Dict[str, Any]],
+                         results: List[PredictionResult]) -> List[PredictionResult]:
+    """Set the explanation of every result (results handed out by _predict_cached are the caller's own)"""
+    clock = StageClock(predictor.model_name)
+    X = predictor.feature_builder.build(records)
+    explanations = _explain_cached(predictor.explanation_cache, loaded, predictor.schema, X)
+    for result, explanation in zip(results, explanations):
+        result.explanation = explanation
+    clock.lap('explain')
+    return results
+
+
+def _offer_shadow(predictor, loaded: LoadedModel, X: np.ndarray, predictions: np.ndarray, risk_probabilities: np.ndarray):
+    """
+    Hand rows scored by the served model to the shadow evaluator, if the model
+    has a shadow. Candidates being validated are not served and not mirrored.
+    """
+    manager = predictor.model_manager
+    shadow = manager.shadows.get(loaded.name)
+    if shadow is not None and manager.registry.get(loaded.name) is loaded:
+        shadow_evaluator.offer(shadow, predictor._score, X, predictions, risk_probabilities)
+
+
+def _classes_from_probabilities(model, probabilities: np.ndarray) -> np.ndarray:
+    """Derive predicted classes from predict_proba output (same rule as sklearn's predict)"""
+    class_index = np.argmax(probabilities, axis=1)
+    classes = getattr(model, 'classes_', None)
+    return classes[class_index] if classes is not None else class_index
 
 
 class DryWeightPredictor:
@@ -82,151 +865,123 @@ class DryWeightPredictor:
     Dry weight prediction service using LightGBM with dialysis session data
     """
     
-    def __init__(self, model_manager: MLModelManager):
+    # Declarative feature schema (column order expected by the model) and its compiled builder
+    schema = DRY_WEIGHT_SCHEMA
+    feature_builder = DRY_WEIGHT_SCHEMA.compile()
+    
+    # Declarative recommendation rules, evaluated over the feature matrix of a batch
+    recommendation_rules = DRY_WEIGHT_RULES.compile(DRY_WEIGHT_SCHEMA)
+    
+    # Type of the results (its FIELDS are the columns of Arrow batch responses)
+    result_class = DryWeightResult
+    
+    # Synthetic, in-range session used to warm the model up at startup
+    warmup_record = {
+        'patient_id': 'WARMUP', 'ap': -150.0, 'auf': 2500.0, 'bfr': 300.0, 'hd_duration': 4.0,
+        'puf': 2500.0, 'tmp': 150.0, 'vp': 150.0, 'weight_gain': 2.5, 'sys': 140.0, 'dia': 80.0,
+        'pre_hd_weight': 62.5, 'post_hd_weight': 60.0, 'dry_weight': 60.0
+    }
+    
+    def __init__(self, model_manager: MLModelManager, cache: Optional[PredictionCache] = None,
+                 explanation_cache: Optional[PredictionCache] = None):
         self.model_manager = model_manager
+        self.cache = cache
+        self.explanation_cache = explanation_cache
+        # Optional MicroBatcher merging concurrent requests into one model call
+        self.batcher = None
         self.model_name = 'dry_weight'
-        
-    def predict(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        self.model_manager.register_validator(self.model_name, self._validate_model)
+    
+    def predict(self, input_data: Dict[str, Any], latency_tier: Optional[str] = None,
+                explain: bool = False) -> PredictionResult:
         """
         Predict if dry weight will change in next session using LightGBM model
         """
         try:
-            # Load model
-            model = self.model_manager.load_model(self.model_name)
-            
-            # Prepare features
-            features = self._prepare_features(input_data)
-
-            print(features)
-            
-            # Convert features to DataFrame for LightGBM compatibility
-            import pandas as pd
-            feature_names = [
-                'SYS_avg_3', 'VP (mmHg)', 'AP (mmHg)', 'Pre HD weight (kg)',
-                'Weight_gain_avg_3', 'SYS (mmHg)', 'Post HD weight (kg)', 'Weight_gain_pct',
-                'UFR', 'TMP (mmHg)', 'DIA (mmHg)', 'Dry weight (kg)',
-                'Weight gain (kg)', 'AUF (ml)', 'PUF (ml)', 'BFR (ml/min)',
-                'High_SBP', 'HD duration (h)', 'UFR_below_15'
-            ]
-            X = pd.DataFrame([features], columns=feature_names)
-            
-            # Make classification prediction
-            prediction = model.predict(X)[0]
-            
-            # Get prediction probabilities
-            if hasattr(model, 'predict_proba'):
-                probabilities = model.predict_proba(X)[0]
-                confidence = max(probabilities)
-                risk_probability = probabilities[1] if len(probabilities) > 1 else probabilities[0]
-            else:
-                raise ValueError(f"Model {self.model_name} does not support probability predictions")
-            
-            # Interpret prediction
-            will_change = bool(prediction)
-            status = "Change Expected" if will_change else "Stable"
-            
-            # Generate recommendations
-            recommendations = self._generate_recommendations(input_data, will_change)
-            
-            return {
-                'patient_id': input_data['patient_id'],
-                'dry_weight_change_predicted': will_change,
-                'prediction_status': status,
-                'change_probability': round(float(risk_probability), 3),
-                'confidence_score': round(float(confidence), 3),
-                'current_dry_weight': float(input_data['dry_weight']),
-                'current_weight_gain': float(input_data['weight_gain']),
-                'recommendations': recommendations,
-                'model_version': self.model_manager.get_model_version(self.model_name),
-                'prediction_date': datetime.now().isoformat()
-            }
-            
+            return self.predict_batch([input_data], latency_tier, explain)[0]
+        
         except Exception as e:
             logger.error(f"Error in dry weight prediction: {str(e)}")
+            metrics.inc('ml_prediction_errors_total', labels(model=self.model_name))
             raise
     
-    def _prepare_features(self, input_data: Dict[str, Any]) -> List[float]:
-        """Prepare 19 features for the LightGBM dry weight model"""
-        
-        # Calculate derived features
-        high_sbp = 1 if input_data['sys'] > 140 else 0
-        
-        # UFR calculation: PUF (ml) / (HD duration (h) × Pre HD weight (kg))
-        hd_duration_hours = input_data['hd_duration']
-        pre_hd_weight = input_data['pre_hd_weight']
-        ufr = input_data['puf'] / (hd_duration_hours * pre_hd_weight) if (hd_duration_hours * pre_hd_weight) > 0 else 0
-        
-        # UFR_below_15
-        ufr_below_15 = 1 if ufr < 15 else 0
-        
-        # Weight_gain_pct = (Weight gain (kg) / Dry weight (kg)) × 100
-        weight_gain_pct = (input_data['weight_gain'] / input_data['dry_weight']) * 100 if input_data['dry_weight'] > 0 else 0
-        
-        # Rolling averages (use provided values or defaults if not available)
-        weight_gain_avg_3 = input_data.get('weight_gain_avg_3', input_data['weight_gain'])
-        sys_avg_3 = input_data.get('sys_avg_3', input_data['sys'])
-        
-        # Prepare feature array in the exact order expected by the model
-        features = [
-            sys_avg_3,                           # SYS_avg_3 (rolling average)
-            input_data['vp'],                    # VP (mmHg)
-            input_data['ap'],                    # AP (mmHg)
-            input_data['pre_hd_weight'],         # Pre HD weight (kg)
-            weight_gain_avg_3,                   # Weight_gain_avg_3 (rolling average)
-            input_data['sys'],                   # SYS (mmHg)
-            input_data['post_hd_weight'],        # Post HD weight (kg)
-            weight_gain_pct,                     # Weight_gain_pct (calculated)
-            ufr,                                 # UFR (calculated)
-            input_data['tmp'],                   # TMP (mmHg)
-            input_data['dia'],                   # DIA (mmHg)
-            input_data['dry_weight'],            # Dry weight (kg)
-            input_data['weight_gain'],           # Weight gain (kg)
-            input_data['auf'],                   # AUF (ml)
-            input_data['puf'],                   # PUF (ml)
-            input_data['bfr'],                   # BFR (ml/min)
-            high_sbp,                            # High_SBP (calculated)
-            input_data['hd_duration'],           # HD duration (h)
-            ufr_below_15                         # UFR_below_15 (calculated)
-        ]
-        return features
+    def predict_batch(self, records: List[Dict[str, Any]], latency_tier: Optional[str] = None,
+                      explain: bool = False) -> List[PredictionResult]:
+        """
+        Predict dry weight change for several validated sessions with a single model call
+        """
+        loaded = self.model_manager.get_loaded(self.model_name)
+        if latency_tier is not None:
+            loaded = loaded.for_tier(latency_tier)
+        predict_loaded = self.batcher.submit if self.batcher is not None else self._predict_loaded
+        results = _predict_cached(self.cache, loaded, self.schema, records, predict_loaded)
+        if explain:
+            _attach_explanations(self, loaded, records, results)
+        return results
     
-    def _generate_recommendations(self, input_data: Dict[str, Any], will_change: bool) -> List[str]:
-        """Generate clinical recommendations based on dry weight prediction"""
-        recommendations = []
-        
-        # Main prediction recommendation
-        if will_change:
-            recommendations.append("⚠️ Dry weight adjustment predicted for next session")
-            recommendations.append("Monitor fluid status closely and reassess dry weight")
-        else:
-            recommendations.append("✅ Current dry weight appears stable")
-            recommendations.append("Continue with current dry weight target")
-        
-        # Clinical parameter recommendations
-        if input_data['sys'] > 140:
-            recommendations.append("High systolic BP detected - consider antihypertensive adjustment")
+    def _validate_model(self, loaded: LoadedModel):
+        """Reject a candidate model that cannot score a known-good record"""
+        self._predict_loaded(loaded, [self.warmup_record])
+    
+    def _predict_loaded(self, loaded: LoadedModel, records: List[Dict[str, Any]]) -> List[PredictionResult]:
+        """Score records with a specific model snapshot"""
+        model = loaded.model
+        if not hasattr(model, 'predict_proba'):
+            raise ValueError(f"Model {self.model_name} does not support probability predictions")
         
-        if input_data['weight_gain'] > 3.0:
-            recommendations.append("Excessive interdialytic weight gain - patient education needed")
-        elif input_data['weight_gain'] < 1.0:
-            recommendations.append("Low weight gain - monitor for signs of volume depletion")
+        # Build one feature matrix for the whole batch
+        clock = StageClock(self.model_name)
+        X, inputs = self.feature_builder.build_with_inputs(records)
+        clock.lap('features')
         
-        # UFR recommendations
-        ufr = input_data['puf'] / (input_data['hd_duration'] * input_data['pre_hd_weight']) if (input_data['hd_duration'] * input_data['pre_hd_weight']) > 0 else 0
-        if ufr > 13:
-            recommendations.append("High UFR detected - risk of hypotension and cramping")
-        elif ufr < 10:
-            recommendations.append("Low UFR - consider longer treatment time if volume overloaded")
+        # Make classification prediction for every row at once
+        probabilities = _predict_proba(model, X, loaded.compiled, loaded.iterations)
+        predictions = _classes_from_probabilities(model, probabilities)
+        clock.lap('predict')
+        _offer_shadow(self, loaded, X, predictions, probabilities[:, -1])
         
-        # TMP recommendations
-        if input_data['tmp'] > 200:
-            recommendations.append("High transmembrane pressure - check for access issues")
+        # Recommendations of all rows in one vectorized pass over the features
+        recommendations = self.recommendation_rules.evaluate(inputs, X, predictions)
+        results = [
+            self._build_result(record, prediction, row_probabilities, row_recommendations, loaded.model_version, loaded.tier)
+            for record, prediction, row_probabilities, row_recommendations
+            in zip(records, predictions, probabilities, recommendations)
+        ]
+        clock.lap('recommendations')
+        return results
+    
+    def _score(self, loaded: LoadedModel, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Predicted classes and risk probabilities of a feature matrix (how a shadow model is scored)"""
+        probabilities = _predict_proba(loaded.model, X, loaded.compiled, loaded.iterations)
+        return _classes_from_probabilities(loaded.model, probabilities), probabilities[:, -1]
+    
+    def _build_result(self, input_data: Dict[str, Any], prediction: Any, probabilities: np.ndarray,
+                      recommendations: List[str], model_version: str, latency_tier: Optional[str] = None) -> DryWeightResult:
+        """Turn one row of model output into the dry weight result"""
+        confidence = max(probabilities)
+        risk_probability = probabilities[1] if len(probabilities) > 1 else probabilities[0]
         
-        # Blood flow recommendations
-        if input_data['bfr'] < 300:
-            recommendations.append("Low blood flow rate - consider access evaluation")
+        # Interpret prediction
+        will_change = bool(prediction)
+        status = "Change Expected" if will_change else "Stable"
         
-        return recommendations
+        return DryWeightResult(
+            patient_id=input_data['patient_id'],
+            dry_weight_change_predicted=will_change,
+            prediction_status=status,
+            change_probability=round(float(risk_probability), 3),
+            confidence_score=round(float(confidence), 3),
+            current_dry_weight=float(input_data['dry_weight']),
+            current_weight_gain=float(input_data['weight_gain']),
+            recommendations=recommendations,
+            model_version=model_version,
+            prediction_date=datetime.now(),
+            latency_tier=latency_tier
+        )
+    
+    def _prepare_features(self, input_data: Dict[str, Any]) -> List[float]:
+        """Prepare 19 features for the LightGBM dry weight model"""
+        return self.feature_builder.build_one(input_data).tolist()
 
 
 class URRPredictor:
@@ -234,136 +989,125 @@ class URRPredictor:
     URR (Urea Reduction Ratio) prediction service using LightGBM
     """
     
-    def __init__(self, model_manager: MLModelManager):
+    # Declarative feature schema (column order expected by the model) and its compiled builder
+    schema = URR_SCHEMA
+    feature_builder = URR_SCHEMA.compile()
+    
+    # Declarative recommendation rules, evaluated over the feature matrix of a batch
+    recommendation_rules = URR_RULES.compile(URR_SCHEMA)
+    
+    # Type of the results (its FIELDS are the columns of Arrow batch responses)
+    result_class = URRResult
+    
+    # Synthetic, in-range investigation used to warm the model up at startup
+    warmup_record = {
+        'albumin': 38.0, 'hb': 10.5, 's_ca': 2.3, 'serum_na_pre_hd': 136.0, 'urr': 68.0, 'urr_diff': 0.0,
+        'serum_k_pre_hd': 5.0, 'serum_k_post_hd': 3.5, 'bu_pre_hd': 25.0, 'bu_post_hd': 8.0,
+        'scr_pre_hd': 800.0, 'scr_post_hd': 300.0
+    }
+    
+    def __init__(self, model_manager: MLModelManager, cache: Optional[PredictionCache] = None,
+                 explanation_cache: Optional[PredictionCache] = None):
         self.model_manager = model_manager
+        self.cache = cache
+        self.explanation_cache = explanation_cache
+        # Optional MicroBatcher merging concurrent requests into one model call
+        self.batcher = None
         self.model_name = 'urr'
-        
-    def predict(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        self.model_manager.register_validator(self.model_name, self._validate_model)
+    
+    def predict(self, input_data: Dict[str, Any], latency_tier: Optional[str] = None,
+                explain: bool = False) -> PredictionResult:
         """
         Predict if URR will go to risk region next month using LightGBM model
         """
         try:
-            # Load model
-            model = self.model_manager.load_model(self.model_name)
-            
-            # Prepare features
-            features = self._prepare_features(input_data)
-
-            print(features)
-            
-            # Convert features to DataFrame for LightGBM compatibility
-            import pandas as pd
-            feature_names = [
-                'Albumin (g/L)', 'Hb (g/dL)', 'S Ca (mmol/L)',
-                'Serum Na Pre-HD (mmol/L)', 'URR', 'URR_diff', 
-                'K_Diff', 'BU_Diff', 'SCR_Diff'
-            ]
-            X = pd.DataFrame([features], columns=feature_names)
-            
-            # Make classification prediction
-            prediction = model.predict([features])[0]
-            
-            # Get prediction probabilities
-            if hasattr(model, 'predict_proba'):
-                probabilities = model.predict_proba(X)[0]
-                confidence = max(probabilities)
-                risk_probability = probabilities[1] if len(probabilities) > 1 else probabilities[0]
-            else:
-                raise ValueError(f"Model {self.model_name} does not support probability predictions")
-            
-            # Interpret prediction
-            at_risk = bool(prediction)
-            risk_status = "At Risk" if at_risk else "Safe"
-            adequacy_status = "Predicted Inadequate" if at_risk else "Predicted Adequate"
-            
-            # Generate URR-specific recommendations
-            recommendations = self._generate_recommendations(input_data, at_risk)
-            
-            return {
-                'patient_id': input_data.get('patient_id'),
-                'urr_risk_predicted': at_risk,
-                'risk_status': risk_status,
-                'adequacy_status': adequacy_status,
-                'current_urr': float(input_data['urr']),
-                'target_urr_range': {'min': 65.0, 'max': 100.0},
-                'risk_probability': round(float(risk_probability), 3),
-                'confidence_score': round(float(confidence), 3),
-                'recommendations': recommendations,
-                'model_version': self.model_manager.get_model_version(self.model_name),
-                'prediction_date': datetime.now().isoformat()
-            }
-            
+            return self.predict_batch([input_data], latency_tier, explain)[0]
+        
         except Exception as e:
             logger.error(f"Error in URR prediction: {str(e)}")
+            metrics.inc('ml_prediction_errors_total', labels(model=self.model_name))
             raise
     
-    def _prepare_features(self, input_data: Dict[str, Any]) -> List[float]:
-        """Prepare features for the LightGBM URR model"""
-        # New feature order based on updated model training:
-        # ['Albumin (g/L)', 'Hb (g/dL)', 'S Ca (mmol/L)', 'Serum Na Pre-HD (mmol/L)', 
-        #  'URR', 'URR_diff', 'K_Diff', 'BU_Diff', 'SCR_Diff']
-        
-        # Calculate derived features
-        k_diff = input_data['serum_k_pre_hd'] - input_data['serum_k_post_hd']
-        bu_diff = input_data['bu_pre_hd'] - input_data['bu_post_hd']
-        scr_diff = input_data['scr_pre_hd'] - input_data['scr_post_hd']
-        
-        features = [
-            input_data['albumin'],                  # Albumin (g/L)
-            input_data['hb'],                      # Hb (g/dL)
-            input_data['s_ca'],                    # S Ca (mmol/L)
-            input_data['serum_na_pre_hd'],         # Serum Na Pre-HD (mmol/L)
-            input_data['urr'],                     # URR
-            input_data['urr_diff'],                # URR_diff
-            k_diff,                                # K_Diff (calculated)
-            bu_diff,                               # BU_Diff (calculated)
-            scr_diff                               # SCR_Diff (calculated)
-        ]
-        return features
+    def predict_batch(self, records: List[Dict[str, Any]], latency_tier: Optional[str] = None,
+                      explain: bool = False) -> List[PredictionResult]:
+        """
+        Predict URR risk for several validated investigations with a single model call
+        """
+        loaded = self.model_manager.get_loaded(self.model_name)
+        if latency_tier is not None:
+            loaded = loaded.for_tier(latency_tier)
+        predict_loaded = self.batcher.submit if self.batcher is not None else self._predict_loaded
+        results = _predict_cached(self.cache, loaded, self.schema, records, predict_loaded)
+        if explain:
+            _attach_explanations(self, loaded, records, results)
+        return results
     
-    def _generate_recommendations(self, input_data: Dict[str, Any], at_risk: bool) -> List[str]:
-        """Generate clinical recommendations based on URR risk prediction"""
-        recommendations = []
-        current_urr = input_data['urr']
-        
-        # URR-specific recommendations
-        if at_risk:
-            recommendations.append("⚠️ Patient predicted to have inadequate URR next month")
-            if current_urr < 65:
-                recommendations.append("Current URR below target - dialysis inadequacy detected")
-                recommendations.append("Consider increasing treatment time or frequency")
-                recommendations.append("Evaluate vascular access function")
-            else:
-                recommendations.append("Monitor closely - risk of URR decline detected")
-                recommendations.append("Review dialysis prescription parameters")
-        else:
-            recommendations.append("✅ URR levels predicted to remain adequate")
-            recommendations.append("Continue current dialysis regimen")
-        
-        # Lab-based recommendations for URR optimization
-        if input_data['albumin'] < 35:
-            recommendations.append("Low albumin may affect dialysis efficiency - nutritional support needed")
-        
-        if input_data['hb'] < 10:
-            recommendations.append("Low hemoglobin - may impact dialysis tolerance and adequacy")
+    def _validate_model(self, loaded: LoadedModel):
+        """Reject a candidate model that cannot score a known-good record"""
+        self._predict_loaded(loaded, [self.warmup_record])
+    
+    def _predict_loaded(self, loaded: LoadedModel, records: List[Dict[str, Any]]) -> List[PredictionResult]:
+        """Score records with a specific model snapshot"""
+        model = loaded.model
+        if not hasattr(model, 'predict_proba'):
+            raise ValueError(f"Model {self.model_name} does not support probability predictions")
         
-        # Access-related recommendations based on calculated differences
-        bu_diff = input_data['bu_pre_hd'] - input_data['bu_post_hd']
-        bu_reduction = (bu_diff / input_data['bu_pre_hd']) * 100 if input_data['bu_pre_hd'] > 0 else 0
+        # Build one feature matrix for the whole batch
+        clock = StageClock(self.model_name)
+        X, inputs = self.feature_builder.build_with_inputs(records)
+        clock.lap('features')
         
-        if bu_reduction < 65:
-            recommendations.append("Inadequate urea reduction - check access flow and dialyzer function")
+        # Make classification prediction for every row at once
+        probabilities = _predict_proba(model, X, loaded.compiled, loaded.iterations)
+        predictions = _classes_from_probabilities(model, probabilities)
+        clock.lap('predict')
+        _offer_shadow(self, loaded, X, predictions, probabilities[:, -1])
         
-        # Electrolyte balance recommendations
-        if input_data['serum_k_pre_hd'] > 5.5:
-            recommendations.append("High potassium - dietary counseling and dialysate adjustment needed")
+        # Recommendations of all rows in one vectorized pass over the features
+        recommendations = self.recommendation_rules.evaluate(inputs, X, predictions)
+        results = [
+            self._build_result(record, prediction, row_probabilities, row_recommendations, loaded.model_version, loaded.tier)
+            for record, prediction, row_probabilities, row_recommendations
+            in zip(records, predictions, probabilities, recommendations)
+        ]
+        clock.lap('recommendations')
+        return results
+    
+    def _score(self, loaded: LoadedModel, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Predicted classes and risk probabilities of a feature matrix (how a shadow model is scored)"""
+        probabilities = _predict_proba(loaded.model, X, loaded.compiled, loaded.iterations)
+        return _classes_from_probabilities(loaded.model, probabilities), probabilities[:, -1]
+    
+    def _build_result(self, input_data: Dict[str, Any], prediction: Any, probabilities: np.ndarray,
+                      recommendations: List[str], model_version: str, latency_tier: Optional[str] = None) -> URRResult:
+        """Turn one row of model output into the URR result"""
+        confidence = max(probabilities)
+        risk_probability = probabilities[1] if len(probabilities) > 1 else probabilities[0]
         
-        if input_data['s_ca'] < 2.1:
-            recommendations.append("Low calcium - consider calcium supplementation")
-        elif input_data['s_ca'] > 2.6:
-            recommendations.append("High calcium - review phosphate binders and vitamin D therapy")
+        # Interpret prediction
+        at_risk = bool(prediction)
+        risk_status = "At Risk" if at_risk else "Safe"
+        adequacy_status = "Predicted Inadequate" if at_risk else "Predicted Adequate"
         
-        return recommendations
+        return URRResult(
+            patient_id=input_data.get('patient_id'),
+            urr_risk_predicted=at_risk,
+            risk_status=risk_status,
+            adequacy_status=adequacy_status,
+            current_urr=float(input_data['urr']),
+            target_urr_range={'min': 65.0, 'max': 100.0},
+            risk_probability=round(float(risk_probability), 3),
+            confidence_score=round(float(confidence), 3),
+            recommendations=recommendations,
+            model_version=model_version,
+            prediction_date=datetime.now(),
+            latency_tier=latency_tier
+        )
+    
+    def _prepare_features(self, input_data: Dict[str, Any]) -> List[float]:
+        """Prepare features for the LightGBM URR model"""
+        return self.feature_builder.build_one(input_data).tolist()
 
 
 class HbPredictor:
@@ -371,166 +1115,217 @@ class HbPredictor:
     Hemoglobin prediction service
     """
     
-    def __init__(self, model_manager: MLModelManager):
+    # Declarative feature schema (column order expected by the model) and its compiled builder
+    schema = HB_SCHEMA
+    feature_builder = HB_SCHEMA.compile()
+    
+    # Declarative recommendation rules, evaluated over the feature matrix of a batch
+    recommendation_rules = HB_RULES.compile(HB_SCHEMA)
+    
+    # Type of the results (its FIELDS are the columns of Arrow batch responses)
+    result_class = HbResult
+    
+    # Synthetic, in-range investigation used to warm the model up at startup
+    warmup_record = {
+        'albumin': 38.0, 'bu_post_hd': 8.0, 'bu_pre_hd': 25.0, 's_ca': 2.3, 'scr_post_hd': 300.0,
+        'scr_pre_hd': 800.0, 'serum_k_post_hd': 3.5, 'serum_k_pre_hd': 5.0, 'serum_na_pre_hd': 136.0,
+        'ua': 6.0, 'hb_diff': 0.0, 'hb': 10.5
+    }
+    
+    def __init__(self, model_manager: MLModelManager, cache: Optional[PredictionCache] = None,
+                 explanation_cache: Optional[PredictionCache] = None):
         self.model_manager = model_manager
+        self.cache = cache
+        self.explanation_cache = explanation_cache
+        # Optional MicroBatcher merging concurrent requests into one model call
+        self.batcher = None
         self.model_name = 'hb'
-        
-    def predict(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        self.model_manager.register_validator(self.model_name, self._validate_model)
+    
+    def predict(self, input_data: Dict[str, Any], latency_tier: Optional[str] = None,
+                explain: bool = False) -> PredictionResult:
         """
         Predict if Hb will go to risk region next month using ensemble model
         """
         try:
-            # Load model bundle
-            model_bundle = self.model_manager.load_model(self.model_name)
-            
-            # Prepare features
-            features = self._prepare_features(input_data)
-            
-            # Only use ensemble model - throw error if not available
-            if not isinstance(model_bundle, dict) or 'xgb' not in model_bundle:
-                raise ValueError(f"Ensemble model required for {self.model_name}. Expected dict with 'xgb', 'lgbm', 'weights', 'threshold' keys.")
-            
-            # Validate ensemble components
-            required_keys = ['xgb', 'lgbm', 'weights', 'threshold']
-            missing_keys = [key for key in required_keys if key not in model_bundle]
-            if missing_keys:
-                raise ValueError(f"Missing ensemble components: {missing_keys}. Ensemble model must contain: {required_keys}")
-            
-            # Extract ensemble components
-            xgb_model = model_bundle["xgb"]
-            lgbm_model = model_bundle["lgbm"]
-            w1, w2 = model_bundle["weights"]
-            threshold = model_bundle["threshold"]
-            
-            # Validate models have predict_proba method
-            if not hasattr(xgb_model, 'predict_proba'):
-                raise ValueError("XGB model in ensemble does not support predict_proba")
-            if not hasattr(lgbm_model, 'predict_proba'):
-                raise ValueError("LGBM model in ensemble does not support predict_proba")
-            
-            # Convert features to DataFrame for compatibility
-            import pandas as pd
-            feature_names = model_bundle.get("features", [f"feature_{i}" for i in range(len(features))])
-            X = pd.DataFrame([features], columns=feature_names)
-            
-            # Make ensemble prediction 
-            xgb_probs = xgb_model.predict_proba(X)[:, 1]
-            lgbm_probs = lgbm_model.predict_proba(X)[:, 1]
-            probs_ensemble = w1 * xgb_probs + w2 * lgbm_probs
-            prediction = (probs_ensemble >= threshold).astype(int)[0]
-            
-            # Set probabilities
-            risk_probability = float(probs_ensemble[0])
-            probabilities = [1 - risk_probability, risk_probability]
-            confidence = max(probabilities)
-            
-            # Interpret prediction
-            at_risk = bool(prediction)
-            risk_status = "At Risk" if at_risk else "Safe"
-            
-            # Determine trend based on current Hb and risk prediction
-            current_hb = input_data['hb']
-            if at_risk:
-                if current_hb < 10:
-                    trend = "Declining to Critical"
-                elif current_hb > 12:
-                    trend = "Rising to Excessive"
-                else:
-                    trend = "Moving to Risk Zone"
-            else:
-                trend = "Stable in Target Range"
-            
-            # Generate recommendations
-            recommendations = self._generate_recommendations(input_data, at_risk, current_hb)
-            
-            return {
-                'hb_risk_predicted': at_risk,
-                'risk_status': risk_status,
-                'hb_trend': trend,
-                'current_hb': float(current_hb),
-                'target_hb_range': {'min': 10.0, 'max': 12.0},
-                'risk_probability': round(float(risk_probability), 3),
-                'recommendations': recommendations,
-                'confidence_score': round(float(confidence), 3),
-                'model_version': self.model_manager.get_model_version(self.model_name),
-                'prediction_date': datetime.now().isoformat()
-            }
-            
+            return self.predict_batch([input_data], latency_tier, explain)[0]
+        
         except Exception as e:
             logger.error(f"Error in Hb prediction: {str(e)}")
+            metrics.inc('ml_prediction_errors_total', labels(model=self.model_name))
             raise
     
-    def _prepare_features(self, input_data: Dict[str, Any]) -> List[float]:
-        """Prepare features for the model based on actual feature columns"""
-        # New feature order based on updated model training:
-        # ['Albumin (g/L)', 'S Ca (mmol/L)', 'Serum Na Pre-HD (mmol/L)', 'UA (mg/dL)', 
-        #  'Hb_diff', 'Hb (g/dL)', 'Albumin_BU_Ratio', 'K_Diff', 'BU_Diff', 'SCR_Diff']
-        
-        # Calculate derived features
-        albumin_bu_ratio = input_data['albumin'] / (input_data['bu_pre_hd']+1) if input_data['bu_pre_hd'] != 0 else 0
-        k_diff = input_data['serum_k_pre_hd'] - input_data['serum_k_post_hd']
-        bu_diff = input_data['bu_pre_hd'] - input_data['bu_post_hd']
-        scr_diff = input_data['scr_pre_hd'] - input_data['scr_post_hd']
-        
-        features = [
-            input_data['albumin'],                  # Albumin (g/L)
-            input_data['s_ca'],                    # S Ca (mmol/L)
-            input_data['serum_na_pre_hd'],         # Serum Na Pre-HD (mmol/L)
-            input_data['ua'],                      # UA (mg/dL)
-            input_data['hb_diff'],                 # Hb_diff
-            input_data['hb'],                      # Hb (g/dL)
-            albumin_bu_ratio,                      # Albumin_BU_Ratio (calculated)
-            k_diff,                                # K_Diff (calculated)
-            bu_diff,                               # BU_Diff (calculated)
-            scr_diff                               # SCR_Diff (calculated)
+    def predict_batch(self, records: List[Dict[str, Any]], latency_tier: Optional[str] = None,
+                      explain: bool = False) -> List[PredictionResult]:
+        """
+        Predict Hb risk for several validated investigations with one call per ensemble member
+        """
+        loaded = self.model_manager.get_loaded(self.model_name)
+        if latency_tier is not None:
+            loaded = loaded.for_tier(latency_tier)
+        predict_loaded = self.batcher.submit if self.batcher is not None else self._predict_loaded
+        results = _predict_cached(self.cache, loaded, self.schema, records, predict_loaded)
+        if explain:
+            _attach_explanations(self, loaded, records, results)
+        return results
+    
+    def _validate_model(self, loaded: LoadedModel):
+        """Reject a candidate model that cannot score a known-good record"""
+        bundle_features = loaded.model.get('features') if isinstance(loaded.model, dict) else None
+        if bundle_features is not None and list(bundle_features) != self.schema.feature_names:
+            raise ValueError(f"Ensemble features {list(bundle_features)} do not match schema {self.schema.feature_names}")
+        self._predict_loaded(loaded, [self.warmup_record])
+    
+    def _predict_loaded(self, loaded: LoadedModel, records: List[Dict[str, Any]]) -> List[PredictionResult]:
+        """Score records with a specific ensemble bundle snapshot"""
+        # Only use ensemble model - throw error if not available (bundle structure is validated at load time)
+        ensemble = loaded.ensemble
+        if ensemble is None:
+            raise ValueError(f"Ensemble model required for {self.model_name}. Expected dict with 'xgb', 'lgbm', 'weights', 'threshold' keys.")
+        
+        # Build one feature matrix for the whole batch and score every row in one ensemble evaluation
+        clock = StageClock(self.model_name)
+        X, inputs = self.feature_builder.build_with_inputs(records)
+        clock.lap('features')
+        predictions, probs_ensemble = ensemble.predict(X)
+        clock.lap('predict')
+        _offer_shadow(self, loaded, X, predictions, probs_ensemble)
+        
+        # Recommendations of all rows in one vectorized pass over the features
+        recommendations = self.recommendation_rules.evaluate(inputs, X, predictions)
+        results = [
+            self._build_result(record, prediction, risk_probability, row_recommendations, loaded.model_version, loaded.tier)
+            for record, prediction, risk_probability, row_recommendations
+            in zip(records, predictions, probs_ensemble, recommendations)
         ]
-        return features
+        clock.lap('recommendations')
+        return results
+    
+    def _score(self, loaded: LoadedModel, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Predicted classes and risk probabilities of a feature matrix (how a shadow model is scored)"""
+        if loaded.ensemble is None:
+            raise ValueError(f"Ensemble model required for {self.model_name}")
+        return loaded.ensemble.predict(X)
     
-    def _generate_recommendations(self, input_data: Dict[str, Any], at_risk: bool, current_hb: float) -> List[str]:
-        """Generate clinical recommendations based on risk prediction and lab values"""
-        recommendations = []
+    def _build_result(self, input_data: Dict[str, Any], prediction: int, risk_probability: float,
+                      recommendations: List[str], model_version: str, latency_tier: Optional[str] = None) -> HbResult:
+        """Turn one row of ensemble output into the Hb result"""
+        # Set probabilities
+        risk_probability = float(risk_probability)
+        probabilities = [1 - risk_probability, risk_probability]
+        confidence = max(probabilities)
         
-        # Risk-based recommendations
+        # Interpret prediction
+        at_risk = bool(prediction)
+        risk_status = "At Risk" if at_risk else "Safe"
+        
+        # Determine trend based on current Hb and risk prediction
+        current_hb = input_data['hb']
         if at_risk:
-            recommendations.append("⚠️ Patient predicted to enter Hb risk zone next month")
             if current_hb < 10:
-                recommendations.append("Current Hb below target - urgent intervention needed")
-                recommendations.append("Consider increasing EPO dose or iron supplementation")
+                trend = "Declining to Critical"
             elif current_hb > 12:
-                recommendations.append("Current Hb above target - risk of cardiovascular complications")
-                recommendations.append("Consider reducing EPO dose and monitor closely")
+                trend = "Rising to Excessive"
             else:
-                recommendations.append("Monitor closely and consider preventive measures")
+                trend = "Moving to Risk Zone"
         else:
-            recommendations.append("✅ Hb levels predicted to remain stable")
-            recommendations.append("Continue current treatment regimen")
-        
-        # Lab-based recommendations
-        if input_data['albumin'] < 35:
-            recommendations.append("Low albumin - nutritional counseling recommended")
+            trend = "Stable in Target Range"
         
-        if input_data['s_ca'] < 2.1:
-            recommendations.append("Low calcium - consider calcium supplementation")
-        elif input_data['s_ca'] > 2.6:
-            recommendations.append("High calcium - review phosphate binders")
-        
-        if input_data['serum_k_pre_hd'] > 5.5:
-            recommendations.append("High potassium - dietary restriction advised")
-        elif input_data['serum_k_pre_hd'] < 3.5:
-            recommendations.append("Low potassium - monitor for arrhythmias")
-        
-        # Dialysis adequacy
-        bu_reduction = ((input_data['bu_pre_hd'] - input_data['bu_post_hd']) / input_data['bu_pre_hd']) * 100
-        if bu_reduction < 65:
-            recommendations.append("Inadequate dialysis - consider increasing treatment time/frequency")
-        
-        return recommendations
+        return HbResult(
+            hb_risk_predicted=at_risk,
+            risk_status=risk_status,
+            hb_trend=trend,
+            current_hb=float(current_hb),
+            target_hb_range={'min': 10.0, 'max': 12.0},
+            risk_probability=round(float(risk_probability), 3),
+            recommendations=recommendations,
+            confidence_score=round(float(confidence), 3),
+            model_version=model_version,
+            prediction_date=datetime.now(),
+            latency_tier=latency_tier
+        )
+    
+    def _prepare_features(self, input_data: Dict[str, Any]) -> List[float]:
+        """Prepare features for the model based on actual feature columns"""
+        return self.feature_builder.build_one(input_data).tolist()
 
 
 # Global model manager instance
 model_manager = MLModelManager()
 
+# Global prediction cache (sized from settings in MlModelsConfig.ready)
+prediction_cache = PredictionCache()
+
+# Global cache of explanations per feature row; they never go stale, so no TTL (sized in MlModelsConfig.ready)
+explanation_cache = PredictionCache(max_entries=4096, ttl=0)
+
 # Global predictor instances
-dry_weight_predictor = DryWeightPredictor(model_manager)
-urr_predictor = URRPredictor(model_manager)
-hb_predictor = HbPredictor(model_manager)
+dry_weight_predictor = DryWeightPredictor(model_manager, prediction_cache, explanation_cache)
+urr_predictor = URRPredictor(model_manager, prediction_cache, explanation_cache)
+hb_predictor = HbPredictor(model_manager, prediction_cache, explanation_cache)
+
+
+def _collect_service_metrics(registry):
+    """Copy the prediction and explanation cache and micro-batcher counters into the metrics registry"""
+    cache_stats = prediction_cache.stats()
+    for event in ('hits', 'misses', 'coalesced', 'evictions', 'expirations'):
+        registry.set_counter('ml_prediction_cache_events_total', labels(event=event), cache_stats[event])
+    cache_stats = explanation_cache.stats()
+    for event in ('hits', 'misses', 'coalesced', 'evictions'):
+        registry.set_counter('ml_explanation_cache_events_total', labels(event=event), cache_stats[event])
+    for model_name, batcher_stats in micro_batching_stats().items():
+        for kind in ('batches', 'requests', 'rows'):
+            registry.set_counter('ml_micro_batch_total', labels(model=model_name, kind=kind), batcher_stats[kind])
+
+
+metrics.register_collector(_collect_service_metrics)
+
+
+def configure_micro_batching(model_names: List[str], window_ms: float, max_rows: int):
+    """Enable micro-batching for the given models (disabling it for the others)"""
+    for predictor in (dry_weight_predictor, urr_predictor, hb_predictor):
+        if predictor.model_name in model_names:
+            predictor.batcher = MicroBatcher(predictor.model_name, predictor._predict_loaded, window_ms, max_rows)
+        else:
+            predictor.batcher = None
+
+
+def micro_batching_stats() -> Dict[str, Dict[str, Any]]:
+    """Micro-batcher counters of the models that have one"""
+    return {
+        predictor.model_name: predictor.batcher.stats()
+        for predictor in (dry_weight_predictor, urr_predictor, hb_predictor)
+        if predictor.batcher is not None
+    }
+
+
+def preload_models(warm_up: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Eagerly load every configured model and optionally run a synthetic prediction
+    through it, so that the first real request does not pay for unpickling or
+    first-call initialisation. Missing or broken models are logged and skipped.
+    """
+    for predictor in (dry_weight_predictor, urr_predictor, hb_predictor):
+        model_name = predictor.model_name
+        try:
+            model_manager.load_model(model_name)
+        except FileNotFoundError as e:
+            logger.warning(f"Skipping preload of {model_name}: {str(e)}")
+            continue
+        except Exception as e:
+            logger.error(f"Failed to preload model {model_name}: {str(e)}")
+            continue
+        
+        if warm_up:
+            start = time.perf_counter()
+            try:
+                predictor.predict_batch([predictor.warmup_record])
+            except Exception as e:
+                logger.error(f"Warm-up prediction failed for {model_name}: {str(e)}")
+                continue
+            model_manager.warmup_times[model_name] = (time.perf_counter() - start) * 1000
+            logger.info(f"Warmed up model: {model_name} in {model_manager.warmup_times[model_name]:.1f} ms")
+    
+    # Warm-up records are not real requests
+    prediction_cache.clear()
+    return model_manager.get_status()
@@ -0,0 +1,211 @@
+"""
+Shadow evaluation of candidate models on live traffic
+
+A retrained model can be registered as the shadow of a served model
+(MLModelManager.register_shadow, ML_SHADOW_MODELS). Responses still come from
+the primary model only: after scoring a request, the predictor hands the
+request's feature matrix with the primary predictions to the ShadowEvaluator.
+Feature matrices are built fresh for every call and never written after
+scoring, so handing one over is as good as a copy and costs nothing. offer()
+only appends to a queue bounded in rows and never blocks; when the queue is
+full the rows are dropped (and counted). A background thread drains the queue
+in batches, scores the shadow model and records per model how often it agrees
+with the primary, the differences in risk probability and its own latency.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .metrics import labels, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowStats:
+    """
+    Agreement, probability delta and latency counters of one shadow model
+    """
+    
+    __slots__ = ('shadow_version', 'offered', 'dropped', 'failed', 'scored', 'agreed', 'batches',
+                 'delta_sum', 'abs_delta_sum', 'max_abs_delta', 'seconds', 'max_batch_seconds')
+    
+    def __init__(self, shadow_version: str):
+        self.shadow_version = shadow_version
+        self.offered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.scored = 0
+        self.agreed = 0
+        self.batches = 0
+        self.delta_sum = 0.0
+        self.abs_delta_sum = 0.0
+        self.max_abs_delta = 0.0
+        self.seconds = 0.0
+        self.max_batch_seconds = 0.0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'shadow_version': self.shadow_version,
+            'offered_rows': self.offered,
+            'dropped_rows': self.dropped,
+            'failed_rows': self.failed,
+            'scored_rows': self.scored,
+            'agreement_rate': round(self.agreed / self.scored, 4) if self.scored else None,
+            # Shadow minus primary risk probability
+            'mean_probability_delta': round(self.delta_sum / self.scored, 4) if self.scored else None,
+            'mean_abs_probability_delta': round(self.abs_delta_sum / self.scored, 4) if self.scored else None,
+            'max_abs_probability_delta': round(self.max_abs_delta, 4),
+            'batches': self.batches,
+            'mean_batch_ms': round(self.seconds * 1000 / self.batches, 3) if self.batches else None,
+            'max_batch_ms': round(self.max_batch_seconds * 1000, 3),
+            'mean_row_us': round(self.seconds * 1e6 / self.scored, 2) if self.scored else None,
+        }
+
+
+class ShadowEvaluator:
+    """
+    Bounded queue of primary-scored feature matrices and the thread that scores them with the shadow models
+    """
+    
+    def __init__(self, max_queued_rows: int = 4096, batch_rows: int = 512):
+        self.max_queued_rows = max_queued_rows
+        self.batch_rows = batch_rows
+        self._init_state()
+        
+        # The drain thread does not survive fork; children start their own on first use
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._init_state)
+    
+    def _init_state(self):
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queued_rows = 0
+        self._busy = False
+        self._thread = None
+        self._stats: Dict[str, ShadowStats] = {}
+    
+    def configure(self, max_queued_rows: int, batch_rows: int):
+        self.max_queued_rows = max_queued_rows
+        self.batch_rows = batch_rows
+    
+    def _stats_for(self, shadow) -> ShadowStats:
+        # A new candidate starts from scratch
+        stats = self._stats.get(shadow.name)
+        if stats is None or stats.shadow_version != shadow.model_version:
+            stats = self._stats[shadow.name] = ShadowStats(shadow.model_version)
+        return stats
+    
+    def offer(self, shadow, score: Callable[[Any, np.ndarray], Tuple[np.ndarray, np.ndarray]],
+              X: np.ndarray, predictions: np.ndarray, probabilities: np.ndarray) -> bool:
+        """
+        Queue rows scored by the primary model for scoring with `shadow`
+        
+        score(shadow, X) returns the shadow's (predicted classes, risk
+        probabilities). Returns False if the queue is full and the rows were dropped.
+        """
+        rows = len(X)
+        with self._cond:
+            stats = self._stats_for(shadow)
+            stats.offered += rows
+            if self._queued_rows + rows > self.max_queued_rows:
+                stats.dropped += rows
+                dropped = True
+            else:
+                self._queue.append((shadow, score, X, predictions, probabilities))
+                self._queued_rows += rows
+                dropped = False
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ml-shadow-evaluator', daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        metrics.inc('ml_shadow_rows_total', labels(model=shadow.name, outcome='dropped' if dropped else 'queued'), rows)
+        return not dropped
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._busy = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+                self._busy = True
+                batch = [self._queue.popleft()]
+                rows = len(batch[0][2])
+                # Rows for the same shadow snapshot are scored together
+                while self._queue and self._queue[0][0] is batch[0][0] and rows + len(self._queue[0][2]) <= self.batch_rows:
+                    batch.append(self._queue.popleft())
+                    rows += len(batch[-1][2])
+                self._queued_rows -= rows
+            try:
+                self._evaluate(batch)
+            except Exception as e:
+                logger.error(f"Shadow evaluation failed: {str(e)}")
+    
+    def _evaluate(self, batch):
+        shadow, score = batch[0][0], batch[0][1]
+        if len(batch) == 1:
+            X, predictions, probabilities = batch[0][2:]
+        else:
+            X = np.vstack([entry[2] for entry in batch])
+            predictions = np.concatenate([entry[3] for entry in batch])
+            probabilities = np.concatenate([entry[4] for entry in batch])
+        
+        started = time.perf_counter()
+        try:
+            shadow_predictions, shadow_probabilities = score(shadow, X)
+        except Exception as e:
+            logger.warning(f"Shadow model {shadow.name} ({shadow.model_version}) failed to score {len(X)} rows: {str(e)}")
+            with self._cond:
+                self._stats_for(shadow).failed += len(X)
+            metrics.inc('ml_shadow_rows_total', labels(model=shadow.name, outcome='failed'), len(X))
+            return
+        seconds = time.perf_counter() - started
+        
+        agreed = int(np.count_nonzero(np.asarray(shadow_predictions) == np.asarray(predictions)))
+        deltas = np.asarray(shadow_probabilities, dtype=np.float64) - np.asarray(probabilities, dtype=np.float64)
+        abs_deltas = np.abs(deltas)
+        with self._cond:
+            stats = self._stats_for(shadow)
+            stats.scored += len(X)
+            stats.agreed += agreed
+            stats.batches += 1
+            stats.delta_sum += float(deltas.sum())
+            stats.abs_delta_sum += float(abs_deltas.sum())
+            stats.max_abs_delta = max(stats.max_abs_delta, float(abs_deltas.max()))
+            stats.seconds += seconds
+            stats.max_batch_seconds = max(stats.max_batch_seconds, seconds)
+        
+        model = labels(model=shadow.name)
+        metrics.inc('ml_shadow_rows_total', labels(model=shadow.name, outcome='scored'), len(X))
+        metrics.inc('ml_shadow_rows_total', labels(model=shadow.name, outcome='agreed'), agreed)
+        metrics.observe('ml_shadow_seconds', model, seconds)
+        metrics.observe_many('ml_shadow_probability_delta', model, abs_deltas.tolist())
+    
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued row has been scored (for tests and benchmarks)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and per-model comparison counters reported by the health endpoint"""
+        with self._cond:
+            return {
+                'queued_rows': self._queued_rows,
+                'max_queued_rows': self.max_queued_rows,
+                'models': {model_name: stats.to_dict() for model_name, stats in self._stats.items()},
+            }
+
+
+# Global evaluator (configured from settings in MlModelsConfig.ready)
+shadow_evaluator = ShadowEvaluator()
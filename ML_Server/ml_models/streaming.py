@@ -0,0 +1,141 @@
+"""
+Streaming NDJSON bulk predictions
+
+For re-scoring and back-fills a client POSTs newline-delimited JSON (one
+prediction request per line) and gets one JSON line per record back. The
+body is read from the request stream a chunk of records at a time, and each
+chunk is validated, scored and written to the streamed response before the
+next one is read, so memory depends on the chunk size and never on the size
+of the input. request.body and request.data are never touched (they would
+load the whole body, up to DATA_UPLOAD_MAX_MEMORY_SIZE).
+
+Response lines are the batch results and errors: a result with the `index` of
+its record, or {"index": ..., "details": {...}} for a rejected record, in
+input order. The last line is a summary ({"total": ..., "succeeded": ...,
+"failed": ...}); a stream whose model call failed ends with a summary that
+also has "error" and "message", so a client can tell a complete response
+from a truncated one.
+"""
+import json
+import logging
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .encoding import result_encoder
+from .history import patient_history
+from .metrics import StageClock
+from .services import LoadedModel
+from .validation import input_validation
+
+logger = logging.getLogger(__name__)
+
+# Accepted request content types
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+
+def request_stream(request):
+    """
+    The request body as a readable stream
+    
+    Django only reads up to CONTENT_LENGTH. A chunked upload has none; servers
+    that de-chunk it (gunicorn) mark the input as terminated and it is read to
+    the end instead.
+    """
+    if not request.META.get('CONTENT_LENGTH') and request.META.get('wsgi.input_terminated'):
+        return request.META['wsgi.input']
+    return request
+
+
+def iter_lines(stream, max_line_bytes: int) -> Iterator[Optional[bytes]]:
+    """Non-blank lines of a stream; None for a line longer than max_line_bytes (which is skipped)"""
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes + 1)
+            yield None
+            continue
+        if line.strip():
+            yield line
+
+
+def _parse(line: Optional[bytes], max_line_bytes: int):
+    # (record, None) or (None, error details)
+    if line is None:
+        return None, {'non_field_errors': [f"Line longer than {max_line_bytes} bytes."]}
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, {'non_field_errors': [f"JSON parse error - {e}"]}
+
+
+def iter_predictions(lines: Iterable[Optional[bytes]], serializer_class, predictor, loaded: LoadedModel,
+                     chunk_size: int, max_line_bytes: int) -> Iterator[bytes]:
+    """
+    NDJSON response body for a stream of request lines, one chunk of records at a time
+    
+    Every chunk is scored with the same model snapshot `loaded`, bypassing the
+    prediction cache (bulk records are rarely repeated and would evict the
+    interactive ones).
+    """
+    lines = iter(lines)
+    total = succeeded = 0
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            break
+        clock = StageClock(predictor.model_name)
+        records: List[Any] = []
+        errors: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+        for offset, line in enumerate(chunk):
+            record, errors[offset] = _parse(line, max_line_bytes)
+            records.append(record)
+        parsed = [offset for offset, details in enumerate(errors) if details is None]
+        validated, record_errors = input_validation.validate_many(serializer_class, [records[offset] for offset in parsed])
+        patient_history.complete_many(predictor.model_name, validated, record_errors)
+        valid = []
+        for offset, validated_data, details in zip(parsed, validated, record_errors):
+            if validated_data is None:
+                errors[offset] = details
+            else:
+                valid.append((offset, validated_data))
+        clock.lap('validation')
+        
+        try:
+            # A chunk without a valid record still reports its errors; only scoring is skipped
+            results = predictor._predict_loaded(loaded, [validated_data for _, validated_data in valid]) if valid else []
+        except Exception as e:
+            logger.error(f"Error in {predictor.model_name} stream prediction: {str(e)}")
+            yield result_encoder.encode_bytes({
+                'error': 'Prediction failed',
+                'message': f'Scoring stopped at record {total}. Records before it were scored.',
+                'total': total,
+                'succeeded': succeeded,
+                'failed': total - succeeded,
+            }) + b'\n'
+            return
+        clock.skip()  # features, predict and recommendations are timed by the predictor
+        
+        lines_out: List[Any] = list(errors)
+        for (offset, _), result in zip(valid, results):
+            result.index = total + offset
+            lines_out[offset] = result
+        body = []
+        for offset, line in enumerate(lines_out):
+            if isinstance(line, dict):
+                body.append(result_encoder.encode_bytes({'index': total + offset, 'details': line}))
+                continue
+            try:
+                body.append(result_encoder.encode_bytes(line))
+                succeeded += 1
+            except ValueError as e:
+                # A non-finite probability: report the record instead of breaking the stream
+                body.append(result_encoder.encode_bytes({'index': total + offset, 'details': {'non_field_errors': [str(e)]}}))
+        total += len(chunk)
+        body = b'\n'.join(body) + b'\n'
+        clock.lap('serialization')
+        yield body
+    
+    yield result_encoder.encode_bytes({'total': total, 'succeeded': succeeded, 'failed': total - succeeded}) + b'\n'
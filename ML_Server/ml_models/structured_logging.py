@@ -0,0 +1,98 @@
+"""
+Logging helpers for structured request logs
+
+JSONFormatter renders a record (plus the dict passed as extra={'fields': ...})
+as one JSON line. QueueingStreamHandler keeps the stream write off the request
+thread: records are put on a bounded in-memory queue and written by a
+QueueListener thread. Both are referenced from settings.LOGGING.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message and the record's fields
+    """
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener whose stop() waits (briefly) for room for its sentinel, since
+    the handler's queue is bounded and may be full at shutdown
+    """
+    
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class QueueingStreamHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that writes through a background QueueListener to a stream
+    
+    The calling thread only puts the record on a bounded queue; formatting and
+    the write happen on the listener thread. When the queue is full, records
+    are dropped and counted instead of blocking the request. The listener is
+    started lazily in every process, because threads do not survive the
+    gunicorn fork.
+    """
+    
+    def __init__(self, stream=None, maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+    
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, in the target handler
+        self.target.setFormatter(fmt)
+    
+    def enqueue(self, record: logging.LogRecord):
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _start_listener(self):
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            if self._listener_pid is not None:
+                # Inherited from the parent process: its thread is gone, start over with an empty queue
+                self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = _QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+    
+    def close(self):
+        # Flush what is still queued (called by logging.shutdown at exit)
+        with self._listener_lock:
+            if self._listener is not None and self._listener_pid == os.getpid():
+                try:
+                    self._listener.stop()
+                except queue.Full:
+                    # The stream is still stuck; leave the (daemon) listener thread behind
+                    pass
+            self._listener = None
+            self._listener_pid = None
+        self.target.close()
+        super().close()
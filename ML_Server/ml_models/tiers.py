@@ -0,0 +1,146 @@
+"""
+Latency tiers: predictions from the first boosting rounds only
+
+A request can ask for a latency tier (e.g. "fast" for dashboard overviews)
+and trade a little accuracy for latency: the LightGBM/XGBoost models, both
+members of the Hb ensemble included, are then evaluated with only the first
+fraction of their boosting rounds, through the libraries' own iteration limit
+(num_iteration / iteration_range) or a truncated compiled forest. The "full"
+tier is the model as trained and the default.
+
+How far each tier's probabilities are from the full model is measured
+offline (the measure_latency_tiers management command) and kept in a JSON
+report that models_info publishes next to the tier definitions.
+"""
+import json
+import math
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+FULL_TIER = 'full'
+
+# Tier name -> fraction of the boosting rounds scored
+DEFAULT_TIERS = {'fast': 0.5, 'fastest': 0.2}
+
+REPORT_FORMAT_VERSION = 1
+
+
+class LatencyTiers:
+    """
+    Configured latency tiers and their offline deviation report
+    """
+    
+    def __init__(self, tiers: Optional[Dict[str, float]] = None, report_path: Optional[str] = None):
+        self.configure(DEFAULT_TIERS if tiers is None else tiers, report_path)
+    
+    def configure(self, tiers: Dict[str, float], report_path: Optional[str] = None):
+        fractions = {FULL_TIER: 1.0}
+        for name, fraction in tiers.items():
+            fraction = float(fraction)
+            if name == FULL_TIER or not 0 < fraction <= 1:
+                raise ValueError(f"Invalid latency tier {name}={fraction}: expected a fraction of the boosting rounds in (0, 1]")
+            fractions[name] = fraction
+        self.fractions = fractions
+        self.report_path = report_path
+    
+    def names(self) -> List[str]:
+        return list(self.fractions)
+    
+    def validate(self, tier: Any) -> Optional[str]:
+        """Error message for an unknown tier (None if valid)"""
+        if tier in self.fractions:
+            return None
+        return f"\"{tier}\" is not a valid latency tier. Choose one of: {', '.join(self.fractions)}."
+    
+    def rounds(self, tier: str, total_rounds: int) -> int:
+        """Boosting rounds scored in `tier` by a model trained with total_rounds rounds (at least one)"""
+        return min(total_rounds, max(1, math.ceil(self.fractions[tier] * total_rounds)))
+    
+    def load_report(self) -> Dict[str, Any]:
+        """The deviation report, or an empty one if none has been written"""
+        if not self.report_path or not os.path.exists(self.report_path):
+            return {'format_version': REPORT_FORMAT_VERSION, 'models': {}}
+        with open(self.report_path) as f:
+            return json.load(f)
+    
+    def save_report(self, report: Dict[str, Any]):
+        temporary_path = f"{self.report_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(temporary_path, self.report_path)
+    
+    def describe(self, model_name: str, model_version: str) -> Dict[str, Any]:
+        """
+        Tier definitions of a model with the offline measurements, for
+        models_info. `current` tells whether they were taken on the served
+        model version.
+        """
+        try:
+            measured = self.load_report().get('models', {}).get(model_name)
+        except (OSError, ValueError):
+            measured = None
+        tiers = {}
+        for name, fraction in self.fractions.items():
+            tiers[name] = {'boosting_fraction': fraction, **((measured or {}).get('tiers', {}).get(name, {}))}
+        measurement = None
+        if measured is not None:
+            measurement = {key: value for key, value in measured.items() if key != 'tiers'}
+            measurement['current'] = measured.get('model_version') == model_version
+        return {'default': FULL_TIER, 'tiers': tiers, 'measurement': measurement}
+
+
+def measure_tiers(score: Callable[[Any, np.ndarray], Tuple[np.ndarray, np.ndarray]], loaded, X: np.ndarray,
+                  tiers: List[str], single_rows: int = 200, repeats: int = 3) -> Dict[str, Any]:
+    """
+    Deviation of every tier of a model snapshot from the full model on the
+    feature matrix X, and its latency: per row when scoring X as one batch
+    (best of `repeats`) and the median of single-record calls
+    """
+    full_predictions, full_probabilities = score(loaded, X)
+    measurements = {}
+    for tier in tiers:
+        variant = loaded.for_tier(tier)
+        predictions, probabilities = score(variant, X)
+        deltas = np.abs(np.asarray(probabilities, dtype=np.float64) - full_probabilities)
+        
+        batch_seconds = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            score(variant, X)
+            batch_seconds.append(time.perf_counter() - started)
+        single_seconds = []
+        for row in range(min(single_rows, len(X))):
+            started = time.perf_counter()
+            score(variant, X[row:row + 1])
+            single_seconds.append(time.perf_counter() - started)
+        
+        measurements[tier] = {
+            'boosting_rounds': variant.boosting_rounds,
+            'max_abs_probability_delta': round(float(deltas.max()), 6),
+            'mean_abs_probability_delta': round(float(deltas.mean()), 6),
+            'p99_abs_probability_delta': round(float(np.percentile(deltas, 99)), 6),
+            'prediction_agreement': round(float(np.mean(predictions == full_predictions)), 4),
+            'batch_row_us': round(min(batch_seconds) * 1e6 / len(X), 2),
+            'single_record_us': round(statistics.median(single_seconds) * 1e6, 1),
+        }
+    return measurements
+
+
+def report_entry(model_version: str, rows: int, source: str, measurements: Dict[str, Any]) -> Dict[str, Any]:
+    """Report entry of one model"""
+    return {
+        'model_version': model_version,
+        'measured_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'rows': rows,
+        'source': source,
+        'tiers': measurements,
+    }
+
+
+# Global tier configuration (configured from settings in MlModelsConfig.ready)
+latency_tiers = LatencyTiers()
@@ -0,0 +1,460 @@
+"""
+Compiled flat-array inference for the LightGBM/XGBoost tree ensembles
+
+A booster is compiled once into contiguous NumPy arrays (split feature,
+threshold, child pointers, leaf values) covering all of its trees. Prediction
+walks every tree for every row at the same time, one tree level per step, so
+a single record and a whole batch are both a handful of vectorized array
+operations instead of a round trip through the sklearn wrapper and the native
+library. Compiled forests can be saved next to the model file and loaded back
+without recompiling, or saved as one .npy file per array and memory-mapped.
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# LightGBM reads |x| <= kZeroThreshold as zero; the constant is the float literal 1e-35f
+_LIGHTGBM_ZERO_THRESHOLD = float(np.float32(1e-35))
+
+# Maximum probability deviation from the native predict_proba accepted for a compiled forest
+COMPILED_TOLERANCE = 1e-5
+
+# Above this many node visits (rows x tree levels) the native libraries are faster
+COMPILED_MAX_NODE_VISITS = 100_000
+
+_ARRAY_FIELDS = ('feature', 'threshold', 'children', 'leaf_value', 'default_left',
+                 'nan_is_missing', 'zero_is_missing', 'roots')
+
+
+class CompiledForest:
+    """
+    A binary-classification tree ensemble as flat arrays
+    
+    Every node of every tree lives in the same arrays; a leaf points to itself
+    through both children so that rows reaching a leaf early stay there while
+    deeper trees keep descending. Splits send a row right when
+    value > threshold (XGBoost's strict "<" thresholds are converted at
+    compile time), with per-node overrides for missing values.
+    """
+    
+    def __init__(self, kind: str, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 leaf_value: np.ndarray, default_left: np.ndarray, nan_is_missing: np.ndarray,
+                 zero_is_missing: np.ndarray, roots: np.ndarray, max_depth: int, base_score: float,
+                 sigmoid_scale: float, n_features: int):
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.leaf_value = leaf_value
+        self.default_left = default_left
+        self.nan_is_missing = nan_is_missing
+        self.zero_is_missing = zero_is_missing
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.base_score = float(base_score)
+        self.sigmoid_scale = float(sigmoid_scale)
+        self.n_features = int(n_features)
+        # XGBoost compares single-precision values, LightGBM (and merged forests) double-precision ones
+        self.input_dtype = np.float32 if kind == 'xgboost' else np.float64
+        self._has_zero_missing = bool(zero_is_missing.any())
+        self._children_flat = children.ravel()
+        # Trees sorted deepest first: level k only needs to walk the first _active_trees[k] trees
+        tree_depths = self._tree_depths()
+        self._depth_order = np.argsort(-tree_depths, kind='stable')
+        self._restore_order = np.argsort(self._depth_order)
+        self._sorted_roots = roots[self._depth_order]
+        self._active_trees = [int((tree_depths > level).sum()) for level in range(self.max_depth)
+                              if (tree_depths > level).any()]
+    
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+    
+    def raw_score(self, X: np.ndarray) -> np.ndarray:
+        """Sum of leaf values (margin) for every row"""
+        return self.leaf_values(self.prepare_input(X)).sum(axis=1, dtype=np.float64) + self.base_score
+    
+    def prepare_input(self, X: np.ndarray) -> np.ndarray:
+        """Cast X the way the native library reads it"""
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected a (n, {self.n_features}) feature matrix, got {X.shape}")
+        if self.kind == 'lightgbm':
+            # LightGBM's predictor drops |x| <= kZeroThreshold values, i.e. reads them as 0.0
+            tiny = np.abs(X) <= _LIGHTGBM_ZERO_THRESHOLD
+            if tiny.any():
+                X = np.where(tiny, 0.0, X)
+        return X
+    
+    def leaf_values(self, X: np.ndarray) -> np.ndarray:
+        """(n_rows, n_trees) leaf value reached in every tree by every row of a prepared matrix"""
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+        row_offset = (np.arange(n_rows, dtype=np.intp) * self.n_features)[:, None]
+        node = np.repeat(self._sorted_roots[None, :], n_rows, axis=0)
+        check_missing = self._has_zero_missing or bool(np.isnan(flat_X).any())
+        for n_active in self._active_trees:
+            # Trees already finished at this level are skipped (they sit in the trailing columns)
+            active = node[:, :n_active]
+            values = flat_X.take(row_offset + self.feature.take(active))
+            go_right = values > self.threshold.take(active)
+            if check_missing:
+                go_right = self._missing_direction(values, active, go_right)
+            # children_flat[2 * node] is the left child, [2 * node + 1] the right one
+            node[:, :n_active] = self._children_flat.take(2 * active + go_right)
+        
+        return self.leaf_value.take(node)[:, self._restore_order]
+    
+    def _tree_depths(self) -> np.ndarray:
+        """Depth of every tree, found by walking all trees breadth-first"""
+        depths = np.zeros(len(self.roots), dtype=np.intp)
+        frontier = self.roots
+        frontier_tree = np.arange(len(self.roots))
+        level = 0
+        while frontier.size:
+            internal = self.children[frontier, 0] != frontier
+            frontier = self.children[frontier[internal]].ravel()
+            frontier_tree = np.repeat(frontier_tree[internal], 2)
+            level += 1
+            depths[frontier_tree] = level
+        return depths
+    
+    def truncated(self, n_trees: int) -> 'CompiledForest':
+        """
+        The forest of the first n_trees trees (the first boosting rounds). The
+        nodes of every tree follow those of the previous one, so the arrays are
+        prefixes of this forest's arrays (views, also of memory-mapped arrays).
+        """
+        if n_trees >= self.n_trees:
+            return self
+        if self.kind == 'merged' or n_trees < 1:
+            raise ValueError(f"Cannot truncate a {self.kind} forest to {n_trees} trees")
+        end = int(self.roots[n_trees])
+        arrays = {name: getattr(self, name)[:end] for name in _ARRAY_FIELDS if name != 'roots'}
+        return CompiledForest(**arrays, roots=self.roots[:n_trees], **self._meta())
+    
+    def is_efficient_for(self, n_rows: int) -> bool:
+        """
+        Level-by-level traversal wins on small inputs, where the native libraries'
+        fixed per-call overhead dominates; on large batches of big forests the
+        native code is faster, so callers fall back to it beyond this budget
+        """
+        return n_rows * sum(self._active_trees) <= COMPILED_MAX_NODE_VISITS
+    
+    def _missing_direction(self, values: np.ndarray, node: np.ndarray, go_right: np.ndarray) -> np.ndarray:
+        nan = np.isnan(values)
+        nan_is_missing = self.nan_is_missing.take(node)
+        # LightGBM compares NaN as 0.0 unless the split learned a direction for NaN
+        # (XGBoost splits always treat NaN as missing, so this never applies to them)
+        as_zero = nan & ~nan_is_missing
+        if as_zero.any():
+            values = np.where(as_zero, 0.0, values)
+            go_right = values > self.threshold.take(node)
+        use_default = nan & nan_is_missing
+        if self._has_zero_missing:
+            use_default |= self.zero_is_missing.take(node) & (np.abs(values) <= _LIGHTGBM_ZERO_THRESHOLD)
+        return np.where(use_default, ~self.default_left.take(node), go_right)
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities in the same (n, 2) layout as predict_proba"""
+        positive = 1.0 / (1.0 + np.exp(-self.sigmoid_scale * self.raw_score(X)))
+        return np.column_stack((1.0 - positive, positive))
+    
+    def probe_matrix(self, n_rows: int = 256, seed: int = 0) -> np.ndarray:
+        """
+        Feature matrix for checking a compiled forest against its native model:
+        random rows spread over each feature's split thresholds plus rows that
+        sit exactly on thresholds, where comparison semantics matter most
+        """
+        rng = np.random.default_rng(seed)
+        internal = self.children[:, 0] != np.arange(len(self.children))
+        X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        for feature_index in range(self.n_features):
+            thresholds = self.threshold[internal & (self.feature == feature_index)].astype(np.float64)
+            thresholds = thresholds[np.isfinite(thresholds)]
+            if len(thresholds) == 0:
+                continue
+            low, high = thresholds.min(), thresholds.max()
+            span = max(high - low, 1.0)
+            X[:, feature_index] = rng.uniform(low - 0.1 * span, high + 0.1 * span, n_rows)
+            on_threshold = rng.random(n_rows) < 0.25
+            X[on_threshold, feature_index] = rng.choice(thresholds, on_threshold.sum())
+        return X
+    
+    def _meta(self) -> Dict[str, Any]:
+        return {
+            'kind': self.kind, 'max_depth': self.max_depth, 'base_score': self.base_score,
+            'sigmoid_scale': self.sigmoid_scale, 'n_features': self.n_features
+        }
+    
+    def save(self, path: str):
+        """Save the compiled arrays (np.savez) so the next load can skip compilation"""
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(self._meta())), **{name: getattr(self, name) for name in _ARRAY_FIELDS})
+    
+    @classmethod
+    def load(cls, path: str) -> 'CompiledForest':
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {name: data[name] for name in _ARRAY_FIELDS}
+        return cls(**arrays, **meta)
+    
+    def save_arrays(self, directory: str, prefix: str) -> Dict[str, Any]:
+        """
+        Save every array as its own .npy file ('<prefix>.<array>.npy') so it can
+        be memory-mapped; returns the description to keep in a manifest
+        """
+        files = {}
+        for name in _ARRAY_FIELDS:
+            files[name] = f"{prefix}.{name}.npy"
+            path = os.path.join(directory, files[name])
+            # Replace rather than overwrite: other processes may have the previous file mapped
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(getattr(self, name)), allow_pickle=False)
+            os.replace(temporary_path, path)
+        return {'meta': self._meta(), 'arrays': files}
+    
+    @classmethod
+    def load_arrays(cls, directory: str, description: Dict[str, Any], mmap_mode: Optional[str] = 'r') -> 'CompiledForest':
+        """Load a forest saved with save_arrays, memory-mapping the arrays read-only by default"""
+        arrays = {
+            name: np.load(os.path.join(directory, description['arrays'][name]), mmap_mode=mmap_mode, allow_pickle=False)
+            for name in _ARRAY_FIELDS
+        }
+        return cls(**arrays, **description['meta'])
+
+
+class FusedEnsemble:
+    """
+    Weighted soft-voting ensemble of compiled forests, evaluated in one pass
+    
+    The member forests are merged into a single forest over the side-by-side
+    concatenation of each member's prepared input (XGBoost's float32 values
+    and thresholds are exact in float64), so all trees of all members are
+    walked by the same traversal. Each member's margin is then summed from its
+    own range of trees and the member probabilities are blended with the
+    ensemble weights. A merged forest built earlier (e.g. memory-mapped from a
+    model artifact) can be passed in instead of being rebuilt.
+    """
+    
+    def __init__(self, forests: List[CompiledForest], weights: List[float], merged: Optional[CompiledForest] = None):
+        if len(forests) != len(weights):
+            raise ValueError("FusedEnsemble needs one weight per forest")
+        self.forests = list(forests)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.base_scores = np.array([forest.base_score for forest in forests], dtype=np.float64)
+        self.sigmoid_scales = np.array([forest.sigmoid_scale for forest in forests], dtype=np.float64)
+        self.n_features = forests[0].n_features
+        for forest in forests:
+            if forest.n_features != self.n_features:
+                raise ValueError("All fused forests must take the same features")
+        
+        self._tree_starts = np.cumsum([0] + [forest.n_trees for forest in forests])[:-1]
+        if merged is None:
+            merged = self._merge(forests, self.n_features)
+        elif merged.kind != 'merged' or merged.n_trees != sum(forest.n_trees for forest in forests):
+            raise ValueError("Merged forest does not match the member forests")
+        self.merged = merged
+    
+    @staticmethod
+    def _merge(forests: List[CompiledForest], n_features: int) -> CompiledForest:
+        node_offsets = np.cumsum([0] + [len(forest.feature) for forest in forests])[:-1]
+        return CompiledForest(
+            kind='merged',
+            feature=np.concatenate([forest.feature + member * n_features for member, forest in enumerate(forests)]),
+            threshold=np.concatenate([forest.threshold.astype(np.float64) for forest in forests]),
+            children=np.concatenate([forest.children + offset for forest, offset in zip(forests, node_offsets)]),
+            leaf_value=np.concatenate([forest.leaf_value for forest in forests]),
+            default_left=np.concatenate([forest.default_left for forest in forests]),
+            nan_is_missing=np.concatenate([forest.nan_is_missing for forest in forests]),
+            zero_is_missing=np.concatenate([forest.zero_is_missing for forest in forests]),
+            roots=np.concatenate([forest.roots + offset for forest, offset in zip(forests, node_offsets)]),
+            max_depth=max(forest.max_depth for forest in forests),
+            base_score=0.0,
+            sigmoid_scale=1.0,
+            n_features=n_features * len(forests)
+        )
+    
+    def member_probabilities(self, X: np.ndarray) -> np.ndarray:
+        """(n_rows, n_members) positive-class probability of every member"""
+        merged_X = np.hstack([forest.prepare_input(X).astype(np.float64, copy=False) for forest in self.forests])
+        leaves = self.merged.leaf_values(merged_X)
+        margins = np.add.reduceat(leaves, self._tree_starts, axis=1) + self.base_scores
+        return 1.0 / (1.0 + np.exp(-self.sigmoid_scales * margins))
+    
+    def predict_positive(self, X: np.ndarray) -> np.ndarray:
+        """Weighted positive-class probability for every row"""
+        return (self.member_probabilities(X) * self.weights).sum(axis=1)
+    
+    def is_efficient_for(self, n_rows: int) -> bool:
+        return self.merged.is_efficient_for(n_rows)
+    
+    def truncated(self, n_trees: List[int]) -> 'FusedEnsemble':
+        """The ensemble of each member's first n_trees[i] trees (merged again)"""
+        if all(count >= forest.n_trees for count, forest in zip(n_trees, self.forests)):
+            return self
+        return FusedEnsemble([forest.truncated(count) for forest, count in zip(self.forests, n_trees)], self.weights)
+
+
+class _ForestBuilder:
+    """Accumulates nodes of several trees into flat lists"""
+    
+    def __init__(self):
+        self.feature: List[int] = []
+        self.threshold: List[float] = []
+        self.children: List[Tuple[int, int]] = []
+        self.leaf_value: List[float] = []
+        self.default_left: List[bool] = []
+        self.nan_is_missing: List[bool] = []
+        self.zero_is_missing: List[bool] = []
+        self.roots: List[int] = []
+        self.max_depth = 0
+    
+    def add_node(self) -> int:
+        self.feature.append(0)
+        self.threshold.append(0.0)
+        self.children.append((-1, -1))
+        self.leaf_value.append(0.0)
+        self.default_left.append(True)
+        self.nan_is_missing.append(False)
+        self.zero_is_missing.append(False)
+        return len(self.feature) - 1
+    
+    def set_leaf(self, index: int, value: float):
+        self.children[index] = (index, index)
+        self.leaf_value[index] = value
+    
+    def build(self, kind: str, threshold_dtype, base_score: float, sigmoid_scale: float, n_features: int) -> CompiledForest:
+        return CompiledForest(
+            kind=kind,
+            feature=np.array(self.feature, dtype=np.intp),
+            threshold=np.array(self.threshold, dtype=threshold_dtype),
+            children=np.array(self.children, dtype=np.intp),
+            leaf_value=np.array(self.leaf_value, dtype=np.float64),
+            default_left=np.array(self.default_left, dtype=bool),
+            nan_is_missing=np.array(self.nan_is_missing, dtype=bool),
+            zero_is_missing=np.array(self.zero_is_missing, dtype=bool),
+            roots=np.array(self.roots, dtype=np.intp),
+            max_depth=self.max_depth,
+            base_score=base_score,
+            sigmoid_scale=sigmoid_scale,
+            n_features=n_features
+        )
+
+
+def compile_lightgbm(booster) -> CompiledForest:
+    """Compile a binary LightGBM Booster (best iteration, as used by predict)"""
+    dump = booster.dump_model()
+    objective = dump.get('objective', '')
+    if not objective.startswith('binary') or dump.get('num_class', 1) != 1:
+        raise NotImplementedError(f"Only binary LightGBM objectives can be compiled (got '{objective}')")
+    if dump.get('average_output'):
+        raise NotImplementedError("Random-forest mode LightGBM models cannot be compiled")
+    sigmoid_scale = 1.0
+    for part in objective.split()[1:]:
+        if part.startswith('sigmoid:'):
+            sigmoid_scale = float(part.split(':', 1)[1])
+    
+    builder = _ForestBuilder()
+    
+    def add(tree: Dict[str, Any], depth: int) -> int:
+        index = builder.add_node()
+        if 'leaf_value' in tree:
+            # Leaves of linear trees carry a linear model (leaf_const + leaf_coeff . x) instead of a constant
+            if 'leaf_const' in tree or 'leaf_coeff' in tree:
+                raise NotImplementedError("Linear-tree LightGBM models cannot be compiled")
+            builder.set_leaf(index, tree['leaf_value'])
+            builder.max_depth = max(builder.max_depth, depth)
+            return index
+        if tree.get('decision_type') != '<=':
+            raise NotImplementedError(f"Unsupported LightGBM split type: {tree.get('decision_type')}")
+        builder.feature[index] = tree['split_feature']
+        builder.threshold[index] = tree['threshold']
+        builder.default_left[index] = bool(tree['default_left'])
+        builder.nan_is_missing[index] = tree['missing_type'] == 'NaN'
+        builder.zero_is_missing[index] = tree['missing_type'] == 'Zero'
+        left = add(tree['left_child'], depth + 1)
+        right = add(tree['right_child'], depth + 1)
+        builder.children[index] = (left, right)
+        return index
+    
+    for tree_info in dump['tree_info']:
+        builder.roots.append(add(tree_info['tree_structure'], 0))
+    
+    return builder.build('lightgbm', np.float64, base_score=0.0, sigmoid_scale=sigmoid_scale,
+                         n_features=dump['max_feature_idx'] + 1)
+
+
+def compile_xgboost(booster) -> CompiledForest:
+    """Compile a binary:logistic XGBoost gbtree Booster (best iteration, as used by predict_proba)"""
+    model = json.loads(booster.save_raw('json'))
+    learner = model['learner']
+    objective = learner['objective']['name']
+    if objective != 'binary:logistic':
+        raise NotImplementedError(f"Only binary:logistic XGBoost models can be compiled (got '{objective}')")
+    gradient_booster = learner['gradient_booster']
+    if gradient_booster['name'] != 'gbtree':
+        raise NotImplementedError(f"Only gbtree XGBoost models can be compiled (got '{gradient_booster['name']}')")
+    
+    trees = gradient_booster['model']['trees']
+    best_iteration = booster.attr('best_iteration')
+    if best_iteration is not None:
+        trees_per_iteration = int(gradient_booster['model']['gbtree_model_param']['num_parallel_tree'])
+        trees = trees[:(int(best_iteration) + 1) * trees_per_iteration]
+    
+    # base_score is a probability for binary:logistic, stored as "0.5" or "[5E-1]"
+    base_probability = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+    base_margin = float(np.log(base_probability / (1.0 - base_probability)))
+    
+    builder = _ForestBuilder()
+    for tree in trees:
+        if any(tree.get('split_type', [])) or tree.get('categories'):
+            raise NotImplementedError("Categorical XGBoost splits cannot be compiled")
+        offset = len(builder.feature)
+        left_children = tree['left_children']
+        for node_id in range(len(left_children)):
+            index = builder.add_node()
+            if left_children[node_id] == -1:
+                builder.set_leaf(index, tree['split_conditions'][node_id])
+                continue
+            # XGBoost goes left when value < threshold; in float32 that is value <= previous float
+            threshold = np.float32(tree['split_conditions'][node_id])
+            builder.feature[index] = tree['split_indices'][node_id]
+            builder.threshold[index] = np.nextafter(threshold, np.float32(-np.inf))
+            builder.children[index] = (offset + left_children[node_id], offset + tree['right_children'][node_id])
+            builder.default_left[index] = bool(tree['default_left'][node_id])
+            builder.nan_is_missing[index] = True
+        builder.roots.append(offset)
+        builder.max_depth = max(builder.max_depth, _tree_depth(left_children, tree['right_children']))
+    
+    return builder.build('xgboost', np.float32, base_score=base_margin, sigmoid_scale=1.0,
+                         n_features=int(learner['learner_model_param']['num_feature']))
+
+
+def _tree_depth(left_children: List[int], right_children: List[int]) -> int:
+    depth = 0
+    stack = [(0, 0)]
+    while stack:
+        node_id, node_depth = stack.pop()
+        if left_children[node_id] == -1:
+            depth = max(depth, node_depth)
+        else:
+            stack.append((left_children[node_id], node_depth + 1))
+            stack.append((right_children[node_id], node_depth + 1))
+    return depth
+
+
+def compile_model(estimator) -> CompiledForest:
+    """Compile a fitted LGBMClassifier / XGBClassifier (or their boosters)"""
+    if hasattr(estimator, 'booster_'):
+        return compile_lightgbm(estimator.booster_)
+    if hasattr(estimator, 'get_booster'):
+        return compile_xgboost(estimator.get_booster())
+    if hasattr(estimator, 'dump_model'):
+        return compile_lightgbm(estimator)
+    if hasattr(estimator, 'save_raw'):
+        return compile_xgboost(estimator)
+    raise NotImplementedError(f"Cannot compile model of type {type(estimator).__name__}")
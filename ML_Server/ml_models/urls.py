@@ -5,9 +5,28 @@ urlpatterns = [
     # Health check and info endpoints
     path('health/', views.health_check, name='ml_health_check'),
     path('models/', views.models_info, name='models_info'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    
+    # Admin endpoints
+    path('reload/', views.reload_models, name='reload_models'),
     
     # Prediction endpoints
     path('predict/dry-weight/', views.predict_dry_weight, name='predict_dry_weight'),
     path('predict/urr/', views.predict_urr, name='predict_urr'),
     path('predict/hb/', views.predict_hb, name='predict_hb'),
+    
+    # Batch prediction endpoints
+    path('predict/dry-weight/batch/', views.predict_dry_weight_batch, name='predict_dry_weight_batch'),
+    path('predict/urr/batch/', views.predict_urr_batch, name='predict_urr_batch'),
+    path('predict/hb/batch/', views.predict_hb_batch, name='predict_hb_batch'),
+    
+    # Streaming (NDJSON) bulk prediction endpoints
+    path('predict/dry-weight/stream/', views.predict_dry_weight_stream, name='predict_dry_weight_stream'),
+    path('predict/urr/stream/', views.predict_urr_stream, name='predict_urr_stream'),
+    path('predict/hb/stream/', views.predict_hb_stream, name='predict_hb_stream'),
+    
+    # Patient history endpoints
+    path('history/sessions/', views.push_session_history, name='push_session_history'),
+    path('history/monthly/', views.push_monthly_history, name='push_monthly_history'),
+    path('history/<str:patient_id>/', views.patient_history_view, name='patient_history'),
 ]
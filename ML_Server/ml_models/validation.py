@@ -0,0 +1,324 @@
+"""
+Compiled input validation for the prediction serializers
+
+Validating a record with a DRF serializer runs the full field machinery
+(get_value, validate_empty_values, to_internal_value, every validator) for
+each of its ~15 fields, which for batches and busy single-record endpoints
+costs more than scoring the model. CompiledValidator is built once from the
+same serializer fields and validates whole columns at a time: the float
+fields of all records are converted with one NumPy call and checked against
+the fields' own min/max validators with vectorized comparisons.
+
+Only plain JSON numbers take the vectorized path. Every other value (missing,
+null, strings, booleans, ...) and every non-float field is handed to the DRF
+field itself, so the validated data and the error dicts (messages and codes)
+are exactly what the serializer would return. The serializers stay the
+source of truth and are still used for the schema documentation.
+
+Columnar requests (Arrow) are validated column by column without building
+the request records first (validate_columns): numeric columns arrive as
+float64 arrays and are range-checked as they are, and their validated values
+are returned as columns the feature builder can use directly.
+"""
+import operator
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.core.validators import MaxValueValidator, MinValueValidator
+from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail, ValidationError
+from rest_framework.fields import SkipField, empty
+
+# Types the compiled path converts exactly like FloatField does (bool is deliberately not one of them)
+_NUMBER_TYPES = frozenset((int, float))
+
+# Below this many records the per-value checks are cheaper than building NumPy columns
+COLUMN_MIN_RECORDS = 12
+
+
+class _FloatColumn:
+    """
+    The range validators of a FloatField, applicable to a scalar or a whole column
+    """
+    
+    __slots__ = ('checks',)
+    
+    def __init__(self, field: serializers.FloatField):
+        # (comparison that fails, limit, error) in the field's validator order
+        self.checks = []
+        for validator in field.validators:
+            error = ErrorDetail(str(validator.message), code=validator.code)
+            if type(validator) is MaxValueValidator:
+                self.checks.append((operator.gt, validator.limit_value, error))
+            elif type(validator) is MinValueValidator:
+                self.checks.append((operator.lt, validator.limit_value, error))
+            else:
+                raise ValueError(f"Cannot compile validator {type(validator).__name__} of field '{field.field_name}'")
+    
+    def errors(self, value: float) -> List[ErrorDetail]:
+        return [error for compare, limit, error in self.checks if compare(value, limit)]
+
+
+class NumericColumn:
+    """
+    A numeric column of a columnar request: float64 values and the null mask
+    (null cells count as missing fields)
+    """
+    
+    __slots__ = ('values', 'nulls')
+    
+    def __init__(self, values: np.ndarray, nulls: np.ndarray):
+        self.values = values
+        self.nulls = nulls
+    
+    def cells(self) -> List[Any]:
+        """The column as request values: floats, `empty` for null cells"""
+        return [empty if null else value for value, null in zip(self.values.tolist(), self.nulls.tolist())]
+
+
+def column_cells(column: Any) -> List[Any]:
+    """Request values of a NumericColumn or a list column (None for a null cell), `empty` for nulls"""
+    if isinstance(column, NumericColumn):
+        return column.cells()
+    return [empty if value is None else value for value in column]
+
+
+def column_records(columns: Dict[str, Any], n_rows: int) -> List[Dict[str, Any]]:
+    """Row dicts of a columnar request, without their null cells"""
+    records = [{} for _ in range(n_rows)]
+    for name, column in columns.items():
+        for record, value in zip(records, column_cells(column)):
+            if value is not empty:
+                record[name] = value
+    return records
+
+
+class CompiledValidator:
+    """
+    Column-wise equivalent of a DRF serializer's is_valid()
+    
+    Returns the same validated data and the same error dicts (field -> list
+    of ErrorDetail, in field order) as the serializer, for one record or a
+    whole batch.
+    """
+    
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        serializer = serializer_class()
+        if type(serializer).validate is not serializers.Serializer.validate or serializer.validators:
+            raise ValueError(f"{serializer_class.__name__} has serializer-level validation and cannot be compiled")
+        
+        # (name, field, column); fields without a column are validated by the DRF field itself
+        self.fields: List[Tuple[str, serializers.Field, Optional[_FloatColumn]]] = []
+        for field in serializer._writable_fields:
+            name = field.field_name
+            if getattr(serializer, f'validate_{name}', None) is not None or field.source_attrs != [name]:
+                raise ValueError(f"Field '{name}' of {serializer_class.__name__} cannot be compiled")
+            column = _FloatColumn(field) if type(field) is serializers.FloatField else None
+            self.fields.append((name, field, column))
+    
+    def validate(self, data: Any) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """(validated data, {}) or (None, errors) for one request body"""
+        validated, errors = self.validate_many([data])
+        return validated[0], errors[0] or {}
+    
+    def validate_many(self, records: Sequence[Any]) -> Tuple[List[Optional[Dict[str, Any]]], List[Optional[Dict[str, Any]]]]:
+        """
+        Validate several records at once
+        
+        Returns (validated, errors): validated[i] is the validated data of
+        record i or None if it is invalid, errors[i] its error dict or None
+        if it is valid.
+        """
+        validated: List[Optional[Dict[str, Any]]] = [None] * len(records)
+        errors: List[Optional[Dict[str, Any]]] = [None] * len(records)
+        
+        plain = []
+        for index, record in enumerate(records):
+            if type(record) is dict:
+                plain.append(index)
+            else:
+                # Form data, lists and other payloads: let DRF produce its exact answer
+                serializer = self.serializer_class(data=record)
+                if serializer.is_valid():
+                    validated[index] = serializer.validated_data
+                else:
+                    errors[index] = serializer.errors
+        
+        values = [{} for _ in plain]
+        field_errors = [{} for _ in plain]
+        for name, field, column in self.fields:
+            raw = [records[index].get(name, empty) for index in plain]
+            if column is not None and len(raw) >= COLUMN_MIN_RECORDS and set(map(type, raw)) <= _NUMBER_TYPES:
+                self._check_column(name, column, raw, values, field_errors)
+            else:
+                self._check_cells(name, field, column, raw, values, field_errors)
+        
+        for position, index in enumerate(plain):
+            if field_errors[position]:
+                errors[index] = field_errors[position]
+            else:
+                validated[index] = values[position]
+        return validated, errors
+    
+    def validate_columns(self, columns: Dict[str, Any], n_rows: int) -> Tuple[List[Optional[Dict[str, Any]]],
+                                                                             List[Optional[Dict[str, Any]]],
+                                                                             Dict[str, np.ndarray]]:
+        """
+        Validate a columnar batch ({name: NumericColumn or list}, n_rows rows)
+        
+        Returns (validated, errors, numeric) like validate_many plus the
+        validated values of every float field as a float64 column, NaN where
+        a record has no valid value. The finite, non-null cells of a numeric
+        column are range-checked at once; every other cell goes through the
+        checks of validate_many, so the answers are the same as for the
+        equivalent JSON records.
+        """
+        values = [{} for _ in range(n_rows)]
+        field_errors = [{} for _ in range(n_rows)]
+        numeric = {}
+        for name, field, column in self.fields:
+            data = columns.get(name)
+            if data is None:
+                self._check_cells(name, field, column, [empty] * n_rows, values, field_errors)
+            elif column is not None and isinstance(data, NumericColumn):
+                numeric[name] = self._check_numeric_column(name, field, column, data, values, field_errors)
+                continue
+            else:
+                self._check_cells(name, field, column, column_cells(data), values, field_errors)
+            if column is not None:
+                numeric[name] = np.array([row.get(name, np.nan) for row in values], dtype=np.float64)
+        
+        validated: List[Optional[Dict[str, Any]]] = [None] * n_rows
+        errors: List[Optional[Dict[str, Any]]] = [None] * n_rows
+        for index in range(n_rows):
+            if field_errors[index]:
+                errors[index] = field_errors[index]
+            else:
+                validated[index] = values[index]
+        return validated, errors, numeric
+    
+    @classmethod
+    def _check_numeric_column(cls, name: str, field: serializers.Field, column: _FloatColumn, data: NumericColumn,
+                              values: List[dict], field_errors: List[dict]) -> np.ndarray:
+        """Range-check the finite cells of a numeric column at once; nulls and NaN/inf go through the field"""
+        converted = np.array(data.values, dtype=np.float64)
+        plain = ~np.asarray(data.nulls, dtype=bool) & np.isfinite(converted)
+        bad = np.zeros(len(converted), dtype=bool)
+        for compare, limit, _ in column.checks:
+            bad |= compare(converted, limit)
+        bad &= plain
+        
+        for position in np.flatnonzero(plain & ~bad).tolist():
+            values[position][name] = converted[position].item()
+        for position in np.flatnonzero(bad).tolist():
+            field_errors[position][name] = column.errors(converted[position])
+        
+        others = np.flatnonzero(~plain)
+        if len(others):
+            cells = data.cells()
+            other_values = [{} for _ in others]
+            other_errors = [{} for _ in others]
+            cls._check_cells(name, field, column, [cells[position] for position in others.tolist()],
+                             other_values, other_errors)
+            for position, value, errors in zip(others.tolist(), other_values, other_errors):
+                if name in value:
+                    values[position][name] = value[name]
+                if errors:
+                    field_errors[position][name] = errors[name]
+        
+        validated = np.where(plain & ~bad, converted, np.nan)
+        for position in others.tolist():
+            validated[position] = values[position].get(name, np.nan)
+        return validated
+    
+    @staticmethod
+    def _check_column(name: str, column: _FloatColumn, raw: List[Any], values: List[dict], field_errors: List[dict]):
+        """Every record holds a JSON number: convert and range-check the column at once"""
+        converted = np.array(raw, dtype=np.float64)
+        bad = np.zeros(len(raw), dtype=bool)
+        for compare, limit, _ in column.checks:
+            bad |= compare(converted, limit)
+        
+        for position, value in enumerate(converted.tolist()):
+            values[position][name] = value
+        for position in np.flatnonzero(bad).tolist():
+            del values[position][name]
+            field_errors[position][name] = column.errors(converted[position])
+    
+    @staticmethod
+    def _check_cells(name: str, field: serializers.Field, column: Optional[_FloatColumn], raw: List[Any],
+                     values: List[dict], field_errors: List[dict]):
+        """Mixed column: numbers take the compiled checks, everything else goes through the DRF field"""
+        for position, value in enumerate(raw):
+            if column is not None and type(value) in _NUMBER_TYPES:
+                value = float(value)
+                errors = column.errors(value)
+                if not errors:
+                    values[position][name] = value
+                    continue
+            else:
+                try:
+                    values[position][name] = field.run_validation(value)
+                    continue
+                except SkipField:
+                    continue
+                except ValidationError as exc:
+                    errors = exc.detail
+            field_errors[position][name] = errors
+
+
+class InputValidation:
+    """
+    Validates request data with the compiled validator of its serializer
+    
+    With compiled validation disabled (ML_COMPILED_VALIDATION=False) the
+    serializers validate the data themselves.
+    """
+    
+    def __init__(self):
+        self.compiled = True
+        self._validators: Dict[type, CompiledValidator] = {}
+    
+    def configure(self, compiled: bool = True):
+        self.compiled = compiled
+    
+    def _validator(self, serializer_class) -> CompiledValidator:
+        validator = self._validators.get(serializer_class)
+        if validator is None:
+            validator = self._validators[serializer_class] = CompiledValidator(serializer_class)
+        return validator
+    
+    def validate(self, serializer_class, data: Any) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """(validated data, {}) or (None, errors) for one request body"""
+        if self.compiled:
+            return self._validator(serializer_class).validate(data)
+        serializer = serializer_class(data=data)
+        if serializer.is_valid():
+            return serializer.validated_data, {}
+        return None, serializer.errors
+    
+    def validate_columns(self, serializer_class, columns: Dict[str, Any], n_rows: int):
+        """
+        Validate a columnar batch: (validated, errors, numeric columns), the
+        columns being None when the serializers validate row dicts instead
+        """
+        if self.compiled:
+            return self._validator(serializer_class).validate_columns(columns, n_rows)
+        validated, errors = self.validate_many(serializer_class, column_records(columns, n_rows))
+        return validated, errors, None
+    
+    def validate_many(self, serializer_class, records: Sequence[Any]) -> Tuple[List[Optional[Dict[str, Any]]], List[Optional[Dict[str, Any]]]]:
+        """Per record validated data (None if invalid) and errors (None if valid)"""
+        if self.compiled:
+            return self._validator(serializer_class).validate_many(records)
+        validated, errors = [], []
+        for record in records:
+            record_data, record_errors = self.validate(serializer_class, record)
+            validated.append(record_data)
+            errors.append(record_errors or None)
+        return validated, errors
+
+
+# Global validation entry point of the prediction views
+input_validation = InputValidation()
@@ -1,7 +1,11 @@
-from rest_framework import status
-from rest_framework.decorators import api_view
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import serializers, status
+from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
-from drf_spectacular.utils import extend_schema
+from rest_framework.settings import api_settings
 import logging
 
 from .serializers import (
@@ -11,16 +15,89 @@ from .serializers import (
     URRPredictionResponseSerializer,
     HbPredictionSerializer,
     HbPredictionResponseSerializer,
+    BatchPredictionRequestSerializer,
+    DryWeightBatchPredictionResponseSerializer,
+    URRBatchPredictionResponseSerializer,
+    HbBatchPredictionResponseSerializer,
+    SessionHistoryRequestSerializer,
+    MonthlyHistoryRequestSerializer,
+    HistoryPushResponseSerializer,
+    ModelReloadSerializer,
     ErrorResponseSerializer
 )
-from .services import dry_weight_predictor, urr_predictor, hb_predictor
+from .features import DRY_WEIGHT_SCHEMA, URR_SCHEMA, HB_SCHEMA, ColumnarRecords
+from .services import (
+    model_manager, prediction_cache, explanation_cache, micro_batching_stats, dry_weight_predictor, urr_predictor,
+    hb_predictor
+)
+from .history import MONTHLY_STREAM, SESSION_STREAM, patient_history
+from .encoding import check_results, encode_batch_response, encode_result, iter_batch_response
+from .formats import (
+    ARROW_CONTENT_TYPE, ARROW_FORMAT, JSON_FORMAT, MSGPACK_CONTENT_TYPE, MSGPACK_FORMAT, ArrowBatch, ArrowStreamParser,
+    encode_arrow_batch, encode_msgpack, encode_msgpack_batch, response_format,
+)
+from .metrics import StageClock, metrics, track_requests
+from .schema import OpenApiParameter, extend_schema
+from .shadow import shadow_evaluator
+from .tiers import latency_tiers
+from .streaming import NDJSON_CONTENT_TYPES, iter_lines, iter_predictions, request_stream
+from .validation import input_validation
 from .middleware.auth import require_auth, require_role
 
 logger = logging.getLogger(__name__)
 
+# Optional query parameter of every prediction endpoint (see ml_models/tiers.py)
+LATENCY_TIER_PARAMETER = OpenApiParameter(
+    'latency_tier', str, OpenApiParameter.QUERY, required=False,
+    description="Score with only the first boosting rounds of the models for lower latency "
+                "(e.g. 'fast'; default 'full'). The tiers and their measured deviation are listed by /api/ml/models/."
+)
+
+# Optional query parameter of the single and batch prediction endpoints (see ml_models/explanations.py)
+EXPLAIN_PARAMETER = OpenApiParameter(
+    'explain', bool, OpenApiParameter.QUERY, required=False,
+    description="Add the contribution of every model feature to the predicted probability (TreeSHAP) to each result"
+)
+
+
+# Batch endpoints also take Arrow IPC streams, and answer in JSON, MessagePack or Arrow (see ml_models/formats.py)
+BATCH_PARSER_CLASSES = api_settings.DEFAULT_PARSER_CLASSES + [ArrowStreamParser]
+BATCH_RESPONSE_FORMATS = (JSON_FORMAT, MSGPACK_FORMAT, ARROW_FORMAT)
+
+
+def _latency_tier(request):
+    """The latency tier a request asks for (None if none) and the validation errors of the parameter"""
+    tier = request.GET.get('latency_tier')
+    if tier is None:
+        return None, None
+    error = latency_tiers.validate(tier)
+    return (tier, None) if error is None else (None, {'latency_tier': [error]})
+
+
+def _prediction_options(request):
+    """Options of a single or batch prediction request (latency_tier, explain) and the validation errors of the parameters"""
+    latency_tier, errors = _latency_tier(request)
+    errors = dict(errors or {})
+    explain = False
+    if 'explain' in request.GET:
+        try:
+            explain = serializers.BooleanField().to_internal_value(request.GET['explain'])
+        except serializers.ValidationError as e:
+            errors['explain'] = e.detail
+    return {'latency_tier': latency_tier, 'explain': explain}, errors or None
+
+
+def _result_response(request, result):
+    """Response with a single prediction, in JSON or the MessagePack the request accepts"""
+    if response_format(request) == MSGPACK_FORMAT:
+        check_results([result])
+        return HttpResponse(encode_msgpack(result), content_type=MSGPACK_CONTENT_TYPE)
+    return HttpResponse(encode_result(result), content_type='application/json')
+
 
 @extend_schema(
     request=DryWeightPredictionSerializer,
+    parameters=[LATENCY_TIER_PARAMETER, EXPLAIN_PARAMETER],
     responses={
         200: DryWeightPredictionResponseSerializer,
         400: ErrorResponseSerializer,
@@ -33,29 +110,39 @@ logger = logging.getLogger(__name__)
 @api_view(['POST'])
 @require_auth
 @require_role(['DOCTOR', 'NURSE'])
+@track_requests('dry_weight', 'predict')
 def predict_dry_weight(request):
     """
     Predict if dry weight will change in next session
     """
     try:
         # Validate input data
-        serializer = DryWeightPredictionSerializer(data=request.data)
-        if not serializer.is_valid():
+        clock = StageClock('dry_weight')
+        options, validation_errors = _prediction_options(request)
+        if validation_errors is None:
+            validated_data, validation_errors = input_validation.validate(DryWeightPredictionSerializer, request.data)
+        else:
+            validated_data = None
+        if validated_data is not None:
+            # History inputs the request leaves out are taken from the patient's earlier records
+            validated_data, validation_errors = patient_history.complete('dry_weight', validated_data)
+        clock.lap('validation')
+        if validated_data is None:
             return Response({
                 'error': 'Invalid input data',
                 'message': 'Please check the input parameters',
-                'details': serializer.errors
+                'details': validation_errors
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        validated_data = serializer.validated_data
-        
         # Make prediction
-        prediction_result = dry_weight_predictor.predict(validated_data)
-        
-        # Return response
-        response_serializer = DryWeightPredictionResponseSerializer(prediction_result)
-        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        prediction_result = dry_weight_predictor.predict(validated_data, **options)
+        clock.skip()  # features, predict and recommendations are timed by the predictor
         
+        # Encode the result straight to the response body
+        response = _result_response(request, prediction_result)
+        clock.lap('serialization')
+        return response
+    
     except Exception as e:
         logger.error(f"Error in dry weight prediction: {str(e)}")
         return Response({
@@ -66,6 +153,7 @@ def predict_dry_weight(request):
 
 @extend_schema(
     request=URRPredictionSerializer,
+    parameters=[LATENCY_TIER_PARAMETER, EXPLAIN_PARAMETER],
     responses={
         200: URRPredictionResponseSerializer,
         400: ErrorResponseSerializer,
@@ -78,29 +166,39 @@ def predict_dry_weight(request):
 @api_view(['POST'])
 @require_auth
 @require_role(['DOCTOR', 'NURSE'])
+@track_requests('urr', 'predict')
 def predict_urr(request):
     """
     Predict if URR will go to risk region next month
     """
     try:
         # Validate input data
-        serializer = URRPredictionSerializer(data=request.data)
-        if not serializer.is_valid():
+        clock = StageClock('urr')
+        options, validation_errors = _prediction_options(request)
+        if validation_errors is None:
+            validated_data, validation_errors = input_validation.validate(URRPredictionSerializer, request.data)
+        else:
+            validated_data = None
+        if validated_data is not None:
+            # History inputs the request leaves out are taken from the patient's earlier records
+            validated_data, validation_errors = patient_history.complete('urr', validated_data)
+        clock.lap('validation')
+        if validated_data is None:
             return Response({
                 'error': 'Invalid input data',
                 'message': 'Please check the input parameters',
-                'details': serializer.errors
+                'details': validation_errors
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        validated_data = serializer.validated_data
-        
         # Make prediction
-        prediction_result = urr_predictor.predict(validated_data)
-        
-        # Return response
-        response_serializer = URRPredictionResponseSerializer(prediction_result)
-        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        prediction_result = urr_predictor.predict(validated_data, **options)
+        clock.skip()  # features, predict and recommendations are timed by the predictor
         
+        # Encode the result straight to the response body
+        response = _result_response(request, prediction_result)
+        clock.lap('serialization')
+        return response
+    
     except Exception as e:
         logger.error(f"Error in URR prediction: {str(e)}")
         return Response({
@@ -111,6 +209,7 @@ def predict_urr(request):
 
 @extend_schema(
     request=HbPredictionSerializer,
+    parameters=[LATENCY_TIER_PARAMETER, EXPLAIN_PARAMETER],
     responses={
         200: HbPredictionResponseSerializer,
         400: ErrorResponseSerializer,
@@ -123,30 +222,39 @@ def predict_urr(request):
 @api_view(['POST'])
 @require_auth
 @require_role(['DOCTOR', 'NURSE'])
+@track_requests('hb', 'predict')
 def predict_hb(request):
     """
     Predict if hemoglobin will go to risk region next month
     """
     try:
         # Validate input data
-        serializer = HbPredictionSerializer(data=request.data)
-        print(serializer.is_valid(), serializer.errors)
-        if not serializer.is_valid():
+        clock = StageClock('hb')
+        options, validation_errors = _prediction_options(request)
+        if validation_errors is None:
+            validated_data, validation_errors = input_validation.validate(HbPredictionSerializer, request.data)
+        else:
+            validated_data = None
+        if validated_data is not None:
+            # History inputs the request leaves out are taken from the patient's earlier records
+            validated_data, validation_errors = patient_history.complete('hb', validated_data)
+        clock.lap('validation')
+        if validated_data is None:
             return Response({
                 'error': 'Invalid input data',
                 'message': 'Please check the input parameters',
-                'details': serializer.errors
+                'details': validation_errors
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        validated_data = serializer.validated_data
-        
         # Make prediction
-        prediction_result = hb_predictor.predict(validated_data)
-        
-        # Return response
-        response_serializer = HbPredictionResponseSerializer(prediction_result)
-        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        prediction_result = hb_predictor.predict(validated_data, **options)
+        clock.skip()  # features, predict and recommendations are timed by the predictor
         
+        # Encode the result straight to the response body
+        response = _result_response(request, prediction_result)
+        clock.lap('serialization')
+        return response
+    
     except Exception as e:
         logger.error(f"Error in Hb prediction: {str(e)}")
         return Response({
@@ -155,6 +263,375 @@ def predict_hb(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _predict_batch(request, input_serializer_class, predictor, model_label):
+    """
+    Validate every record of a batch request, score the valid ones with a single
+    model call and report invalid records by index
+    """
+    try:
+        clock = StageClock(predictor.model_name)
+        options, option_errors = _prediction_options(request)
+        if option_errors is not None:
+            return Response({
+                'error': 'Invalid input data',
+                'message': 'Please check the input parameters',
+                'details': option_errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        # An Arrow table stays in columns; only its length goes through the batch serializer
+        arrow_batch = request.data.get('records') if isinstance(request.data, dict) else None
+        if not isinstance(arrow_batch, ArrowBatch):
+            arrow_batch = None
+        batch_data = {'records': [None] * len(arrow_batch)} if arrow_batch is not None else request.data
+        batch_serializer = BatchPredictionRequestSerializer(data=batch_data)
+        if not batch_serializer.is_valid():
+            return Response({
+                'error': 'Invalid input data',
+                'message': 'Please provide a non-empty list of records',
+                'details': batch_serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        records = batch_serializer.validated_data['records']
+        
+        # Validate all records, keeping track of their position in the request
+        valid_indices = []
+        valid_records = []
+        errors = []
+        numeric_columns = None
+        if arrow_batch is not None:
+            validated, record_errors, numeric_columns = input_validation.validate_columns(
+                input_serializer_class, arrow_batch.columns(), len(arrow_batch)
+            )
+        else:
+            validated, record_errors = input_validation.validate_many(input_serializer_class, records)
+        patient_history.complete_many(predictor.model_name, validated, record_errors)
+        for index, (validated_data, details) in enumerate(zip(validated, record_errors)):
+            if validated_data is not None:
+                valid_indices.append(index)
+                valid_records.append(validated_data)
+            else:
+                errors.append({'index': index, 'details': details})
+        if numeric_columns is not None:
+            valid_records = ColumnarRecords(valid_records, {name: column[valid_indices]
+                                                            for name, column in numeric_columns.items()})
+        clock.lap('validation')
+        
+        # Make predictions for all valid records at once
+        results = []
+        if valid_records:
+            results = predictor.predict_batch(valid_records, **options)
+            for index, prediction_result in zip(valid_indices, results):
+                prediction_result.index = index
+        clock.skip()  # features, predict and recommendations are timed by the predictor
+        
+        # Large responses are streamed a chunk of results at a time instead of being encoded in one piece
+        stream_threshold = getattr(settings, 'ML_STREAM_BATCH_RESULTS', 100)
+        encoding = response_format(request, BATCH_RESPONSE_FORMATS)
+        if encoding == MSGPACK_FORMAT:
+            check_results(results)
+            response = HttpResponse(encode_msgpack_batch(len(records), results, errors), content_type=MSGPACK_CONTENT_TYPE)
+        elif encoding == ARROW_FORMAT:
+            check_results(results)
+            response = HttpResponse(encode_arrow_batch(len(records), results, errors, predictor.result_class),
+                                    content_type=ARROW_CONTENT_TYPE)
+        elif stream_threshold and len(results) >= stream_threshold:
+            check_results(results)
+            response = StreamingHttpResponse(iter_batch_response(len(records), results, errors),
+                                             content_type='application/json')
+        else:
+            response = HttpResponse(encode_batch_response(len(records), results, errors),
+                                    content_type='application/json')
+        clock.lap('serialization')
+        return response
+    
+    except Exception as e:
+        logger.error(f"Error in {model_label} batch prediction: {str(e)}")
+        return Response({
+            'error': 'Prediction failed',
+            'message': 'An error occurred during batch prediction. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _predict_stream(request, input_serializer_class, predictor, model_label):
+    """
+    Score a newline-delimited JSON stream of records into a streamed NDJSON
+    response, a chunk of records at a time (see ml_models/streaming.py)
+    """
+    if request.content_type not in NDJSON_CONTENT_TYPES:
+        return JsonResponse({
+            'error': 'Unsupported media type',
+            'message': f"Send one JSON record per line with Content-Type {NDJSON_CONTENT_TYPES[0]}"
+        }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    
+    latency_tier, tier_errors = _latency_tier(request)
+    if tier_errors is not None:
+        return JsonResponse({
+            'error': 'Invalid input data',
+            'message': 'Please check the input parameters',
+            'details': tier_errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # One model snapshot for the whole stream, so that a reload cannot mix versions
+        loaded = model_manager.get_loaded(predictor.model_name)
+        if latency_tier is not None:
+            loaded = loaded.for_tier(latency_tier)
+    except Exception as e:
+        logger.error(f"Error loading model for {model_label} stream prediction: {str(e)}")
+        return JsonResponse({
+            'error': 'Prediction failed',
+            'message': 'An error occurred during stream prediction. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    max_line_bytes = getattr(settings, 'ML_STREAM_MAX_LINE_BYTES', 65536)
+    return StreamingHttpResponse(
+        iter_predictions(
+            iter_lines(request_stream(request), max_line_bytes), input_serializer_class, predictor, loaded,
+            chunk_size=getattr(settings, 'ML_STREAM_CHUNK_RECORDS', 500), max_line_bytes=max_line_bytes
+        ),
+        content_type='application/x-ndjson'
+    )
+
+
+# The streaming endpoints are plain Django views: DRF's request parsing would read the whole body
+
+@csrf_exempt
+@require_POST
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+@track_requests('dry_weight', 'stream')
+def predict_dry_weight_stream(request):
+    """
+    Predict dry weight change for an NDJSON stream of sessions
+    """
+    return _predict_stream(request, DryWeightPredictionSerializer, dry_weight_predictor, 'dry weight')
+
+
+@csrf_exempt
+@require_POST
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+@track_requests('urr', 'stream')
+def predict_urr_stream(request):
+    """
+    Predict URR risk for an NDJSON stream of investigations
+    """
+    return _predict_stream(request, URRPredictionSerializer, urr_predictor, 'URR')
+
+
+@csrf_exempt
+@require_POST
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+@track_requests('hb', 'stream')
+def predict_hb_stream(request):
+    """
+    Predict hemoglobin risk for an NDJSON stream of investigations
+    """
+    return _predict_stream(request, HbPredictionSerializer, hb_predictor, 'Hb')
+
+
+@extend_schema(
+    request=BatchPredictionRequestSerializer,
+    parameters=[LATENCY_TIER_PARAMETER, EXPLAIN_PARAMETER],
+    responses={
+        200: DryWeightBatchPredictionResponseSerializer,
+        400: ErrorResponseSerializer,
+        401: ErrorResponseSerializer,
+        500: ErrorResponseSerializer
+    },
+    summary="Batch Predict Dry Weight Change",
+    description="Predict dry weight change for a list of dialysis sessions in one call. Invalid records are reported by index."
+)
+@api_view(['POST'])
+@parser_classes(BATCH_PARSER_CLASSES)
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+@track_requests('dry_weight', 'batch')
+def predict_dry_weight_batch(request):
+    """
+    Predict dry weight change for several sessions
+    """
+    return _predict_batch(request, DryWeightPredictionSerializer, dry_weight_predictor, 'dry weight')
+
+
+@extend_schema(
+    request=BatchPredictionRequestSerializer,
+    parameters=[LATENCY_TIER_PARAMETER, EXPLAIN_PARAMETER],
+    responses={
+        200: URRBatchPredictionResponseSerializer,
+        400: ErrorResponseSerializer,
+        401: ErrorResponseSerializer,
+        500: ErrorResponseSerializer
+    },
+    summary="Batch Predict URR Risk",
+    description="Predict URR risk for a list of monthly investigations in one call. Invalid records are reported by index."
+)
+@api_view(['POST'])
+@parser_classes(BATCH_PARSER_CLASSES)
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+@track_requests('urr', 'batch')
+def predict_urr_batch(request):
+    """
+    Predict URR risk for several patients
+    """
+    return _predict_batch(request, URRPredictionSerializer, urr_predictor, 'URR')
+
+
+@extend_schema(
+    request=BatchPredictionRequestSerializer,
+    parameters=[LATENCY_TIER_PARAMETER, EXPLAIN_PARAMETER],
+    responses={
+        200: HbBatchPredictionResponseSerializer,
+        400: ErrorResponseSerializer,
+        401: ErrorResponseSerializer,
+        500: ErrorResponseSerializer
+    },
+    summary="Batch Predict Hemoglobin Risk",
+    description="Predict hemoglobin risk for a list of monthly investigations in one call. Invalid records are reported by index."
+)
+@api_view(['POST'])
+@parser_classes(BATCH_PARSER_CLASSES)
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+@track_requests('hb', 'batch')
+def predict_hb_batch(request):
+    """
+    Predict hemoglobin risk for several patients
+    """
+    return _predict_batch(request, HbPredictionSerializer, hb_predictor, 'Hb')
+
+
+def _push_history(request, request_serializer_class, stream):
+    """
+    Store a list of patient records in the history store
+    """
+    if not patient_history.enabled:
+        return Response({
+            'error': 'History store disabled',
+            'message': 'The patient history store is disabled on this server (ML_HISTORY_STORE)'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    serializer = request_serializer_class(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'error': 'Invalid input data',
+            'message': 'Please check the input parameters',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        stored = patient_history.push(stream, serializer.validated_data['records'])
+    except Exception as e:
+        logger.error(f"Error storing {stream.name} history records: {str(e)}")
+        return Response({
+            'error': 'History update failed',
+            'message': 'An error occurred while storing the records. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    return Response({'stream': stream.name, 'stored': stored}, status=status.HTTP_201_CREATED)
+
+
+@extend_schema(
+    request=SessionHistoryRequestSerializer,
+    responses={
+        201: HistoryPushResponseSerializer,
+        400: ErrorResponseSerializer,
+        401: ErrorResponseSerializer,
+        503: ErrorResponseSerializer
+    },
+    summary="Push Dialysis Session History",
+    description="Store dialysis session records (weight gain, SYS) so that dry weight predictions can use the patient's rolling averages"
+)
+@api_view(['POST'])
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+def push_session_history(request):
+    """
+    Store dialysis session records in the patient history
+    """
+    return _push_history(request, SessionHistoryRequestSerializer, SESSION_STREAM)
+
+
+@extend_schema(
+    request=MonthlyHistoryRequestSerializer,
+    responses={
+        201: HistoryPushResponseSerializer,
+        400: ErrorResponseSerializer,
+        401: ErrorResponseSerializer,
+        503: ErrorResponseSerializer
+    },
+    summary="Push Monthly Investigation History",
+    description="Store monthly investigation records (Hb, URR) so that URR and Hb predictions can take URR_diff and Hb_diff from the patient's history"
+)
+@api_view(['POST'])
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+def push_monthly_history(request):
+    """
+    Store monthly investigation records in the patient history
+    """
+    return _push_history(request, MonthlyHistoryRequestSerializer, MONTHLY_STREAM)
+
+
+@extend_schema(
+    summary="Get Patient History",
+    description="The records of a patient the history store keeps for the history-based prediction inputs"
+)
+@api_view(['GET'])
+@require_auth
+@require_role(['DOCTOR', 'NURSE'])
+def patient_history_view(request, patient_id):
+    """
+    Kept history records of a patient
+    """
+    if not patient_history.enabled:
+        return Response({
+            'error': 'History store disabled',
+            'message': 'The patient history store is disabled on this server (ML_HISTORY_STORE)'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response(patient_history.patient(patient_id), status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    request=ModelReloadSerializer,
+    summary="Reload ML Models",
+    description="Load model files again and swap changed models in without restarting the server. In-flight requests finish on the previous version."
+)
+@api_view(['POST'])
+@require_auth
+@require_role(['ADMIN'])
+def reload_models(request):
+    """
+    Hot-reload one or all ML models from disk
+    """
+    serializer = ModelReloadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({
+            'error': 'Invalid input data',
+            'message': 'Please check the input parameters',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    model_name = serializer.validated_data.get('model')
+    model_names = [model_name] if model_name else [name for name, model_status in model_manager.get_status().items() if model_status['loaded']]
+    
+    results = []
+    errors = []
+    for name in model_names:
+        try:
+            results.append(model_manager.reload_model(name, force=serializer.validated_data['force']))
+        except Exception as e:
+            logger.error(f"Error reloading model {name}: {str(e)}")
+            errors.append({'model': name, 'message': str(e)})
+    
+    return Response({
+        'results': results,
+        'errors': errors,
+        'models': model_manager.get_status()
+    }, status=status.HTTP_200_OK if not errors else status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 def health_check(request):
     """
@@ -164,10 +641,25 @@ def health_check(request):
         'status': 'healthy',
         'service': 'ML Models API',
         'available_models': ['dry_weight', 'urr', 'hb'],
+        'models': model_manager.get_status(),
+        'prediction_cache': prediction_cache.stats(),
+        'explanation_cache': explanation_cache.stats(),
+        'micro_batching': micro_batching_stats(),
+        'patient_history': patient_history.stats(),
+        'shadow_models': shadow_evaluator.stats(),
         'version': '1.0.0'
     }, status=status.HTTP_200_OK)
 
 
+@extend_schema(exclude=True)
+@api_view(['GET'])
+def metrics_view(request):
+    """
+    Prometheus metrics of all server processes (stage latencies, model loads, cache, errors)
+    """
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @api_view(['GET'])
 def models_info(request):
     """
@@ -180,85 +672,42 @@ def models_info(request):
             'model_type': 'LightGBM with 50 estimators',
             'test_performance': 'ROC-AUC: 0.637',
             'data_source': 'Dialysis session parameters',
-            'input_parameters': [
-                'patient_id', 'ap', 'auf', 'bfr', 'hd_duration', 'puf', 'tmp', 'vp',
-                'weight_gain', 'sys', 'dia', 'pre_hd_weight', 'post_hd_weight', 'dry_weight',
-                'weight_gain_avg_3 (optional)', 'sys_avg_3 (optional)'
-            ],
-            'feature_order': [
-                '1. SYS_avg_3', '2. VP (mmHg)', '3. AP (mmHg)', '4. Pre HD weight (kg)',
-                '5. Weight_gain_avg_3', '6. SYS (mmHg)', '7. Post HD weight (kg)', '8. Weight_gain_pct',
-                '9. UFR', '10. TMP (mmHg)', '11. DIA (mmHg)', '12. Dry weight (kg)',
-                '13. Weight gain (kg)', '14. AUF (ml)', '15. PUF (ml)', '16. BFR (ml/min)',
-                '17. High_SBP', '18. HD duration (h)', '19. UFR_below_15'
-            ],
-            'calculated_features': [
-                'High_SBP (1 if SYS > 140, else 0)',
-                'UFR (PUF / (HD duration × Pre HD weight))',
-                'UFR_below_15 (1 if UFR < 15, else 0)',
-                'Weight_gain_pct ((Weight gain / Dry weight) × 100)',
-                'SYS_avg_3 (3-session rolling average of SYS, uses current if not provided)',
-                'Weight_gain_avg_3 (3-session rolling average of Weight gain, uses current if not provided)'
-            ],
-            'total_features': 19,
-            'feature_engineering': 'Server automatically calculates 6 derived features from 13 original dialysis parameters',
+            **DRY_WEIGHT_SCHEMA.describe(),
             'output': 'Binary classification: will dry weight change (True/False) with probability and clinical recommendations'
         },
         'urr': {
             'name': 'URR Risk Prediction (LightGBM)',
             'description': 'Predicts if URR will go to risk region (inadequate) next month using LightGBM model',
             'model_type': 'LightGBM',
-            'input_parameters': [
-                'patient_id (optional)', 'albumin', 'hb', 's_ca', 'serum_na_pre_hd',
-                'urr', 'urr_diff', 'serum_k_pre_hd', 'serum_k_post_hd',
-                'bu_pre_hd', 'bu_post_hd', 'scr_pre_hd', 'scr_post_hd'
-            ],
-            'feature_order': [
-                '1. Albumin (g/L)', '2. Hb (g/dL)', '3. S Ca (mmol/L)',
-                '4. Serum Na Pre-HD (mmol/L)', '5. URR', '6. URR_diff',
-                '7. K_Diff', '8. BU_Diff', '9. SCR_Diff'
-            ],
-            'calculated_features': [
-                'K_Diff (serum_k_pre_hd - serum_k_post_hd)',
-                'BU_Diff (bu_pre_hd - bu_post_hd)',
-                'SCR_Diff (scr_pre_hd - scr_post_hd)'
-            ],
-            'total_features': 9,
-            'feature_engineering': 'Server automatically calculates URR and 3 difference features from laboratory parameters',
+            **URR_SCHEMA.describe(),
             'output': 'Binary classification: URR at risk (True/False) with probability, adequacy status and clinical recommendations'
         },
         'hb': {
             'name': 'Hemoglobin Risk Prediction (Ensemble)',
             'description': 'Predicts if hemoglobin will go to risk region next month using ensemble model',
             'model_type': 'Ensemble (XGBoost + LightGBM) with weighted averaging',
-            'input_parameters': [
-                'albumin', 'bu_post_hd', 'bu_pre_hd', 's_ca',
-                'scr_post_hd', 'scr_pre_hd', 'serum_k_post_hd', 'serum_k_pre_hd',
-                'serum_na_pre_hd', 'ua', 'hb_diff', 'hb'
-            ],
-            'feature_order': [
-                '1. Albumin (g/L)', '2. S Ca (mmol/L)', '3. Serum Na Pre-HD (mmol/L)',
-                '4. UA (mg/dL)', '5. Hb_diff', '6. Hb (g/dL)',
-                '7. Albumin_BU_Ratio', '8. K_Diff', '9. BU_Diff', '10. SCR_Diff'
-            ],
-            'calculated_features': [
-                'Albumin_BU_Ratio (albumin / (bu_pre_hd + 1))',
-                'K_Diff (serum_k_pre_hd - serum_k_post_hd)',
-                'BU_Diff (bu_pre_hd - bu_post_hd)',
-                'SCR_Diff (scr_pre_hd - scr_post_hd)'
-            ],
-            'total_features': 10,
-            'feature_engineering': 'Server automatically calculates 4 derived features from 12 laboratory parameters',
+            **HB_SCHEMA.describe(),
             'ensemble_details': 'XGBoost + LightGBM with optimized weights and threshold',
             'output': 'Binary classification: Hb at risk (True/False) with probability and clinical recommendations'
         }
     }
+    for model_name, model_info in models_info.items():
+        model_info['latency_tiers'] = latency_tiers.describe(model_name, model_manager.get_model_version(model_name))
     
     return Response({
         'available_models': models_info,
         'endpoints': {
             'dry_weight': '/api/ml/predict/dry-weight/',
             'urr': '/api/ml/predict/urr/',
-            'hb': '/api/ml/predict/hb/'
+            'hb': '/api/ml/predict/hb/',
+            'dry_weight_batch': '/api/ml/predict/dry-weight/batch/',
+            'urr_batch': '/api/ml/predict/urr/batch/',
+            'hb_batch': '/api/ml/predict/hb/batch/',
+            'dry_weight_stream': '/api/ml/predict/dry-weight/stream/',
+            'urr_stream': '/api/ml/predict/urr/stream/',
+            'hb_stream': '/api/ml/predict/hb/stream/',
+            'session_history': '/api/ml/history/sessions/',
+            'monthly_history': '/api/ml/history/monthly/',
+            'patient_history': '/api/ml/history/<patient_id>/'
         }
     }, status=status.HTTP_200_OK)
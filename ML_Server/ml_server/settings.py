@@ -35,26 +35,36 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0']
 
 # Application definition
 
+# The Django admin (with the sessions and messages it needs) and OpenAPI schema generation are
+# not used to serve predictions, so the workers only import them when they are enabled
+ML_ENABLE_ADMIN = os.getenv('ML_ENABLE_ADMIN', 'False').lower() == 'true'
+ML_OPENAPI_SCHEMA = os.getenv('ML_OPENAPI_SCHEMA', 'False').lower() == 'true'
+
 INSTALLED_APPS = [
-    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
-    'django.contrib.sessions',
-    'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
     'ml_models',
 ]
+if ML_ENABLE_ADMIN:
+    INSTALLED_APPS[:0] = ['django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages']
+if ML_OPENAPI_SCHEMA:
+    INSTALLED_APPS.append('drf_spectacular')
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'ml_models.middleware.request_logging.RequestLoggingMiddleware',  # Sampled structured request logs
+    'ml_models.middleware.compression.PredictionCompressionMiddleware',  # gzip of large prediction responses
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    *(['django.contrib.sessions.middleware.SessionMiddleware'] if ML_ENABLE_ADMIN else []),
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    *([
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ] if ML_ENABLE_ADMIN else []),
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'ml_models.middleware.auth.JWTAuthenticationMiddleware',  # Custom JWT middleware
 ]
@@ -71,8 +81,7 @@ TEMPLATES = [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-            ],
+            ] + (['django.contrib.messages.context_processors.messages'] if ML_ENABLE_ADMIN else []),
         },
     },
 ]
@@ -137,6 +146,15 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'ml_models.middleware.request_logging.BodyCapturingJSONParser',
+        'ml_models.formats.MessagePackParser',
+        'ml_models.formats.MessagePackAliasParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # The prediction views answer in MessagePack or Arrow themselves; other Accept headers get JSON, not 406
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'ml_models.formats.LenientContentNegotiation',
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
@@ -144,6 +162,13 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
+if ML_OPENAPI_SCHEMA:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
+    SPECTACULAR_SETTINGS = {
+        'TITLE': 'Renal Care ML Server API',
+        'DESCRIPTION': 'Dry weight, URR and Hb prediction endpoints',
+        'VERSION': '1.0.0',
+    }
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
@@ -158,14 +183,114 @@ CORS_ALLOW_CREDENTIALS = True
 # ML Models configuration
 ML_MODELS_DIR = BASE_DIR / 'models'
 
+# Load (and warm up) all models when Django starts instead of on the first request.
+# Off by default so that management commands, the shell and the runserver autoreloader
+# do not load every model; gunicorn.conf.py turns it on for the server
+ML_PRELOAD_MODELS = os.getenv('ML_PRELOAD_MODELS', 'False').lower() == 'true'
+ML_WARMUP_MODELS = os.getenv('ML_WARMUP_MODELS', 'True').lower() == 'true'
+
+# Poll the model files every N seconds and hot-swap changed models (0 disables the watcher)
+ML_MODEL_WATCH_INTERVAL = float(os.getenv('ML_MODEL_WATCH_INTERVAL', '0'))
+
+# Load models from their native artifacts (models/<name>/manifest.json, written by
+# `manage.py export_native_models`) when present, otherwise from the pickles
+ML_NATIVE_ARTIFACTS = os.getenv('ML_NATIVE_ARTIFACTS', 'True').lower() == 'true'
+
+# Inference backend per model: 'native' (LightGBM/XGBoost) or 'compiled' (flat NumPy trees,
+# cached next to the model file), e.g. ML_INFERENCE_BACKENDS=urr=compiled,hb=compiled.
+# Hb is compiled by default so that both ensemble members are scored in one fused pass
+ML_INFERENCE_BACKENDS = dict(
+    item.split('=', 1) for item in os.getenv('ML_INFERENCE_BACKENDS', 'hb=compiled').split(',') if '=' in item
+)
+
+# Latency tiers: name=fraction of the boosting rounds scored when a request passes
+# ?latency_tier=<name> ('full', the whole model, is always available), and the file where
+# `manage.py measure_latency_tiers` records each tier's deviation for /api/ml/models/
+ML_LATENCY_TIERS = {
+    name.strip(): float(fraction)
+    for name, fraction in (item.split('=', 1) for item in os.getenv('ML_LATENCY_TIERS', 'fast=0.5,fastest=0.2').split(',') if '=' in item)
+}
+ML_LATENCY_TIER_REPORT = os.getenv('ML_LATENCY_TIER_REPORT', '') or str(BASE_DIR / 'ml_models' / 'models' / 'latency_tiers.json')
+
+# Validate prediction inputs with the compiled (vectorized) validators built from the
+# serializers; False validates with the DRF serializers themselves
+ML_COMPILED_VALIDATION = os.getenv('ML_COMPILED_VALIDATION', 'True').lower() == 'true'
+
+# Maximum number of records accepted by the batch prediction endpoints
+ML_BATCH_MAX_RECORDS = int(os.getenv('ML_BATCH_MAX_RECORDS', '500'))
+
+# Batch responses with at least this many results are streamed in chunks (0 never streams)
+ML_STREAM_BATCH_RESULTS = int(os.getenv('ML_STREAM_BATCH_RESULTS', '100'))
+
+# gzip prediction responses of at least this many bytes for clients that accept it (0 disables it)
+ML_COMPRESS_MIN_BYTES = int(os.getenv('ML_COMPRESS_MIN_BYTES', '0'))
+
+# NDJSON stream endpoints: records read and scored per chunk, and the longest accepted line
+ML_STREAM_CHUNK_RECORDS = int(os.getenv('ML_STREAM_CHUNK_RECORDS', '500'))
+ML_STREAM_MAX_LINE_BYTES = int(os.getenv('ML_STREAM_MAX_LINE_BYTES', '65536'))
+
+# In-process prediction cache: maximum number of cached results (0 disables it) and TTL in seconds
+ML_PREDICTION_CACHE_SIZE = int(os.getenv('ML_PREDICTION_CACHE_SIZE', '1024'))
+ML_PREDICTION_CACHE_TTL = float(os.getenv('ML_PREDICTION_CACHE_TTL', '300'))
+
+# Explanations (?explain=true) cached per model version and feature row (0 disables the cache)
+ML_EXPLANATION_CACHE_SIZE = int(os.getenv('ML_EXPLANATION_CACHE_SIZE', '4096'))
+
+# Opt-in micro-batching of concurrent requests per model (e.g. ML_MICRO_BATCH_MODELS=urr,hb);
+# only useful when a worker serves several requests at once (GUNICORN_THREADS > 1)
+ML_MICRO_BATCH_MODELS = [name.strip() for name in os.getenv('ML_MICRO_BATCH_MODELS', '').split(',') if name.strip()]
+ML_MICRO_BATCH_WINDOW_MS = float(os.getenv('ML_MICRO_BATCH_WINDOW_MS', '2'))
+ML_MICRO_BATCH_MAX_ROWS = int(os.getenv('ML_MICRO_BATCH_MAX_ROWS', '64'))
+
+# Shadow models scored on copies of the live traffic, off the request path, to compare a
+# candidate with the served model (e.g. ML_SHADOW_MODELS=hb=models/hb_model_v2.pkl; paths
+# relative to ml_models/). Rows beyond ML_SHADOW_QUEUE_ROWS waiting to be scored are dropped
+ML_SHADOW_MODELS = dict(
+    item.split('=', 1) for item in os.getenv('ML_SHADOW_MODELS', '').split(',') if '=' in item
+)
+ML_SHADOW_QUEUE_ROWS = int(os.getenv('ML_SHADOW_QUEUE_ROWS', '4096'))
+ML_SHADOW_BATCH_ROWS = int(os.getenv('ML_SHADOW_BATCH_ROWS', '512'))
+
+# Metrics: directory where each server process writes its metrics snapshot for
+# /api/ml/metrics/ to merge (required with several gunicorn workers, see gunicorn.conf.py)
+ML_METRICS_DIR = os.getenv('ML_METRICS_DIR', '')
+ML_METRICS_FLUSH_INTERVAL = float(os.getenv('ML_METRICS_FLUSH_INTERVAL', '5'))
+
+# Patient history store: session and monthly records pushed by clients, used to fill in
+# the history-based inputs (Hb_diff, URR_diff, rolling averages) of predictions.
+# Kept in its own SQLite file, apart from Django's database (ML_HISTORY_DB names another one)
+ML_HISTORY_STORE = os.getenv('ML_HISTORY_STORE', 'True').lower() == 'true'
+ML_HISTORY_DB = os.getenv('ML_HISTORY_DB', '') or str(BASE_DIR / 'ml_history.sqlite3')
+
+# Maximum number of verified JWTs cached by JWTAuthenticationMiddleware (entries expire with the token)
+JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', '1024'))
+
+# Structured request logging (one JSON line per request on the 'ml_models.requests' logger).
+# Errors are always logged, successful requests with probability ML_REQUEST_LOG_SAMPLE_RATE;
+# request bodies are only logged, capped to ML_REQUEST_LOG_BODY_LIMIT bytes, when JSON parsing fails
+# (paths and parse errors are capped to the same limit)
+ML_REQUEST_LOGGING = os.getenv('ML_REQUEST_LOGGING', 'True').lower() == 'true'
+ML_REQUEST_LOG_SAMPLE_RATE = float(os.getenv('ML_REQUEST_LOG_SAMPLE_RATE', '1.0' if DEBUG else '0.05'))
+ML_REQUEST_LOG_BODY_LIMIT = int(os.getenv('ML_REQUEST_LOG_BODY_LIMIT', '2048'))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'ml_models.structured_logging.JSONFormatter',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'request_log': {
+            # Written by a background thread so request threads never block on the stream
+            'class': 'ml_models.structured_logging.QueueingStreamHandler',
+            'formatter': 'json',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -177,5 +302,10 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        'ml_models.requests': {
+            'handlers': ['request_log'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
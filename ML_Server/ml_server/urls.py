@@ -14,7 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 from django.http import JsonResponse
 
@@ -27,7 +27,15 @@ def health_check(request):
     })
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('health/', health_check, name='health_check'),
     path('api/ml/', include('ml_models.urls')),
 ]
+
+# Imported only when enabled (see ML_ENABLE_ADMIN and ML_OPENAPI_SCHEMA in settings.py)
+if settings.ML_ENABLE_ADMIN:
+    from django.contrib import admin
+    urlpatterns.append(path('admin/', admin.site.urls))
+
+if settings.ML_OPENAPI_SCHEMA:
+    from drf_spectacular.views import SpectacularAPIView
+    urlpatterns.append(path('api/schema/', SpectacularAPIView.as_view(), name='schema'))
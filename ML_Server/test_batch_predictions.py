@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script for the batch prediction endpoints
+Checks that every record of a batch gets the same prediction as the
+single-record endpoint, that the models are called once per batch, and that
+invalid records (including items that are not objects) are reported by index
+without failing the rest of the batch
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+import jwt
+from django.conf import settings
+from django.test import Client
+from rest_framework import serializers
+
+from ml_models.serializers import DryWeightPredictionSerializer, HbPredictionSerializer, URRPredictionSerializer
+from ml_models import services
+from ml_models.services import model_manager
+
+ENDPOINTS = [
+    ('dry-weight', DryWeightPredictionSerializer, 'dry_weight'),
+    ('urr', URRPredictionSerializer, 'urr'),
+    ('hb', HbPredictionSerializer, 'hb'),
+]
+
+
+def client():
+    token = jwt.encode({'id': 'batch-test', 'role': 'doctor', 'exp': int(time.time()) + 3600},
+                       os.environ['JWT_SECRET'], algorithm='HS256')
+    return Client(HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_HOST='localhost')
+
+
+def random_records(serializer_class, count, seed):
+    """Valid records with every numeric field drawn from its serializer range (dates left out)"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        record = {}
+        for name, field in serializer_class().fields.items():
+            if isinstance(field, serializers.FloatField):
+                record[name] = round(rng.uniform(field.min_value, field.max_value), 2)
+            elif isinstance(field, serializers.CharField):
+                record[name] = f'BATCH_{index:03d}'
+        records.append(record)
+    return records
+
+
+def response_json(response):
+    """JSON body of a plain or streamed response (large batches are streamed)"""
+    return json.loads(b''.join(response.streaming_content) if response.streaming else response.content)
+
+
+def without_date(result):
+    return {key: value for key, value in result.items() if key != 'prediction_date'}
+
+
+def test_batch_matches_single():
+    """Every batch result equals the single-record prediction of the same record"""
+    print("🧪 Testing Batch Prediction Endpoints")
+    print("=" * 50)
+    
+    for endpoint, serializer_class, _ in ENDPOINTS:
+        records = random_records(serializer_class, 25, seed=len(endpoint))
+        response = client().post(f'/api/ml/predict/{endpoint}/batch/', json.dumps({'records': records}),
+                                 content_type='application/json')
+        assert response.status_code == 200, response.content
+        body = response.json()
+        assert (body['total'], body['succeeded'], body['failed'], body['errors']) == (25, 25, 0, [])
+        assert [result['index'] for result in body['results']] == list(range(25))
+        
+        for record, result in zip(records, body['results']):
+            single = client().post(f'/api/ml/predict/{endpoint}/', json.dumps(record), content_type='application/json')
+            assert single.status_code == 200, single.content
+            batch_result = without_date(result)
+            assert batch_result.pop('index') == records.index(record)
+            assert batch_result == without_date(single.json()), (batch_result, single.json())
+        print(f"✅ {endpoint}: 25 batch results equal the single-record predictions")
+
+
+def test_one_model_call():
+    """A batch scores each model once, whatever its size"""
+    for endpoint, serializer_class, model_name in ENDPOINTS:
+        model = model_manager.load_model(model_name)
+        # The Hb bundle is scored by both ensemble members
+        models = [model['xgb'], model['lgbm']] if isinstance(model, dict) else [model]
+        with mock.patch.object(services, '_predict_proba', wraps=services._predict_proba) as predict_proba:
+            records = random_records(serializer_class, 60, seed=7)
+            response = client().post(f'/api/ml/predict/{endpoint}/batch/', json.dumps({'records': records}),
+                                     content_type='application/json')
+            assert response.status_code == 200 and response.json()['succeeded'] == 60
+        assert [call.args[0] for call in predict_proba.call_args_list] == models, predict_proba.call_args_list
+        assert all(call.args[1].shape[0] == 60 for call in predict_proba.call_args_list)
+    print("✅ 60-record batches are scored with one call per model")
+
+
+def test_invalid_records():
+    """Invalid and non-object records are reported by index; the others are scored"""
+    records = random_records(URRPredictionSerializer, 6, seed=3)
+    records[1]['urr'] = 500
+    del records[4]['albumin']
+    items = records[:3] + ['oops'] + records[3:] + [5, None, [1, 2]]
+    response = client().post('/api/ml/predict/urr/batch/', json.dumps({'records': items}),
+                             content_type='application/json')
+    assert response.status_code == 200, response.content
+    body = response.json()
+    assert (body['total'], body['succeeded'], body['failed']) == (10, 4, 6), body
+    assert [error['index'] for error in body['errors']] == [1, 3, 5, 7, 8, 9]
+    assert [result['index'] for result in body['results']] == [0, 2, 4, 6]
+    errors = {error['index']: error['details'] for error in body['errors']}
+    assert 'urr' in errors[1] and 'albumin' in errors[5]
+    for index in (3, 7, 9):
+        assert 'Expected a dictionary' in errors[index]['non_field_errors'][0], errors[index]
+    print("✅ Invalid and non-object records reported by index, the rest scored")
+    
+    too_many = random_records(URRPredictionSerializer, 1, seed=4) * (settings.ML_BATCH_MAX_RECORDS + 1)
+    for body in ({'records': []}, {'records': {'urr': 60}}, {'rows': records}, {'records': too_many}):
+        response = client().post('/api/ml/predict/urr/batch/', json.dumps(body), content_type='application/json')
+        assert response.status_code == 400 and response.json()['error'] == 'Invalid input data', response.content
+    response = client().post('/api/ml/predict/urr/batch/', json.dumps({'records': too_many[:settings.ML_BATCH_MAX_RECORDS]}),
+                             content_type='application/json')
+    assert response.status_code == 200 and response_json(response)['succeeded'] == settings.ML_BATCH_MAX_RECORDS
+    print(f"✅ Empty, non-list, missing and over-long (> {settings.ML_BATCH_MAX_RECORDS}) batches rejected with 400")
+    
+    response = Client(HTTP_HOST='localhost').post('/api/ml/predict/urr/batch/', json.dumps({'records': records}),
+                                                  content_type='application/json')
+    assert response.status_code == 401
+    print("✅ Batch endpoints require authentication")
+
+
+if __name__ == "__main__":
+    test_batch_matches_single()
+    test_one_model_call()
+    test_invalid_records()
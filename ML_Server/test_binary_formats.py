@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Test script for the binary request and response formats
+Checks that MessagePack and Arrow IPC requests and responses carry the same
+predictions as JSON, that Accept negotiation falls back to JSON, that large
+prediction responses are gzipped when enabled, that Arrow batches are
+validated and turned into features column by column, and that the benchmark
+records request and response sizes per encoding. The parts of a format whose
+package (requirements-optional.txt) is not installed are skipped
+"""
+
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+import numpy as np
+from django.test import Client, override_settings
+
+from ml_models.benchmark import InProcessTransport, compare_results, mint_token, request_bodies, run_level, synthetic_payloads
+from ml_models.features import ColumnarRecords
+from ml_models.formats import (
+    ARROW_CONTENT_TYPE, ARROW_FORMAT, MSGPACK_CONTENT_TYPE, MSGPACK_FORMAT, ArrowBatch, arrow_records,
+    encode_arrow_records, format_available,
+)
+from ml_models.serializers import HbPredictionSerializer, URRPredictionSerializer
+from ml_models.services import urr_predictor
+from ml_models.validation import input_validation
+
+HAS_MSGPACK = format_available(MSGPACK_FORMAT)
+HAS_ARROW = format_available(ARROW_FORMAT)
+if HAS_MSGPACK:
+    import msgpack
+if HAS_ARROW:
+    import pyarrow
+    import pyarrow.ipc
+
+TOKEN = mint_token(os.environ['JWT_SECRET'])
+
+
+def client():
+    return Client(HTTP_AUTHORIZATION=f'Bearer {TOKEN}', HTTP_HOST='localhost')
+
+
+def without_dates(results):
+    return [{key: value for key, value in result.items() if key != 'prediction_date'} for result in results]
+
+
+def skipped(package, part):
+    print(f"⚠️ {package} not installed (see requirements-optional.txt), {part} skipped")
+
+
+def test_batch_formats():
+    """The same batch as JSON, MessagePack and Arrow gives the same results and errors"""
+    print("🧪 Testing Binary Request and Response Formats")
+    print("=" * 50)
+    
+    records = synthetic_payloads(URRPredictionSerializer, 40, seed=11)
+    records[7]['urr'] = 500
+    del records[15]['albumin']
+    
+    expected = client().post('/api/ml/predict/urr/batch/', json.dumps({'records': records}),
+                             content_type='application/json').json()
+    assert expected['failed'] == 2 and [error['index'] for error in expected['errors']] == [7, 15], expected['errors']
+    
+    if HAS_MSGPACK:
+        response = client().post('/api/ml/predict/urr/batch/', msgpack.packb({'records': records}),
+                                 content_type=MSGPACK_CONTENT_TYPE, HTTP_ACCEPT=MSGPACK_CONTENT_TYPE)
+        assert response.status_code == 200 and response['Content-Type'] == MSGPACK_CONTENT_TYPE
+        body = msgpack.unpackb(response.content)
+        assert {key: body[key] for key in ('total', 'succeeded', 'failed', 'errors')} == \
+            {key: expected[key] for key in ('total', 'succeeded', 'failed', 'errors')}
+        assert without_dates(body['results']) == without_dates(expected['results'])
+        print(f"✅ MessagePack batch: {body['succeeded']} results and {body['failed']} errors match JSON")
+        
+        response = client().post('/api/ml/predict/urr/batch/', json.dumps({'records': records[:3]}),
+                                 content_type='application/json', HTTP_ACCEPT=f'application/json;q=0.5, {MSGPACK_CONTENT_TYPE}')
+        assert response['Content-Type'] == MSGPACK_CONTENT_TYPE
+    else:
+        skipped('msgpack', 'MessagePack batches')
+    
+    if HAS_ARROW:
+        response = client().post('/api/ml/predict/urr/batch/', encode_arrow_records(records),
+                                 content_type=ARROW_CONTENT_TYPE, HTTP_ACCEPT=ARROW_CONTENT_TYPE)
+        assert response.status_code == 200 and response['Content-Type'] == ARROW_CONTENT_TYPE
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        metadata = {key.decode(): value.decode() for key, value in table.schema.metadata.items()}
+        assert (int(metadata['total']), int(metadata['succeeded']), int(metadata['failed'])) == (40, 38, 2)
+        assert json.loads(metadata['errors']) == expected['errors']
+        assert table.column_names[-1] == 'index' and table.column('index').to_pylist() == \
+            [result['index'] for result in expected['results']]
+        rows = arrow_records(table.drop_columns(['prediction_date']))
+        for row, result in zip(rows, without_dates(expected['results'])):
+            assert row == {key: value for key, value in result.items() if value is not None}, (row, result)
+        print(f"✅ Arrow batch: {table.num_rows} rows, totals and errors in the schema metadata")
+        
+        response = client().post('/api/ml/predict/urr/batch/', encode_arrow_records(records[:3]),
+                                 content_type=ARROW_CONTENT_TYPE)
+        assert response['Content-Type'] == 'application/json' and response.json()['succeeded'] == 3
+    else:
+        skipped('pyarrow', 'Arrow batches')
+    print("✅ Request and response formats are negotiated independently")
+
+
+def test_arrow_columns():
+    """An Arrow batch is validated column by column and gives the features and errors of the same JSON batch"""
+    if not HAS_ARROW:
+        skipped('pyarrow', 'columnar Arrow validation')
+        return
+    records = synthetic_payloads(URRPredictionSerializer, 60, seed=15)
+    records[3]['urr'] = 500
+    records[9]['albumin'] = None
+    del records[21]['s_ca']
+    records[30]['scr_pre_hd'] = -1e9
+    records[44]['hb'] = float('nan')
+    history = {index: records[index].pop('urr_diff') for index in range(0, 60, 4)}
+    payload = encode_arrow_records(records)
+    
+    table = pyarrow.ipc.open_stream(payload).read_all()
+    columns = ArrowBatch(table).columns()
+    validated, errors, numeric = input_validation.validate_columns(URRPredictionSerializer, columns, len(records))
+    json_records = [{key: value for key, value in record.items() if value is not None} for record in records]
+    expected_validated, expected_errors = input_validation.validate_many(URRPredictionSerializer, json_records)
+    # Compared as JSON text: the NaN read from the table is not the NaN object of the record
+    assert errors == expected_errors and json.dumps(validated) == json.dumps(expected_validated)
+    
+    # The null urr_diff cells are completed in the records afterwards, as patient history does
+    assert all('urr_diff' not in validated[index] for index in history if validated[index] is not None)
+    for data in (validated, expected_validated):
+        for index, value in history.items():
+            if data[index] is not None:
+                data[index]['urr_diff'] = value
+    
+    indexes = [index for index, data in enumerate(validated) if data is not None]
+    valid = [validated[index] for index in indexes]
+    columnar = ColumnarRecords(valid, {name: column[indexes] for name, column in numeric.items()})
+    X_columns = urr_predictor.feature_builder.build(columnar)
+    X_records = urr_predictor.feature_builder.build(valid)
+    assert np.array_equal(X_columns, X_records, equal_nan=True)
+    assert np.array_equal(urr_predictor.feature_builder.build(columnar.take([4, 0, 2])), X_records[[4, 0, 2]])
+    print(f"✅ {len(records)} Arrow rows validated in columns: same errors as JSON for "
+          f"{sum(error is not None for error in errors)} rows, identical {X_columns.shape} feature matrix")
+    
+    # Strings in a numeric column go through the DRF field like JSON strings
+    text_records = [dict(record, urr=value) for record, value in zip(records[1:4], ('65.5', 'abc', None))]
+    text_table = pyarrow.table({name: pyarrow.array([record.get(name) for record in text_records],
+                                                    type=pyarrow.string() if name == 'urr' else None)
+                                for name in text_records[0]})
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, text_table.schema) as writer:
+        writer.write_table(text_table)
+    arrow_body = client().post('/api/ml/predict/urr/batch/', sink.getvalue().to_pybytes(),
+                               content_type=ARROW_CONTENT_TYPE).json()
+    json_body = client().post('/api/ml/predict/urr/batch/',
+                              json.dumps({'records': [{key: value for key, value in record.items() if value is not None}
+                                                      for record in text_records]}),
+                              content_type='application/json').json()
+    assert arrow_body['errors'] == json_body['errors'] and arrow_body['failed'] == 2, arrow_body['errors']
+    assert without_dates(arrow_body['results']) == without_dates(json_body['results'])
+    
+    # Without the compiled validator the serializers check the rows built from the columns
+    input_validation.configure(compiled=False)
+    try:
+        fallback = input_validation.validate_columns(URRPredictionSerializer, columns, len(records))
+    finally:
+        input_validation.configure(compiled=True)
+    assert fallback[2] is None and fallback[1] == expected_errors
+    print("✅ String cells and the serializer fallback give the JSON answers")
+
+
+def test_single_formats():
+    """Single predictions answer MessagePack; Arrow and unknown types fall back to JSON"""
+    record = synthetic_payloads(HbPredictionSerializer, 1, seed=12)[0]
+    expected = client().post('/api/ml/predict/hb/', json.dumps(record), content_type='application/json').json()
+    
+    if HAS_MSGPACK:
+        response = client().post('/api/ml/predict/hb/', msgpack.packb(record), content_type='application/x-msgpack',
+                                 HTTP_ACCEPT='application/x-msgpack')
+        assert response.status_code == 200 and response['Content-Type'] == MSGPACK_CONTENT_TYPE
+        assert without_dates([msgpack.unpackb(response.content)]) == without_dates([expected])
+        response = client().post('/api/ml/predict/hb/', msgpack.packb({'hb': 'x'}), content_type=MSGPACK_CONTENT_TYPE,
+                                 HTTP_ACCEPT=MSGPACK_CONTENT_TYPE)
+        assert response.status_code == 400 and response['Content-Type'] == 'application/json'
+    else:
+        skipped('msgpack', 'MessagePack single predictions')
+    
+    for accept in (ARROW_CONTENT_TYPE, 'text/html', f'{MSGPACK_CONTENT_TYPE};q=0, application/json', '*/*'):
+        response = client().post('/api/ml/predict/hb/', json.dumps(record), content_type='application/json',
+                                 HTTP_ACCEPT=accept)
+        assert response.status_code == 200 and response['Content-Type'] == 'application/json', accept
+    
+    if HAS_ARROW:
+        response = client().post('/api/ml/predict/hb/', encode_arrow_records([record]), content_type=ARROW_CONTENT_TYPE)
+        assert response.status_code != 200 and response['Content-Type'] == 'application/json', response.status_code
+    print("✅ Single predictions: MessagePack both ways, JSON otherwise, Arrow rejected, errors in JSON")
+
+
+def test_compression():
+    """Prediction responses above ML_COMPRESS_MIN_BYTES are gzipped, smaller ones and other paths are not"""
+    records = synthetic_payloads(URRPredictionSerializer, 30, seed=13)
+    body = json.dumps({'records': records})
+    plain = client().post('/api/ml/predict/urr/batch/', body, content_type='application/json',
+                          HTTP_ACCEPT_ENCODING='gzip')
+    assert not plain.has_header('Content-Encoding')
+    
+    with override_settings(ML_COMPRESS_MIN_BYTES=1024):
+        compressed = client().post('/api/ml/predict/urr/batch/', body, content_type='application/json',
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        assert compressed['Content-Encoding'] == 'gzip' and len(compressed.content) < len(plain.content) / 2
+        assert without_dates(json.loads(gzip.decompress(compressed.content))['results']) == \
+            without_dates(plain.json()['results'])
+        small = client().post('/api/ml/predict/urr/', json.dumps(records[0]), content_type='application/json',
+                              HTTP_ACCEPT_ENCODING='gzip')
+        assert not small.has_header('Content-Encoding')
+        health = client().get('/api/ml/health/', HTTP_ACCEPT_ENCODING='gzip')
+        assert not health.has_header('Content-Encoding')
+    print(f"✅ gzip: {len(plain.content)} -> {len(compressed.content)} bytes, small and non-prediction responses untouched")
+
+
+def test_benchmark_encodings():
+    """The benchmark encodes batches per encoding and records request and response sizes"""
+    payloads = synthetic_payloads(HbPredictionSerializer, 25, seed=14)
+    encodings = [encoding for encoding in ('json', 'msgpack', 'arrow') if format_available(encoding)]
+    for encoding in encodings:
+        bodies = request_bodies('hb-batch', payloads, encoding, batch_size=10)
+        assert len(bodies) == 3
+    assert json.loads(request_bodies('hb-batch', payloads, 'json', batch_size=10)[2]) == {'records': payloads[20:]}
+    if HAS_MSGPACK:
+        assert len(request_bodies('hb', payloads, 'msgpack')) == 25
+    if HAS_ARROW:
+        assert arrow_records(pyarrow.ipc.open_stream(request_bodies('hb-batch', payloads, 'arrow', 10)[0]).read_all()) == \
+            [{key: value for key, value in payload.items() if value is not None} for payload in payloads[:10]]
+    
+    transport = InProcessTransport(TOKEN)
+    runs = [run_level(transport, 'hb-batch', payloads, 1, 4, encoding=encoding, batch_size=10)
+            for encoding in encodings]
+    for run in runs:
+        assert run['errors'] == 0 and run['request_bytes'] > 0 and run['response_bytes'] > 0, run
+    sizes = {run['encoding']: (run['request_bytes'], run['response_bytes']) for run in runs}
+    if HAS_MSGPACK:
+        assert sizes['msgpack'][0] < sizes['json'][0] and sizes['msgpack'][1] < sizes['json'][1], sizes
+    
+    rows = compare_results({'runs': runs}, {'runs': runs})
+    assert [row['encoding'] for row in rows] == encodings
+    assert rows[0]['response_bytes'][2] == 0.0
+    print("✅ Benchmark sizes (request, response bytes): " +
+          ', '.join(f"{encoding} {request:.0f}/{response:.0f}" for encoding, (request, response) in sizes.items()))
+
+
+if __name__ == "__main__":
+    test_batch_formats()
+    test_arrow_columns()
+    test_single_formats()
+    test_compression()
+    test_benchmark_encodings()
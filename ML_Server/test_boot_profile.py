@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for the worker boot profile
+Boots the WSGI application in fresh interpreters: checks that serving a
+prediction does not import the admin app, the sessions or drf-spectacular
+unless they are enabled, that the profile_boot command reports the cold start,
+memory and import time, and that it fails on a regression against a baseline
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ml_models.benchmark import mint_token, synthetic_payloads
+from ml_models.boot import AVOIDED_MODULES, boot_once, check_regressions, summarize_importtime
+from ml_models.serializers import URRPredictionSerializer
+
+REQUEST = {
+    'path': '/api/ml/predict/urr/',
+    'body': synthetic_payloads(URRPredictionSerializer, 1, seed=4)[0],
+    'token': mint_token(os.environ['JWT_SECRET']),
+}
+
+
+def test_serving_imports():
+    """A worker serves predictions without the admin app, sessions or schema generation unless enabled"""
+    print("🧪 Testing Worker Boot Profile")
+    print("=" * 50)
+    
+    env = {**os.environ, 'ML_ENABLE_ADMIN': 'False', 'ML_OPENAPI_SCHEMA': 'False'}
+    measurement, lines = boot_once(REQUEST, str(settings.BASE_DIR), env, importtime=True)
+    assert measurement['status'] == '200 OK', measurement
+    loaded = [name for name in AVOIDED_MODULES if measurement['modules'][name]]
+    assert not loaded, loaded
+    assert measurement['cold_start_s'] >= measurement['django_ready_s'] + measurement['first_response_s']
+    imports = summarize_importtime(lines)
+    assert imports['modules'] > 100 and 'django' in imports['packages_ms'] and 'drf_spectacular' not in imports['packages_ms']
+    print(f"✅ Cold start {measurement['cold_start_s']:.2f} s, rss {measurement['rss_served_mb']} MiB, "
+          f"{imports['modules']} modules imported, none of {', '.join(AVOIDED_MODULES)}")
+    
+    env = {**os.environ, 'ML_ENABLE_ADMIN': 'True', 'ML_OPENAPI_SCHEMA': 'True'}
+    measurement, _ = boot_once(REQUEST, str(settings.BASE_DIR), env)
+    assert measurement['status'] == '200 OK' and all(measurement['modules'][name] for name in AVOIDED_MODULES), measurement
+    print("✅ ML_ENABLE_ADMIN and ML_OPENAPI_SCHEMA bring them back")
+
+
+def test_regression_check():
+    """Metrics above the threshold and newly imported avoided modules are regressions"""
+    lines = [
+        'import time: self [us] | cumulative | imported package',
+        'import time:       500 |        500 |   numpy.core',
+        'import time:      1500 |       2000 | numpy',
+        'import time:       300 |        300 | ml_models.boot',
+    ]
+    assert summarize_importtime(lines) == {'modules': 3, 'total_ms': 2.3, 'packages_ms': {'numpy': 2.0, 'ml_models': 0.3}}
+    
+    baseline = {'summary': {'cold_start_s': 2.0, 'rss_served_mb': 200.0}, 'modules': {'drf_spectacular': False}}
+    profile = {'summary': {'cold_start_s': 2.3, 'rss_served_mb': 260.0}, 'modules': {'drf_spectacular': True}}
+    regressions = check_regressions(baseline, profile, 20.0)
+    assert len(regressions) == 2 and regressions[0].startswith('rss_served_mb') and 'drf_spectacular' in regressions[1]
+    assert check_regressions(baseline, {'summary': baseline['summary'], 'modules': {}}, 0.0) == []
+    print("✅ Regression check: +15% cold start passes a 20% threshold, +30% memory and drf_spectacular fail it")
+
+
+def test_profile_command():
+    """profile_boot saves the profile and fails against a faster baseline"""
+    directory = tempfile.mkdtemp(prefix='ml_boot_test_')
+    baseline_path, output_path = os.path.join(directory, 'baseline.json'), os.path.join(directory, 'profile.json')
+    with open(baseline_path, 'w') as f:
+        json.dump({'summary': {'cold_start_s': 0.01, 'rss_served_mb': 1000.0}, 'modules': {}}, f)
+    
+    stdout = io.StringIO()
+    try:
+        call_command('profile_boot', endpoint='urr', runs=1, output=output_path, baseline=baseline_path, stdout=stdout)
+        raise AssertionError('profile_boot did not fail on a regression')
+    except CommandError as e:
+        assert 'cold_start_s' in str(e) and 'rss_served_mb' not in str(e), str(e)
+    with open(output_path) as f:
+        profile = json.load(f)
+    assert profile['request_path'] == '/api/ml/predict/urr/' and len(profile['runs']) == 1
+    assert profile['summary']['cold_start_s'] > 0 and profile['imports']['total_ms'] > 0
+    assert 'median cold start' in stdout.getvalue()
+    top = ', '.join(f"{package} {elapsed:.0f} ms" for package, elapsed in list(profile['imports']['packages_ms'].items())[:3])
+    print(f"✅ profile_boot: cold start {profile['summary']['cold_start_s']:.2f} s, top imports {top}")
+
+
+if __name__ == "__main__":
+    test_serving_imports()
+    test_regression_check()
+    test_profile_command()
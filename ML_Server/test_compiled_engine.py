@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Test script for the compiled tree engine
+Checks that compiled forests reproduce the native predict_proba of every model
+on fuzzed inputs (missing values, values on and next to split thresholds,
+LightGBM's near-zero values), that unsupported boosters are rejected, that
+the compiled copy cached next to a model file round-trips, and that the fused
+Hb ensemble (served by default) matches the weighted native members and their
+risk decision at about the cost of one member evaluation
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+import lightgbm
+import xgboost
+
+from rest_framework import serializers
+
+from ml_models.serializers import DryWeightPredictionSerializer, HbPredictionSerializer, URRPredictionSerializer
+from ml_models import services
+from ml_models.services import (MLModelManager, WeightedEnsemble, dry_weight_predictor, hb_predictor, model_manager,
+                                urr_predictor)
+from ml_models.tree_engine import COMPILED_TOLERANCE, CompiledForest, FusedEnsemble, compile_model
+
+PREDICTORS = [
+    (dry_weight_predictor, DryWeightPredictionSerializer),
+    (urr_predictor, URRPredictionSerializer),
+    (hb_predictor, HbPredictionSerializer),
+]
+ROWS = 2000
+SEED = 2024
+
+
+def random_records(serializer_class, count, seed):
+    """Valid records with every numeric field drawn from its serializer range (dates left out)"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        record = {}
+        for name, field in serializer_class().fields.items():
+            if isinstance(field, serializers.FloatField):
+                record[name] = rng.uniform(field.min_value, field.max_value)
+            elif isinstance(field, serializers.CharField):
+                record[name] = f'COMPILED_{index:04d}'
+        records.append(record)
+    return records
+
+
+def native_proba(estimator, X):
+    """predict_proba of the sklearn wrapper (without its feature name warnings)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return estimator.predict_proba(X)[:, 1]
+
+
+def fuzz_matrix(forest, X, rng):
+    """
+    Realistic feature rows, the forest's threshold probe and copies of both with
+    missing values, values one float step either side of a threshold, zeros
+    and values LightGBM reads as zero
+    """
+    X = np.vstack([X, forest.probe_matrix(len(X), seed=int(rng.integers(1 << 30)))])
+    fuzzed = X.copy()
+    internal = forest.children[:, 0] != np.arange(len(forest.children))
+    dtype = forest.threshold.dtype
+    for feature_index in range(forest.n_features):
+        thresholds = forest.threshold[internal & (forest.feature == feature_index)]
+        if len(thresholds):
+            picked = rng.choice(thresholds, len(X))
+            direction = np.where(rng.random(len(X)) < 0.5, -np.inf, np.inf).astype(dtype)
+            near = rng.random(len(X)) < 0.3
+            fuzzed[near, feature_index] = np.nextafter(picked, direction)[near]
+    choice = rng.random(X.shape)
+    fuzzed[choice < 0.15] = np.nan
+    fuzzed[(choice >= 0.15) & (choice < 0.2)] = 0.0
+    fuzzed[(choice >= 0.2) & (choice < 0.25)] = rng.choice([1e-40, -1e-40, 1e-36], ((choice >= 0.2) & (choice < 0.25)).sum())
+    return np.vstack([X, fuzzed])
+
+
+def members(predictor):
+    """(label, native estimator) of every booster a predictor serves"""
+    model = model_manager.get_loaded(predictor.model_name).model
+    if isinstance(model, dict):
+        return [(f"{predictor.model_name}/{key}", model[key]) for key in ('xgb', 'lgbm')]
+    return [(predictor.model_name, model)]
+
+
+def test_compiled_forests():
+    """Compiled and native probabilities agree on fuzzed inputs for every model"""
+    print("🧪 Testing Compiled Tree Engine")
+    print("=" * 50)
+    
+    rng = np.random.default_rng(SEED)
+    for predictor, serializer_class in PREDICTORS:
+        if not os.path.exists(model_manager.get_model_path(predictor.model_name)):
+            print(f"⚠️  {predictor.model_name}: model file not found, skipped")
+            continue
+        X = predictor.feature_builder.build(random_records(serializer_class, ROWS, seed=SEED))
+        for label, estimator in members(predictor):
+            forest = compile_model(estimator)
+            fuzzed = fuzz_matrix(forest, X, rng)
+            expected = native_proba(estimator, fuzzed)
+            compiled = forest.predict_proba(fuzzed)
+            assert compiled.shape == (len(fuzzed), 2) and np.allclose(compiled.sum(axis=1), 1.0)
+            deviation = float(np.abs(compiled[:, 1] - expected).max())
+            assert deviation <= COMPILED_TOLERANCE, (label, deviation)
+            
+            # A row scored alone lands in the same leaves as in a batch
+            leaves = forest.leaf_values(forest.prepare_input(fuzzed))
+            for row in rng.choice(len(fuzzed), 20, replace=False):
+                assert np.array_equal(forest.leaf_values(forest.prepare_input(fuzzed[row:row + 1]))[0], leaves[row])
+            missing = int(np.isnan(fuzzed).any(axis=1).sum())
+            print(f"✅ {label}: {forest.n_trees} trees, {len(fuzzed)} rows ({missing} with missing values), "
+                  f"max deviation {deviation:.1e}")
+
+
+def test_unsupported_models():
+    """Boosters the flat arrays cannot represent are rejected instead of mis-predicted"""
+    rng = np.random.default_rng(SEED)
+    X = rng.normal(size=(400, 4))
+    X[:, 3] = rng.integers(0, 6, 400)
+    y = (X[:, 0] + (X[:, 3] > 2) + rng.normal(scale=0.5, size=400) > 0.5).astype(int)
+    params = {'n_estimators': 5, 'num_leaves': 8, 'verbose': -1}
+    
+    rejected = {
+        'categorical splits': lightgbm.LGBMClassifier(min_data_per_group=5, **params).fit(
+            X, np.isin(X[:, 3], [1, 4]).astype(int), categorical_feature=[3]),
+        'linear trees': lightgbm.LGBMClassifier(linear_tree=True, **params).fit(X, y),
+        'multiclass': lightgbm.LGBMClassifier(**params).fit(X, np.digitize(X[:, 0], [-0.5, 0.5])),
+        'random forest mode': lightgbm.LGBMClassifier(boosting_type='rf', bagging_freq=1, bagging_fraction=0.8,
+                                                      **params).fit(X, y),
+        'XGBoost regression': xgboost.XGBRegressor(n_estimators=5).fit(X, y),
+        'XGBoost linear booster': xgboost.XGBClassifier(n_estimators=5, booster='gblinear').fit(X, y),
+    }
+    for name, estimator in rejected.items():
+        try:
+            compile_model(estimator)
+            raise AssertionError(f"{name} compiled")
+        except NotImplementedError:
+            pass
+    
+    # Missing values routed by learned defaults (NaN and Zero missing types)
+    X_missing = X.copy()
+    X_missing[rng.random(X.shape) < 0.2] = np.nan
+    for estimator in (lightgbm.LGBMClassifier(**params).fit(X_missing, y),
+                      lightgbm.LGBMClassifier(zero_as_missing=True, **params).fit(np.nan_to_num(X_missing), y),
+                      xgboost.XGBClassifier(n_estimators=5, max_depth=4).fit(X_missing, y)):
+        forest = compile_model(estimator)
+        fuzzed = fuzz_matrix(forest, X_missing, rng)
+        assert np.abs(forest.predict_proba(fuzzed)[:, 1] - native_proba(estimator, fuzzed)).max() <= COMPILED_TOLERANCE
+    print(f"✅ Rejected: {', '.join(rejected)}; NaN and zero-as-missing defaults match the native libraries")
+
+
+def test_compiled_cache():
+    """Compiled forests survive save/load and are reused from the cache next to the model file"""
+    directory = tempfile.mkdtemp(prefix='ml_compiled_test_')
+    try:
+        estimator = members(urr_predictor)[0][1]
+        forest = compile_model(estimator)
+        X = forest.probe_matrix(500)
+        
+        path = os.path.join(directory, 'forest.npz')
+        forest.save(path)
+        loaded = CompiledForest.load(path)
+        mapped = CompiledForest.load_arrays(directory, forest.save_arrays(directory, 'forest'))
+        for copy in (loaded, mapped):
+            assert copy.kind == forest.kind and copy.n_features == forest.n_features
+            assert np.array_equal(copy.leaf_value, forest.leaf_value) and np.array_equal(copy.threshold, forest.threshold)
+            assert np.array_equal(copy.predict_proba(X), forest.predict_proba(X))
+        assert isinstance(mapped.threshold, np.memmap)
+        
+        # The model manager writes the cache on the first compiled load and reads it on the next ones
+        model_path = os.path.join(directory, 'urr_model.pkl')
+        shutil.copyfile(model_manager.get_model_path('urr'), model_path)
+        manager = MLModelManager()
+        manager.model_paths = {'urr': model_path}
+        manager._init_locks()
+        manager.configure_backends({'urr': 'compiled'})
+        
+        first = manager._load_artifact('urr')
+        cache_files = [name for name in os.listdir(directory) if name.startswith('urr_model.') and name.endswith('.compiled.npz')]
+        assert len(cache_files) == 1 and first.compiled is not None, cache_files
+        cache_path = os.path.join(directory, cache_files[0])
+        assert np.array_equal(CompiledForest.load(cache_path).leaf_value, forest.leaf_value)
+        
+        # A cached copy within the tolerance is used as it is...
+        nudged = CompiledForest.load(cache_path)
+        nudged.leaf_value = nudged.leaf_value + 1e-12
+        nudged.save(cache_path)
+        second = manager._load_artifact('urr')
+        assert np.array_equal(second.compiled.leaf_value, nudged.leaf_value)
+        
+        # ...one that no longer matches the model is refused and the model served natively
+        corrupted = CompiledForest.load(cache_path)
+        corrupted.leaf_value = corrupted.leaf_value + 0.5
+        corrupted.save(cache_path)
+        third = manager._load_artifact('urr')
+        assert third.compiled is None
+        print(f"✅ Compiled cache: save/load and memory-mapped arrays round-trip, {cache_files[0]} reused, "
+              f"a corrupted cache falls back to native inference")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_fused_ensemble():
+    """The fused Hb forest equals the weighted native members, and so does the risk decision at the threshold"""
+    bundle = model_manager.get_loaded('hb').model
+    weights, threshold = bundle['weights'], float(bundle['threshold'])
+    forests = [compile_model(bundle['xgb']), compile_model(bundle['lgbm'])]
+    fused = FusedEnsemble(forests, weights)
+    assert fused.merged.n_trees == sum(forest.n_trees for forest in forests)
+    
+    rng = np.random.default_rng(SEED)
+    X = hb_predictor.feature_builder.build(random_records(HbPredictionSerializer, ROWS, seed=SEED))
+    X = np.vstack([fuzz_matrix(forest, X, rng) for forest in forests])
+    native_members = np.column_stack([native_proba(bundle['xgb'], X), native_proba(bundle['lgbm'], X)])
+    native = native_members @ np.asarray(weights, dtype=np.float64)
+    assert np.abs(fused.member_probabilities(X) - native_members).max() <= COMPILED_TOLERANCE
+    deviation = float(np.abs(fused.predict_positive(X) - native).max())
+    assert deviation <= COMPILED_TOLERANCE, deviation
+    
+    # The decision is probability >= threshold, on both sides of it
+    ensemble = WeightedEnsemble([bundle['xgb'], bundle['lgbm']], weights, threshold, fused=fused)
+    predictions, probabilities = ensemble.predict(X[:200])
+    assert np.array_equal(predictions, (probabilities >= threshold).astype(int))
+    clear = np.abs(native - threshold) > COMPILED_TOLERANCE
+    assert np.array_equal((fused.predict_positive(X) >= threshold)[clear], (native >= threshold)[clear])
+    row = int(np.argmin(np.abs(native - threshold)))
+    probability = float(fused.predict_positive(X[row:row + 1])[0])
+    for cut, expected in ((probability, 1), (np.nextafter(probability, np.inf), 0)):
+        at_cut = WeightedEnsemble(ensemble.members, weights, cut, fused=fused)
+        assert at_cut.predict(X[row:row + 1])[0][0] == expected, (cut, probability)
+    
+    # The served snapshot (compiled by default) gives the native results, hb_risk_predicted included
+    served = model_manager.get_loaded('hb')
+    assert model_manager.backends.get('hb') == 'compiled'
+    assert served.ensemble.fused is not None and served.ensemble.fused.is_efficient_for(1)
+    assert (served.ensemble.weights, served.ensemble.threshold) == ([float(weight) for weight in weights], threshold)
+    native_ensemble = WeightedEnsemble([bundle['xgb'], bundle['lgbm']], weights, threshold)
+    records = random_records(HbPredictionSerializer, 50, seed=SEED + 1)
+    for record in records:
+        fused_result = hb_predictor._predict_loaded(served, [record])[0]
+        native_probability = float(native_ensemble.predict_positive(hb_predictor.feature_builder.build([record]))[0])
+        assert abs(fused_result.risk_probability - round(native_probability, 3)) <= 0.001
+        if abs(native_probability - threshold) > COMPILED_TOLERANCE:
+            assert fused_result.hb_risk_predicted == (native_probability >= threshold)
+    
+    # A prebuilt merged forest (e.g. memory-mapped from an artifact) must match its members
+    assert FusedEnsemble(forests, weights, merged=fused.merged).merged is fused.merged
+    try:
+        FusedEnsemble(forests, weights, merged=forests[1])
+        raise AssertionError('mismatched merged forest accepted')
+    except ValueError:
+        pass
+    print(f"✅ Fused Hb ensemble (weights {tuple(weights)}, threshold {threshold:.4f}): {len(X)} rows, "
+          f"max deviation {deviation:.1e}, decisions match the native ensemble")
+
+
+def test_fused_cost():
+    """A single Hb record costs about one member evaluation: one fused pass, no native member calls"""
+    ensemble = model_manager.get_loaded('hb').ensemble
+    X = hb_predictor.feature_builder.build([hb_predictor.warmup_record])
+    with mock.patch.object(services, '_predict_proba', wraps=services._predict_proba) as predict_proba:
+        hb_predictor.predict(hb_predictor.warmup_record)
+    assert predict_proba.call_count == 0, predict_proba.call_args_list
+    
+    def best_of(function, repeat=7, number=50):
+        function()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            timings.append((time.perf_counter() - start) / number)
+        return min(timings)
+    
+    hb_cost = best_of(lambda: ensemble.predict_positive(X))
+    member_costs = [best_of(lambda member=member: services._predict_proba(member, X)) for member in ensemble.members]
+    assert hb_cost <= 1.25 * max(member_costs), (hb_cost, member_costs)
+    print(f"✅ Hb single record: {hb_cost * 1e6:.0f} µs fused vs "
+          f"{' + '.join(f'{cost * 1e6:.0f}' for cost in member_costs)} µs for the native members")
+
+
+if __name__ == "__main__":
+    test_compiled_forests()
+    test_unsupported_models()
+    test_compiled_cache()
+    test_fused_ensemble()
+    test_fused_cost()
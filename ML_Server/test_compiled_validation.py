@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script for the compiled input validators
+Fuzzes CompiledValidator and checks that it returns exactly the validated data
+and the error dicts (messages and codes) of the DRF serializers it is compiled
+from
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+from rest_framework import serializers
+
+from ml_models.serializers import DryWeightPredictionSerializer, HbPredictionSerializer, URRPredictionSerializer
+from ml_models.validation import CompiledValidator
+
+SERIALIZERS = [DryWeightPredictionSerializer, URRPredictionSerializer, HbPredictionSerializer]
+RECORDS_PER_SERIALIZER = 3000
+SEED = 1234
+
+
+def fuzz_value(rng, field, noise):
+    """A value for one field: valid with probability 1 - noise, otherwise anything a client might send"""
+    low = getattr(field, 'min_value', None)
+    high = getattr(field, 'max_value', None)
+    if rng.random() >= noise:
+        if not isinstance(field, serializers.FloatField):
+            return 'PAT%04d' % rng.randint(0, 9999)
+        value = rng.uniform(low, high)
+        return round(value, rng.choice([0, 1, 2, 6])) if rng.random() < 0.5 else value
+    
+    choice = rng.randrange(20)
+    if choice == 0 and low is not None:
+        return low
+    if choice == 1 and high is not None:
+        return high
+    if choice == 2 and high is not None:
+        return high + rng.choice([1e-9, 0.5, 1000])
+    if choice == 3 and low is not None:
+        return low - rng.choice([1e-9, 0.5, 1000])
+    if choice == 4:
+        return rng.randint(-1000, 3000)
+    if choice == 5:
+        return str(round(rng.uniform(-100, 600), 2))
+    if choice == 6:
+        return rng.choice(['nan', 'inf', '-inf', 'NaN', '1e3', ' 42 ', '0x10', '', '   ', 'abc', '1,5'])
+    if choice == 7:
+        return rng.choice([float('nan'), float('inf'), float('-inf'), -0.0, 1e308, 10 ** 30])
+    if choice == 8:
+        return rng.choice([True, False])
+    if choice == 9:
+        return None
+    if choice == 10:
+        return rng.choice([[], [1.0], {}, {'value': 1}])
+    if choice == 11:
+        return '7' * rng.choice([50, 51, 1000, 1001])
+    if choice == 12:
+        return 'P' + str(rng.randint(0, 10 ** 6))
+    if choice == 13:
+        return rng.choice(['bad\x00id', '\ud800', 'PAT 001 ', ''])
+    if isinstance(field, serializers.FloatField):
+        return rng.uniform(low, high)
+    return 'PAT%04d' % rng.randint(0, 9999)
+
+
+def fuzz_record(rng, fields):
+    """A request body: a dict of fuzzed fields with some missing and extra keys, or occasionally not a dict"""
+    if rng.random() < 0.01:
+        return rng.choice([None, [], 'text', 42, [{'patient_id': 'X'}]])
+    noise = rng.choice([0.0, 0.02, 0.1, 0.5])
+    record = {}
+    for name, field in fields.items():
+        if rng.random() < noise / 4:
+            continue
+        record[name] = fuzz_value(rng, field, noise)
+    if rng.random() < 0.1:
+        record['unexpected'] = rng.random()
+    return record
+
+
+def canonical(value):
+    """Comparable form of validated data and errors (ErrorDetail codes included, NaN equal to NaN)"""
+    if isinstance(value, dict):
+        return [(key, canonical(item)) for key, item in value.items()]
+    if isinstance(value, list):
+        return [canonical(item) for item in value]
+    if isinstance(value, float):
+        return ('float', repr(value))
+    if hasattr(value, 'code'):
+        return (str(value), value.code)
+    return (type(value).__name__, value)
+
+
+def drf_result(serializer_class, record):
+    serializer = serializer_class(data=record)
+    if serializer.is_valid():
+        return serializer.validated_data, None
+    return None, serializer.errors
+
+
+def test_compiled_validation():
+    """Compare single-record and batch validation against the serializers"""
+    print("🧪 Testing Compiled Validation")
+    print("=" * 50)
+    
+    rng = random.Random(SEED)
+    for serializer_class in SERIALIZERS:
+        validator = CompiledValidator(serializer_class)
+        fields = serializer_class().fields
+        records = [fuzz_record(rng, fields) for _ in range(RECORDS_PER_SERIALIZER)]
+        expected = [drf_result(serializer_class, record) for record in records]
+        
+        # Single records
+        for record, (expected_data, expected_errors) in zip(records, expected):
+            validated, errors = validator.validate(record)
+            assert canonical(validated) == canonical(expected_data), (record, validated, expected_data)
+            assert canonical(errors) == canonical(expected_errors or {}), (record, errors, expected_errors)
+        
+        # Batches of mixed valid and invalid records
+        start = 0
+        while start < len(records):
+            size = rng.choice([1, 2, 7, 64, 500])
+            batch = records[start:start + size]
+            validated, errors = validator.validate_many(batch)
+            for offset, (expected_data, expected_errors) in enumerate(expected[start:start + size]):
+                assert canonical(validated[offset]) == canonical(expected_data), (batch[offset], validated[offset])
+                assert canonical(errors[offset]) == canonical(expected_errors), (batch[offset], errors[offset])
+            start += size
+        
+        invalid = sum(1 for data, _ in expected if data is None)
+        print(f"✅ {serializer_class.__name__}: {len(records)} records identical ({invalid} invalid)")
+
+
+if __name__ == "__main__":
+    test_compiled_validation()
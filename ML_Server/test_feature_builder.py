@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test script for the schema-driven feature builder
+Compares FeatureBuilder.build with the previous per-record _prepare_features
+lists on random valid records (including missing, None and NaN rolling
+averages), checks that the predictions are unchanged and that /api/ml/models/
+still describes the features as before
+"""
+
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+import numpy as np
+import pandas as pd
+from django.test import Client
+from rest_framework import serializers
+
+from ml_models.serializers import DryWeightPredictionSerializer, HbPredictionSerializer, URRPredictionSerializer
+from ml_models.services import dry_weight_predictor, hb_predictor, urr_predictor
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_models', 'models')
+
+
+# Previous per-record implementations, kept here as the reference
+def legacy_dry_weight_features(input_data):
+    high_sbp = 1 if input_data['sys'] > 140 else 0
+    hd_duration_hours = input_data['hd_duration']
+    pre_hd_weight = input_data['pre_hd_weight']
+    ufr = input_data['puf'] / (hd_duration_hours * pre_hd_weight) if (hd_duration_hours * pre_hd_weight) > 0 else 0
+    ufr_below_15 = 1 if ufr < 15 else 0
+    weight_gain_pct = (input_data['weight_gain'] / input_data['dry_weight']) * 100 if input_data['dry_weight'] > 0 else 0
+    weight_gain_avg_3 = input_data.get('weight_gain_avg_3', input_data['weight_gain'])
+    sys_avg_3 = input_data.get('sys_avg_3', input_data['sys'])
+    return [
+        sys_avg_3, input_data['vp'], input_data['ap'], input_data['pre_hd_weight'], weight_gain_avg_3,
+        input_data['sys'], input_data['post_hd_weight'], weight_gain_pct, ufr, input_data['tmp'],
+        input_data['dia'], input_data['dry_weight'], input_data['weight_gain'], input_data['auf'],
+        input_data['puf'], input_data['bfr'], high_sbp, input_data['hd_duration'], ufr_below_15
+    ]
+
+
+def legacy_urr_features(input_data):
+    k_diff = input_data['serum_k_pre_hd'] - input_data['serum_k_post_hd']
+    bu_diff = input_data['bu_pre_hd'] - input_data['bu_post_hd']
+    scr_diff = input_data['scr_pre_hd'] - input_data['scr_post_hd']
+    return [
+        input_data['albumin'], input_data['hb'], input_data['s_ca'], input_data['serum_na_pre_hd'],
+        input_data['urr'], input_data['urr_diff'], k_diff, bu_diff, scr_diff
+    ]
+
+
+def legacy_hb_features(input_data):
+    albumin_bu_ratio = input_data['albumin'] / (input_data['bu_pre_hd']+1) if input_data['bu_pre_hd'] != 0 else 0
+    k_diff = input_data['serum_k_pre_hd'] - input_data['serum_k_post_hd']
+    bu_diff = input_data['bu_pre_hd'] - input_data['bu_post_hd']
+    scr_diff = input_data['scr_pre_hd'] - input_data['scr_post_hd']
+    return [
+        input_data['albumin'], input_data['s_ca'], input_data['serum_na_pre_hd'], input_data['ua'],
+        input_data['hb_diff'], input_data['hb'], albumin_bu_ratio, k_diff, bu_diff, scr_diff
+    ]
+
+
+PREDICTORS = [
+    ('dry_weight', DryWeightPredictionSerializer, dry_weight_predictor, legacy_dry_weight_features),
+    ('urr', URRPredictionSerializer, urr_predictor, legacy_urr_features),
+    ('hb', HbPredictionSerializer, hb_predictor, legacy_hb_features),
+]
+
+
+# Optional inputs the feature builder falls back on (the history-based diffs are filled in before it)
+ROLLING_AVERAGES = ('weight_gain_avg_3', 'sys_avg_3')
+
+
+def random_records(serializer_class, count, seed):
+    """Valid records drawn from the serializer ranges, rolling averages present, absent, None or NaN"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        record = {}
+        for name, field in serializer_class().fields.items():
+            if isinstance(field, serializers.CharField):
+                record[name] = f'FEATURE_{index:03d}'
+            if not isinstance(field, serializers.FloatField):
+                continue
+            # Hit the range edges now and then (zero denominators, thresholds)
+            choice = rng.random()
+            value = field.min_value if choice < 0.05 else field.max_value if choice < 0.1 else rng.uniform(field.min_value, field.max_value)
+            if name in ROLLING_AVERAGES:
+                option = rng.randrange(4)
+                if option == 0:
+                    continue
+                value = (None, math.nan, value)[option - 1]
+            record[name] = value
+        records.append(record)
+    return records
+
+
+def as_legacy_input(record):
+    """A None or NaN optional average is treated as not provided"""
+    return {key: value for key, value in record.items()
+            if not (value is None or (isinstance(value, float) and math.isnan(value)))}
+
+
+def test_features_match_legacy():
+    """The feature matrix equals the old per-record feature lists"""
+    print("🧪 Testing Feature Builder")
+    print("=" * 50)
+    
+    for model_name, serializer_class, predictor, legacy_features in PREDICTORS:
+        records = random_records(serializer_class, 500, seed=len(model_name))
+        expected = np.array([legacy_features(as_legacy_input(record)) for record in records], dtype=np.float64)
+        X = predictor.feature_builder.build(records)
+        assert X.shape == expected.shape == (500, len(predictor.schema.features)), (X.shape, expected.shape)
+        assert not np.isnan(X).any()
+        np.testing.assert_array_equal(X, expected)
+        
+        for record, row in zip(records[:20], expected):
+            assert predictor._prepare_features(record) == row.tolist()
+        print(f"✅ {model_name}: 500 random records give the same {X.shape[1]} features as before")
+    
+    optional = [record for record in random_records(DryWeightPredictionSerializer, 200, seed=1)
+                if record.get('sys_avg_3') is None]
+    X = dry_weight_predictor.feature_builder.build(optional)
+    np.testing.assert_array_equal(X[:, 0], [record['sys'] for record in optional])
+    print(f"✅ Missing and None rolling averages fall back to the current session ({len(optional)} records)")
+
+
+def test_predictions_match_legacy():
+    """Model outputs on the builder matrix equal the old DataFrame path"""
+    for model_name, serializer_class, predictor, legacy_features in PREDICTORS:
+        if not os.path.exists(os.path.join(MODELS_DIR, f'{model_name}_model.pkl')):
+            print(f"⚠️ {model_name}: model file missing, skipped")
+            continue
+        records = random_records(serializer_class, 200, seed=11)
+        frame = pd.DataFrame([legacy_features(as_legacy_input(record)) for record in records],
+                             columns=predictor.schema.feature_names)
+        model = predictor.model_manager.load_model(model_name)
+        if isinstance(model, dict):
+            w1, w2 = model['weights']
+            expected = w1 * model['xgb'].predict_proba(frame)[:, 1] + w2 * model['lgbm'].predict_proba(frame)[:, 1]
+            probabilities = [result.risk_probability for result in predictor.predict_batch(records)]
+        else:
+            expected = model.predict_proba(frame)[:, 1]
+            key = 'change_probability' if model_name == 'dry_weight' else 'risk_probability'
+            probabilities = [getattr(result, key) for result in predictor.predict_batch(records)]
+        assert probabilities == [round(float(probability), 3) for probability in expected], model_name
+        print(f"✅ {model_name}: predictions unchanged on 200 random records")
+
+
+def test_models_info_unchanged():
+    """/api/ml/models/ keeps its previous feature descriptions"""
+    models = Client(HTTP_HOST='localhost').get('/api/ml/models/').json()['available_models']
+    assert models['dry_weight']['calculated_features'] == [
+        'High_SBP (1 if SYS > 140, else 0)',
+        'UFR (PUF / (HD duration × Pre HD weight))',
+        'UFR_below_15 (1 if UFR < 15, else 0)',
+        'Weight_gain_pct ((Weight gain / Dry weight) × 100)',
+        'SYS_avg_3 (3-session rolling average of SYS, uses current if not provided)',
+        'Weight_gain_avg_3 (3-session rolling average of Weight gain, uses current if not provided)'
+    ]
+    assert models['dry_weight']['feature_engineering'] == 'Server automatically calculates 6 derived features from 13 original dialysis parameters'
+    assert models['urr']['feature_engineering'] == 'Server automatically calculates URR and 3 difference features from laboratory parameters'
+    assert models['hb']['feature_engineering'] == 'Server automatically calculates 4 derived features from 12 laboratory parameters'
+    assert models['dry_weight']['input_parameters'][-2:] == ['weight_gain_avg_3 (optional)', 'sys_avg_3 (optional)']
+    assert models['urr']['input_parameters'][0] == 'patient_id (optional)'
+    assert [models[name]['total_features'] for name in ('dry_weight', 'urr', 'hb')] == [19, 9, 10]
+    assert models['hb']['feature_order'][6] == '7. Albumin_BU_Ratio'
+    print("✅ /api/ml/models/ feature descriptions unchanged")
+
+
+if __name__ == "__main__":
+    test_features_match_legacy()
+    test_predictions_match_legacy()
+    test_models_info_unchanged()
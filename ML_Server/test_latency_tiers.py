@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test script for latency tiers
+Checks that a tier scores exactly the first boosting rounds (native iteration
+limits and truncated compiled forests agree), that the API echoes the tier
+only when one was asked for, and that the offline measurements end up in
+models_info
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+from django.core.management import call_command
+from django.test import Client
+
+from ml_models.benchmark import mint_token, synthetic_payloads
+from ml_models.serializers import HbPredictionSerializer, URRPredictionSerializer
+from ml_models.services import hb_predictor, model_manager, prediction_cache, urr_predictor
+from ml_models.tiers import latency_tiers
+
+
+def test_tier_rounds():
+    """Tiers score the first rounds of every booster; compiled and native backends agree"""
+    print("🧪 Testing Latency Tiers")
+    print("=" * 50)
+    
+    X_urr = urr_predictor.feature_builder.build(synthetic_payloads(URRPredictionSerializer, 200, seed=1))
+    X_hb = hb_predictor.feature_builder.build(synthetic_payloads(HbPredictionSerializer, 200, seed=1))
+    backends = dict(model_manager.backends)
+    model_manager.configure_backends({**backends, 'urr': 'compiled', 'hb': 'compiled'})
+    try:
+        compiled = {'urr': model_manager._load_artifact('urr'), 'hb': model_manager._load_artifact('hb')}
+    finally:
+        model_manager.configure_backends(backends)
+    
+    totals = {'urr': model_manager.get_loaded('urr').boosting_rounds, 'hb': model_manager.get_loaded('hb').boosting_rounds}
+    for tier in latency_tiers.names():
+        native = model_manager.get_loaded('urr').for_tier(tier)
+        rounds = native.boosting_rounds['model']
+        assert rounds == latency_tiers.rounds(tier, totals['urr']['model'])
+        expected = native.model.predict_proba(X_urr, num_iteration=rounds)[:, 1]
+        assert np.allclose(urr_predictor._score(native, X_urr)[1], expected, atol=1e-12)
+        truncated = compiled['urr'].for_tier(tier).compiled
+        assert truncated.n_trees == rounds
+        assert np.allclose(truncated.predict_proba(X_urr)[:, 1], expected, atol=1e-9)
+        
+        native = model_manager.get_loaded('hb').for_tier(tier)
+        rounds = native.boosting_rounds
+        assert rounds == {key: latency_tiers.rounds(tier, total) for key, total in totals['hb'].items()}
+        (xgb, lgbm), weights = native.ensemble.members, native.ensemble.weights
+        expected = (weights[0] * xgb.predict_proba(X_hb, iteration_range=(0, rounds['xgb']))[:, 1] +
+                    weights[1] * lgbm.predict_proba(X_hb, num_iteration=rounds['lgbm'])[:, 1])
+        assert np.allclose(hb_predictor._score(native, X_hb)[1], expected, atol=1e-9)
+        fused = compiled['hb'].for_tier(tier).ensemble.fused
+        assert fused.merged.n_trees == rounds['xgb'] + rounds['lgbm']
+        assert np.allclose(fused.predict_positive(X_hb), expected, atol=1e-6)
+        print(f"✅ {tier}: Hb ensemble with xgb {rounds['xgb']} + lgbm {rounds['lgbm']} rounds, "
+              f"native and compiled predictions agree")
+    
+    # Variants are built once per snapshot
+    loaded = model_manager.get_loaded('hb')
+    assert loaded.for_tier('fast') is loaded.for_tier('fast') and loaded.tier is None
+
+
+def test_tier_api():
+    """The tier is echoed when asked for, rejected when unknown and cached separately"""
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {mint_token(os.environ['JWT_SECRET'])}", HTTP_HOST='localhost')
+    record = synthetic_payloads(HbPredictionSerializer, 1, seed=9)[0]
+    prediction_cache.clear()
+    
+    def post(path, body):
+        response = client.post(path, json.dumps(body), content_type='application/json')
+        return response.status_code, response.json()
+    
+    code, full = post('/api/ml/predict/hb/', record)
+    assert code == 200 and 'latency_tier' not in full, full
+    code, fast = post('/api/ml/predict/hb/?latency_tier=fastest', record)
+    assert code == 200 and fast['latency_tier'] == 'fastest', fast
+    assert fast['risk_probability'] != full['risk_probability']
+    code, again = post('/api/ml/predict/hb/?latency_tier=fastest', record)
+    assert again['risk_probability'] == fast['risk_probability'] and again['latency_tier'] == 'fastest'
+    code, explicit = post('/api/ml/predict/hb/?latency_tier=full', record)
+    assert explicit['latency_tier'] == 'full' and explicit['risk_probability'] == full['risk_probability']
+    
+    code, body = post('/api/ml/predict/hb/?latency_tier=instant', record)
+    assert code == 400 and 'latency_tier' in body['details'], body
+    print("✅ Single endpoint echoes the tier and rejects unknown ones")
+    
+    records = synthetic_payloads(URRPredictionSerializer, 40, seed=9)
+    code, body = post('/api/ml/predict/urr/batch/?latency_tier=fast', {'records': records})
+    assert code == 200 and {result['latency_tier'] for result in body['results']} == {'fast'}
+    loaded = model_manager.get_loaded('urr').for_tier('fast')
+    X = urr_predictor.feature_builder.build(records)
+    expected = urr_predictor._score(loaded, X)[1]
+    assert np.allclose([result['risk_probability'] for result in body['results']], expected, atol=1e-3)
+    
+    response = client.post('/api/ml/predict/urr/stream/?latency_tier=fast',
+                           '\n'.join(json.dumps(record) for record in records[:5]), content_type='application/x-ndjson')
+    lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    assert [line['latency_tier'] for line in lines[:-1]] == ['fast'] * 5, lines
+    response = client.post('/api/ml/predict/urr/stream/?latency_tier=instant', json.dumps(records[0]),
+                           content_type='application/x-ndjson')
+    assert response.status_code == 400
+    print("✅ Batch and stream endpoints score the tier's rounds")
+
+
+def test_tier_report():
+    """The measure command writes the report that models_info publishes"""
+    report_path = os.path.join(tempfile.mkdtemp(prefix='ml_tiers_test_'), 'latency_tiers.json')
+    previous_path = latency_tiers.report_path
+    try:
+        call_command('measure_latency_tiers', models='urr,hb', records=300, output=report_path, stdout=io.StringIO())
+        with open(report_path) as f:
+            report = json.load(f)
+        assert set(report['models']) == {'urr', 'hb'}
+        fast = report['models']['hb']['tiers']['fast']
+        assert fast['boosting_rounds'] == model_manager.get_loaded('hb').for_tier('fast').boosting_rounds
+        assert report['models']['hb']['tiers']['full']['max_abs_probability_delta'] == 0.0
+        
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {mint_token(os.environ['JWT_SECRET'])}", HTTP_HOST='localhost')
+        info = client.get('/api/ml/models/').json()['available_models']
+        tiers = info['hb']['latency_tiers']
+        assert tiers['default'] == 'full' and tiers['measurement']['current'], tiers
+        assert tiers['tiers']['fast'] == {'boosting_fraction': latency_tiers.fractions['fast'], **fast}, tiers
+        assert info['dry_weight']['latency_tiers']['measurement'] is None
+    finally:
+        latency_tiers.report_path = previous_path
+    print(f"✅ Hb fast tier: max |delta| {fast['max_abs_probability_delta']}, agreement {fast['prediction_agreement']}, "
+          f"{fast['single_record_us']} µs per record vs {report['models']['hb']['tiers']['full']['single_record_us']} µs")
+
+
+if __name__ == "__main__":
+    test_tier_rounds()
+    test_tier_api()
+    test_tier_report()
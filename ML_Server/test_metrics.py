@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script for the Prometheus metrics
+Writes the snapshots of two processes into a temporary ML_METRICS_DIR and
+checks the merge rules of MetricsRegistry.render() (counters and histograms
+summed, gauges from the newest snapshot, cumulative buckets), then checks that
+/api/ml/metrics/ reports every request stage after a prediction
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+import jwt
+from django.test import Client
+from rest_framework import serializers
+
+from ml_models.metrics import LATENCY_BUCKETS, MetricsRegistry, labels
+from ml_models.serializers import URRPredictionSerializer
+
+STAGES = ('validation', 'features', 'predict', 'recommendations', 'serialization')
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def parse(text):
+    """{(name, ((label, value), ...)): value} of the samples in Prometheus text format"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, label_text, value = SAMPLE.match(line).groups()
+        label_set = tuple(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', label_text or ''))
+        samples[(name, label_set)] = float(value)
+    return samples
+
+
+def process_snapshot(directory, pid, written_at, record):
+    """Snapshot file of a simulated worker process"""
+    registry = MetricsRegistry()
+    record(registry)
+    snapshot = registry.snapshot()
+    snapshot.update(pid=pid, written_at=written_at)
+    with open(os.path.join(directory, f'metrics-{pid}-{int(written_at)}.json'), 'w') as f:
+        json.dump(snapshot, f)
+
+
+def test_render_merges_processes():
+    """Counters and histograms are summed, gauges come from the newest snapshot"""
+    print("🧪 Testing Metrics")
+    print("=" * 50)
+    
+    urr = labels(model='urr', stage='predict')
+    requests = labels(endpoint='predict', model='urr', status=200)
+    load = labels(model='urr')
+    
+    def first_worker(registry):
+        registry.inc('ml_requests_total', requests, 3)
+        registry.set_gauge('ml_model_last_load_seconds', load, 9.0)
+        for seconds in (0.0002, 0.003, 0.003, 20.0):
+            registry.observe('ml_stage_seconds', urr, seconds)
+    
+    def second_worker(registry):
+        registry.inc('ml_requests_total', requests, 4)
+        registry.inc('ml_prediction_errors_total', labels(model='urr'))
+        registry.set_gauge('ml_model_last_load_seconds', load, 2.0)
+        for seconds in (0.003, 0.04):
+            registry.observe('ml_stage_seconds', urr, seconds)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # The older snapshot holds the larger gauge value: the newest one must win
+        process_snapshot(directory, 101, time.time() - 60, first_worker)
+        process_snapshot(directory, 102, time.time() - 30, second_worker)
+        scraper = MetricsRegistry()
+        scraper.configure(directory)
+        text = scraper.render()
+    
+    samples = parse(text)
+    assert samples[('ml_requests_total', requests)] == 7
+    assert samples[('ml_prediction_errors_total', labels(model='urr'))] == 1
+    assert samples[('ml_model_last_load_seconds', load)] == 2.0
+    assert '# TYPE ml_stage_seconds histogram' in text and '# TYPE ml_requests_total counter' in text
+    
+    buckets = [(float(dict(label_set)['le']), value) for (name, label_set), value in samples.items()
+               if name == 'ml_stage_seconds_bucket' and dict(label_set)['stage'] == 'predict']
+    assert [bound for bound, _ in buckets] == list(LATENCY_BUCKETS) + [float('inf')]
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts), counts
+    expected = [sum(seconds <= bound for seconds in (0.0002, 0.003, 0.003, 20.0, 0.003, 0.04)) for bound, _ in buckets]
+    assert counts == expected, (counts, expected)
+    assert samples[('ml_stage_seconds_count', urr)] == counts[-1] == 6
+    assert abs(samples[('ml_stage_seconds_sum', urr)] - 20.0492) < 1e-9
+    print("✅ Two process snapshots merged: counters and histograms summed, newest gauge kept, "
+          "cumulative buckets ending at _count")
+
+
+def test_metrics_endpoint():
+    """After one prediction /api/ml/metrics/ has an ml_stage_seconds histogram for every stage"""
+    rng = random.Random()
+    record = {name: round(rng.uniform(field.min_value, field.max_value), 2) if isinstance(field, serializers.FloatField)
+              else 'METRICS_001' for name, field in URRPredictionSerializer().fields.items()
+              if not isinstance(field, serializers.DateField)}
+    token = jwt.encode({'id': 'metrics-test', 'role': 'doctor', 'exp': int(time.time()) + 3600},
+                       os.environ['JWT_SECRET'], algorithm='HS256')
+    client = Client(HTTP_HOST='localhost')
+    response = client.post('/api/ml/predict/urr/', json.dumps(record), content_type='application/json',
+                           HTTP_AUTHORIZATION=f'Bearer {token}')
+    assert response.status_code == 200, response.content
+    
+    response = client.get('/api/ml/metrics/')
+    assert response.status_code == 200 and response['Content-Type'].startswith('text/plain; version=0.0.4')
+    samples = parse(response.content.decode())
+    for stage in STAGES:
+        stage_labels = labels(model='urr', stage=stage)
+        assert samples.get(('ml_stage_seconds_count', stage_labels), 0) >= 1, stage
+        assert ('ml_stage_seconds_bucket', stage_labels + (('le', '+Inf'),)) in samples, stage
+    assert samples[('ml_requests_total', labels(endpoint='predict', model='urr', status=200))] >= 1
+    print(f"✅ /api/ml/metrics/ reports {', '.join(STAGES)} after one urr prediction")
+
+
+if __name__ == "__main__":
+    test_render_merges_processes()
+    test_metrics_endpoint()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Test script for the micro-batcher
+Checks the leader/follower hand-off of MicroBatcher: a lone request on an idle
+batcher is scored at once, queued requests are merged into one model call
+within the max-rows and window limits, results and errors go back to the
+caller they belong to, and concurrent callers each get their own rows
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+
+from rest_framework import serializers
+
+from ml_models.serializers import URRPredictionSerializer
+from ml_models.services import MicroBatcher, configure_micro_batching, model_manager, urr_predictor
+
+SNAPSHOT = object()
+
+
+class FakeModel:
+    """
+    predict_loaded stand-in recording its calls; the first call can be held
+    open so that other requests queue up behind it
+    """
+    
+    def __init__(self, hold_first=False, delay=0.0):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold_first:
+            self.release.set()
+        self.delay = delay
+        self.lock = threading.Lock()
+    
+    def __call__(self, loaded, records):
+        with self.lock:
+            self.calls.append([record['id'] for record in records])
+            first = len(self.calls) == 1
+        if first:
+            self.started.set()
+            self.release.wait(5)
+        if self.delay:
+            time.sleep(self.delay)
+        if any(record.get('fail') for record in records):
+            raise ValueError(f"cannot score {[record['id'] for record in records if record.get('fail')]}")
+        return [('result', record['id']) for record in records]
+
+
+def rows(*ids, fail=False):
+    return [{'id': row_id, 'fail': fail} for row_id in ids]
+
+
+def random_records(serializer_class, count, seed):
+    """Valid records with every numeric field drawn from its serializer range (dates left out)"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        record = {}
+        for name, field in serializer_class().fields.items():
+            if isinstance(field, serializers.FloatField):
+                record[name] = round(rng.uniform(field.min_value, field.max_value), 2)
+            elif isinstance(field, serializers.CharField):
+                record[name] = f'BATCHER_{index:03d}'
+        records.append(record)
+    return records
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def submit_in_thread(batcher, records, outcomes, name, loaded=SNAPSHOT):
+    def run():
+        try:
+            outcomes[name] = batcher.submit(loaded, records)
+        except Exception as e:
+            outcomes[name] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_idle_request():
+    """A lone request on an idle batcher is scored by its own thread without waiting for the window"""
+    print("🧪 Testing Micro-Batching")
+    print("=" * 50)
+    
+    model = FakeModel()
+    batcher = MicroBatcher('fake', model, window_ms=500, max_rows=64)
+    records = rows(1, 2, 3)
+    start = time.perf_counter()
+    assert batcher.submit(SNAPSHOT, records) == [('result', 1), ('result', 2), ('result', 3)]
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.25 and model.calls == [[1, 2, 3]], (elapsed, model.calls)
+    
+    try:
+        batcher.submit(SNAPSHOT, rows(4, fail=True))
+        raise AssertionError('error not raised')
+    except ValueError as e:
+        assert str(e) == 'cannot score [4]'
+    
+    stats = batcher.stats()
+    assert (stats['batches'], stats['requests'], stats['rows'], stats['queue_depth']) == (2, 2, 4, 0), stats
+    assert batcher.submit(SNAPSHOT, rows(5)) == [('result', 5)]
+    print(f"✅ Idle request scored in {elapsed * 1000:.1f} ms with a 500 ms window; errors raised to the caller")
+
+
+def test_hand_off():
+    """Requests queued behind a batch are merged into the next one and each gets its own slice back"""
+    model = FakeModel(hold_first=True)
+    batcher = MicroBatcher('fake', model, window_ms=20, max_rows=64)
+    outcomes = {}
+    threads = [submit_in_thread(batcher, rows(1), outcomes, 'leader')]
+    assert model.started.wait(5)
+    for name, ids in (('b', (2, 3)), ('c', (4,)), ('d', (5, 6, 7))):
+        threads.append(submit_in_thread(batcher, rows(*ids), outcomes, name))
+        wait_until(lambda: len(batcher._queue) == len(threads) - 1)
+    assert batcher.stats()['queued_rows'] == 6
+    model.release.set()
+    for thread in threads:
+        thread.join(5)
+    
+    assert model.calls == [[1], [2, 3, 4, 5, 6, 7]], model.calls
+    assert outcomes == {
+        'leader': [('result', 1)],
+        'b': [('result', 2), ('result', 3)],
+        'c': [('result', 4)],
+        'd': [('result', 5), ('result', 6), ('result', 7)],
+    }, outcomes
+    stats = batcher.stats()
+    assert (stats['batches'], stats['requests'], stats['max_batch_size'], stats['queue_depth']) == (2, 4, 6, 0), stats
+    assert not batcher._running
+    
+    # A failing merged batch is retried per request: the error goes to its caller only
+    model = FakeModel(hold_first=True)
+    batcher = MicroBatcher('fake', model, window_ms=20, max_rows=64)
+    outcomes = {}
+    threads = [submit_in_thread(batcher, rows(1), outcomes, 'leader')]
+    assert model.started.wait(5)
+    for name, records in (('good', rows(2, 3)), ('bad', rows(4, fail=True)), ('also_good', rows(5))):
+        threads.append(submit_in_thread(batcher, records, outcomes, name))
+        wait_until(lambda: len(batcher._queue) == len(threads) - 1)
+    model.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert model.calls == [[1], [2, 3, 4, 5], [2, 3], [4], [5]], model.calls
+    assert outcomes['good'] == [('result', 2), ('result', 3)] and outcomes['also_good'] == [('result', 5)]
+    assert isinstance(outcomes['bad'], ValueError) and str(outcomes['bad']) == 'cannot score [4]'
+    
+    # Requests holding another model snapshot are not merged with the head of the queue
+    model = FakeModel(hold_first=True)
+    batcher = MicroBatcher('fake', model, window_ms=0, max_rows=64)
+    outcomes = {}
+    reloaded = object()
+    threads = [submit_in_thread(batcher, rows(1), outcomes, 'leader')]
+    assert model.started.wait(5)
+    for name, ids, loaded in (('old', (2,), SNAPSHOT), ('new', (3,), reloaded), ('old_again', (4,), SNAPSHOT)):
+        threads.append(submit_in_thread(batcher, rows(*ids), outcomes, name, loaded))
+        wait_until(lambda: len(batcher._queue) == len(threads) - 1)
+    model.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert model.calls == [[1], [2], [3], [4]] and outcomes['new'] == [('result', 3)], model.calls
+    print("✅ Leader/follower hand-off: queued requests merged, results and errors back to their callers, "
+          "snapshots kept apart")
+
+
+def test_limits():
+    """A batch never exceeds max_rows, and the next leader waits at most window_ms for stragglers"""
+    model = FakeModel(hold_first=True)
+    batcher = MicroBatcher('fake', model, window_ms=10000, max_rows=4)
+    outcomes = {}
+    threads = [submit_in_thread(batcher, rows(1), outcomes, 'leader')]
+    assert model.started.wait(5)
+    for name, ids in (('three', (2, 3, 4)), ('two', (5, 6)), ('one', (7,)), ('six', (8, 9, 10, 11, 12, 13))):
+        threads.append(submit_in_thread(batcher, rows(*ids), outcomes, name))
+        wait_until(lambda: len(batcher._queue) == len(threads) - 1)
+    start = time.perf_counter()
+    model.release.set()
+    for thread in threads:
+        thread.join(5)
+    elapsed = time.perf_counter() - start
+    # Full queues do not wait out the 10 s window; a request larger than max_rows is scored on its own
+    assert elapsed < 2, elapsed
+    assert model.calls == [[1], [2, 3, 4], [5, 6, 7], [8, 9, 10, 11, 12, 13]], model.calls
+    assert outcomes['six'] == [('result', row_id) for row_id in range(8, 14)]
+    
+    # With room left in the batch the leader waits for the window, and stragglers arriving within it join
+    window_ms = 300
+    model = FakeModel(hold_first=True)
+    batcher = MicroBatcher('fake', model, window_ms=window_ms, max_rows=64)
+    outcomes = {}
+    threads = [submit_in_thread(batcher, rows(1), outcomes, 'leader')]
+    assert model.started.wait(5)
+    for name, ids in (('b', (2,)), ('c', (3,))):
+        threads.append(submit_in_thread(batcher, rows(*ids), outcomes, name))
+        wait_until(lambda: len(batcher._queue) == len(threads) - 1)
+    start = time.perf_counter()
+    model.release.set()
+    time.sleep(window_ms / 3000)
+    threads.append(submit_in_thread(batcher, rows(4), outcomes, 'straggler'))
+    for thread in threads:
+        thread.join(5)
+    elapsed = time.perf_counter() - start
+    assert model.calls == [[1], [2, 3, 4]], model.calls
+    assert window_ms / 1000 <= elapsed < window_ms / 1000 + 1, elapsed
+    assert outcomes['straggler'] == [('result', 4)]
+    stats = batcher.stats()
+    assert stats['max_wait_ms'] >= window_ms, stats
+    print(f"✅ Batches capped at max_rows without waiting; window of {window_ms} ms held "
+          f"({elapsed * 1000:.0f} ms) and joined by a straggler")
+
+
+def test_concurrent_callers():
+    """Many concurrent callers each get exactly the results of their own rows"""
+    model = FakeModel(delay=0.002)
+    batcher = MicroBatcher('fake', model, window_ms=1, max_rows=16)
+    failures = []
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+    submitted_rows = [0]
+    
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(50):
+            with counter_lock:
+                ids = [next(counter) for _ in range(rng.randint(1, 5))]
+                submitted_rows[0] += len(ids)
+            result = batcher.submit(SNAPSHOT, rows(*ids))
+            if result != [('result', row_id) for row_id in ids]:
+                failures.append((ids, result))
+    
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(24)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert not failures, failures[:3]
+    stats = batcher.stats()
+    assert stats['requests'] == 24 * 50 and stats['rows'] == submitted_rows[0], stats
+    assert stats['batches'] < stats['requests'] and stats['max_batch_size'] <= 16 and stats['queue_depth'] == 0, stats
+    assert sum(len(call) for call in model.calls) == submitted_rows[0]
+    
+    # The same through a real predictor: the first call is held until every other request is queued,
+    # so the rest are merged into batches of max_rows and each thread still gets its own record's prediction
+    records = random_records(URRPredictionSerializer, 48, seed=31)
+    loaded = model_manager.get_loaded('urr')
+    expected = urr_predictor._predict_loaded(loaded, records)
+    configure_micro_batching(['urr'], window_ms=2, max_rows=8)
+    try:
+        batcher = urr_predictor.batcher
+        all_queued = threading.Event()
+        
+        def held_predict(snapshot, batch):
+            all_queued.wait(5)
+            return urr_predictor._predict_loaded(snapshot, batch)
+        
+        batcher.predict_loaded = held_predict
+        results = [None] * len(records)
+        
+        def predict(index):
+            results[index] = urr_predictor.predict_batch([records[index]])[0]
+        
+        threads = [threading.Thread(target=predict, args=(index,)) for index in range(len(records))]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: len(batcher._queue) == len(records) - 1)
+        all_queued.set()
+        for thread in threads:
+            thread.join(60)
+        urr_stats = batcher.stats()
+    finally:
+        configure_micro_batching(settings.ML_MICRO_BATCH_MODELS, settings.ML_MICRO_BATCH_WINDOW_MS,
+                                 settings.ML_MICRO_BATCH_MAX_ROWS)
+    assert urr_stats['batches'] == 1 + (len(records) - 1 + 7) // 8 and urr_stats['max_batch_size'] == 8, urr_stats
+    
+    def without_date(result):
+        return {key: value for key, value in result.to_dict().items() if key != 'prediction_date'}
+    
+    for index, result in enumerate(results):
+        assert without_date(result) == without_date(expected[index]), index
+    print(f"✅ {len(threads)} concurrent urr requests in {urr_stats['batches']} model calls, each with its own result; "
+          f"fake model: {stats['requests']} requests in {stats['batches']} batches")
+
+
+if __name__ == "__main__":
+    test_idle_request()
+    test_hand_off()
+    test_limits()
+    test_concurrent_callers()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for model preloading at startup
+Starts Django in fresh interpreters and checks that with ML_PRELOAD_MODELS
+every model is loaded and warmed up during django.setup(), with its load and
+warm-up timings reported by /api/ml/health/, that without it (the default)
+nothing is loaded, and that gunicorn.conf.py turns preloading on
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter: django.setup() (and with it MlModelsConfig.ready) then one health check
+HEALTH_SCRIPT = """
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+import django
+start = time.perf_counter()
+django.setup()
+setup_ms = (time.perf_counter() - start) * 1000
+from django.test import Client
+health = Client(HTTP_HOST='localhost').get('/api/ml/health/').json()
+print(json.dumps({'setup_ms': setup_ms, 'models': health['models']}))
+"""
+
+
+def health_after_setup(**env):
+    """/api/ml/health/ models section of a fresh process started with the given environment"""
+    environment = {key: value for key, value in os.environ.items() if not key.startswith('ML_')}
+    environment.update(env)
+    output = subprocess.run([sys.executable, '-c', HEALTH_SCRIPT], cwd=BASE_DIR, env=environment,
+                            capture_output=True, text=True, timeout=300, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_preload_timings():
+    """With ML_PRELOAD_MODELS every model is loaded and warmed up before the first request"""
+    print("🧪 Testing Model Preloading")
+    print("=" * 50)
+    
+    result = health_after_setup(ML_PRELOAD_MODELS='True')
+    for model_name, status in result['models'].items():
+        if not os.path.exists(os.path.join(BASE_DIR, 'ml_models', 'models', f'{model_name}_model.pkl')):
+            print(f"⚠️ {model_name}: model file missing, skipped")
+            continue
+        assert status['loaded'] and status['version'] != 'unknown', (model_name, status)
+        assert status['load_time_ms'] > 0 and status['warmup_time_ms'] > 0, (model_name, status)
+        print(f"✅ {model_name}: loaded in {status['load_time_ms']:.1f} ms, warmed up in {status['warmup_time_ms']:.1f} ms")
+    
+    result = health_after_setup(ML_PRELOAD_MODELS='True', ML_WARMUP_MODELS='False')
+    assert all(status['warmup_time_ms'] is None for status in result['models'].values()), result
+    print("✅ ML_WARMUP_MODELS=False loads the models without a warm-up prediction")
+
+
+def test_preload_off_by_default():
+    """Without ML_PRELOAD_MODELS django.setup() loads nothing, so manage.py commands stay fast"""
+    result = health_after_setup()
+    for model_name, status in result['models'].items():
+        assert not status['loaded'] and status['load_time_ms'] is None, (model_name, status)
+    print(f"✅ Nothing preloaded by default (django.setup() took {result['setup_ms']:.0f} ms)")
+    
+    script = ("import os, runpy; runpy.run_path('gunicorn.conf.py'); "
+              "print(os.environ['ML_PRELOAD_MODELS'], os.environ['OMP_NUM_THREADS'])")
+    environment = {key: value for key, value in os.environ.items() if key not in ('ML_PRELOAD_MODELS', 'OMP_NUM_THREADS')}
+    output = subprocess.run([sys.executable, '-c', script], cwd=BASE_DIR, env=environment,
+                            capture_output=True, text=True, timeout=60, check=True).stdout
+    assert output.split() == ['True', '1'], output
+    print("✅ gunicorn.conf.py turns preloading on for the server")
+
+
+if __name__ == "__main__":
+    test_preload_timings()
+    test_preload_off_by_default()
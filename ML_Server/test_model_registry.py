@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test script for the model registry
+Works on a copy of the URR model in a temporary directory and checks that
+concurrent first loads unpickle the model only once, that a reload swaps in
+the new artifact while a request holding the old snapshot finishes on it, that
+a bad artifact is rejected while the old model keeps serving, and that the file
+watcher picks up a changed file
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+import joblib
+
+from ml_models import services
+from ml_models.services import MLModelManager, URRPredictor
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_models', 'models')
+
+
+def temp_manager(directory):
+    """A manager serving a copy of the URR model from `directory`"""
+    path = os.path.join(directory, 'urr_model.pkl')
+    shutil.copyfile(os.path.join(MODELS_DIR, 'urr_model.pkl'), path)
+    manager = MLModelManager()
+    manager.model_paths = {'urr': path}
+    manager._init_locks()
+    return manager, path
+
+
+def write_variant(model, path):
+    """Write the same model with a different compression, so the file content (and hash) changes"""
+    staging = path + '.new'
+    joblib.dump(model, staging, compress=3)
+    os.replace(staging, path)
+
+
+def test_single_flight_load():
+    """Concurrent first requests unpickle the model once and share it"""
+    print("🧪 Testing Model Registry")
+    print("=" * 50)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        manager, _ = temp_manager(directory)
+        real_load = joblib.load
+        
+        def slow_load(path):
+            time.sleep(0.2)
+            return real_load(path)
+        
+        barrier = threading.Barrier(8)
+        models = []
+        
+        def first_request():
+            barrier.wait()
+            models.append(manager.load_model('urr'))
+        
+        with mock.patch.object(joblib, 'load', side_effect=slow_load) as load:
+            threads = [threading.Thread(target=first_request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        assert load.call_count == 1, load.call_count
+        assert len(models) == 8 and all(model is models[0] for model in models)
+    print("✅ 8 concurrent first loads unpickled the model once")
+
+
+def test_reload_keeps_inflight_snapshot():
+    """A reload swaps in the new hash; a request already scoring finishes on the old snapshot"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager, path = temp_manager(directory)
+        predictor = URRPredictor(manager)
+        old = manager.get_loaded('urr')
+        
+        unchanged = manager.reload_model('urr')
+        assert not unchanged['reloaded'] and manager.get_loaded('urr') is old
+        
+        in_model = threading.Event()
+        release = threading.Event()
+        real_predict_proba = services._predict_proba
+        
+        def blocking_predict_proba(model, *args, **kwargs):
+            if model is old.model:
+                in_model.set()
+                release.wait(10)
+            return real_predict_proba(model, *args, **kwargs)
+        
+        results = []
+        write_variant(old.model, path)
+        with mock.patch.object(services, '_predict_proba', side_effect=blocking_predict_proba):
+            request = threading.Thread(target=lambda: results.append(predictor.predict(URRPredictor.warmup_record)))
+            request.start()
+            assert in_model.wait(10)
+            
+            outcome = manager.reload_model('urr')
+            release.set()
+            request.join()
+        
+        new = manager.get_loaded('urr')
+        assert outcome['reloaded'] and outcome['previous_version'] == old.model_version, outcome
+        assert new is not old and new.content_hash != old.content_hash
+        assert outcome['model_version'] == new.model_version
+        assert results[0].model_version == old.model_version, results
+        assert predictor.predict(URRPredictor.warmup_record).model_version == new.model_version
+        
+        forced = manager.reload_model('urr', force=True)
+        assert forced['reloaded'] and forced['model_version'] == new.model_version
+    print("✅ Reload swapped in a new hash while the in-flight request finished on the old one")
+
+
+def test_bad_artifact_rejected():
+    """A corrupt file or a model that fails validation never replaces the served model"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager, path = temp_manager(directory)
+        predictor = URRPredictor(manager)
+        old = manager.get_loaded('urr')
+        expected = predictor.predict(URRPredictor.warmup_record)
+        
+        with open(path, 'wb') as f:
+            f.write(b'not a pickle')
+        try:
+            manager.reload_model('urr')
+            raise AssertionError("corrupt artifact was accepted")
+        except ValueError as e:
+            assert 'Failed to load model' in str(e), e
+        
+        # Unpickles fine, but cannot score the validation record
+        joblib.dump({'weights': [1.0]}, path)
+        try:
+            manager.reload_model('urr')
+            raise AssertionError("invalid model was accepted")
+        except ValueError as e:
+            assert 'does not support probability predictions' in str(e), e
+        
+        assert manager.get_loaded('urr') is old
+        result = predictor.predict(URRPredictor.warmup_record)
+        assert result.model_version == old.model_version
+        assert result.risk_probability == expected.risk_probability
+    print("✅ Corrupt and invalid artifacts rejected, the old model keeps serving")
+
+
+def test_watcher_picks_up_changes():
+    """The file watcher reloads a changed file and ignores a broken one"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager, path = temp_manager(directory)
+        URRPredictor(manager)
+        old = manager.get_loaded('urr')
+        manager.start_watcher(0.05)
+        try:
+            with open(path, 'wb') as f:
+                f.write(b'half-written artifact')
+            time.sleep(0.5)
+            assert manager.get_loaded('urr') is old
+            
+            write_variant(old.model, path)
+            deadline = time.monotonic() + 10
+            while manager.get_loaded('urr') is old and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            manager.stop_watcher()
+        
+        new = manager.get_loaded('urr')
+        assert new is not old and new.content_hash != old.content_hash
+        assert new.content_hash == services._file_sha256(path)
+    print("✅ Watcher ignored a broken file and reloaded the changed one")
+
+
+if __name__ == "__main__":
+    test_single_flight_load()
+    test_reload_keeps_inflight_snapshot()
+    test_bad_artifact_rejected()
+    test_watcher_picks_up_changes()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test script for the native model artifacts
+Exports copies of the URR and Hb models into a temporary models directory and
+checks that MLModelManager loads the manifest rather than the pickle, that the
+predictions equal those of the pickled models, that the compiled arrays are
+read-only memory maps, and that the pickle is used again once the manifest is
+missing or broken
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+import joblib
+import numpy as np
+from rest_framework import serializers
+
+from ml_models.artifacts import MANIFEST_NAME, NativeClassifier, export_native_artifact
+from ml_models.features import HB_SCHEMA, URR_SCHEMA
+from ml_models.serializers import HbPredictionSerializer, URRPredictionSerializer
+from ml_models.services import HbPredictor, MLModelManager, URRPredictor
+from ml_models.tree_engine import CompiledForest
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_models', 'models')
+
+MODELS = [
+    ('urr', URR_SCHEMA, URRPredictor, URRPredictionSerializer),
+    ('hb', HB_SCHEMA, HbPredictor, HbPredictionSerializer),
+]
+
+
+def random_records(serializer_class, count, seed):
+    """Valid records drawn from the serializer ranges (dates left out)"""
+    rng = random.Random(seed)
+    return [{name: rng.uniform(field.min_value, field.max_value) if isinstance(field, serializers.FloatField)
+             else f'NATIVE_{index:03d}' for name, field in serializer_class().fields.items()
+             if not isinstance(field, serializers.DateField)}
+            for index in range(count)]
+
+
+def temp_manager(directory, prefer_native=True, backend='compiled'):
+    """A manager serving the URR and Hb pickles copied to `directory`"""
+    manager = MLModelManager()
+    manager.model_paths = {model_name: os.path.join(directory, f'{model_name}_model.pkl') for model_name, *_ in MODELS}
+    manager.prefer_native = prefer_native
+    manager.configure_backends({'urr': backend, 'hb': backend})
+    manager._init_locks()
+    predictors = {model_name: predictor_class(manager) for model_name, _, predictor_class, _ in MODELS}
+    return manager, predictors
+
+
+def export(directory):
+    """Export every copied pickle next to it, as the export_native_models command does"""
+    for model_name, schema, *_ in MODELS:
+        source_path = os.path.join(directory, f'{model_name}_model.pkl')
+        export_native_artifact(model_name, joblib.load(source_path), os.path.join(directory, model_name),
+                               MLModelManager.DEFAULT_VERSION, features=schema.feature_names, source_path=source_path)
+
+
+def comparable(results):
+    """Results without the fields that differ between two loads of the same model"""
+    return [{key: value for key, value in result.to_dict().items() if key not in ('model_version', 'prediction_date')}
+            for result in results]
+
+
+def test_manifest_preferred():
+    """A model with a manifest is loaded from it, and scores exactly like its pickle"""
+    print("🧪 Testing Native Artifacts")
+    print("=" * 50)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        for model_name, *_ in MODELS:
+            shutil.copyfile(os.path.join(MODELS_DIR, f'{model_name}_model.pkl'),
+                            os.path.join(directory, f'{model_name}_model.pkl'))
+        export(directory)
+        
+        native, native_predictors = temp_manager(directory)
+        pickled, pickled_predictors = temp_manager(directory, prefer_native=False)
+        # The exported boosters themselves, without the compiled arrays
+        boosters, booster_predictors = temp_manager(directory, backend='native')
+        pickled_boosters, pickled_booster_predictors = temp_manager(directory, prefer_native=False, backend='native')
+        status = {}
+        for model_name, _, _, serializer_class in MODELS:
+            manifest_path = os.path.join(directory, model_name, MANIFEST_NAME)
+            assert native.get_artifact_path(model_name) == manifest_path
+            loaded = native.get_loaded(model_name)
+            assert loaded.path == manifest_path and pickled.get_loaded(model_name).path.endswith('.pkl')
+            status[model_name] = native.get_status()[model_name]
+            assert status[model_name]['format'] == 'native', status
+            assert pickled.get_status()[model_name]['format'] == 'pickle'
+            
+            records = random_records(serializer_class, 200, seed=len(model_name))
+            for artifact_predictors, pickle_predictors in ((native_predictors, pickled_predictors),
+                                                           (booster_predictors, pickled_booster_predictors)):
+                assert comparable(artifact_predictors[model_name].predict_batch(records)) == \
+                    comparable(pickle_predictors[model_name].predict_batch(records)), model_name
+                assert comparable([artifact_predictors[model_name].predict(records[0])]) == \
+                    comparable([pickle_predictors[model_name].predict(records[0])]), model_name
+        
+        urr = native.get_loaded('urr')
+        assert isinstance(urr.model, NativeClassifier) and isinstance(boosters.get_loaded('urr').model, NativeClassifier)
+        assert boosters.get_loaded('urr').compiled is None and pickled_boosters.get_loaded('hb').ensemble.fused is None
+        hb = native.get_loaded('hb')
+        assert all(isinstance(member, NativeClassifier) for member in hb.ensemble.members)
+        assert hb.ensemble.weights == list(joblib.load(native.get_model_path('hb'))['weights'])
+        formats = ', '.join(f"{name}={entry['format']}" for name, entry in status.items())
+        print(f"✅ Manifests preferred over the pickles (health format: {formats}), "
+              f"200 random records per model give the pickle predictions on both backends")
+        
+        # The compiled arrays come straight from the .npy files, mapped read-only
+        forests = {'urr': urr.compiled, 'hb (fused)': hb.ensemble.fused.merged}
+        for label, forest in forests.items():
+            assert isinstance(forest, CompiledForest), label
+            for array in (forest.feature, forest.threshold, forest.children, forest.leaf_value):
+                assert isinstance(array, np.memmap) and array.mode == 'r', label
+                assert not array.flags.writeable, label
+        try:
+            urr.compiled.leaf_value[0] = 0.0
+            raise AssertionError("memory-mapped artifact array was writable")
+        except ValueError:
+            pass
+        print(f"✅ Compiled arrays of {', '.join(forests)} are read-only np.memmap views of the .npy files")
+
+
+def test_pickle_fallback():
+    """Without a usable manifest the model is loaded from its pickle"""
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copyfile(os.path.join(MODELS_DIR, 'urr_model.pkl'), os.path.join(directory, 'urr_model.pkl'))
+        shutil.copyfile(os.path.join(MODELS_DIR, 'hb_model.pkl'), os.path.join(directory, 'hb_model.pkl'))
+        export(directory)
+        manifest_path = os.path.join(directory, 'urr', MANIFEST_NAME)
+        manager, predictors = temp_manager(directory)
+        record = random_records(URRPredictionSerializer, 1, seed=3)[0]
+        expected = comparable([predictors['urr'].predict(record)])
+        assert manager.get_loaded('urr').path == manifest_path
+        
+        # A manifest whose booster no longer matches its checksum is rejected in favour of the pickle
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest['members']['model']['sha256'] = '0' * 64
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        outcome = manager.reload_model('urr')
+        assert outcome['reloaded'] and manager.get_loaded('urr').path == manager.get_model_path('urr'), outcome
+        assert manager.get_status()['urr']['format'] == 'pickle'
+        
+        os.remove(manifest_path)
+        fresh, fresh_predictors = temp_manager(directory)
+        assert fresh.get_artifact_path('urr') == fresh.get_model_path('urr')
+        assert fresh.get_loaded('urr').path == fresh.get_model_path('urr')
+        assert comparable([fresh_predictors['urr'].predict(record)]) == expected
+        assert fresh.get_loaded('hb').path == os.path.join(directory, 'hb', MANIFEST_NAME)
+        print("✅ Broken and missing manifests fall back to the pickle with the same predictions")
+
+
+if __name__ == "__main__":
+    test_manifest_preferred()
+    test_pickle_fallback()
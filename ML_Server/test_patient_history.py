@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Test script for the patient history store
+Checks the in-memory ring buffers against the rolling windows computed with
+pandas, that server processes see each other's records through the shared
+SQLite file, and that predictions with only a patient_id and the new values
+match predictions with the history inputs given explicitly
+"""
+
+import importlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DIR = tempfile.mkdtemp(prefix='ml_history_test_')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ['ML_HISTORY_DB'] = os.path.join(HISTORY_DIR, 'api.sqlite3')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+from django.test import Client
+
+from ml_models.benchmark import mint_token
+from ml_models.history import HISTORY_INPUTS, MONTHLY_STREAM, SESSION_STREAM, PatientHistoryStore, patient_history
+
+URR_PAYLOAD = {
+    'albumin': 38, 'hb': 10.5, 's_ca': 2.2, 'serum_na_pre_hd': 136, 'urr': 66,
+    'serum_k_pre_hd': 5.6, 'serum_k_post_hd': 3.5, 'bu_pre_hd': 25, 'bu_post_hd': 8, 'scr_pre_hd': 800, 'scr_post_hd': 300,
+}
+HB_PAYLOAD = {
+    'albumin': 35.2, 'bu_post_hd': 8.5, 'bu_pre_hd': 25.3, 's_ca': 2.3, 'scr_post_hd': 450, 'scr_pre_hd': 890,
+    'serum_k_post_hd': 3.8, 'serum_k_pre_hd': 5.2, 'serum_na_pre_hd': 138, 'ua': 6.8, 'hb': 9.5,
+}
+
+
+def expected_value(history_input, records, current, before):
+    """The history input computed with pandas from every pushed record (latest push per date wins)"""
+    frame = pd.DataFrame(records, columns=['recorded_at', 'value']).drop_duplicates('recorded_at', keep='last')
+    frame = frame.sort_values('recorded_at')
+    if before is not None:
+        frame = frame[frame['recorded_at'] < before]
+    values = pd.concat([frame['value'].astype(float), pd.Series([current])], ignore_index=True)
+    if history_input.kind == 'diff':
+        value = (values - values.shift(1)).iloc[-1]
+    else:
+        value = values.rolling(history_input.stream.window + 1, min_periods=1).mean().iloc[-1]
+    return None if np.isnan(value) else value
+
+
+def test_rolling_windows():
+    """Ring buffers and rolling sums match pandas for random, late and replaced records"""
+    print("🧪 Testing Patient History Windows")
+    print("=" * 50)
+    
+    rng = random.Random(11)
+    store = PatientHistoryStore()
+    store.configure(os.path.join(HISTORY_DIR, 'windows.sqlite3'))
+    pushed = {}
+    start = date(2024, 1, 1)
+    for _ in range(40):
+        records = []
+        for _ in range(rng.randint(1, 25)):
+            patient_id = f'P{rng.randint(0, 9)}'
+            recorded_at = start + timedelta(days=rng.randint(0, 60))
+            record = {'patient_id': patient_id, 'recorded_at': recorded_at,
+                      'weight_gain': rng.choice([None, round(rng.uniform(0, 5), 2)]),
+                      'sys': round(rng.uniform(100, 180), 1), 'hb': round(rng.uniform(7, 13), 1),
+                      'urr': rng.choice([None, round(rng.uniform(50, 80), 3)])}
+            records.append(record)
+        stream = rng.choice([SESSION_STREAM, MONTHLY_STREAM])
+        for record in records:
+            store.push(stream, [record])
+        for record in records:
+            pushed.setdefault((record['patient_id'], stream.name), []).append(record)
+    
+    checked = 0
+    for model_name in ('dry_weight', 'urr', 'hb'):
+        for history_input in HISTORY_INPUTS[model_name]:
+            for patient in range(10):
+                records = pushed.get((f'P{patient}', history_input.stream.name), [])
+                if not records:
+                    continue
+                latest = max(record['recorded_at'] for record in records)
+                source = [(record['recorded_at'].isoformat(), record[history_input.source]) for record in records]
+                # A new record, and the latest record predicted again (its own push is not history)
+                for recorded_at in (None, latest + timedelta(days=1), latest):
+                    current = round(rng.uniform(1, 5), 2)
+                    data = {'patient_id': f'P{patient}', history_input.source: current}
+                    if recorded_at is not None:
+                        data['recorded_at'] = recorded_at
+                    validated, errors = [data], [None]
+                    store.complete_many(model_name, validated, errors)
+                    expected = expected_value(history_input, source, current,
+                                              recorded_at.isoformat() if recorded_at is not None else None)
+                    if expected is None:
+                        assert validated[0] is None or validated[0].get(history_input.name) is None
+                    else:
+                        assert validated[0] is not None, errors[0]
+                        assert abs(validated[0][history_input.name] - expected) < 1e-9, (history_input.name, expected)
+                    checked += 1
+    print(f"✅ {checked} history inputs match the pandas rolling windows")
+
+
+def test_shared_database():
+    """A second server process sees the first one's records, also after a restart"""
+    path = os.path.join(HISTORY_DIR, 'shared.sqlite3')
+    first, second = PatientHistoryStore(), PatientHistoryStore()
+    first.configure(path)
+    second.configure(path)
+    
+    first.push(MONTHLY_STREAM, [{'patient_id': 'S1', 'recorded_at': date(2024, 1, 1), 'hb': 9.0, 'urr': 60.0}])
+    data, errors = second.complete('hb', {'patient_id': 'S1', 'hb': 10.0})
+    assert not errors and abs(data['hb_diff'] - 1.0) < 1e-9
+    second.push(MONTHLY_STREAM, [{'patient_id': 'S1', 'recorded_at': date(2024, 2, 1), 'hb': 9.5, 'urr': 62.0}])
+    data, errors = first.complete('urr', {'patient_id': 'S1', 'urr': 65.0})
+    assert not errors and abs(data['urr_diff'] - 3.0) < 1e-9
+    
+    restarted = PatientHistoryStore()
+    restarted.configure(path)
+    assert restarted.patient('S1')['monthly'] == [
+        {'recorded_at': '2024-01-01', 'hb': 9.0, 'urr': 60.0}, {'recorded_at': '2024-02-01', 'hb': 9.5, 'urr': 62.0}
+    ]
+    print("✅ Records pushed by one store are used by another store on the same database")
+
+
+def test_history_api():
+    """Push records over the API and predict with only the patient_id and the new values"""
+    # By default the store has a file of its own, not Django's database, whose schema belongs to the migrations
+    with mock.patch.dict(os.environ, {'ML_HISTORY_DB': ''}):
+        defaults = importlib.reload(importlib.import_module('ml_server.settings'))
+    assert os.path.basename(defaults.ML_HISTORY_DB) == 'ml_history.sqlite3'
+    assert os.path.abspath(defaults.ML_HISTORY_DB) != os.path.abspath(defaults.DATABASES['default']['NAME'])
+    importlib.reload(defaults)
+    
+    # The API store on its own file (the settings may have been loaded before ML_HISTORY_DB was set)
+    patient_history.configure(os.path.join(HISTORY_DIR, 'api.sqlite3'))
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {mint_token(os.environ['JWT_SECRET'])}", HTTP_HOST='localhost')
+    
+    def post(path, body):
+        response = client.post(path, json.dumps(body), content_type='application/json')
+        return response.status_code, response.json()
+    
+    code, body = post('/api/ml/history/monthly/', {'records': [
+        {'patient_id': 'API-1', 'recorded_at': '2024-01-01', 'hb': 9.1, 'bu_pre_hd': 24.0, 'bu_post_hd': 8.4},
+        {'patient_id': 'API-1', 'recorded_at': '2024-02-01', 'hb': 9.8, 'urr': 64.0},
+    ]})
+    assert code == 201 and body == {'stream': 'monthly', 'stored': 2}, body
+    code, body = post('/api/ml/history/sessions/', {'records': [
+        {'patient_id': 'API-1', 'recorded_at': '2024-02-03', 'weight_gain': 2.0, 'sys': 150},
+        {'patient_id': 'API-1', 'recorded_at': '2024-02-05', 'weight_gain': 3.0, 'sys': 130},
+    ]})
+    assert code == 201 and body['stored'] == 2, body
+    print("✅ Session and monthly records stored")
+    
+    for path, payload, history in (
+        ('/api/ml/predict/urr/', URR_PAYLOAD, {'urr_diff': 66 - 64.0}),
+        ('/api/ml/predict/hb/', HB_PAYLOAD, {'hb_diff': 9.5 - 9.8}),
+    ):
+        code, from_history = post(path, {**payload, 'patient_id': 'API-1'})
+        assert code == 200, from_history
+        code, explicit = post(path, {**payload, 'patient_id': 'API-1', **history})
+        assert code == 200, explicit
+        for response in (from_history, explicit):
+            response.pop('prediction_date')
+        assert from_history == explicit, (from_history, explicit)
+        
+        code, body = post(path, {**payload, 'patient_id': 'NO-HISTORY'})
+        assert code == 400 and list(body['details']) == list(history), body
+        
+        code, body = post(path + 'batch/', {'records': [
+            {**payload, 'patient_id': 'NO-HISTORY'}, {**payload, 'patient_id': 'API-1'}
+        ]})
+        assert code == 200 and body['succeeded'] == 1 and body['errors'][0]['index'] == 0, body
+        print(f"✅ {path}: history inputs filled in from the store; missing history rejected")
+    
+    dry_weight = {'patient_id': 'API-1', 'ap': -120, 'auf': 2500, 'bfr': 350, 'hd_duration': 4, 'puf': 2800, 'tmp': 150,
+                  'vp': 80, 'weight_gain': 2.5, 'sys': 145, 'dia': 85, 'pre_hd_weight': 72.5, 'post_hd_weight': 70,
+                  'dry_weight': 70}
+    code, from_history = post('/api/ml/predict/dry-weight/', dry_weight)
+    code, explicit = post('/api/ml/predict/dry-weight/', {**dry_weight, 'weight_gain_avg_3': 2.5, 'sys_avg_3': 425 / 3})
+    for response in (from_history, explicit):
+        response.pop('prediction_date')
+    assert from_history == explicit, (from_history, explicit)
+    print("✅ Dry weight rolling averages taken from the session history")
+    
+    history = client.get('/api/ml/history/API-1/').json()
+    assert history['monthly'][0] == {'recorded_at': '2024-01-01', 'hb': 9.1, 'urr': 65.0}, history
+    assert len(history['session']) == 2
+    
+    # Filling in the history inputs costs a dictionary lookup per record
+    validated = [{'patient_id': 'API-1', **HB_PAYLOAD} for _ in range(500)]
+    started = time.perf_counter()
+    patient_history.complete_many('hb', validated, [None] * len(validated))
+    elapsed = time.perf_counter() - started
+    print(f"✅ Filled in hb_diff for {len(validated)} records in {elapsed * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    test_rolling_windows()
+    test_shared_database()
+    test_history_api()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Test script for the prediction cache
+Checks LRU eviction, TTL expiry and the hit/miss counters with a fake clock,
+single-flight de-duplication and error hand-off between concurrent callers,
+that a new model version is never answered from the old version's entries,
+and that a cached response differs from a fresh one only in prediction_date
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+import jwt
+from django.test import Client
+from rest_framework import serializers
+
+from ml_models.cache import PredictionCache
+from ml_models.serializers import URRPredictionSerializer
+from ml_models.services import _predict_cached, model_manager, prediction_cache, urr_predictor
+
+THREADS = 16
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+def random_records(serializer_class, count, seed):
+    """Valid records with every numeric field drawn from its serializer range (dates left out)"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        record = {}
+        for name, field in serializer_class().fields.items():
+            if isinstance(field, serializers.FloatField):
+                record[name] = round(rng.uniform(field.min_value, field.max_value), 2)
+            elif isinstance(field, serializers.CharField):
+                record[name] = f'CACHE_{index:03d}'
+        records.append(record)
+    return records
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def test_lru_and_ttl():
+    """Least recently used entries are evicted first, expired ones recomputed, every lookup counted"""
+    print("🧪 Testing Prediction Cache")
+    print("=" * 50)
+    
+    clock = FakeClock()
+    cache = PredictionCache(max_entries=3, ttl=10.0, clock=clock)
+    computed = []
+    
+    def get(key):
+        return cache.get(key, lambda: computed.append(key) or f"value-{key}")
+    
+    for key in 'abc':
+        assert get(key) == f"value-{key}"
+    assert get('a') == 'value-a'  # a becomes the most recently used
+    get('d')  # evicts b, the least recently used
+    assert computed == ['a', 'b', 'c', 'd']
+    get('a'), get('c'), get('d')
+    get('b')
+    assert computed == ['a', 'b', 'c', 'd', 'b']
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses'], stats['evictions']) == (3, 4, 5, 2), stats
+    assert stats['hit_rate'] == round(4 / 9, 3)
+    
+    clock.now += 9.999
+    get('d')
+    assert computed[-1] == 'b'
+    clock.now += 0.001
+    get('d')
+    assert computed[-1] == 'd' and cache.stats()['expirations'] == 1
+    
+    forever = PredictionCache(max_entries=2, ttl=0, clock=clock)
+    forever.get('k', lambda: 1)
+    clock.now += 10 ** 9
+    assert forever.get('k', lambda: 2) == 1
+    
+    disabled = PredictionCache(max_entries=0)
+    assert [disabled.get('k', lambda: value) for value in (1, 2)] == [1, 2] and disabled.stats()['size'] == 0
+    
+    # Duplicate keys of one batch are computed once, and only the missing ones are passed on
+    batches = []
+    cache.get('a', lambda: 'value-a')
+    values = cache.get_many(['x', 'a', 'x', 'y'], lambda indexes: batches.append(indexes) or [f"v{index}" for index in indexes])
+    assert batches == [[0, 3]] and values == ['v0', 'value-a', 'v0', 'v3']
+    assert cache.stats()['coalesced'] == 1
+    cache.clear()
+    assert cache.stats()['size'] == 0 and cache.stats()['hits'] == 0
+    print("✅ LRU eviction, TTL expiry (and ttl=0), counters and in-batch de-duplication")
+
+
+def test_single_flight():
+    """Concurrent identical lookups run one computation; its value or error reaches every waiter"""
+    cache = PredictionCache(max_entries=100, ttl=0)
+    release = threading.Event()
+    calls = []
+    
+    def compute():
+        calls.append(threading.get_ident())
+        release.wait(5)
+        return object()
+    
+    results = [None] * THREADS
+    
+    def worker(position):
+        results[position] = cache.get('same', compute)
+    
+    threads = [threading.Thread(target=worker, args=(position,)) for position in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    # Every follower is waiting on the leader's flight before the leader finishes
+    wait_until(lambda: cache.stats()['coalesced'] == THREADS - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and all(result is results[0] for result in results)
+    assert cache.stats()['misses'] == 1
+    
+    # A failing computation is raised to every waiter and not cached
+    failing = threading.Event()
+    
+    def compute_error():
+        failing.wait(5)
+        raise RuntimeError('model failed')
+    
+    errors = []
+    
+    def failing_worker():
+        try:
+            cache.get('broken', compute_error)
+        except RuntimeError as e:
+            errors.append(str(e))
+    
+    coalesced = cache.stats()['coalesced']
+    threads = [threading.Thread(target=failing_worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: cache.stats()['coalesced'] == coalesced + THREADS - 1)
+    failing.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ['model failed'] * THREADS
+    assert cache.get('broken', lambda: 'recovered') == 'recovered'
+    
+    # Overlapping batches in opposite orders cannot deadlock, and each key is computed once
+    computed = []
+    lock = threading.Lock()
+    
+    def compute_many(keys):
+        def compute(indexes):
+            time.sleep(0.005)
+            with lock:
+                computed.extend(keys[index] for index in indexes)
+            return [keys[index].upper() for index in indexes]
+        return compute
+    
+    outputs = {}
+    
+    def batch_worker(name, keys):
+        outputs[name] = cache.get_many(keys, compute_many(keys))
+    
+    threads = [threading.Thread(target=batch_worker, args=('forward', ['p', 'q', 'r'])),
+               threading.Thread(target=batch_worker, args=('reverse', ['r', 'q', 'p']))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive(), 'overlapping batches deadlocked'
+    assert outputs == {'forward': ['P', 'Q', 'R'], 'reverse': ['R', 'Q', 'P']}
+    assert sorted(computed) == ['p', 'q', 'r']
+    print(f"✅ Single flight: {THREADS} concurrent lookups, one computation; errors reach every waiter; "
+          f"overlapping batches finish")
+
+
+def test_concurrent_consistency():
+    """Under concurrent load with eviction every lookup gets its own key's value and is counted once"""
+    cache = PredictionCache(max_entries=20, ttl=0)
+    lookups_per_thread = 2000
+    failures = []
+    
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(lookups_per_thread):
+            keys = [rng.randrange(50) for _ in range(rng.randint(1, 5))]
+            values = cache.get_many(keys, lambda indexes: [('value', keys[index]) for index in indexes])
+            if values != [('value', key) for key in keys]:
+                failures.append((keys, values))
+    
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures, failures[:3]
+    stats = cache.stats()
+    assert stats['size'] <= 20 and stats['evictions'] == stats['misses'] - stats['size'], stats
+    print(f"✅ {len(threads)} threads x {lookups_per_thread} batches: every caller got its own keys' values "
+          f"({stats['hits']} hits, {stats['misses']} misses, {stats['coalesced']} coalesced)")
+
+
+def test_model_version_and_payloads():
+    """Entries are per model version, and a cached result is a fresh one with another prediction_date"""
+    cache = PredictionCache(max_entries=100, ttl=0)
+    records = random_records(URRPredictionSerializer, 5, seed=21)
+    loaded = model_manager.get_loaded('urr')
+    scored = []
+    
+    def predict_loaded(snapshot, batch):
+        scored.append((snapshot.model_version, len(batch)))
+        return urr_predictor._predict_loaded(snapshot, batch)
+    
+    first = _predict_cached(cache, loaded, urr_predictor.schema, records, predict_loaded)
+    second = _predict_cached(cache, loaded, urr_predictor.schema, records, predict_loaded)
+    fresh = urr_predictor._predict_loaded(loaded, records)
+    assert scored == [(loaded.model_version, 5)]
+    for cached, first_result, fresh_result in zip(second, first, fresh):
+        assert cached is not first_result and cached.prediction_date >= first_result.prediction_date
+        without_date = [{key: value for key, value in result.to_dict().items() if key != 'prediction_date'}
+                        for result in (cached, fresh_result)]
+        assert without_date[0] == without_date[1], without_date
+    
+    # Callers own their copies: changing one does not leak into later hits
+    second[0].risk_status = 'changed by a caller'
+    assert _predict_cached(cache, loaded, urr_predictor.schema, records[:1], predict_loaded)[0].risk_status != 'changed by a caller'
+    
+    # Another version of the model (a reload with new content) is scored, not served from the old entries
+    reloaded = model_manager._load_artifact('urr')
+    reloaded.version = '9.9.9'
+    results = _predict_cached(cache, reloaded, urr_predictor.schema, records, predict_loaded)
+    assert scored[-1] == (reloaded.model_version, 5) and reloaded.model_version != loaded.model_version
+    assert {result.model_version for result in results} == {reloaded.model_version}
+    _predict_cached(cache, loaded, urr_predictor.schema, records, predict_loaded)
+    assert len(scored) == 2
+    
+    # Through the API: the second identical request is a hit with the same body but the date
+    token = jwt.encode({'id': 'cache-test', 'role': 'doctor', 'exp': int(time.time()) + 3600},
+                       os.environ['JWT_SECRET'], algorithm='HS256')
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_HOST='localhost')
+    record = random_records(URRPredictionSerializer, 1, seed=22)[0]
+    hits = prediction_cache.stats()['hits']
+    bodies = [client.post('/api/ml/predict/urr/', json.dumps(record), content_type='application/json').json()
+              for _ in range(2)]
+    if prediction_cache.enabled:
+        assert prediction_cache.stats()['hits'] == hits + 1
+    dates = [body.pop('prediction_date') for body in bodies]
+    assert bodies[0] == bodies[1] and dates[1] >= dates[0]
+    print("✅ Entries keyed by model version; cached and fresh responses differ only in prediction_date")
+
+
+if __name__ == "__main__":
+    test_lru_and_ttl()
+    test_single_flight()
+    test_concurrent_consistency()
+    test_model_version_and_payloads()
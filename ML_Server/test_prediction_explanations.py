@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script for prediction explanations
+Checks that the contributions are the models' native TreeSHAP values on the
+probability scale (the Hb members combined with the bundle weights) and add
+up to the predicted risk probability, that batch explanations match single
+ones and are cached per feature row, and compares their cost with plain
+prediction
+"""
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+from django.test import Client
+
+from ml_models.benchmark import mint_token, synthetic_payloads
+from ml_models.explanations import _margin_contributions, probability_contributions
+from ml_models.serializers import DryWeightPredictionSerializer, HbPredictionSerializer, URRPredictionSerializer
+from ml_models.services import (
+    dry_weight_predictor, explanation_cache, hb_predictor, model_manager, prediction_cache, urr_predictor,
+)
+
+PREDICTORS = [
+    (dry_weight_predictor, DryWeightPredictionSerializer, 'change_probability'),
+    (urr_predictor, URRPredictionSerializer, 'risk_probability'),
+    (hb_predictor, HbPredictionSerializer, 'risk_probability'),
+]
+
+
+def total(explanation):
+    return explanation['base_probability'] + sum(item['contribution'] for item in explanation['contributions'])
+
+
+def test_native_contributions():
+    """Contributions follow the native TreeSHAP values and add up to the served probability"""
+    print("🧪 Testing Prediction Explanations")
+    print("=" * 50)
+    
+    X = hb_predictor.feature_builder.build(synthetic_payloads(HbPredictionSerializer, 200, seed=3))
+    ensemble = model_manager.get_loaded('hb').ensemble
+    combined, base = np.zeros((len(X), X.shape[1])), np.zeros(len(X))
+    for member, weight in zip(ensemble.members, ensemble.weights):
+        native = _margin_contributions(member, X)
+        margin = native.sum(axis=1)
+        assert np.allclose(margin, np.log(member.predict_proba(X)[:, 1] / member.predict_proba(X)[:, 0]), atol=1e-5)
+        contributions, member_base = probability_contributions(member, X)
+        # One scale per row: same signs and ranking as the log-odds contributions
+        ratios = contributions / np.where(native[:, :-1] == 0, np.nan, native[:, :-1])
+        assert np.all(np.nanmax(ratios, axis=1) - np.nanmin(ratios, axis=1) < 1e-9) and np.all(np.nanmin(ratios, axis=1) > 0)
+        combined += weight * contributions
+        base += weight * member_base
+    assert np.allclose(base + combined.sum(axis=1), ensemble.predict_positive(X), atol=1e-6)
+    print(f"✅ Hb members combined with weights {ensemble.weights}: contributions add up to the ensemble probability")
+    
+    for predictor, serializer_class, probability_field in PREDICTORS:
+        records = synthetic_payloads(serializer_class, 50, seed=3)
+        prediction_cache.clear()
+        explanation_cache.clear()
+        results = predictor.predict_batch(records, explain=True)
+        for result in results:
+            explanation = result.explanation
+            assert sorted(item['feature'] for item in explanation['contributions']) == sorted(predictor.schema.feature_names)
+            sizes = [abs(item['contribution']) for item in explanation['contributions']]
+            assert sizes == sorted(sizes, reverse=True)
+            assert abs(total(explanation) - getattr(result, probability_field)) < 2e-3, (total(explanation), result)
+        print(f"✅ {predictor.model_name}: base probability + contributions = {probability_field} for {len(results)} records")
+
+
+def test_explain_api():
+    """?explain=true adds the explanation to single and batch results; batches are explained in one cached call"""
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {mint_token(os.environ['JWT_SECRET'])}", HTTP_HOST='localhost')
+    
+    def post(path, body):
+        response = client.post(path, json.dumps(body), content_type='application/json')
+        return response.status_code, response.json()
+    
+    records = synthetic_payloads(HbPredictionSerializer, 40, seed=8)
+    prediction_cache.clear()
+    explanation_cache.clear()
+    code, plain = post('/api/ml/predict/hb/', records[0])
+    assert code == 200 and 'explanation' not in plain, plain
+    code, single = post('/api/ml/predict/hb/?explain=true', records[0])
+    assert code == 200 and single['risk_probability'] == plain['risk_probability']
+    assert list(single)[-1] == 'explanation'
+    code, body = post('/api/ml/predict/hb/?explain=maybe', records[0])
+    assert code == 400 and 'explain' in body['details'], body
+    
+    misses = explanation_cache.stats()['misses']
+    code, batch = post('/api/ml/predict/hb/batch/?explain=true', {'records': records})
+    assert code == 200 and batch['succeeded'] == len(records)
+    assert batch['results'][0]['explanation'] == single['explanation']
+    stats = explanation_cache.stats()
+    assert stats['misses'] - misses == len(records) - 1 and stats['hits'] >= 1, stats
+    code, again = post('/api/ml/predict/hb/batch/?explain=true', {'records': records})
+    assert [result['explanation'] for result in again['results']] == [result['explanation'] for result in batch['results']]
+    assert explanation_cache.stats()['hits'] - stats['hits'] == len(records)
+    print(f"✅ Batch of {len(records)} explained in one call, then served from the explanation cache")
+    
+    code, fast = post('/api/ml/predict/hb/?explain=true&latency_tier=fastest', records[0])
+    assert fast['latency_tier'] == 'fastest' and fast['explanation'] != single['explanation']
+    assert abs(total(fast['explanation']) - fast['risk_probability']) < 2e-3
+    top = ', '.join(f"{item['feature']} {item['contribution']:+.3f}" for item in single['explanation']['contributions'][:3])
+    print(f"✅ Latency tiers are explained with their own boosting rounds; top contributions: {top}")
+
+
+def test_explanation_overhead():
+    """Cost of explaining compared with plain prediction, uncached"""
+    for predictor, serializer_class, _ in PREDICTORS:
+        timings = {}
+        for rows, repeats in ((1, 20), (100, 5)):
+            records = synthetic_payloads(serializer_class, repeats * rows, seed=12)
+            for explain in (False, True):
+                prediction_cache.clear()
+                explanation_cache.clear()
+                started = time.perf_counter()
+                for start in range(0, len(records), rows):
+                    predictor.predict_batch(records[start:start + rows], explain=explain)
+                timings[rows, explain] = (time.perf_counter() - started) / repeats
+        print(f"✅ {predictor.model_name}: single record {timings[1, False] * 1000:.2f} -> {timings[1, True] * 1000:.2f} ms "
+              f"({timings[1, True] / timings[1, False]:.1f}x), batch of 100 {timings[100, False] * 1000:.1f} -> "
+              f"{timings[100, True] * 1000:.1f} ms ({timings[100, True] / timings[100, False]:.1f}x)")
+
+
+if __name__ == "__main__":
+    test_native_contributions()
+    test_explain_api()
+    test_explanation_overhead()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Test script for the declarative recommendation rules
+Checks that the vectorized rule tables give exactly the recommendations of the
+hand-written per-record rules they replaced, for batches and single records
+"""
+
+import math
+import os
+import random
+import sys
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+from rest_framework import serializers
+
+from ml_models.features import DRY_WEIGHT_SCHEMA, HB_SCHEMA, URR_SCHEMA
+from ml_models.history import HISTORY_INPUTS
+from ml_models.recommendations import DRY_WEIGHT_RULES, HB_RULES, URR_RULES
+from ml_models.serializers import DryWeightPredictionSerializer, HbPredictionSerializer, URRPredictionSerializer
+
+RECORDS_PER_MODEL = 5000
+SEED = 2024
+
+# Thresholds used by the rules: values exactly on them must take the same branch as before
+THRESHOLDS = [1.0, 2.1, 2.6, 3.0, 3.5, 5.5, 10, 12, 35, 65, 140, 200, 300]
+
+HISTORY_REQUIRED = {history_input.name for inputs in HISTORY_INPUTS.values() for history_input in inputs if history_input.required}
+
+
+# Reference implementation: the per-record rules of the predictors before the rule tables
+
+def legacy_dry_weight_recommendations(input_data: Dict[str, Any], will_change: bool) -> List[str]:
+    """Generate clinical recommendations based on dry weight prediction"""
+    recommendations = []
+    
+    # Main prediction recommendation
+    if will_change:
+        recommendations.append("⚠️ Dry weight adjustment predicted for next session")
+        recommendations.append("Monitor fluid status closely and reassess dry weight")
+    else:
+        recommendations.append("✅ Current dry weight appears stable")
+        recommendations.append("Continue with current dry weight target")
+    
+    # Clinical parameter recommendations
+    if input_data['sys'] > 140:
+        recommendations.append("High systolic BP detected - consider antihypertensive adjustment")
+    
+    if input_data['weight_gain'] > 3.0:
+        recommendations.append("Excessive interdialytic weight gain - patient education needed")
+    elif input_data['weight_gain'] < 1.0:
+        recommendations.append("Low weight gain - monitor for signs of volume depletion")
+    
+    # UFR recommendations
+    ufr = input_data['puf'] / (input_data['hd_duration'] * input_data['pre_hd_weight']) if (input_data['hd_duration'] * input_data['pre_hd_weight']) > 0 else 0
+    if ufr > 13:
+        recommendations.append("High UFR detected - risk of hypotension and cramping")
+    elif ufr < 10:
+        recommendations.append("Low UFR - consider longer treatment time if volume overloaded")
+    
+    # TMP recommendations
+    if input_data['tmp'] > 200:
+        recommendations.append("High transmembrane pressure - check for access issues")
+    
+    # Blood flow recommendations
+    if input_data['bfr'] < 300:
+        recommendations.append("Low blood flow rate - consider access evaluation")
+    
+    return recommendations
+
+
+
+def legacy_urr_recommendations(input_data: Dict[str, Any], at_risk: bool) -> List[str]:
+    """Generate clinical recommendations based on URR risk prediction"""
+    recommendations = []
+    current_urr = input_data['urr']
+    
+    # URR-specific recommendations
+    if at_risk:
+        recommendations.append("⚠️ Patient predicted to have inadequate URR next month")
+        if current_urr < 65:
+            recommendations.append("Current URR below target - dialysis inadequacy detected")
+            recommendations.append("Consider increasing treatment time or frequency")
+            recommendations.append("Evaluate vascular access function")
+        else:
+            recommendations.append("Monitor closely - risk of URR decline detected")
+            recommendations.append("Review dialysis prescription parameters")
+    else:
+        recommendations.append("✅ URR levels predicted to remain adequate")
+        recommendations.append("Continue current dialysis regimen")
+    
+    # Lab-based recommendations for URR optimization
+    if input_data['albumin'] < 35:
+        recommendations.append("Low albumin may affect dialysis efficiency - nutritional support needed")
+    
+    if input_data['hb'] < 10:
+        recommendations.append("Low hemoglobin - may impact dialysis tolerance and adequacy")
+    
+    # Access-related recommendations based on calculated differences
+    bu_diff = input_data['bu_pre_hd'] - input_data['bu_post_hd']
+    bu_reduction = (bu_diff / input_data['bu_pre_hd']) * 100 if input_data['bu_pre_hd'] > 0 else 0
+    
+    if bu_reduction < 65:
+        recommendations.append("Inadequate urea reduction - check access flow and dialyzer function")
+    
+    # Electrolyte balance recommendations
+    if input_data['serum_k_pre_hd'] > 5.5:
+        recommendations.append("High potassium - dietary counseling and dialysate adjustment needed")
+    
+    if input_data['s_ca'] < 2.1:
+        recommendations.append("Low calcium - consider calcium supplementation")
+    elif input_data['s_ca'] > 2.6:
+        recommendations.append("High calcium - review phosphate binders and vitamin D therapy")
+    
+    return recommendations
+
+
+
+def legacy_hb_recommendations(input_data: Dict[str, Any], at_risk: bool, current_hb: float) -> List[str]:
+    """Generate clinical recommendations based on risk prediction and lab values"""
+    recommendations = []
+    
+    # Risk-based recommendations
+    if at_risk:
+        recommendations.append("⚠️ Patient predicted to enter Hb risk zone next month")
+        if current_hb < 10:
+            recommendations.append("Current Hb below target - urgent intervention needed")
+            recommendations.append("Consider increasing EPO dose or iron supplementation")
+        elif current_hb > 12:
+            recommendations.append("Current Hb above target - risk of cardiovascular complications")
+            recommendations.append("Consider reducing EPO dose and monitor closely")
+        else:
+            recommendations.append("Monitor closely and consider preventive measures")
+    else:
+        recommendations.append("✅ Hb levels predicted to remain stable")
+        recommendations.append("Continue current treatment regimen")
+    
+    # Lab-based recommendations
+    if input_data['albumin'] < 35:
+        recommendations.append("Low albumin - nutritional counseling recommended")
+    
+    if input_data['s_ca'] < 2.1:
+        recommendations.append("Low calcium - consider calcium supplementation")
+    elif input_data['s_ca'] > 2.6:
+        recommendations.append("High calcium - review phosphate binders")
+    
+    if input_data['serum_k_pre_hd'] > 5.5:
+        recommendations.append("High potassium - dietary restriction advised")
+    elif input_data['serum_k_pre_hd'] < 3.5:
+        recommendations.append("Low potassium - monitor for arrhythmias")
+    
+    # Dialysis adequacy
+    bu_reduction = ((input_data['bu_pre_hd'] - input_data['bu_post_hd']) / input_data['bu_pre_hd']) * 100
+    if bu_reduction < 65:
+        recommendations.append("Inadequate dialysis - consider increasing treatment time/frequency")
+    
+    return recommendations
+
+
+
+def random_record(rng, serializer_class):
+    record = {}
+    for name, field in serializer_class().fields.items():
+        if isinstance(field, serializers.DateField):
+            continue
+        if not hasattr(field, 'min_value'):
+            record[name] = 'P%04d' % rng.randint(0, 9999)
+            continue
+        # History inputs are optional in the request but always reach the feature builder
+        if not field.required and name not in HISTORY_REQUIRED and rng.random() < 0.5:
+            continue
+        choice = rng.random()
+        if choice < 0.15:
+            record[name] = float(rng.choice(THRESHOLDS))
+        elif choice < 0.18:
+            record[name] = math.nan
+        else:
+            record[name] = round(rng.uniform(field.min_value, field.max_value), rng.choice([1, 2, 6]))
+    if 'puf' in record and rng.random() < 0.1:
+        # UFR exactly on its thresholds
+        record['puf'] = rng.choice([10, 13]) * record['hd_duration'] * record['pre_hd_weight']
+    if 'bu_pre_hd' in record and rng.random() < 0.1:
+        # Urea reduction exactly 65 %
+        record['bu_post_hd'] = record['bu_pre_hd'] * 0.35
+    return record
+
+
+MODELS = [
+    ('dry_weight', DryWeightPredictionSerializer, DRY_WEIGHT_SCHEMA, DRY_WEIGHT_RULES,
+     lambda record, predicted: legacy_dry_weight_recommendations(record, predicted)),
+    ('urr', URRPredictionSerializer, URR_SCHEMA, URR_RULES,
+     lambda record, predicted: legacy_urr_recommendations(record, predicted)),
+    ('hb', HbPredictionSerializer, HB_SCHEMA, HB_RULES,
+     lambda record, predicted: legacy_hb_recommendations(record, predicted, record['hb'])),
+]
+
+
+def test_recommendation_rules():
+    """Compare the rule tables with the reference rules on random, boundary and NaN inputs"""
+    print("🧪 Testing Recommendation Rules")
+    print("=" * 50)
+    
+    rng = random.Random(SEED)
+    for model_name, serializer_class, schema, rules, legacy in MODELS:
+        builder = schema.compile()
+        engine = rules.compile(schema)
+        records = [random_record(rng, serializer_class) for _ in range(RECORDS_PER_MODEL)]
+        predictions = [rng.randint(0, 1) for _ in records]
+        expected = [legacy(record, bool(prediction)) for record, prediction in zip(records, predictions)]
+        
+        # Whole batch in one pass
+        X, inputs = builder.build_with_inputs(records)
+        assert engine.evaluate(inputs, X, predictions) == expected
+        
+        # Single records
+        for record, prediction, recommendations in list(zip(records, predictions, expected))[:500]:
+            X, inputs = builder.build_with_inputs([record])
+            assert engine.evaluate(inputs, X, [prediction]) == [recommendations], (record, prediction)
+        
+        distinct = len({tuple(recommendations) for recommendations in expected})
+        print(f"✅ {model_name}: {len(records)} records identical ({distinct} distinct recommendation lists)")
+
+
+if __name__ == "__main__":
+    test_recommendation_rules()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test script for the structured request logs
+Checks that successful requests are sampled while errors are always logged,
+that logged fields are capped in size, that the request body is recorded only
+when JSON parsing fails, that the queueing handler drops records instead of
+blocking when its queue is full, and that ML_REQUEST_LOGGING switches the
+logs off
+"""
+
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+import jwt
+from django.test import Client, override_settings
+
+from ml_models.structured_logging import JSONFormatter, QueueingStreamHandler
+from ml_models.services import URRPredictor
+
+VALID_URR = dict(URRPredictor.warmup_record, patient_id='LOGGING_001')
+
+
+class CapturingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+    
+    def emit(self, record):
+        self.records.append(record)
+
+
+def logged_requests(requests, **overrides):
+    """Send (method, path, body) requests through a fresh middleware stack and return the logged fields"""
+    handler = CapturingHandler()
+    logger = logging.getLogger('ml_models.requests')
+    logger.addHandler(handler)
+    try:
+        with override_settings(**overrides):
+            token = jwt.encode({'id': 'logging-test', 'role': 'doctor', 'exp': int(time.time()) + 3600},
+                               os.environ['JWT_SECRET'], algorithm='HS256')
+            client = Client(HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_HOST='localhost')
+            for method, path, body in requests:
+                if method == 'GET':
+                    client.get(path)
+                else:
+                    client.post(path, body, content_type='application/json')
+    finally:
+        logger.removeHandler(handler)
+    return [record.fields for record in handler.records]
+
+
+def test_sampling():
+    """Successful requests are sampled, errors are always logged"""
+    print("🧪 Testing Request Logging")
+    print("=" * 50)
+    
+    requests = [('GET', '/api/ml/health/', None)] * 5 + [
+        ('POST', '/api/ml/predict/urr/', json.dumps(dict(VALID_URR, urr=500))),
+        ('GET', '/api/ml/does-not-exist/', None),
+    ]
+    fields = logged_requests(requests, ML_REQUEST_LOG_SAMPLE_RATE=0.0)
+    assert [entry['status'] for entry in fields] == [400, 404], fields
+    
+    fields = logged_requests(requests, ML_REQUEST_LOG_SAMPLE_RATE=1.0)
+    assert [entry['status'] for entry in fields] == [200] * 5 + [400, 404], fields
+    entry = fields[0]
+    assert entry['method'] == 'GET' and entry['path'] == '/api/ml/health/' and entry['duration_ms'] >= 0
+    assert entry['response_bytes'] > 0 and entry['user_id'] is None and entry['sample_rate'] == 1.0
+    assert fields[5]['user_id'] == 'logging-test' and fields[5]['request_bytes'] == len(requests[5][2])
+    
+    with mock.patch('ml_models.middleware.request_logging.random.random', side_effect=[0.1, 0.9, 0.3, 0.6, 0.2]):
+        fields = logged_requests(requests, ML_REQUEST_LOG_SAMPLE_RATE=0.5)
+    assert [entry['status'] for entry in fields] == [200, 200, 200, 400, 404], fields
+    
+    # Requests outside the ML API are not logged at all
+    assert logged_requests([('GET', '/admin/login/', None)], ML_REQUEST_LOG_SAMPLE_RATE=1.0) == []
+    print("✅ Successful requests sampled (0, 1 and 0.5), errors always logged")
+
+
+def test_body_only_on_parse_error():
+    """The body is recorded only when JSON parsing fails, and every field is capped"""
+    fields = logged_requests([
+        ('POST', '/api/ml/predict/urr/', json.dumps(VALID_URR)),
+        ('POST', '/api/ml/predict/urr/', json.dumps(dict(VALID_URR, albumin='high'))),
+        ('POST', '/api/ml/predict/urr/', '{"albumin": 38.0, oops'),
+    ], ML_REQUEST_LOG_SAMPLE_RATE=1.0)
+    assert [entry['status'] for entry in fields[:2]] == [200, 400] and fields[2]['status'] >= 400, fields
+    assert all('body' not in entry and 'parse_error' not in entry for entry in fields[:2]), fields
+    assert fields[2]['body'] == '{"albumin": 38.0, oops' and fields[2]['body_bytes'] == 22
+    assert not fields[2]['body_truncated'] and 'JSON parse error' in fields[2]['parse_error']
+    print("✅ Body recorded only for the request that failed JSON parsing")
+    
+    limit = 64
+    huge_body = '{"albumin": ' + 'x' * 10000
+    fields = logged_requests([
+        ('POST', '/api/ml/predict/urr/', huge_body),
+        ('GET', '/api/ml/' + 'a' * 5000 + '/', None),
+    ], ML_REQUEST_LOG_SAMPLE_RATE=1.0, ML_REQUEST_LOG_BODY_LIMIT=limit)
+    assert fields[0]['body'] == huge_body[:limit] and fields[0]['body_truncated'], fields[0]
+    assert fields[0]['body_bytes'] == fields[0]['request_bytes'] == len(huge_body)
+    assert len(fields[0]['parse_error']) <= limit
+    assert fields[1]['status'] == 404 and len(fields[1]['path']) == limit
+    for entry in fields:
+        line = JSONFormatter().format(logging.makeLogRecord({'name': 'ml_models.requests', 'msg': 'request',
+                                                             'fields': entry}))
+        assert len(line) < 3 * limit + 400, line
+    print(f"✅ Body, parse error and path capped to {limit} bytes (10 kB body, 5 kB path)")
+
+
+def test_queue_drops_when_full():
+    """A full queue drops records instead of blocking the request thread"""
+    release = threading.Event()
+    
+    class BlockingStream(io.StringIO):
+        def write(self, text):
+            release.wait(10)
+            return super().write(text)
+    
+    stream = BlockingStream()
+    handler = QueueingStreamHandler(stream=stream, maxsize=2)
+    handler.setFormatter(JSONFormatter())
+    logger = logging.getLogger('ml_models.requests.queue_test')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        start = time.perf_counter()
+        for index in range(50):
+            logger.warning('request', extra={'fields': {'index': index}})
+        elapsed = time.perf_counter() - start
+        # At most one record is being written by the listener and two are queued
+        assert 47 <= handler.dropped <= 48, handler.dropped
+        assert elapsed < 1.0, elapsed
+    finally:
+        release.set()
+        logger.removeHandler(handler)
+        handler.close()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(lines) == 50 - handler.dropped and lines[0]['index'] == 0, lines
+    print(f"✅ Full queue: {handler.dropped} of 50 records dropped in {elapsed * 1000:.1f} ms, "
+          f"{len(lines)} written once the stream recovered")
+
+
+def test_switch_off():
+    """ML_REQUEST_LOGGING=False logs nothing, not even errors or parse failures"""
+    fields = logged_requests([
+        ('GET', '/api/ml/health/', None),
+        ('POST', '/api/ml/predict/urr/', '{broken'),
+    ], ML_REQUEST_LOGGING=False, ML_REQUEST_LOG_SAMPLE_RATE=1.0)
+    assert fields == [], fields
+    print("✅ ML_REQUEST_LOGGING=False switches request logging off")
+
+
+if __name__ == "__main__":
+    test_sampling()
+    test_body_only_on_parse_error()
+    test_queue_drops_when_full()
+    test_switch_off()
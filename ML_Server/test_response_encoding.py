@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for the direct response encoder
+Checks that encoded prediction results are byte-identical to what the response
+serializers and DRF's JSONRenderer produce for the same payload
+"""
+
+import os
+import random
+import sys
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+
+from ml_models.encoding import encode_batch_response, encode_result, iter_batch_response
+from ml_models.results import DryWeightResult, HbResult, URRResult
+from ml_models.serializers import (
+    DryWeightBatchResultSerializer, DryWeightPredictionResponseSerializer, HbBatchResultSerializer,
+    HbPredictionResponseSerializer, URRBatchResultSerializer, URRPredictionResponseSerializer,
+)
+
+PATIENT_IDS = ['P001', 'Pé ü', 'quote " and \\ backslash', 'line\u2028separator\u2029', 'tab\tand\x01control', '⚠️ emoji']
+RECOMMENDATIONS = ["⚠️ Patient predicted to enter Hb risk zone next month", "Continue current dialysis regimen"]
+
+
+def random_float(rng):
+    value = rng.choice([rng.uniform(0, 1), rng.uniform(-500, 3000), 0.1 + 0.2, 1e-7, 123456789.0, -0.0])
+    return round(value, 3) if rng.random() < 0.5 else value
+
+
+def random_results(rng):
+    version = '1.0.0+%012x' % rng.getrandbits(48)
+    date = datetime(2025, 1, 1, 12, 30, 15, rng.choice([0, 1, 123456]))
+    recommendations = rng.sample(RECOMMENDATIONS, rng.randint(0, 2))
+    yield DryWeightResult(
+        rng.choice(PATIENT_IDS), rng.random() < 0.5, 'Stable', random_float(rng), random_float(rng),
+        np.float64(random_float(rng)), random_float(rng), recommendations, version, date
+    ), DryWeightPredictionResponseSerializer, DryWeightBatchResultSerializer
+    yield URRResult(
+        rng.choice(PATIENT_IDS + [None]), rng.random() < 0.5, 'Safe', 'Predicted Adequate', random_float(rng),
+        {'min': 65.0, 'max': 100.0}, random_float(rng), random_float(rng), recommendations, version, date
+    ), URRPredictionResponseSerializer, URRBatchResultSerializer
+    yield HbResult(
+        rng.random() < 0.5, 'At Risk', 'Moving to Risk Zone', random_float(rng), {'min': 10.0, 'max': 12.0},
+        random_float(rng), recommendations, random_float(rng), version, date
+    ), HbPredictionResponseSerializer, HbBatchResultSerializer
+
+
+def random_explanation(rng):
+    return {
+        'base_probability': round(rng.uniform(0, 1), 4),
+        'contributions': [
+            {'feature': feature, 'value': rng.choice([None, random_float(rng)]), 'contribution': round(rng.uniform(-0.3, 0.3), 4)}
+            for feature in rng.sample(['Hb (g/dL)', 'URR', 'K_Diff', 'Albumin (g/L)'], rng.randint(1, 4))
+        ],
+    }
+
+
+def test_response_encoding():
+    """Compare single and batch response bodies with the serializer + JSONRenderer output"""
+    print("🧪 Testing Response Encoding")
+    print("=" * 50)
+    
+    rng = random.Random(42)
+    renderer = JSONRenderer()
+    batches = {}
+    for _ in range(300):
+        for result, serializer_class, batch_serializer_class in random_results(rng):
+            if rng.random() < 0.3:
+                result.latency_tier = rng.choice(['full', 'fast'])
+            if rng.random() < 0.3:
+                result.explanation = random_explanation(rng)
+            expected = renderer.render(serializer_class(result.to_dict()).data)
+            assert encode_result(result) == expected, (encode_result(result), expected)
+            batches.setdefault(batch_serializer_class, []).append(result)
+    
+    errors = [{'index': 7, 'details': {'hb': ['A valid number is required.']}},
+              {'index': 9, 'details': {'non_field_errors': ['Invalid data. Expected a dictionary, but got str.']}}]
+    for batch_serializer_class, results in batches.items():
+        for index, result in enumerate(results):
+            result.index = index
+        expected = renderer.render({
+            'total': len(results) + len(errors),
+            'succeeded': len(results),
+            'failed': len(errors),
+            'results': batch_serializer_class([result.to_dict() for result in results], many=True).data,
+            'errors': errors
+        })
+        assert encode_batch_response(len(results) + len(errors), results, errors) == expected
+        assert b''.join(iter_batch_response(len(results) + len(errors), results, errors, chunk_size=7)) == expected
+        print(f"✅ {batch_serializer_class.__name__}: {len(results)} results byte-identical")
+
+
+if __name__ == "__main__":
+    test_response_encoding()
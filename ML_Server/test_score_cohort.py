@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for the score_cohort management command
+Scores a synthetic monthly investigations file in small chunks with a process
+pool and checks the results against the predictors applied to the whole file
+at once (history inputs computed with pandas as in the training notebooks), and
+that a Parquet file gives the same results when pyarrow is installed
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+
+import django
+
+django.setup()
+
+from django.core.management import call_command
+
+from ml_models.serializers import HbPredictionSerializer, URRPredictionSerializer
+from ml_models.services import hb_predictor, model_manager, urr_predictor
+from ml_models.validation import input_validation
+
+ROWS = 3000
+SEED = 7
+
+
+def monthly_investigations(rows, seed):
+    """Cleaned monthly investigations layout: 12 months per patient, a few gaps and bad cells"""
+    rng = np.random.default_rng(seed)
+    patients = np.repeat([f'RHD_THP_{index:03d}' for index in range(rows // 12 + 1)], 12)[:rows]
+    bu_pre_hd = rng.uniform(15, 30, rows).round(2)
+    frame = pd.DataFrame({
+        'Subject_ID': patients,
+        'Month': np.tile(pd.date_range('2024-01-01', periods=12, freq='MS').strftime('%Y-%m-%d'), rows // 12 + 1)[:rows],
+        'Albumin (g/L)': rng.uniform(25, 45, rows).round(1),
+        'BU - post HD': (bu_pre_hd * rng.uniform(0.34, 0.45, rows)).round(2),
+        'BU - pre HD': bu_pre_hd,
+        'Hb (g/dL)': rng.uniform(7, 14, rows).round(1),
+        'S Ca (mmol/L)': rng.uniform(1.9, 2.8, rows).round(2),
+        'SCR- post HD (µmol/L)': rng.uniform(100, 400, rows).round(1),
+        'SCR- pre HD (µmol/L)': rng.uniform(400, 1100, rows).round(1),
+        'Serum K Post-HD (mmol/L)': rng.uniform(2.5, 4, rows).round(2),
+        'Serum K Pre-HD (mmol/L)': rng.uniform(3.5, 6.5, rows).round(2),
+        'Serum Na Pre-HD (mmol/L)': rng.uniform(128, 145, rows).round(0),
+        'UA (mg/dL)': rng.uniform(200, 600, rows).round(0),
+    })
+    frame.loc[rng.choice(rows, 30, replace=False), 'Hb (g/dL)'] = np.nan
+    frame.loc[rng.choice(rows, 30, replace=False), 'Albumin (g/L)'] = 5.0
+    return frame
+
+
+def expected_results(frame, model_name, serializer_class, predictor):
+    """The predictor applied to the whole file in one batch"""
+    data = frame.copy()
+    data['urr'] = ((data['BU - pre HD'] - data['BU - post HD']) / data['BU - pre HD'] * 100).round(3)
+    data['urr_diff'] = data['urr'] - data.groupby('Subject_ID')['urr'].shift(1)
+    data['hb_diff'] = data['Hb (g/dL)'] - data.groupby('Subject_ID')['Hb (g/dL)'].shift(1)
+    data = data.rename(columns={
+        'Subject_ID': 'patient_id', 'Albumin (g/L)': 'albumin', 'BU - post HD': 'bu_post_hd', 'BU - pre HD': 'bu_pre_hd',
+        'Hb (g/dL)': 'hb', 'S Ca (mmol/L)': 's_ca', 'SCR- post HD (µmol/L)': 'scr_post_hd',
+        'SCR- pre HD (µmol/L)': 'scr_pre_hd', 'Serum K Post-HD (mmol/L)': 'serum_k_post_hd',
+        'Serum K Pre-HD (mmol/L)': 'serum_k_pre_hd', 'Serum Na Pre-HD (mmol/L)': 'serum_na_pre_hd', 'UA (mg/dL)': 'ua',
+    })
+    validated, errors = input_validation.validate_many(serializer_class, data.to_dict('records'))
+    valid = [index for index, record in enumerate(validated) if record is not None]
+    results = predictor._predict_loaded(model_manager.get_loaded(model_name), [validated[index] for index in valid])
+    return valid, results, errors
+
+
+def test_score_cohort():
+    """Chunked, multi-process scoring gives the whole-file results in input order"""
+    print("🧪 Testing Cohort Scoring")
+    print("=" * 50)
+    
+    frame = monthly_investigations(ROWS, SEED)
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, 'monthly.csv')
+        frame.to_csv(input_path, index=False)
+        
+        outputs = {}
+        parquet_scores = None
+        for workers, chunk_size in ((1, ROWS), (2, 250)):
+            output_path = os.path.join(directory, f'scores-{workers}.csv')
+            call_command('score_cohort', input_path, output_path, workers=workers, chunk_size=chunk_size,
+                         recommendations=True, progress_interval=3600, stdout=open(os.devnull, 'w'))
+            outputs[workers] = pd.read_csv(output_path)
+            print(f"✅ Scored {ROWS} rows with {workers} worker(s) in chunks of {chunk_size}")
+        
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("⚠️ pyarrow not installed (see requirements-optional.txt), Parquet round trip skipped")
+        else:
+            parquet_input = os.path.join(directory, 'monthly.parquet')
+            frame.to_parquet(parquet_input, index=False)
+            parquet_output = os.path.join(directory, 'scores.parquet')
+            call_command('score_cohort', parquet_input, parquet_output, workers=2, chunk_size=250,
+                         recommendations=True, progress_interval=3600, stdout=open(os.devnull, 'w'))
+            parquet_scores = pd.read_parquet(parquet_output)
+            print("✅ Scored the same rows from Parquet to Parquet")
+    
+    single, pooled = outputs[1], outputs[2]
+    pd.testing.assert_frame_equal(single, pooled)
+    assert single['row'].tolist() == list(range(ROWS))
+    assert single['patient_id'].tolist() == frame['Subject_ID'].tolist()
+    if parquet_scores is not None:
+        # Missing values read back as None from Parquet and as NaN from CSV
+        as_objects = [scores.astype(object).where(scores.notna(), None) for scores in (parquet_scores, single)]
+        pd.testing.assert_frame_equal(*as_objects)
+    
+    for model_name, serializer_class, predictor in (('urr', URRPredictionSerializer, urr_predictor),
+                                                    ('hb', HbPredictionSerializer, hb_predictor)):
+        valid, results, errors = expected_results(frame, model_name, serializer_class, predictor)
+        scored = single.iloc[valid]
+        assert scored[f'{model_name}_error'].isna().all()
+        assert scored[f'{model_name}_probability'].tolist() == [result.risk_probability for result in results]
+        assert scored[f'{model_name}_predicted'].tolist() == [getattr(result, f'{model_name}_risk_predicted') for result in results]
+        assert scored[f'{model_name}_recommendations'].tolist() == [' | '.join(result.recommendations) for result in results]
+        invalid = [index for index, error in enumerate(errors) if error is not None]
+        assert [json.loads(error) for error in single[f'{model_name}_error'].iloc[invalid]] == [errors[index] for index in invalid]
+        print(f"✅ {model_name}: {len(valid)} scored rows and {len(invalid)} invalid rows match the whole-file batch")
+
+
+if __name__ == "__main__":
+    test_score_cohort()
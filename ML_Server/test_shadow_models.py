@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script for shadow model evaluation
+Checks that responses still come from the served model, that the shadow
+comparison counters match a direct comparison of the two models, and that a
+full queue drops rows instead of slowing requests down
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+from django.test import Client
+
+from ml_models.benchmark import mint_token, synthetic_payloads
+from ml_models.serializers import HbPredictionSerializer, URRPredictionSerializer
+from ml_models.services import hb_predictor, model_manager, prediction_cache
+from ml_models.shadow import ShadowEvaluator, shadow_evaluator
+
+
+def post_batch(client, path, records):
+    response = client.post(path, json.dumps({'records': records}), content_type='application/json')
+    assert response.status_code == 200, response.content
+    results = response.json()['results']
+    for result in results:
+        result.pop('prediction_date')
+    return results
+
+
+def test_identical_shadow():
+    """The served model as its own shadow agrees on every row"""
+    print("🧪 Testing Shadow Model Evaluation")
+    print("=" * 50)
+    
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {mint_token(os.environ['JWT_SECRET'])}", HTTP_HOST='localhost')
+    records = synthetic_payloads(URRPredictionSerializer, 80, seed=21)
+    prediction_cache.clear()
+    before = post_batch(client, '/api/ml/predict/urr/batch/', records)
+    
+    model_manager.register_shadow('urr', 'models/urr_model.pkl')
+    try:
+        prediction_cache.clear()
+        after = post_batch(client, '/api/ml/predict/urr/batch/', records)
+        assert after == before
+        assert shadow_evaluator.wait_idle(timeout=30)
+        stats = shadow_evaluator.stats()['models']['urr']
+        assert stats['scored_rows'] == len(records) and stats['dropped_rows'] == 0, stats
+        assert stats['agreement_rate'] == 1.0 and stats['max_abs_probability_delta'] == 0.0, stats
+        assert model_manager.get_status()['urr']['shadow_version'] == stats['shadow_version']
+        health = client.get('/api/ml/health/').json()
+        assert health['shadow_models']['models']['urr']['scored_rows'] == len(records)
+    finally:
+        model_manager.remove_shadow('urr')
+    print(f"✅ Responses unchanged; {stats['scored_rows']} rows scored in the background, agreement {stats['agreement_rate']}")
+
+
+def test_candidate_shadow():
+    """Counters of a different candidate match a direct comparison with the served model"""
+    bundle = joblib.load(model_manager.get_model_path('hb'))
+    candidate_path = os.path.join(tempfile.mkdtemp(prefix='ml_shadow_test_'), 'hb_candidate.pkl')
+    joblib.dump({**bundle, 'weights': [0.8, 0.2], 'version': '2.0.0-rc1'}, candidate_path)
+    
+    model_manager.register_shadow('hb', candidate_path)
+    try:
+        records = [record for record in synthetic_payloads(HbPredictionSerializer, 300, seed=4)]
+        prediction_cache.clear()
+        for start in range(0, len(records), 25):
+            hb_predictor.predict_batch(records[start:start + 25])
+        assert shadow_evaluator.wait_idle(timeout=30)
+        stats = shadow_evaluator.stats()['models']['hb']
+        
+        X = hb_predictor.feature_builder.build(records)
+        primary_predictions, primary_probabilities = model_manager.get_loaded('hb').ensemble.predict(X)
+        shadow_predictions, shadow_probabilities = model_manager.shadows['hb'].ensemble.predict(X)
+        deltas = shadow_probabilities - primary_probabilities
+        assert stats['shadow_version'].startswith('2.0.0-rc1+'), stats
+        assert stats['scored_rows'] == len(records), stats
+        assert stats['agreement_rate'] == round(float(np.mean(shadow_predictions == primary_predictions)), 4), stats
+        assert stats['mean_probability_delta'] == round(float(deltas.mean()), 4), stats
+        assert stats['max_abs_probability_delta'] == round(float(np.abs(deltas).max()), 4), stats
+    finally:
+        model_manager.remove_shadow('hb')
+    print(f"✅ Candidate agreement {stats['agreement_rate']}, mean |delta| {stats['mean_abs_probability_delta']}, "
+          f"{stats['mean_row_us']} µs per row")
+
+
+def test_incompatible_shadow():
+    """A shadow that cannot score the model's records is rejected at registration"""
+    try:
+        model_manager.register_shadow('urr', 'models/dry_weight_model.pkl')
+    except Exception as e:
+        print(f"✅ Incompatible shadow rejected: {str(e)[:80]}")
+    else:
+        raise AssertionError('dry weight model accepted as URR shadow')
+    assert 'urr' not in model_manager.shadows
+
+
+def test_full_queue_drops():
+    """While the shadow is slow the queue fills up and further rows are dropped without waiting"""
+    loaded = model_manager.get_loaded('urr')
+    release = threading.Event()
+    
+    def slow_score(shadow, X):
+        release.wait()
+        return np.zeros(len(X), dtype=int), np.zeros(len(X))
+    
+    evaluator = ShadowEvaluator(max_queued_rows=100, batch_rows=50)
+    X = np.zeros((40, 12))
+    predictions, probabilities = np.zeros(40, dtype=int), np.zeros(40)
+    accepted = [evaluator.offer(loaded, slow_score, X, predictions, probabilities) for _ in range(2)]
+    time.sleep(0.2)  # the drain thread is now blocked in slow_score
+    
+    started = time.perf_counter()
+    accepted += [evaluator.offer(loaded, slow_score, X, predictions, probabilities) for _ in range(200)]
+    elapsed = time.perf_counter() - started
+    stats = evaluator.stats()
+    assert stats['queued_rows'] <= 100, stats
+    assert stats['models']['urr']['dropped_rows'] == 40 * accepted.count(False) > 0, stats
+    
+    release.set()
+    assert evaluator.wait_idle(timeout=30)
+    stats = evaluator.stats()['models']['urr']
+    assert stats['scored_rows'] == 40 * accepted.count(True), stats
+    print(f"✅ {stats['dropped_rows']} rows dropped while the shadow was busy; "
+          f"offering took {elapsed * 1e6 / 200:.1f} µs per request")
+
+
+if __name__ == "__main__":
+    test_identical_shadow()
+    test_candidate_shadow()
+    test_incompatible_shadow()
+    test_full_queue_drops()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming NDJSON prediction endpoints
+Checks that streamed results equal the batch endpoint's results for the same
+records, that bad lines are reported in place (also when a whole chunk is
+bad), and that memory stays flat as the stream grows
+"""
+
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+from django.test import Client, RequestFactory, override_settings
+
+from ml_models.benchmark import mint_token, synthetic_payloads
+from ml_models.serializers import URRPredictionSerializer
+from ml_models.services import model_manager, urr_predictor
+from ml_models.streaming import iter_lines, iter_predictions, request_stream
+
+MAX_LINE_BYTES = 4096
+
+
+def ndjson_lines(records):
+    """Request lines with an invalid JSON line, an over-long line, a blank line and a non-object"""
+    lines, expected = [], []
+    for index, record in enumerate(records):
+        if index == 3:
+            lines.append(b'{"albumin": 38,')
+            expected.append('not json')
+        elif index == 8:
+            lines.append(json.dumps({**record, 'patient_id': 'x' * MAX_LINE_BYTES}).encode())
+            expected.append('too long')
+        elif index == 12:
+            lines.append(b'[1, 2]')
+            expected.append([1, 2])
+        else:
+            lines.append(json.dumps(record).encode())
+            expected.append(record)
+        if index == 5:
+            lines.append(b'   ')
+    return b'\n'.join(lines) + b'\n', expected
+
+
+def test_stream_predictions():
+    """Stream a few chunks of records and compare with the batch endpoint"""
+    print("🧪 Testing Streaming NDJSON Predictions")
+    print("=" * 50)
+    
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {mint_token(os.environ['JWT_SECRET'])}",
+                    HTTP_HOST='localhost')
+    records = synthetic_payloads(URRPredictionSerializer, 60, seed=5)
+    records[20]['urr'] = 500
+    body, expected = ndjson_lines(records)
+    
+    with override_settings(ML_STREAM_CHUNK_RECORDS=7, ML_STREAM_MAX_LINE_BYTES=MAX_LINE_BYTES):
+        response = client.post('/api/ml/predict/urr/stream/', body, content_type='application/x-ndjson')
+        assert response.status_code == 200 and response.streaming
+        assert response['Content-Type'] == 'application/x-ndjson'
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    
+    summary = lines.pop()
+    assert summary == {'total': len(records), 'succeeded': len(records) - 4, 'failed': 4}, summary
+    assert [line['index'] for line in lines] == list(range(len(records)))
+    
+    # The JSON objects through the batch endpoint
+    positions = [index for index, record in enumerate(expected) if isinstance(record, dict)]
+    batch = client.post('/api/ml/predict/urr/batch/', json.dumps({'records': [expected[index] for index in positions]}),
+                        content_type='application/json').json()
+    batch_lines = {positions[result.pop('index')]: result for result in batch['results']}
+    batch_lines.update({positions[error['index']]: {'details': error['details']} for error in batch['errors']})
+    for line in lines:
+        index = line.pop('index')
+        if expected[index] == 'not json':
+            assert 'JSON parse error' in line['details']['non_field_errors'][0], line
+        elif expected[index] == 'too long':
+            assert line['details'] == {'non_field_errors': [f"Line longer than {MAX_LINE_BYTES} bytes."]}, line
+        elif isinstance(expected[index], list):
+            assert 'Expected a dictionary' in line['details']['non_field_errors'][0], line
+        else:
+            line.pop('prediction_date', None)
+            batch_lines[index].pop('prediction_date', None)
+            assert line == batch_lines[index], (line, batch_lines[index])
+    print(f"✅ {summary['succeeded']} streamed results and {summary['failed']} errors match the batch endpoint")
+    
+    response = client.post('/api/ml/predict/urr/stream/', json.dumps(records[0]), content_type='application/json')
+    assert response.status_code == 415
+    print("✅ Non-NDJSON requests rejected with 415")
+
+
+def test_invalid_chunks():
+    """Chunks without a single valid record report their errors and the stream goes on"""
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {mint_token(os.environ['JWT_SECRET'])}",
+                    HTTP_HOST='localhost')
+    
+    def stream(model, body):
+        response = client.post(f'/api/ml/predict/{model}/stream/', body, content_type='application/x-ndjson')
+        assert response.status_code == 200
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    
+    lines = stream('hb', b'bad\n{"hb": 1}\n')
+    assert lines[-1] == {'total': 2, 'succeeded': 0, 'failed': 2}, lines
+    assert [line['index'] for line in lines[:-1]] == [0, 1] and all('details' in line for line in lines[:-1]), lines
+    
+    # Invalid chunks before, between and after valid ones
+    records = synthetic_payloads(URRPredictionSerializer, 4, seed=6)
+    invalid = [b'bad', json.dumps({'urr': 500}).encode(), b'[1]']
+    body = b'\n'.join(invalid + [json.dumps(record).encode() for record in records[:3]] + invalid +
+                      [json.dumps(records[3]).encode()] + invalid) + b'\n'
+    with override_settings(ML_STREAM_CHUNK_RECORDS=3):
+        lines = stream('urr', body)
+    summary = lines.pop()
+    assert summary == {'total': 13, 'succeeded': 4, 'failed': 9}, summary
+    assert [line['index'] for line in lines] == list(range(13))
+    scored = [line['index'] for line in lines if 'details' not in line]
+    assert scored == [3, 4, 5, 9], scored
+    print("✅ Chunks without valid records report their errors; later chunks are still scored")
+
+
+def test_chunked_upload_lines():
+    """A de-chunked upload without Content-Length is read to its end, line by line"""
+    request = RequestFactory().post('/api/ml/predict/urr/stream/', b'', content_type='application/x-ndjson')
+    stream = io.BytesIO(b'{"a": 1}\n\n' + b'x' * 100 + b'\n{"b": 2}')
+    request.META.update({'CONTENT_LENGTH': '', 'wsgi.input_terminated': True, 'wsgi.input': stream})
+    assert list(iter_lines(request_stream(request), 50)) == [b'{"a": 1}\n', None, b'{"b": 2}']
+    print("✅ Chunked uploads are read to the end; over-long lines are skipped")
+
+
+def peak_memory(count, payloads, loaded):
+    """Peak traced memory while streaming `count` records (lines generated on the fly)"""
+    lines = (json.dumps(payloads[index % len(payloads)]).encode() for index in range(count))
+    tracemalloc.start()
+    written = 0
+    for chunk in iter_predictions(lines, URRPredictionSerializer, urr_predictor, loaded,
+                                  chunk_size=250, max_line_bytes=MAX_LINE_BYTES):
+        written += len(chunk)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, written
+
+
+def test_flat_memory():
+    """Ten times more records must not take more memory"""
+    loaded = model_manager.get_loaded('urr')
+    payloads = synthetic_payloads(URRPredictionSerializer, 200, seed=9)
+    peak_memory(500, payloads, loaded)  # warm caches
+    small, _ = peak_memory(2000, payloads, loaded)
+    large, written = peak_memory(20000, payloads, loaded)
+    assert large < small * 1.5, (small, large)
+    print(f"✅ Peak memory {small / 1024:.0f} KiB for 2000 records, {large / 1024:.0f} KiB for 20000 "
+          f"({written / 1024 / 1024:.1f} MiB streamed)")
+
+
+if __name__ == "__main__":
+    test_stream_predictions()
+    test_invalid_chunks()
+    test_chunked_upload_lines()
+    test_flat_memory()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Test script for the verified token cache
+Checks that JWTAuthenticationMiddleware answers a cached token that has since
+expired with 401 "Token expired", does not cache tokens without `exp`, keeps
+the cache within JWT_CACHE_SIZE, never serves a tampered or re-signed token
+from the cache and still upper-cases roles for require_role
+"""
+
+import json
+import os
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server.settings')
+os.environ.setdefault('ML_PRELOAD_MODELS', 'False')
+os.environ.setdefault('JWT_SECRET', 'ml-server-test-secret-with-a-32-byte-key')
+
+import django
+
+django.setup()
+
+import jwt
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+
+from ml_models.middleware import auth
+from ml_models.middleware.auth import JWTAuthenticationMiddleware, VerifiedTokenCache
+
+SECRET = os.environ['JWT_SECRET']
+PATH = '/api/ml/predict/urr/'
+
+
+def mint_token(secret, role='doctor', user_id='token-test', ttl=3600):
+    """HS256 token in the shape issued by the Express backend"""
+    return jwt.encode({'id': user_id, 'role': role, 'exp': int(time.time()) + ttl}, secret, algorithm='HS256')
+
+
+def middleware():
+    return JWTAuthenticationMiddleware(lambda request: HttpResponse('ok'))
+
+
+def authenticate(auth_middleware, token):
+    """(response or None, request) of the middleware for a request carrying token"""
+    request = RequestFactory().post(PATH, HTTP_AUTHORIZATION=f'Bearer {token}')
+    return auth_middleware.process_request(request), request
+
+
+def error_of(response):
+    return response.status_code, json.loads(response.content)['error']
+
+
+def test_expiry():
+    """A cached token is rejected as expired once its exp passes, like an uncached one"""
+    print("🧪 Testing Verified Token Cache")
+    print("=" * 50)
+    
+    auth_middleware = middleware()
+    token = mint_token(SECRET, ttl=60)
+    response, request = authenticate(auth_middleware, token)
+    assert response is None and request.user_id == 'token-test'
+    assert len(auth_middleware.token_cache._entries) == 1
+    
+    # Served from the cache while valid: no second decode
+    with mock.patch.object(auth.jwt, 'decode', side_effect=AssertionError('decoded again')):
+        response, request = authenticate(auth_middleware, token)
+    assert response is None and request.user_role == 'DOCTOR'
+    
+    # One second past exp the cached entry is rejected and dropped
+    expires_at = jwt.decode(token, SECRET, algorithms=['HS256'])['exp']
+    with mock.patch.object(auth.time, 'time', return_value=expires_at + 1):
+        response, _ = authenticate(auth_middleware, token)
+    assert error_of(response) == (401, 'Token expired'), response.content
+    assert len(auth_middleware.token_cache._entries) == 0
+    
+    # Cached again while still valid, then rejected exactly at exp as jwt.decode does
+    assert authenticate(auth_middleware, token)[0] is None
+    with mock.patch.object(auth.time, 'time', return_value=expires_at):
+        assert error_of(authenticate(auth_middleware, token)[0]) == (401, 'Token expired')
+    
+    # An already expired token is never cached
+    expired = mint_token(SECRET, ttl=-10)
+    for _ in range(2):
+        assert error_of(authenticate(auth_middleware, expired)[0]) == (401, 'Token expired')
+    assert len(auth_middleware.token_cache._entries) == 0
+    print("✅ Cached tokens are rejected with 401 'Token expired' once exp has passed")
+
+
+def test_tokens_without_exp():
+    """Tokens without exp (or with a non-numeric one) are verified on every request and not cached"""
+    auth_middleware = middleware()
+    tokens = [jwt.encode({'id': 'no-exp', 'role': 'nurse'}, SECRET, algorithm='HS256'),
+              jwt.encode({'id': 'string-exp', 'role': 'nurse', 'exp': str(int(time.time()) + 60)}, SECRET,
+                         algorithm='HS256')]
+    decode = mock.Mock(wraps=jwt.decode)
+    with mock.patch.object(auth.jwt, 'decode', decode):
+        for token in tokens:
+            for _ in range(3):
+                response, request = authenticate(auth_middleware, token)
+                assert response is None or response.status_code == 401, response.status_code
+    assert len(auth_middleware.token_cache._entries) == 0
+    assert decode.call_count == 6, decode.call_count
+    assert authenticate(auth_middleware, tokens[0])[1].user_role == 'NURSE'
+    print("✅ Tokens without a numeric exp are decoded on every request and never cached")
+
+
+def test_lru_bound():
+    """The cache holds at most JWT_CACHE_SIZE tokens and evicts the least recently used"""
+    cache = VerifiedTokenCache(max_entries=3)
+    exp = time.time() + 60
+    for name in 'abcd':
+        if name == 'd':
+            assert cache.get(b'a', time.time()) is not None  # a becomes the most recently used
+        cache.put(name.encode(), {'exp': exp, 'id': name}, 'DOCTOR')
+    assert list(cache._entries) == [b'c', b'a', b'd'] and cache.get(b'b', time.time()) is None
+    
+    disabled = VerifiedTokenCache(max_entries=0)
+    disabled.put(b'a', {'exp': exp}, 'DOCTOR')
+    assert disabled.get(b'a', time.time()) is None
+    
+    with override_settings(JWT_CACHE_SIZE=5):
+        auth_middleware = middleware()
+    tokens = [mint_token(SECRET, user_id=f'user-{index}') for index in range(20)]
+    for token in tokens:
+        assert authenticate(auth_middleware, token)[0] is None
+        assert len(auth_middleware.token_cache._entries) <= 5
+    assert list(auth_middleware.token_cache._entries) == [VerifiedTokenCache.digest(token) for token in tokens[-5:]]
+    assert authenticate(auth_middleware, tokens[0])[1].user_id == 'user-0'
+    print("✅ Cache bounded by JWT_CACHE_SIZE with least-recently-used eviction")
+
+
+def test_tampered_tokens():
+    """A token with the cached payload but another signature is verified, not served from the cache"""
+    auth_middleware = middleware()
+    token = mint_token(SECRET, user_id='patient-reader')
+    assert authenticate(auth_middleware, token)[0] is None
+    payload = jwt.decode(token, SECRET, algorithms=['HS256'])
+    
+    header, body, signature = token.split('.')
+    flipped = signature[:-2] + ('A' if signature[-2] != 'A' else 'B') + signature[-1]
+    forged = jwt.encode(payload, 'another-secret-that-is-at-least-32-bytes', algorithm='HS256')
+    assert forged.split('.')[1] == body
+    for bad in (f'{header}.{body}.{flipped}', forged, f'{header}.{body}.'):
+        response, request = authenticate(auth_middleware, bad)
+        assert error_of(response) == (401, 'Invalid token'), bad
+        assert not hasattr(request, 'user_id')
+    assert len(auth_middleware.token_cache._entries) == 1
+    assert authenticate(auth_middleware, token)[0] is None
+    print("✅ Tampered and re-signed tokens with a cached payload are rejected")
+
+
+def test_roles():
+    """Roles are upper-cased once per token, cached or not, and checked by require_role"""
+    auth_middleware = middleware()
+    for role, expected in (('doctor', 'DOCTOR'), ('Nurse', 'NURSE'), ('ADMIN', 'ADMIN'), (None, ''), ('', '')):
+        token = jwt.encode({'id': 'u', 'role': role, 'exp': int(time.time()) + 60}, SECRET, algorithm='HS256')
+        for _ in range(2):
+            response, request = authenticate(auth_middleware, token)
+            assert response is None and request.user_role == expected, (role, request.user_role)
+    
+    for role, status in (('doctor', 400), ('Nurse', 400), ('NURSE', 400), ('admin', 403), (None, 403)):
+        token = jwt.encode({'id': 'u', 'role': role, 'exp': int(time.time()) + 60}, SECRET, algorithm='HS256')
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_HOST='localhost')
+        for _ in range(2):
+            response = client.post(PATH, '{}', content_type='application/json')
+            assert response.status_code == status, (role, response.status_code, response.content)
+    print("✅ Roles upper-cased for require_role: doctor/Nurse allowed, admin and missing roles forbidden")
+
+
+if __name__ == "__main__":
+    test_expiry()
+    test_tokens_without_exp()
+    test_lru_bound()
+    test_tampered_tokens()
+    test_roles()